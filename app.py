@@ -70,6 +70,13 @@ def main():
                 st.warning(f"⏳ {step}")
             else:
                 st.info(f"📅 {step}")
+        
+        # 后台运行中的任务
+        active_jobs = get_job_runner().active_jobs()
+        if active_jobs:
+            st.markdown("### ⏳ 后台任务")
+            for job in active_jobs:
+                st.caption(f"{job['title']} · {job['status_label']} {job['progress']}%")
     
     # 主内容区域
     if current_step == "首页概览":
@@ -0,0 +1,11 @@
+"""
+基准测试模块
+包含本地模拟GPTBots服务和流水线各阶段的吞吐量基准测试
+"""
+
+from .mock_server import MockGPTBotsServer, DEFAULT_PROFILE
+
+__all__ = [
+    'MockGPTBotsServer',
+    'DEFAULT_PROFILE'
+]
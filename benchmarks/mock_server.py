@@ -0,0 +1,593 @@
+#!/usr/bin/env python3
+"""
+本地模拟GPTBots服务
+实现 GPTBotsAPI 与 KnowledgeBaseAPI 使用的接口，支持可配置的延迟分布、429/5xx注入和并发上限，
+用于在不访问生产后端的情况下进行压测和吞吐量基准测试
+
+使用方式:
+    python -m benchmarks.mock_server --port 19090 --llm-median 0.5 --error-5xx 0.02
+    GPTBOTS_BASE_URL=http://127.0.0.1:19090 python run_app.py
+"""
+
+import argparse
+import base64
+import copy
+import gzip
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+# 默认压测配置
+# 接口分组: conversation(创建对话)、llm(发送消息)、kb(知识库相关接口)
+DEFAULT_PROFILE = {
+    "seed": 42,
+    "latency": {
+        "conversation": {"distribution": "fixed", "value": 0.01},
+        "llm": {
+            "distribution": "lognormal",
+            "median": 0.2,
+            "sigma": 0.5,
+            "per_kchar": 0.01,            # 每千字符输入额外增加的延迟（秒）
+            "tail_probability": 0.0,      # 长尾请求的概率
+            "tail_multiplier": 10.0       # 长尾请求的延迟倍数
+        },
+        "kb": {"distribution": "uniform", "low": 0.02, "high": 0.08}
+    },
+    # 错误注入比例
+    "error_rates": {
+        "conversation": {"429": 0.0, "5xx": 0.0},
+        "llm": {"429": 0.0, "5xx": 0.0},
+        "kb": {"429": 0.0, "5xx": 0.0}
+    },
+    # 同时处理的请求数上限，超出时直接返回429（0表示不限制）
+    "max_concurrency": {
+        "conversation": 0,
+        "llm": 8,
+        "kb": 4
+    },
+    # 文档上传后多久变为 AVAILABLE（秒）
+    "embedding_delay": 0.5
+}
+
+_EMAIL_BLOCK_PATTERN = re.compile(r'<<<EMAIL id=([A-Za-z0-9_-]+)>>>\s*(.*?)\s*<<<END EMAIL>>>', re.DOTALL)
+_SUBJECT_PATTERN = re.compile(r'\*\*主题\*\*:\s*(.+)')
+_MAX_FILES_PER_ADD = 20
+
+
+def _merge_profile(base: Dict, override: Dict) -> Dict:
+    """递归合并配置"""
+    merged = copy.deepcopy(base)
+    for key, value in (override or {}).items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge_profile(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+class MockState:
+    def __init__(self, profile: Dict):
+        """
+        初始化模拟服务状态
+
+        Args:
+            profile: 压测配置，未指定的项使用 DEFAULT_PROFILE
+        """
+        self.profile = _merge_profile(DEFAULT_PROFILE, profile)
+        self._rng = random.Random(self.profile["seed"])
+        self._lock = threading.Lock()
+        self._in_flight = {group: 0 for group in self.profile["max_concurrency"]}
+
+        self.documents: Dict[str, Dict] = {}
+        self.stats = {
+            "requests": {},
+            "status": {},
+            "injected_429": 0,
+            "injected_5xx": 0,
+            "concurrency_rejected": 0,
+            "max_in_flight": {group: 0 for group in self._in_flight},
+            "bytes_received": 0
+        }
+
+    def random(self) -> float:
+        with self._lock:
+            return self._rng.random()
+
+    def sample_latency(self, group: str, payload_chars: int = 0) -> float:
+        """
+        按配置的分布采样一次延迟
+
+        Args:
+            group: 接口分组
+            payload_chars: 请求文本长度，用于计算与输入长度相关的延迟
+
+        Returns:
+            延迟（秒）
+        """
+        spec = self.profile["latency"].get(group, {"distribution": "fixed", "value": 0.0})
+        distribution = spec.get("distribution", "fixed")
+        with self._lock:
+            if distribution == "uniform":
+                latency = self._rng.uniform(spec.get("low", 0.0), spec.get("high", 0.0))
+            elif distribution == "exponential":
+                latency = self._rng.expovariate(1.0 / spec["mean"]) if spec.get("mean") else 0.0
+            elif distribution == "lognormal":
+                latency = self._rng.lognormvariate(math.log(spec.get("median", 0.1)), spec.get("sigma", 0.5))
+            else:
+                latency = spec.get("value", 0.0)
+
+            if spec.get("tail_probability") and self._rng.random() < spec["tail_probability"]:
+                latency *= spec.get("tail_multiplier", 10.0)
+
+        return latency + payload_chars / 1000 * spec.get("per_kchar", 0.0)
+
+    def enter(self, group: str) -> bool:
+        """占用一个并发名额，超过上限时返回False"""
+        limit = self.profile["max_concurrency"].get(group, 0)
+        with self._lock:
+            self._in_flight.setdefault(group, 0)
+            if limit and self._in_flight[group] >= limit:
+                self.stats["concurrency_rejected"] += 1
+                return False
+            self._in_flight[group] += 1
+            self.stats["max_in_flight"][group] = max(
+                self.stats["max_in_flight"].get(group, 0), self._in_flight[group]
+            )
+            return True
+
+    def leave(self, group: str):
+        with self._lock:
+            self._in_flight[group] -= 1
+
+    def inject_error(self, group: str) -> Optional[int]:
+        """按配置比例注入错误，返回注入的状态码或None"""
+        rates = self.profile["error_rates"].get(group, {})
+        roll = self.random()
+        if roll < rates.get("429", 0.0):
+            with self._lock:
+                self.stats["injected_429"] += 1
+            return 429
+        if roll < rates.get("429", 0.0) + rates.get("5xx", 0.0):
+            with self._lock:
+                self.stats["injected_5xx"] += 1
+            return 503
+        return None
+
+    def record(self, route: str, status: int, body_size: int):
+        with self._lock:
+            self.stats["requests"][route] = self.stats["requests"].get(route, 0) + 1
+            self.stats["status"][str(status)] = self.stats["status"].get(str(status), 0) + 1
+            self.stats["bytes_received"] += body_size
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            stats = copy.deepcopy(self.stats)
+            stats["documents"] = len(self.documents)
+            return stats
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # 支持长连接，便于测量客户端连接复用
+    protocol_version = "HTTP/1.1"
+    server_version = "MockGPTBots/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def state(self) -> MockState:
+        return self.server.state
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send_json(self, status: int, data):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _dispatch(self, method: str):
+        parsed = urlparse(self.path)
+        route = parsed.path
+        query = parse_qs(parsed.query)
+        raw_body = self._read_body()
+        body_size = len(raw_body)
+
+        if route.startswith("/__mock/"):
+            self._handle_admin(method, route)
+            return
+
+        handler, group = _ROUTES.get((method, route), (None, None))
+        if handler is None:
+            self.state.record(route, 404, body_size)
+            self._send_json(404, {"code": 40400, "message": f"未知接口: {method} {route}"})
+            return
+
+        if not self.headers.get("Authorization", "").startswith("Bearer "):
+            self.state.record(route, 401, body_size)
+            self._send_json(401, {"code": 40127, "message": "开发者鉴权失败"})
+            return
+
+        if not self.state.enter(group):
+            self.state.record(route, 429, body_size)
+            self._send_json(429, {"code": 42900, "message": "并发超出上限"})
+            return
+
+        try:
+            try:
+                if self.headers.get("Content-Encoding") == "gzip":
+                    raw_body = gzip.decompress(raw_body)
+                body = json.loads(raw_body) if raw_body else {}
+            except (ValueError, OSError):
+                self.state.record(route, 400, body_size)
+                self._send_json(400, {"code": 40000, "message": "参数错误"})
+                return
+
+            time.sleep(self.state.sample_latency(group, len(raw_body) if group == "llm" else 0))
+
+            injected = self.state.inject_error(group)
+            if injected:
+                self.state.record(route, injected, body_size)
+                self._send_json(injected, {"code": injected * 100, "message": "注入的错误"})
+                return
+
+            status, data = handler(self.state, body, query)
+            self.state.record(route, status, body_size)
+            self._send_json(status, data)
+        finally:
+            self.state.leave(group)
+
+    def _handle_admin(self, method: str, route: str):
+        if route == "/__mock/stats" and method == "GET":
+            self._send_json(200, self.state.snapshot())
+        elif route == "/__mock/reset" and method == "POST":
+            with self.state._lock:
+                self.state.documents.clear()
+            self._send_json(200, {"code": 0, "message": "OK"})
+        else:
+            self._send_json(404, {"code": 40400, "message": "未知管理接口"})
+
+
+def _create_conversation(state: MockState, body: Dict, query: Dict) -> Tuple[int, Dict]:
+    return 200, {"conversation_id": uuid.uuid4().hex}
+
+
+def _mock_summary(email_text: str) -> str:
+    """根据邮件内容生成固定格式的模拟结果"""
+    subject = _SUBJECT_PATTERN.search(email_text)
+    subject = subject.group(1).strip() if subject else email_text.strip().split("\n")[0][:60]
+    return (
+        f"## 邮件摘要\n\n- **主题**: {subject}\n- **字符数**: {len(email_text)}\n\n"
+        f"## 关键信息\n\n模拟服务生成的结构化结果。"
+    )
+
+
+def _send_message(state: MockState, body: Dict, query: Dict) -> Tuple[int, Dict]:
+    text = ""
+    for message in body.get("messages", []):
+        for part in message.get("content", []):
+            if part.get("type") == "text":
+                text += part.get("text", "")
+    if not body.get("conversation_id") or not text:
+        return 400, {"code": 40000, "message": "参数错误"}
+
+    # 合并提示词：按邮件ID逐个返回结果块
+    blocks = _EMAIL_BLOCK_PATTERN.findall(text)
+    if blocks:
+        answer = "\n\n".join(
+            f"<<<RESULT id={email_id}>>>\n{_mock_summary(content)}\n<<<END RESULT>>>"
+            for email_id, content in blocks
+        )
+    else:
+        answer = _mock_summary(text)
+
+    return 200, {
+        "message_id": uuid.uuid4().hex,
+        "conversation_id": body["conversation_id"],
+        "output": [
+            {
+                "from_component_branch": "1",
+                "from_component_name": "LLM",
+                "content": {"text": answer}
+            }
+        ],
+        "usage": {"tokens": len(text) // 4 + len(answer) // 4}
+    }
+
+
+def _knowledge_bases(state: MockState, body: Dict, query: Dict) -> Tuple[int, Dict]:
+    with state._lock:
+        doc_count = len(state.documents)
+    return 200, {
+        "knowledge_base": [
+            {"id": "mock-kb", "name": "Mock Knowledge Base", "desc": "本地模拟知识库",
+             "doc": doc_count, "chunk": 0, "token": 0, "owner_id": "mock", "owner_email": "mock@local"}
+        ]
+    }
+
+
+def _doc_list(state: MockState, body: Dict, query: Dict) -> Tuple[int, Dict]:
+    page = int(query.get("page", ["1"])[0])
+    page_size = int(query.get("page_size", ["10"])[0])
+    if page < 1 or not 10 <= page_size <= 100:
+        return 400, {"code": 40000, "message": "参数错误"}
+
+    kb_id = query.get("knowledge_base_id", [None])[0]
+    with state._lock:
+        docs = [
+            doc for doc in state.documents.values()
+            if not kb_id or doc["knowledge_base_id"] == kb_id
+        ]
+    docs.sort(key=lambda doc: doc["create_time"])
+    start = (page - 1) * page_size
+    fields = ("id", "name", "format", "source_url", "status", "chunk", "token",
+              "char_count", "create_time", "update_time")
+    return 200, {
+        "list": [{field: doc[field] for field in fields} for doc in docs[start:start + page_size]],
+        "total": len(docs)
+    }
+
+
+def _decode_file(file: Dict) -> str:
+    try:
+        return base64.b64decode(file.get("file_base64") or "").decode("utf-8")
+    except (ValueError, UnicodeDecodeError):
+        return ""
+
+
+def _add_documents(state: MockState, body: Dict, query: Dict) -> Tuple[int, Dict]:
+    files = body.get("files") or []
+    if not files or len(files) > _MAX_FILES_PER_ADD:
+        return 400, {"code": 40000, "message": f"参数错误: 单次最多添加 {_MAX_FILES_PER_ADD} 个文档"}
+    if not body.get("chunk_token") and not body.get("splitter"):
+        return 400, {"code": 40000, "message": "参数错误: chunk_token 与 splitter 必须二选一"}
+
+    added, failed = [], []
+    now = time.time()
+    for file in files:
+        content = _decode_file(file)
+        if not file.get("file_name") or not content:
+            failed.append(file.get("file_name") or "unknown")
+            continue
+        doc_id = uuid.uuid4().hex[:24]
+        with state._lock:
+            state.documents[doc_id] = {
+                "id": doc_id,
+                "name": file["file_name"],
+                "format": file["file_name"].rsplit(".", 1)[-1],
+                "source_url": file.get("source_url", ""),
+                "status": "ACTIVE",
+                "chunk": max(1, len(content) // 2000),
+                "token": len(content) // 4,
+                "char_count": len(content),
+                "create_time": int(now),
+                "update_time": int(now),
+                "knowledge_base_id": body.get("knowledge_base_id") or "mock-kb",
+                "content": content,
+                "embedded_at": now + state.profile["embedding_delay"]
+            }
+        added.append({"doc_id": doc_id, "doc_name": file["file_name"]})
+
+    return 200, {"doc": added, "failed": failed}
+
+
+def _update_documents(state: MockState, body: Dict, query: Dict) -> Tuple[int, Dict]:
+    files = body.get("files") or []
+    if not files or len(files) > 200:
+        return 400, {"code": 40000, "message": "参数错误"}
+
+    updated, failed = [], []
+    now = time.time()
+    for file in files:
+        with state._lock:
+            doc = state.documents.get(file.get("doc_id"))
+            if doc is None:
+                failed.append(file.get("file_name") or file.get("doc_id") or "unknown")
+                continue
+            content = _decode_file(file)
+            if content:
+                doc["content"] = content
+                doc["char_count"] = len(content)
+            doc["name"] = file.get("file_name", doc["name"])
+            doc["update_time"] = int(now)
+            doc["embedded_at"] = now + state.profile["embedding_delay"]
+        updated.append({"doc_id": doc["id"], "doc_name": doc["name"]})
+
+    return 200, {"doc": updated, "failed": failed}
+
+
+def _delete_documents(state: MockState, body: Dict, query: Dict) -> Tuple[int, Dict]:
+    doc_ids = [doc_id for doc_id in query.get("doc", [""])[0].split(",") if doc_id]
+    if not doc_ids:
+        return 400, {"code": 40000, "message": "参数错误"}
+    with state._lock:
+        for doc_id in doc_ids:
+            state.documents.pop(doc_id, None)
+    return 200, {"code": 0, "message": "OK"}
+
+
+def _add_chunks(state: MockState, body: Dict, query: Dict) -> Tuple[int, Dict]:
+    with state._lock:
+        doc = state.documents.get(body.get("doc_id"))
+        if doc is None or not body.get("chunks"):
+            return 400, {"code": 40000, "message": "参数错误"}
+        doc["chunk"] += len(body["chunks"])
+        doc["content"] += "\n\n" + "\n\n".join(chunk.get("content", "") for chunk in body["chunks"])
+    return 200, {"code": 0, "message": "OK"}
+
+
+def _doc_status(state: MockState, body: Dict, query: Dict) -> Tuple[int, list]:
+    now = time.time()
+    result = []
+    with state._lock:
+        for data_id in query.get("data_ids", []):
+            doc = state.documents.get(data_id)
+            if doc is None:
+                continue
+            status = "AVAILABLE" if now >= doc["embedded_at"] else "EMBEDDING"
+            result.append({"data_id": data_id, "data_status": status})
+    return 200, result
+
+
+def _vector_match(state: MockState, body: Dict, query: Dict) -> Tuple[int, Dict]:
+    prompt = body.get("prompt") or ""
+    if not prompt:
+        return 400, {"code": 40000, "message": "参数错误"}
+
+    # 以字符重合度近似相似度得分
+    terms = set(prompt)
+    data_ids = set(body.get("data_ids") or [])
+    matches = []
+    with state._lock:
+        docs = list(state.documents.values())
+    for doc in docs:
+        if data_ids and doc["id"] not in data_ids:
+            continue
+        overlap = len(terms & set(doc["content"][:5000]))
+        score = round(overlap / max(1, len(terms)), 4)
+        if score > 0:
+            matches.append({
+                "content": doc["content"][:300],
+                "data_id": doc["id"],
+                "document_name": doc["name"],
+                "score": score
+            })
+    matches.sort(key=lambda item: item["score"], reverse=True)
+    matches = matches[:int(body.get("top_k") or 10)]
+    return 200, {"total": len(matches), "list": matches}
+
+
+def _retry_embeddings(state: MockState, body: Dict, query: Dict) -> Tuple[int, Dict]:
+    return 200, {"affectCount": 0}
+
+
+_ROUTES = {
+    ("POST", "/v1/conversation"): (_create_conversation, "conversation"),
+    ("POST", "/v2/conversation/message"): (_send_message, "llm"),
+    ("GET", "/v1/bot/knowledge/base/page"): (_knowledge_bases, "kb"),
+    ("GET", "/v1/bot/doc/query/page"): (_doc_list, "kb"),
+    ("POST", "/v1/bot/doc/text/add"): (_add_documents, "kb"),
+    ("POST", "/v1/bot/doc/spreadsheet/add"): (_add_documents, "kb"),
+    ("PUT", "/v1/bot/doc/text/update"): (_update_documents, "kb"),
+    ("PUT", "/v1/bot/doc/spreadsheet/update"): (_update_documents, "kb"),
+    ("DELETE", "/v1/bot/doc/batch/delete"): (_delete_documents, "kb"),
+    ("POST", "/v1/bot/doc/chunks/add"): (_add_chunks, "kb"),
+    ("GET", "/v1/bot/data/detail/list"): (_doc_status, "kb"),
+    ("POST", "/v1/vector/match"): (_vector_match, "kb"),
+    ("POST", "/v1/bot/data/retry/batch"): (_retry_embeddings, "kb"),
+}
+
+
+class MockGPTBotsServer:
+    def __init__(self, profile: Dict = None, host: str = "127.0.0.1", port: int = 0):
+        """
+        初始化模拟服务
+
+        Args:
+            profile: 压测配置，按键覆盖 DEFAULT_PROFILE
+            host: 监听地址
+            port: 监听端口，0表示随机分配
+        """
+        self.state = MockState(profile or {})
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.state = self.state
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """服务地址，可直接作为 GPTBOTS_BASE_URL 使用"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockGPTBotsServer":
+        """在后台线程中启动服务"""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """停止服务"""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def serve_forever(self):
+        """在当前线程中运行服务"""
+        self._server.serve_forever()
+
+    def get_stats(self) -> Dict:
+        """获取请求统计"""
+        return self.state.snapshot()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def main():
+    """命令行启动模拟服务"""
+    parser = argparse.ArgumentParser(description="本地模拟GPTBots服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=19090)
+    parser.add_argument("--profile", help="JSON格式的压测配置文件，按键覆盖默认配置")
+    parser.add_argument("--seed", type=int, help="随机种子")
+    parser.add_argument("--llm-median", type=float, help="LLM调用延迟中位数（秒）")
+    parser.add_argument("--error-429", type=float, help="LLM调用429注入比例")
+    parser.add_argument("--error-5xx", type=float, help="LLM调用5xx注入比例")
+    parser.add_argument("--llm-concurrency", type=int, help="LLM调用并发上限")
+    args = parser.parse_args()
+
+    profile = {}
+    if args.profile:
+        with open(args.profile, "r", encoding="utf-8") as f:
+            profile = json.load(f)
+    overrides = {}
+    if args.seed is not None:
+        overrides["seed"] = args.seed
+    if args.llm_median is not None:
+        overrides["latency"] = {"llm": {"median": args.llm_median}}
+    if args.error_429 is not None or args.error_5xx is not None:
+        overrides["error_rates"] = {"llm": {}}
+        if args.error_429 is not None:
+            overrides["error_rates"]["llm"]["429"] = args.error_429
+        if args.error_5xx is not None:
+            overrides["error_rates"]["llm"]["5xx"] = args.error_5xx
+    if args.llm_concurrency is not None:
+        overrides["max_concurrency"] = {"llm": args.llm_concurrency}
+
+    server = MockGPTBotsServer(_merge_profile(profile, overrides), args.host, args.port)
+    print(f"🧪 模拟GPTBots服务已启动: {server.url}")
+    print(f"💡 设置 GPTBOTS_BASE_URL={server.url} 后启动应用即可使用模拟服务")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n模拟服务已停止")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,548 @@
+#!/usr/bin/env python3
+"""
+流水线吞吐量基准测试
+基于本地模拟GPTBots服务离线测量各处理阶段的端到端吞吐量，语料和延迟均由随机种子决定，结果可复现
+
+使用方式:
+    python -m benchmarks.run_benchmarks
+    python -m benchmarks.run_benchmarks --emails 200 --scenarios llm_sequential,kb_upload --output report.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from email.message import EmailMessage
+from email.utils import format_datetime
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+# 以 `python benchmarks/run_benchmarks.py` 方式运行时保证项目根目录可导入
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.mock_server import MockGPTBotsServer
+
+_PHRASES = [
+    "请确认本周的项目进度", "附件为最新的报价单", "客户反馈系统登录缓慢", "会议改到周四下午三点",
+    "合同条款需要法务再次审核", "服务器将在周末进行维护", "请在月底前提交报销材料",
+    "The shipment has been delayed by two days", "Please review the attached proposal",
+    "We need to align on the Q3 roadmap", "数据库备份任务执行失败", "新版本已部署到测试环境",
+    "请协助排查接口超时问题", "发票信息有误需要重新开具", "Looking forward to your reply"
+]
+
+
+def generate_email_markdown(index: int, rng: random.Random, long_ratio: float = 0.05) -> str:
+    """
+    生成与数据清洗输出格式一致的模拟邮件Markdown
+
+    Args:
+        index: 邮件序号
+        rng: 随机数生成器
+        long_ratio: 超长邮件的比例
+
+    Returns:
+        邮件Markdown内容
+    """
+    if rng.random() < long_ratio:
+        paragraph_count = rng.randint(150, 250)
+    else:
+        paragraph_count = rng.randint(2, 12)
+
+    paragraphs = []
+    for _ in range(paragraph_count):
+        paragraphs.append("，".join(rng.choice(_PHRASES) for _ in range(rng.randint(2, 6))) + "。")
+
+    return "\n".join([
+        f"# 邮件内容 - mail_{index:05d}.eml",
+        "",
+        "## 📧 邮件信息",
+        "",
+        f"- **源文件名**: `mail_{index:05d}.eml`",
+        f"- **发件人**: sender{index % 17}@example.com",
+        f"- **收件人**: team{index % 5}@example.com",
+        f"- **主题**: {rng.choice(_PHRASES)} #{index}",
+        f"- **时间**: 2024-0{index % 9 + 1}-1{index % 9} 10:00:00",
+        "",
+        "## 📄 邮件内容",
+        "",
+        "\n\n".join(paragraphs),
+        "",
+        "---",
+        "*处理时间: 2024-01-01 00:00:00*"
+    ])
+
+
+def generate_corpus(count: int, seed: int) -> List[Tuple[str, str]]:
+    """生成 (文件名, 内容) 列表"""
+    rng = random.Random(seed)
+    return [(f"mail_{index:05d}.md", generate_email_markdown(index, rng)) for index in range(count)]
+
+
+def _percentile(values: List[float], percentile: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+
+def _summarize(name: str, items: int, elapsed: float, latencies: List[float],
+               failures: int, server: MockGPTBotsServer, extra: Dict = None) -> Dict:
+    """汇总单个场景的测量结果"""
+    stats = server.get_stats()
+    result = {
+        "scenario": name,
+        "items": items,
+        "failures": failures,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_per_second": round(items / elapsed, 2) if elapsed else 0.0,
+        "latency_p50": round(_percentile(latencies, 50), 3),
+        "latency_p95": round(_percentile(latencies, 95), 3),
+        "latency_mean": round(statistics.mean(latencies), 3) if latencies else 0.0,
+        "http_requests": sum(stats["requests"].values()),
+        "http_status": stats["status"],
+        "server_max_in_flight": stats["max_in_flight"]
+    }
+    result.update(extra or {})
+    return result
+
+
+def write_eml_corpus(input_dir: Path, count: int, seed: int):
+    """生成模拟EML文件"""
+    rng = random.Random(seed)
+    input_dir.mkdir(parents=True, exist_ok=True)
+    start_date = datetime(2024, 1, 1, 9, 0, 0)
+    for index in range(count):
+        message = EmailMessage()
+        message["From"] = f"sender{index % 17}@example.com"
+        message["To"] = f"team{index % 5}@example.com"
+        message["Subject"] = f"{rng.choice(_PHRASES)} #{index}"
+        message["Date"] = format_datetime(start_date + timedelta(minutes=index))
+        # 附加序号，避免短邮件被去重合并
+        message.set_content(f"编号 {index}\n\n" + "\n\n".join(rng.choice(_PHRASES) for _ in range(rng.randint(3, 30))))
+        (input_dir / f"mail_{index:05d}.eml").write_bytes(message.as_bytes())
+
+
+def bench_cleaning(args) -> Dict:
+    """数据清洗阶段：EML解析、去重、生成Markdown（不依赖模拟服务）"""
+    try:
+        from tools.email_processing import EmailCleaner
+    except Exception as e:
+        return {"scenario": "cleaning", "skipped": f"无法导入EmailCleaner: {e}"}
+
+    with tempfile.TemporaryDirectory() as workdir:
+        input_dir = Path(workdir) / "eml"
+        output_dir = Path(workdir) / "processed"
+        write_eml_corpus(input_dir, args.emails, args.seed)
+
+        cleaner = EmailCleaner(str(input_dir), str(output_dir))
+        start = time.perf_counter()
+        report = cleaner.process_all_emails()
+        elapsed = time.perf_counter() - start
+
+    return {
+        "scenario": "cleaning",
+        "items": args.emails,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_per_second": round(args.emails / elapsed, 2) if elapsed else 0.0,
+        "report": {key: value for key, value in report.items() if isinstance(value, (int, float, str))}
+    }
+
+
+def _run_llm(args, name: str, profile: Dict, pack: bool = False, workers: int = 0) -> Dict:
+    """LLM处理阶段：逐封或经 LLMWorkerPool 并发调用 LLMEmailProcessor（不使用响应缓存）"""
+    from tools.api_clients import GPTBotsAPI
+    from tools.llm_engine import LLMEmailProcessor, LLMWorkerPool
+
+    corpus = generate_corpus(args.emails, args.seed)
+    with MockGPTBotsServer(profile) as server:
+        client = GPTBotsAPI("app-benchmark", base_url=server.url)
+        processor = LLMEmailProcessor(client, "app-benchmark", cache=None)
+
+        latencies = []
+        failures = 0
+        start = time.perf_counter()
+        if pack:
+            processor.prefetch_packed(corpus)
+        if workers:
+            process = processor.process
+
+            def timed_process(content, source_name=None):
+                item_start = time.perf_counter()
+                outcome = process(content, source_name)
+                latencies.append(time.perf_counter() - item_start)
+                return outcome
+
+            def count_failure(index, item, outcome):
+                nonlocal failures
+                if not outcome["content"]:
+                    failures += 1
+
+            processor.process = timed_process
+            pool = LLMWorkerPool(processor, workers=workers, retry_backoff=0.1)
+            pool.run([(source_name, source_name, content) for source_name, content in corpus], count_failure)
+        else:
+            for source_name, content in corpus:
+                item_start = time.perf_counter()
+                outcome = processor.process(content, source_name)
+                latencies.append(time.perf_counter() - item_start)
+                if not outcome["content"]:
+                    failures += 1
+        elapsed = time.perf_counter() - start
+
+        return _summarize(name, len(corpus), elapsed, latencies, failures, server, {
+            "llm_calls": processor.api_calls,
+            "packed_calls": processor.packed_calls,
+            "map_reduce_emails": processor.map_reduce_emails
+        })
+
+
+def bench_llm_sequential(args) -> Dict:
+    return _run_llm(args, "llm_sequential", _profile(args))
+
+
+def bench_llm_concurrent(args) -> Dict:
+    return _run_llm(args, "llm_concurrent", _profile(args), workers=args.workers)
+
+
+def bench_llm_packed(args) -> Dict:
+    return _run_llm(args, "llm_packed", _profile(args), pack=True)
+
+
+def bench_llm_faults(args) -> Dict:
+    """LLM处理阶段：注入429与5xx错误，观察重试、自适应并发和熔断对吞吐的影响"""
+    profile = _profile(args)
+    profile["error_rates"] = {"llm": {"429": args.fault_rate / 2, "5xx": args.fault_rate / 2}}
+    return _run_llm(args, "llm_faults", profile)
+
+
+def _run_kb_upload(args, name: str, concurrent_batches: int) -> Dict:
+    """知识库上传阶段：目录批量上传（每批最多20个文件），比较逐批上传与多批并发上传"""
+    from tools.api_clients import KnowledgeBaseAPI
+
+    corpus = generate_corpus(args.emails, args.seed)
+    with MockGPTBotsServer(_profile(args)) as server, tempfile.TemporaryDirectory() as workdir:
+        for source_name, content in corpus:
+            (Path(workdir) / source_name).write_text(content, encoding="utf-8")
+
+        client = KnowledgeBaseAPI("app-benchmark", base_url=server.url)
+        start = time.perf_counter()
+        results = client.upload_markdown_files_from_directory(workdir, concurrent_batches=concurrent_batches)
+        elapsed = time.perf_counter() - start
+
+        return _summarize(name, len(corpus), elapsed, [], results.get("failed_uploads", 0), server, {
+            "batches": results.get("batches_processed", 0),
+            "concurrent_batches": concurrent_batches
+        })
+
+
+def bench_kb_upload(args) -> Dict:
+    return _run_kb_upload(args, "kb_upload", 1)
+
+
+def bench_kb_upload_concurrent(args) -> Dict:
+    return _run_kb_upload(args, "kb_upload_concurrent", args.upload_batches)
+
+
+def _run_body_encoding(args, name: str, streaming: bool) -> Dict:
+    """
+    知识库上传请求体构建：比较整批读取+base64+JSON序列化与按块流式编码的耗时和峰值内存（不发送请求）
+
+    峰值内存由 tracemalloc 统计Python分配的内存，mmap映射的文件页不计入。
+    """
+    import base64
+    from tools.api_clients.streaming_body import UploadDocument, StreamingDocumentBody
+
+    doc_bytes = int(args.body_doc_mb * 1024 * 1024)
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as workdir:
+        paths = []
+        for index in range(args.body_docs):
+            path = Path(workdir) / f"doc_{index:03d}.md"
+            line = (rng.choice(_PHRASES) + "\n").encode("utf-8")
+            path.write_bytes(line * (doc_bytes // len(line)))
+            paths.append(path)
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        if streaming:
+            body = StreamingDocumentBody([UploadDocument.from_file(path) for path in paths], {"chunk_token": 600})
+            body_bytes = sum(len(chunk) for chunk in body)
+        else:
+            files = []
+            for path in paths:
+                with open(path, "r", encoding="utf-8") as f:
+                    content = f.read()
+                files.append({
+                    "file_name": path.name,
+                    "file_base64": base64.b64encode(content.encode("utf-8")).decode("utf-8"),
+                    "source_url": f"local://{path.name}"
+                })
+            body_bytes = len(json.dumps({"files": files, "chunk_token": 600}).encode("utf-8"))
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {
+        "scenario": name,
+        "items": args.body_docs,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_per_second": round(args.body_docs / elapsed, 2) if elapsed else 0.0,
+        "body_mb": round(body_bytes / 1024 / 1024, 1),
+        "peak_memory_mb": round(peak / 1024 / 1024, 1)
+    }
+
+
+def bench_kb_body_buffered(args) -> Dict:
+    return _run_body_encoding(args, "kb_body_buffered", streaming=False)
+
+
+def bench_kb_body_streaming(args) -> Dict:
+    return _run_body_encoding(args, "kb_body_streaming", streaming=True)
+
+
+def _run_vector_search(args, name: str, use_cache: bool, batch: bool = False) -> Dict:
+    """
+    检索阶段：上传语料后执行向量相似度匹配（查询从固定短语中抽取，存在重复的热门问题），
+    逐条执行或用 vector_search_many 批量并发执行
+    """
+    from tools.api_clients import KnowledgeBaseAPI, VectorSearchCache
+
+    corpus = generate_corpus(min(args.emails, 100), args.seed)
+    rng = random.Random(args.seed)
+    queries = [rng.choice(_PHRASES) for _ in range(args.queries)]
+    with MockGPTBotsServer(_profile(args)) as server, tempfile.TemporaryDirectory() as workdir:
+        for source_name, content in corpus:
+            (Path(workdir) / source_name).write_text(content, encoding="utf-8")
+        client = KnowledgeBaseAPI("app-benchmark", base_url=server.url)
+        client.upload_markdown_files_from_directory(workdir)
+        client.search_cache = VectorSearchCache()
+
+        latencies = []
+        failures = 0
+        extra = {}
+        start = time.perf_counter()
+        if batch:
+            distinct = 0
+            for item in client.vector_search_many(queries, top_k=5, use_cache=use_cache):
+                distinct += 1
+                latencies.append(item["latency"])
+                if not item["result"] or "error" in item["result"]:
+                    failures += len(item["indices"])
+            extra["distinct_queries"] = distinct
+        else:
+            for query in queries:
+                item_start = time.perf_counter()
+                result = client.vector_similarity_search(query, top_k=5, use_cache=use_cache)
+                latencies.append(time.perf_counter() - item_start)
+                if not result or "error" in result:
+                    failures += 1
+        elapsed = time.perf_counter() - start
+
+        if use_cache:
+            extra["cache_hit_rate"] = round(client.search_cache.get_stats()["hit_rate"], 3)
+        return _summarize(name, len(queries), elapsed, latencies, failures, server, extra)
+
+
+def bench_vector_search(args) -> Dict:
+    return _run_vector_search(args, "vector_search", use_cache=False)
+
+
+def bench_vector_search_cached(args) -> Dict:
+    return _run_vector_search(args, "vector_search_cached", use_cache=True)
+
+
+def bench_vector_search_batch(args) -> Dict:
+    return _run_vector_search(args, "vector_search_batch", use_cache=False, batch=True)
+
+
+def _run_pipeline(args, name: str, streaming: bool) -> Dict:
+    """全自动流水线：清洗 -> LLM处理 -> 知识库上传，比较按阶段依次执行与流式并行执行"""
+    try:
+        from tools.auto_pipeline import AutoProcessingPipeline
+    except Exception as e:
+        return {"scenario": name, "skipped": f"无法导入AutoProcessingPipeline: {e}"}
+    from config import DIRECTORIES, JOBS_CONFIG
+
+    with MockGPTBotsServer(_profile(args)) as server, tempfile.TemporaryDirectory() as workdir:
+        os.environ["GPTBOTS_BASE_URL"] = server.url
+        for key in ("upload_dir", "processed_dir", "final_dir"):
+            DIRECTORIES[key] = str(Path(workdir) / key)
+        JOBS_CONFIG["db_path"] = str(Path(workdir) / "jobs.db")
+        write_eml_corpus(Path(DIRECTORIES["upload_dir"]), args.emails, args.seed)
+
+        pipeline = AutoProcessingPipeline({
+            "llm_api_key": "app-benchmark",
+            "kb_api_key": "app-benchmark",
+            "knowledge_base_id": "",
+            "chunk_token": 600,
+            "workers": args.workers,
+            "delay": 0,
+            "bypass_llm_cache": True,
+            "streaming": streaming
+        })
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = pipeline.run_processing_steps()
+        elapsed = time.perf_counter() - start
+
+        extra = {
+            "success": results["success"],
+            "kb_uploaded": results["kb_uploaded_count"]
+        }
+        if results.get("stream_stats"):
+            extra["first_upload_seconds"] = results["stream_stats"][-1]["first_output_seconds"]
+            extra["stages"] = results["stream_stats"]
+        return _summarize(name, args.emails, elapsed, [], len(results["errors"]), server, extra)
+
+
+def bench_pipeline_barrier(args) -> Dict:
+    return _run_pipeline(args, "pipeline_barrier", streaming=False)
+
+
+def bench_pipeline_streaming(args) -> Dict:
+    return _run_pipeline(args, "pipeline_streaming", streaming=True)
+
+
+SCENARIOS: Dict[str, Callable] = {
+    "cleaning": bench_cleaning,
+    "llm_sequential": bench_llm_sequential,
+    "llm_concurrent": bench_llm_concurrent,
+    "llm_packed": bench_llm_packed,
+    "llm_faults": bench_llm_faults,
+    "kb_upload": bench_kb_upload,
+    "kb_upload_concurrent": bench_kb_upload_concurrent,
+    "kb_body_buffered": bench_kb_body_buffered,
+    "kb_body_streaming": bench_kb_body_streaming,
+    "vector_search": bench_vector_search,
+    "vector_search_cached": bench_vector_search_cached,
+    "vector_search_batch": bench_vector_search_batch,
+    "pipeline_barrier": bench_pipeline_barrier,
+    "pipeline_streaming": bench_pipeline_streaming,
+}
+
+
+def _profile(args) -> Dict:
+    """根据命令行参数构建模拟服务配置"""
+    return {
+        "seed": args.seed,
+        "latency": {
+            "llm": {"median": args.llm_median},
+            "kb": {"distribution": "uniform", "low": args.kb_latency * 0.5, "high": args.kb_latency * 1.5}
+        }
+    }
+
+
+def _isolate_runtime_paths(root: Path):
+    """将缓存、任务数据库、日志和指标文件重定向到临时目录，压测不在项目目录中留下运行产物"""
+    from config import DIRECTORIES, JOBS_CONFIG, LOGGING_CONFIG, METRICS_CONFIG
+
+    DIRECTORIES["cache_dir"] = str(root / "cache")
+    DIRECTORIES["logs_dir"] = str(root / "logs")
+    JOBS_CONFIG["db_path"] = str(root / "jobs.db")
+    METRICS_CONFIG["textfile_path"] = str(root / "logs" / "api_metrics.prom")
+    for key in ("activity_log", "api_log", "kb_log"):
+        LOGGING_CONFIG[key] = str(root / "logs" / Path(LOGGING_CONFIG[key]).name)
+
+
+def _run_scenario(name: str, args) -> Dict:
+    """在独立进程中运行场景，避免进程内共享的并发控制器、熔断器等状态相互影响"""
+    # API客户端在导入时会配置INFO级别日志，压测期间只保留警告及以上
+    logging.disable(logging.INFO)
+    with tempfile.TemporaryDirectory() as runtime_dir:
+        # 必须在导入API客户端之前重定向，日志文件在导入时打开
+        _isolate_runtime_paths(Path(runtime_dir))
+        try:
+            return SCENARIOS[name](args)
+        except Exception as e:
+            return {"scenario": name, "skipped": f"{type(e).__name__}: {e}"}
+
+
+def run_benchmarks(args) -> List[Dict]:
+    """
+    依次运行选定的基准场景
+
+    Returns:
+        各场景的测量结果列表
+    """
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for name in args.scenarios:
+        print(f"▶️ 运行场景: {name}", flush=True)
+        with context.Pool(1) as pool:
+            result = pool.apply(_run_scenario, (name, args))
+        results.append(result)
+    return results
+
+
+def print_report(results: List[Dict]):
+    """打印结果汇总表"""
+    header = (f"{'场景':<16}{'条目':>6}{'失败':>6}{'耗时(s)':>10}{'吞吐(/s)':>10}{'P50(s)':>9}{'P95(s)':>9}"
+              f"{'HTTP请求':>10}{'峰值内存(MB)':>14}")
+    print("\n" + header)
+    print("-" * len(header))
+    for result in results:
+        if "skipped" in result:
+            print(f"{result['scenario']:<16}跳过: {result['skipped']}")
+            continue
+        print(
+            f"{result['scenario']:<16}{result['items']:>6}{result.get('failures', 0):>6}"
+            f"{result['elapsed_seconds']:>10.2f}{result['throughput_per_second']:>10.2f}"
+            f"{result.get('latency_p50', 0):>9.3f}{result.get('latency_p95', 0):>9.3f}"
+            f"{result.get('http_requests', 0):>10}{result.get('peak_memory_mb', '-'):>14}"
+        )
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="邮件处理流水线吞吐量基准测试（使用本地模拟GPTBots服务）")
+    parser.add_argument("--emails", type=int, default=100, help="模拟邮件数量")
+    parser.add_argument("--queries", type=int, default=50, help="检索场景的查询数量")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子（语料与延迟）")
+    parser.add_argument("--llm-median", type=float, default=0.2, help="模拟LLM调用延迟中位数（秒）")
+    parser.add_argument("--workers", type=int, default=8, help="llm_concurrent 与 pipeline_* 场景的LLM工作线程数")
+    parser.add_argument("--kb-latency", type=float, default=0.05, help="模拟知识库接口平均延迟（秒）")
+    parser.add_argument("--upload-batches", type=int, default=4, help="kb_upload_concurrent 场景同时在途的上传批次数")
+    parser.add_argument("--body-docs", type=int, default=20, help="kb_body_* 场景单批文档数")
+    parser.add_argument("--body-doc-mb", type=float, default=2.0, help="kb_body_* 场景单个文档大小（MB）")
+    parser.add_argument("--fault-rate", type=float, default=0.1, help="llm_faults 场景的错误注入比例")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"逗号分隔的场景列表，可选: {', '.join(SCENARIOS)}")
+    parser.add_argument("--output", help="将结果写入JSON文件")
+    args = parser.parse_args()
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知场景: {', '.join(unknown)}")
+
+    results = run_benchmarks(args)
+    print_report(results)
+
+    if args.output:
+        report = {
+            "generated_at": datetime.now().isoformat(timespec="seconds"),
+            "parameters": {
+                "emails": args.emails, "queries": args.queries, "seed": args.seed,
+                "llm_median": args.llm_median, "fault_rate": args.fault_rate,
+                "workers": args.workers, "kb_latency": args.kb_latency, "upload_batches": args.upload_batches,
+                "body_docs": args.body_docs, "body_doc_mb": args.body_doc_mb
+            },
+            "results": results
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n📄 结果已保存: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,23 @@ from .settings import (
     APP_CONFIG,
     DIRECTORIES,
     API_CONFIG,
+    CONCURRENCY_CONFIG,
+    HEDGING_CONFIG,
+    CIRCUIT_BREAKER_CONFIG,
+    CIRCUIT_RETRY_CONFIG,
+    KB_UPLOAD_CONFIG,
+    KB_REQUEST_CONFIG,
+    KB_CHUNKING_CONFIG,
+    KB_MIRROR_CONFIG,
+    VECTOR_SEARCH_CACHE_CONFIG,
+    VECTOR_SEARCH_BATCH_CONFIG,
+    TRANSPORT_CONFIG,
+    METRICS_CONFIG,
+    LLM_CONFIG,
+    JOBS_CONFIG,
+    DEAD_LETTER_CONFIG,
+    EMBEDDING_STATUS_CONFIG,
+    PIPELINE_CONFIG,
     NAVIGATION,
     LOGGING_CONFIG,
     FILE_CONFIG,
@@ -14,6 +31,8 @@ from .settings import (
     get_api_key,
     get_available_api_keys,
     get_api_key_display_name,
+    get_llm_split_threshold,
+    get_api_base_url,
     init_directories,
     get_full_config
 )
@@ -25,6 +44,23 @@ __all__ = [
     'APP_CONFIG',
     'DIRECTORIES', 
     'API_CONFIG',
+    'CONCURRENCY_CONFIG',
+    'HEDGING_CONFIG',
+    'CIRCUIT_BREAKER_CONFIG',
+    'CIRCUIT_RETRY_CONFIG',
+    'KB_UPLOAD_CONFIG',
+    'KB_REQUEST_CONFIG',
+    'KB_CHUNKING_CONFIG',
+    'KB_MIRROR_CONFIG',
+    'VECTOR_SEARCH_CACHE_CONFIG',
+    'VECTOR_SEARCH_BATCH_CONFIG',
+    'TRANSPORT_CONFIG',
+    'METRICS_CONFIG',
+    'LLM_CONFIG',
+    'JOBS_CONFIG',
+    'DEAD_LETTER_CONFIG',
+    'EMBEDDING_STATUS_CONFIG',
+    'PIPELINE_CONFIG',
     'NAVIGATION',
     'LOGGING_CONFIG',
     'FILE_CONFIG',
@@ -33,6 +69,8 @@ __all__ = [
     'get_api_key',
     'get_available_api_keys',
     'get_api_key_display_name',
+    'get_llm_split_threshold',
+    'get_api_base_url',
     'init_directories',
     'get_full_config'
 ]
@@ -20,6 +20,7 @@ DIRECTORIES = {
     "output_dir": "eml_process/output", 
     "processed_dir": "eml_process/processed",
     "final_dir": "eml_process/final_output",
+    "cache_dir": "eml_process/cache",
     "logs_dir": "logs",
     "config_dir": "config"
 }
@@ -33,6 +34,178 @@ API_CONFIG = {
     "max_retries": 3
 }
 
+# 自适应并发配置（AIMD：加性增、乘性减）
+CONCURRENCY_CONFIG = {
+    "llm": {
+        "initial_limit": 2,
+        "min_limit": 1,
+        "max_limit": 16,
+        "additive_step": 1,
+        "multiplicative_factor": 0.5,
+        "latency_target": 60.0,  # 秒，平均延迟超过该值视为不健康
+        "error_rate_threshold": 0.1,
+        "window_size": 20,
+        "cooldown_seconds": 5.0
+    },
+    "kb": {
+        "initial_limit": 2,
+        "min_limit": 1,
+        "max_limit": 8,
+        "additive_step": 1,
+        "multiplicative_factor": 0.5,
+        "latency_target": 30.0,
+        "error_rate_threshold": 0.1,
+        "window_size": 20,
+        "cooldown_seconds": 5.0
+    }
+}
+
+# 对冲请求配置（GPTBots调用超过延迟分位数仍未返回时，发起一次重复请求）
+HEDGING_CONFIG = {
+    "enabled": False,
+    "percentile": 95,             # 以历史延迟的该分位数作为对冲等待时间
+    "min_delay_seconds": 5.0,     # 对冲等待时间下限
+    "min_samples": 20,            # 样本不足时不发起对冲
+    "window_size": 500,           # 延迟统计窗口
+    "budget_ratio": 0.1,          # 对冲请求最多占主请求的比例
+    "budget_burst": 3             # 对冲预算的突发上限
+}
+
+# 熔断器配置（GPTBots与知识库API共用同一后端，共享一个熔断器）
+CIRCUIT_BREAKER_CONFIG = {
+    "gptbots": {
+        "failure_threshold": 5,          # 连续失败多少次后熔断
+        "recovery_timeout": 30.0,        # 熔断后等待多久发起探测（秒）
+        "max_recovery_timeout": 300.0,   # 探测连续失败时等待时间翻倍的上限（秒）
+        "half_open_max_calls": 1         # 半开状态下允许同时进行的探测请求数
+    }
+}
+
+# 熔断期间的处理方式
+CIRCUIT_RETRY_CONFIG = {
+    "park_on_open": True,                # True: 暂存到重试队列，恢复后自动处理；False: 立即失败
+    "max_wait_seconds": 1800             # 重试队列最长等待时间（秒）
+}
+
+# 知识库批量上传配置
+KB_UPLOAD_CONFIG = {
+    "concurrent_batches": 3,       # 同时在途的上传批次数，1表示逐批上传（下一批仍在上传期间预先读取编码）
+    "requests_per_second": 1.0,    # 上传请求的发起速率上限，避免触发API限流
+    "max_batch_docs": 20,          # 单批最大文档数（接口上限）
+    "max_request_bytes": 8 * 1024 * 1024  # 单次上传请求体上限（base64编码后），按大小装箱避免大文件批次超时
+}
+
+# 知识库API请求超时与重试配置
+KB_REQUEST_CONFIG = {
+    "connect_timeout": 10,         # 建立连接超时（秒）
+    "read_timeout": 300,           # 等待响应超时（秒），调用方未指定超时时使用
+    "max_retries": 3,              # 失败后的最大重试次数
+    "backoff_base": 1.0,           # 退避基数（秒），第n次重试在 0 ~ base*2^(n-1) 之间随机等待
+    "backoff_max": 30.0,           # 单次退避等待上限（秒）
+    "retry_statuses": [429, 502, 503, 504],  # 可重试的HTTP状态码（新增类请求只重试429）
+    "reconcile_adds": True,        # 新增文档请求结果不确定（超时、5xx）时查询文档列表确认已创建的文档，只重发缺失的文档
+    "reconcile_time_margin": 300   # 确认已创建的文档时，创建时间早于请求发出时间多少秒内仍视为本次创建（容忍与服务端的时钟偏差）
+}
+
+# 知识库本地分块上传配置（本地按标题和Token数分块，跳过已上传的重复知识块）
+KB_CHUNKING_CONFIG = {
+    "max_parallel": 4,             # 同时上传的文件数（实际并发仍受自适应并发控制限制）
+    "chunks_per_request": 50       # 单次添加知识块请求的最大知识块数
+}
+
+# 知识库文档本地镜像配置（知识库页面浏览/搜索全部文档）
+KB_MIRROR_CONFIG = {
+    "page_size": 100,              # 文档列表每页数量（接口范围10-100）
+    "prefetch_pages": 4,           # 同时请求的页数
+    "page_retries": 2,             # 单页获取失败（如限流）后的重试次数
+    "write_batch_size": 500,       # 每批写入镜像的文档数
+    "display_limit": 500           # 页面单次显示的最大文档数
+}
+
+# 向量检索结果缓存配置（相同问题和检索参数直接返回缓存结果）
+VECTOR_SEARCH_CACHE_CONFIG = {
+    "enabled": True,
+    "max_entries": 1000,           # 最多缓存的检索结果数，超出时淘汰最久未使用的
+    "ttl_seconds": 300             # 缓存有效期（秒），本应用上传/更新/删除文档时相关缓存立即失效
+}
+
+# 批量向量检索配置（评测、问答预取等一次执行大量检索）
+VECTOR_SEARCH_BATCH_CONFIG = {
+    "max_parallel": 8              # 同时在途的检索数（实际并发仍受自适应并发控制限制）
+}
+
+# HTTP传输配置（进程内所有API客户端共用一个连接池）
+TRANSPORT_CONFIG = {
+    "pool_connections": 4,        # 缓存的主机连接池数量
+    "pool_maxsize": 0,            # 每个主机的最大连接数，0表示按并发上限自动计算
+    "pool_block": False,          # 连接用尽时是否阻塞等待
+    "gzip_requests": False,       # 是否对较大的JSON请求体进行gzip压缩（需服务端支持 Content-Encoding: gzip）
+    "gzip_min_bytes": 64 * 1024,  # 超过该字节数的请求体才压缩
+    "gzip_level": 5
+}
+
+# API调用指标配置
+METRICS_CONFIG = {
+    "enabled": True,
+    "textfile_path": "logs/api_metrics.prom",   # Prometheus文本文件，留空表示不写文件
+    "export_interval": 15,                      # 写文件间隔（秒）
+    "http_host": "127.0.0.1",
+    "http_port": 0                              # 本地 /metrics 接口端口，0表示不启动（可用 GPTBOTS_METRICS_PORT 覆盖）
+}
+
+# LLM处理配置
+LLM_CONFIG = {
+    "cache_max_size_mb": 500,     # 响应缓存总大小上限
+    "cache_max_age_days": 30,     # 响应缓存最长保留天数
+    "cache_evict_interval": 50,   # 每写入多少条缓存执行一次淘汰
+    "pack_token_budget": 3000,    # 合并处理时单次调用的Token预算
+    "pack_max_emails": 8,         # 合并处理时单次调用的最大邮件数
+    "pack_small_email_tokens": 800,  # 低于该Token数的邮件才参与合并
+    "split_threshold_tokens": 6000,  # 超过该Token数的邮件走分块+汇总（map-reduce）处理
+    "map_workers": 4,             # 分块并发处理的线程数
+    "workers": 4,                 # 并发处理文件的工作线程数
+    "file_max_retries": 2,        # 单个文件处理失败后的重试次数
+    "file_retry_backoff": 2.0     # 文件重试退避基数（秒）
+}
+
+# 后台任务配置
+JOBS_CONFIG = {
+    "db_path": "eml_process/jobs.db",  # 任务表（SQLite）
+    "max_workers": 2,                  # 同时运行的后台任务数
+    "poll_interval": 1.0,              # 页面轮询任务状态的间隔（秒）
+    "history_limit": 10                # 页面显示的历史任务数
+}
+
+# 死信队列配置（LLM处理/知识库上传失败的文件）
+DEAD_LETTER_CONFIG = {
+    "auto_retry": True,            # 后台定时自动重放到期的死信
+    "scheduler_interval": 30,      # 检查到期死信的间隔（秒）
+    "retry_base_seconds": 60,      # 首次失败后的重试等待时间，之后每次失败翻倍
+    "retry_max_seconds": 3600,     # 重试等待时间上限
+    "max_attempts": 5              # 累计失败达到该次数后不再自动重试，可手动重放
+}
+
+# 文档向量化状态轮询配置（上传后跟踪文档何时可被检索）
+EMBEDDING_STATUS_CONFIG = {
+    "enabled": True,
+    "query_batch_size": 50,        # 单次状态查询的文档ID数（GET参数，过多会超出URL长度限制）
+    "min_interval": 2.0,           # 有文档状态变化时的轮询间隔（秒）
+    "max_interval": 60.0,          # 连续无变化时间隔按倍数增长的上限（秒）
+    "backoff_factor": 2.0,         # 连续无变化时轮询间隔的增长倍数
+    "retry_cooldown": 120,         # 同一API Key两次触发重新嵌入的最小间隔（秒）
+    "max_embedding_retries": 3,    # 单个文档向量化失败后自动重新嵌入的次数
+    "max_wait_seconds": 3600       # 上传后超过该时间仍未可检索则停止跟踪（标记为超时）
+}
+
+# 全自动流水线配置
+PIPELINE_CONFIG = {
+    "streaming": True,             # 清洗/LLM/知识库上传通过有界队列连接并行运行
+    "queue_size": 20,              # 阶段间队列容量，下游处理不过来时上游阻塞（背压）
+    "upload_workers": 1,           # 知识库上传阶段的工作线程数
+    "upload_batch_size": 10,       # 单次上传的最大文件数
+    "upload_linger_seconds": 2.0   # 凑批等待时间：首个文件到达后最多等待多久再上传
+}
+
 # 导航配置
 NAVIGATION = {
     "options": [
@@ -89,6 +262,13 @@ def get_env_config():
             "3": os.getenv("GPTBOTS_KB_API_KEY_3", "")
         },
         
+        # LLM Bot分块阈值（Token数，与LLM API Key编号对应，0表示使用默认值）
+        "llm_split_thresholds": {
+            "1": int(os.getenv("GPTBOTS_LLM_SPLIT_TOKENS_1", "0")),
+            "2": int(os.getenv("GPTBOTS_LLM_SPLIT_TOKENS_2", "0")),
+            "3": int(os.getenv("GPTBOTS_LLM_SPLIT_TOKENS_3", "0"))
+        },
+        
         # 问答系统API Keys (支持多个编号)
         "qa_api_keys": {
             "1": os.getenv("GPTBOTS_QA_API_KEY_1", "app-AYGRiA6TP12EeP1A0FgoRc6O"),
@@ -168,6 +348,39 @@ def get_available_api_keys(purpose):
     return {k: v for k, v in api_keys.items() if v.strip()}
 
 
+def get_llm_split_threshold(api_key):
+    """
+    获取指定LLM Bot的分块阈值
+    
+    Args:
+        api_key: LLM API Key
+    
+    Returns:
+        int: 超过该Token数的邮件将走分块+汇总处理
+    """
+    env_config = get_env_config()
+    
+    for key_number, llm_key in env_config["llm_api_keys"].items():
+        if llm_key and llm_key == api_key:
+            threshold = env_config["llm_split_thresholds"].get(key_number, 0)
+            if threshold > 0:
+                return threshold
+    
+    return LLM_CONFIG["split_threshold_tokens"]
+
+
+def get_api_base_url():
+    """
+    获取GPTBots API服务地址
+    
+    可通过环境变量 GPTBOTS_BASE_URL 覆盖（例如指向本地模拟服务进行压测）
+    
+    Returns:
+        str: 不带末尾斜杠的服务地址
+    """
+    return (os.getenv("GPTBOTS_BASE_URL") or API_CONFIG["base_url"]).rstrip("/")
+
+
 def get_api_key_display_name(purpose, key_number):
     """
     获取API Key的显示名称
@@ -195,6 +408,23 @@ def get_full_config():
         "app": APP_CONFIG,
         "directories": DIRECTORIES,
         "api": API_CONFIG,
+        "concurrency": CONCURRENCY_CONFIG,
+        "hedging": HEDGING_CONFIG,
+        "circuit_breaker": CIRCUIT_BREAKER_CONFIG,
+        "circuit_retry": CIRCUIT_RETRY_CONFIG,
+        "kb_upload": KB_UPLOAD_CONFIG,
+        "kb_request": KB_REQUEST_CONFIG,
+        "kb_chunking": KB_CHUNKING_CONFIG,
+        "kb_mirror": KB_MIRROR_CONFIG,
+        "vector_search_cache": VECTOR_SEARCH_CACHE_CONFIG,
+        "vector_search_batch": VECTOR_SEARCH_BATCH_CONFIG,
+        "transport": TRANSPORT_CONFIG,
+        "metrics": METRICS_CONFIG,
+        "llm": LLM_CONFIG,
+        "jobs": JOBS_CONFIG,
+        "dead_letters": DEAD_LETTER_CONFIG,
+        "embedding_status": EMBEDDING_STATUS_CONFIG,
+        "pipeline": PIPELINE_CONFIG,
         "navigation": NAVIGATION,
         "logging": LOGGING_CONFIG,
         "file": FILE_CONFIG,
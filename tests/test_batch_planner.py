@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+上传批次规划测试
+每批不超过文档数和请求体上限，超过上限的单个文件单独成批，批次顺序与输入顺序一致
+"""
+
+import tempfile
+import unittest
+from pathlib import Path
+
+from tools.api_clients.batch_planner import encoded_doc_size, plan_upload_batches, _REQUEST_OVERHEAD_BYTES
+
+
+class PlanUploadBatchesTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self._tmp.name)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def make(self, sizes):
+        files = []
+        for i, size in enumerate(sizes):
+            path = self.dir / f"mail-{i:02d}.md"
+            path.write_bytes(b"x" * size)
+            files.append(path)
+        return files
+
+    @staticmethod
+    def request_bytes(batch):
+        return _REQUEST_OVERHEAD_BYTES + sum(encoded_doc_size(path.stat().st_size, path.name) for path in batch)
+
+    def test_respects_doc_and_byte_caps(self):
+        files = self.make([3000, 100, 5000, 200, 4000, 300, 2500, 50, 1200, 800] * 3)
+        max_bytes = 20000
+
+        batches = plan_upload_batches(files, max_docs=4, max_bytes=max_bytes)
+
+        self.assertEqual(sorted(path for batch in batches for path in batch), sorted(files))
+        for batch in batches:
+            self.assertLessEqual(len(batch), 4)
+            self.assertLessEqual(self.request_bytes(batch), max_bytes)
+
+    def test_small_files_share_batches(self):
+        files = self.make([100] * 45)
+        batches = plan_upload_batches(files, max_docs=20, max_bytes=10 * 1024 * 1024)
+        self.assertEqual([len(batch) for batch in batches], [20, 20, 5])
+
+    def test_oversized_file_gets_its_own_batch(self):
+        files = self.make([100, 50000, 100])
+        batches = plan_upload_batches(files, max_docs=20, max_bytes=10000)
+
+        self.assertIn([files[1]], batches)
+        self.assertEqual(len(batches), 2)
+
+    def test_order_is_stable(self):
+        files = self.make([900, 100, 800, 200, 700, 300, 600, 400])
+        batches = plan_upload_batches(files, max_docs=3, max_bytes=10 * 1024 * 1024)
+
+        for batch in batches:
+            self.assertEqual(batch, sorted(batch, key=files.index))
+        firsts = [files.index(batch[0]) for batch in batches]
+        self.assertEqual(firsts, sorted(firsts))
+        self.assertEqual(batches, plan_upload_batches(list(files), max_docs=3, max_bytes=10 * 1024 * 1024))
+
+    def test_missing_file_counts_as_empty(self):
+        files = self.make([100]) + [self.dir / "missing.md"]
+        self.assertEqual(plan_upload_batches(files, max_docs=20, max_bytes=10000), [files])
+
+
+if __name__ == "__main__":
+    unittest.main()
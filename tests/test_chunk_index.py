@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+共享知识块回归测试
+删除持有共享知识块的文档后，知识块重新上传到仍引用它的文件的文档中，不会从知识库中缺失；
+同时上传的文件中认领共享知识块的文件上传失败时，由其他文件重新上传该知识块
+"""
+
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from tools.jobs.chunk_index import ChunkIndex
+from tools.jobs.kb_manifest import KBManifest
+from tools.kb_chunker import chunk_markdown, upload_chunked_files
+from tools.kb_sync import apply_kb_sync
+
+_SHARED = "-----Original Message-----\nFrom: sender@example.com\n\n这是被多封回复引用的历史邮件正文。"
+
+
+class FakeKnowledgeBase:
+    def __init__(self):
+        self.docs = {}
+
+    def upload_markdown_content(self, content, filename=None, knowledge_base_id=None, splitter=None):
+        doc_id = f"doc-{len(self.docs) + 1}"
+        self.docs[doc_id] = [content]
+        return {"doc_id": doc_id}
+
+    def add_document_chunks(self, doc_id, chunks):
+        self.docs[doc_id].extend(chunk["content"] for chunk in chunks)
+        return {"code": 0}
+
+    def delete_documents(self, doc_ids):
+        for doc_id in doc_ids:
+            self.docs.pop(doc_id, None)
+        return {"code": 0}
+
+    def contains(self, text):
+        return any(text in content for chunks in self.docs.values() for content in chunks)
+
+
+class RacingKnowledgeBase(FakeKnowledgeBase):
+    """两个文件都完成知识块认领后才创建文档，第一次添加共享知识块失败"""
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._both_claimed = threading.Event()
+        self._creates = 0
+        self.shared_failures = 0
+
+    def upload_markdown_content(self, content, filename=None, knowledge_base_id=None, splitter=None):
+        with self._lock:
+            self._creates += 1
+            if self._creates == 2:
+                self._both_claimed.set()
+            created = super().upload_markdown_content(content, filename, knowledge_base_id, splitter)
+        self._both_claimed.wait(5)
+        return created
+
+    def add_document_chunks(self, doc_id, chunks):
+        with self._lock:
+            if any("历史邮件正文" in chunk["content"] for chunk in chunks) and not self.shared_failures:
+                self.shared_failures += 1
+                return {"error": True, "message": "服务端错误"}
+            return super().add_document_chunks(doc_id, chunks)
+
+
+class SharedChunkTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        root = Path(self._tmp.name)
+        self.index = ChunkIndex(str(root / "jobs.db"))
+        self.manifest = KBManifest(str(root / "jobs.db"))
+        self.client = FakeKnowledgeBase()
+        self.dir = root / "final"
+        self.dir.mkdir()
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def write(self, name, reply):
+        path = self.dir / name
+        path.write_text(f"# 邮件\n\n{reply}\n\n{_SHARED}\n", encoding="utf-8")
+        return path
+
+    def upload(self, path):
+        result = upload_chunked_files(self.client, [path], "kb", index=self.index)
+        return result["uploaded_files"][0]["doc_id"] if result["uploaded_files"] else None
+
+    def delete(self, path, doc_id):
+        plan = {"new": [], "changed": [], "unchanged": [], "doc_ids": {}, "hashes": {},
+                "removed": [{"doc_id": doc_id, "path": str(path.resolve()), "name": path.name}]}
+        with mock.patch("tools.kb_sync.get_chunk_index", return_value=self.index), \
+                mock.patch("tools.kb_chunker.get_chunk_index", return_value=self.index):
+            return apply_kb_sync(self.client, plan, "kb", manifest=self.manifest)
+
+    def test_shared_chunk_moves_to_surviving_document(self):
+        first, second = self.write("a.md", "第一封回复"), self.write("b.md", "第二封回复")
+        first_doc, second_doc = self.upload(first), self.upload(second)
+        self.assertEqual(len(self.client.docs[second_doc]), 1)
+
+        result = self.delete(first, first_doc)
+        self.assertEqual(result["chunks_reuploaded"], 1)
+        self.assertTrue(self.client.contains("这是被多封回复引用的历史邮件正文"))
+        self.assertEqual(len(self.client.docs[second_doc]), 2)
+
+        shared_hash = chunk_markdown(second.read_text(encoding="utf-8"))[-1]["hash"]
+        self.assertEqual(self.index.known("kb", [shared_hash]), {shared_hash})
+
+    def test_duplicate_only_file_gets_its_own_document(self):
+        first = self.write("a.md", "同一封回复")
+        first_doc = self.upload(first)
+        copy = self.write("copy.md", "同一封回复")
+        self.assertIsNone(self.upload(copy))
+
+        result = self.delete(first, first_doc)
+        self.assertEqual(result["chunks_reuploaded"], 2)
+        self.assertEqual(len(self.client.docs), 1)
+        self.assertTrue(self.client.contains("同一封回复"))
+        self.assertTrue(self.client.contains("这是被多封回复引用的历史邮件正文"))
+
+    def test_failed_claim_is_uploaded_by_waiting_file(self):
+        files = [self.write("a.md", "第一封回复"), self.write("b.md", "第二封回复")]
+        self.client = RacingKnowledgeBase()
+        statuses = {}
+
+        result = upload_chunked_files(self.client, files, "kb", index=self.index, max_parallel=2,
+                                      file_callback=lambda name, status, detail: statuses.__setitem__(name, status))
+
+        self.assertEqual(self.client.shared_failures, 1)
+        self.assertEqual((result["successful_uploads"], result["failed_uploads"]), (1, 1))
+        survivor_doc = result["uploaded_files"][0]["doc_id"]
+        self.assertEqual(len(self.client.docs[survivor_doc]), 2)
+        self.assertTrue(any("历史邮件正文" in content for content in self.client.docs[survivor_doc]))
+        self.assertEqual(sorted(statuses.values()), ["done", "failed"])
+
+        shared_hash = chunk_markdown(files[0].read_text(encoding="utf-8"))[-1]["hash"]
+        self.assertEqual(self.index.known("kb", [shared_hash]), {shared_hash})
+
+    def test_unshared_chunks_are_dropped(self):
+        first = self.write("a.md", "唯一的回复")
+        first_doc = self.upload(first)
+
+        result = self.delete(first, first_doc)
+        self.assertEqual(result["chunks_reuploaded"], 0)
+        self.assertEqual(self.index.count("kb"), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
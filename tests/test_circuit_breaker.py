@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+熔断器探测名额回归测试
+半开状态下放行的探测请求无论以何种异常结束，都必须向熔断器记录结果，否则探测名额无法归还，
+共享熔断器将一直拒绝请求
+"""
+
+import time
+import unittest
+from unittest import mock
+
+import requests
+
+from tools.api_clients.circuit_breaker import CircuitBreaker, OPEN, HALF_OPEN, CLOSED
+from tools.api_clients.gptbots_api import GPTBotsAPI
+from tools.api_clients.knowledge_base_api import KnowledgeBaseAPI
+
+
+def _half_open_breaker() -> CircuitBreaker:
+    breaker = CircuitBreaker("test", failure_threshold=1, recovery_timeout=0.01, max_recovery_timeout=0.01)
+    breaker.record_failure("测试")
+    time.sleep(0.02)
+    assert breaker.state == HALF_OPEN
+    return breaker
+
+
+def _ok_response() -> mock.Mock:
+    response = mock.Mock(status_code=200, text="{}", content=b"{}")
+    response.json.return_value = {"conversation_id": "c1"}
+    return response
+
+
+class ProbeReleaseTest(unittest.TestCase):
+    def assert_probe_released(self, breaker: CircuitBreaker):
+        self.assertEqual(breaker._probes_in_flight, 0)
+        time.sleep(0.05)
+        self.assertTrue(breaker.allow_request())
+
+    def test_send_message_chunked_encoding_error(self):
+        breaker = _half_open_breaker()
+        client = GPTBotsAPI("app-test", base_url="http://127.0.0.1:1")
+        client.circuit = breaker
+        client.session = mock.Mock()
+        client.session.post.side_effect = requests.exceptions.ChunkedEncodingError("连接中断")
+
+        self.assertIsNone(client.send_message("c1", "hello", max_retries=1))
+        self.assertEqual(breaker.state, OPEN)
+        self.assert_probe_released(breaker)
+
+    def test_send_message_metrics_error_after_response(self):
+        breaker = _half_open_breaker()
+        client = GPTBotsAPI("app-test", base_url="http://127.0.0.1:1")
+        client.circuit = breaker
+        client.session = mock.Mock()
+        client.session.post.return_value = _ok_response()
+
+        with mock.patch("tools.api_clients.gptbots_api.record_http", side_effect=RuntimeError("指标异常")):
+            client.send_message("c1", "hello", max_retries=1)
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_create_conversation_metrics_error(self):
+        breaker = _half_open_breaker()
+        client = GPTBotsAPI("app-test", base_url="http://127.0.0.1:1")
+        client.circuit = breaker
+        client.session = mock.Mock()
+        client.session.post.side_effect = requests.exceptions.TooManyRedirects("重定向过多")
+
+        self.assertIsNone(client.create_conversation())
+        self.assert_probe_released(breaker)
+
+    def test_knowledge_base_request_content_decoding_error(self):
+        breaker = _half_open_breaker()
+        client = KnowledgeBaseAPI("app-test", base_url="http://127.0.0.1:1")
+        client.circuit = breaker
+        client.session = mock.Mock()
+        client.session.request.side_effect = requests.exceptions.ContentDecodingError("解码失败")
+
+        result = client.get_knowledge_bases()
+        self.assertEqual(result["error"], "Exception")
+        self.assert_probe_released(breaker)
+
+    def test_knowledge_base_request_metrics_error_after_response(self):
+        breaker = _half_open_breaker()
+        client = KnowledgeBaseAPI("app-test", base_url="http://127.0.0.1:1")
+        client.circuit = breaker
+        client.session = mock.Mock()
+        client.session.request.return_value = _ok_response()
+
+        with mock.patch("tools.api_clients.knowledge_base_api.record_http", side_effect=RuntimeError("指标异常")):
+            client.get_knowledge_bases()
+        self.assertEqual(breaker.state, CLOSED)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+自适应并发控制测试
+并发跑满且健康的一轮后加性提高上限，429限流立即乘性缩减；
+按状态码记录时2xx/3xx为成功、5xx为错误，其他4xx不影响并发上限
+"""
+
+import unittest
+
+from tools.api_clients.concurrency import AdaptiveConcurrencyController
+
+
+class AdaptiveConcurrencyControllerTest(unittest.TestCase):
+    def controller(self, **kwargs):
+        options = {"initial_limit": 2, "max_limit": 4, "cooldown_seconds": 0}
+        options.update(kwargs)
+        return AdaptiveConcurrencyController("test", **options)
+
+    @staticmethod
+    def saturate(controller):
+        # 占满全部槽位后释放，标记本轮并发已跑满
+        for _ in range(controller.limit):
+            controller.acquire(timeout=0)
+        for _ in range(controller.limit):
+            controller.release()
+
+    def run_round(self, controller, status_codes):
+        self.saturate(controller)
+        for status_code in status_codes:
+            controller.record_response(status_code, 0.1)
+
+    def test_healthy_saturated_rounds_increase_limit(self):
+        controller = self.controller()
+
+        self.run_round(controller, [200, 201])
+        self.assertEqual(controller.limit, 3)
+        self.run_round(controller, [204, 301, 304])
+        self.assertEqual(controller.limit, 4)
+        self.run_round(controller, [200] * 4)
+        self.assertEqual(controller.limit, 4)
+        self.assertEqual((controller.total_requests, controller.total_errors), (9, 0))
+
+    def test_unsaturated_round_keeps_limit(self):
+        controller = self.controller()
+        for _ in range(4):
+            controller.record_response(200, 0.1)
+        self.assertEqual(controller.limit, 2)
+
+    def test_throttle_decreases_limit(self):
+        controller = self.controller(initial_limit=8, max_limit=16, cooldown_seconds=60)
+
+        controller.record_response(429, 0.1)
+        self.assertEqual(controller.limit, 4)
+        # 冷却时间内不重复缩减
+        controller.record_response(429, 0.1)
+        self.assertEqual(controller.limit, 4)
+        self.assertEqual(controller.total_throttled, 2)
+
+        controller = self.controller(initial_limit=2)
+        for _ in range(3):
+            controller.record_response(429, 0.1)
+        self.assertEqual(controller.limit, controller.min_limit)
+
+    def test_server_errors_count_against_round(self):
+        controller = self.controller(initial_limit=4, max_limit=8, error_rate_threshold=0.1)
+
+        self.run_round(controller, [500, 200, 503, 200])
+
+        self.assertEqual(controller.limit, 2)
+        self.assertEqual(controller.total_errors, 2)
+
+    def test_client_errors_are_neutral(self):
+        controller = self.controller()
+
+        self.run_round(controller, [400, 401, 403, 404, 413, 422])
+        self.assertEqual((controller.limit, controller.total_requests), (2, 0))
+
+        # 夹在成功请求之间的4xx不打断本轮统计
+        self.run_round(controller, [200, 404, 200])
+        self.assertEqual(controller.limit, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+死信重放调度回归测试
+重放任务进行中不重复提交；重放被取消后不再自动重放，整体失败时记一次失败并按退避重新安排，
+已在重放任务中按文件记录过失败的死信不重复计数
+"""
+
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from config import DEAD_LETTER_CONFIG
+from tools.jobs.dead_letters import DeadLetterQueue, RetryScheduler, WAITING, EXHAUSTED, HELD
+from tools.jobs.store import QUEUED, FAILED, CANCELLED, SUCCEEDED
+
+
+class FakeRunner:
+    def __init__(self):
+        self.jobs = {"origin": {"id": "origin", "kind": "llm", "status": FAILED, "error": None,
+                                "params": {"api_key": "key-1", "delay": 0}}}
+        self.submitted = []
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def active_jobs(self, kind):
+        return [job for job in self.jobs.values() if job["kind"] == kind and job["status"] == QUEUED]
+
+    def submit(self, kind, params, title):
+        job_id = f"replay-{len(self.submitted) + 1}"
+        self.jobs[job_id] = {"id": job_id, "kind": kind, "status": QUEUED, "error": None, "params": params}
+        self.submitted.append(job_id)
+        return job_id
+
+    def finish(self, job_id, status, error=None):
+        self.jobs[job_id].update(status=status, error=error)
+
+
+class RetrySchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.queue = DeadLetterQueue(str(Path(self._tmp.name) / "jobs.db"))
+        self.runner = FakeRunner()
+        self.scheduler = RetryScheduler(self.runner, self.queue, interval=60)
+        self.path = Path(self._tmp.name) / "a.md"
+        config = mock.patch.dict(DEAD_LETTER_CONFIG, {"retry_base_seconds": 60, "retry_max_seconds": 3600,
+                                                      "max_attempts": 3})
+        config.start()
+        self.addCleanup(config.stop)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _record_due(self):
+        with mock.patch.dict(DEAD_LETTER_CONFIG, {"retry_base_seconds": 0}):
+            self.queue.record("llm", self.path, "超时", "origin")
+
+    def _letter(self):
+        letters = self.queue.list_letters("llm")
+        self.assertEqual(len(letters), 1)
+        return letters[0]
+
+    def test_active_replay_is_not_resubmitted(self):
+        self._record_due()
+        self.assertEqual(self.scheduler.run_once(), ["replay-1"])
+        self.assertEqual(self.scheduler.run_once(), [])
+        self.assertEqual(self.queue.summary("llm")["due"], 0)
+
+    def test_cancelled_replay_is_held(self):
+        self._record_due()
+        self.scheduler.run_once()
+        self.runner.finish("replay-1", CANCELLED)
+
+        self.assertEqual(self.scheduler.run_once(), [])
+        letter = self._letter()
+        self.assertEqual(letter["status"], HELD)
+        self.assertIsNone(letter["next_retry_at"])
+        self.assertEqual(letter["failures"], 1)
+        self.assertEqual(self.scheduler.run_once(), [])
+        self.assertEqual(self.runner.submitted, ["replay-1"])
+
+    def test_failed_replay_backs_off_until_exhausted(self):
+        self._record_due()
+        self.scheduler.run_once()
+        self.runner.finish("replay-1", FAILED, "API Key无效")
+
+        self.assertEqual(self.scheduler.run_once(), [])
+        letter = self._letter()
+        self.assertEqual((letter["status"], letter["failures"], letter["error"]), (WAITING, 2, "API Key无效"))
+        self.assertAlmostEqual(letter["next_retry_at"] - letter["last_failed_at"], 120, delta=1)
+
+        # 到期后再次重放，仍然整体失败则达到最大次数
+        with mock.patch("tools.jobs.dead_letters.time.time", return_value=letter["next_retry_at"] + 1):
+            self.assertEqual(self.scheduler.run_once(), ["replay-2"])
+        self.runner.finish("replay-2", SUCCEEDED)
+        self.scheduler.run_once()
+        letter = self._letter()
+        self.assertEqual((letter["status"], letter["failures"]), (EXHAUSTED, 3))
+        self.assertEqual(self.runner.submitted, ["replay-1", "replay-2"])
+
+    def test_per_file_failure_in_replay_is_counted_once(self):
+        self._record_due()
+        self.scheduler.run_once()
+        self.queue.record("llm", self.path, "解析失败", "replay-1")
+        self.runner.finish("replay-1", FAILED, "任务异常")
+
+        self.scheduler.run_once()
+        letter = self._letter()
+        self.assertEqual((letter["failures"], letter["error"]), (2, "解析失败"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+文档向量化状态轮询回归测试
+轮询线程使用自己创建的客户端（不沿用上传任务的客户端），线程意外退出后可以重新启动；
+轮询间隔随状态变化自适应，同一API Key在冷却时间内只触发一次重新嵌入
+"""
+
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from config import EMBEDDING_STATUS_CONFIG
+from tools.jobs.embedding_status import (EmbeddingStatusPoller, EmbeddingStatusStore,
+                                         AVAILABLE, EMBEDDING, FAILED)
+
+
+class _Killed(BaseException):
+    """模拟任务取消（JobCancelled 继承自 BaseException）"""
+
+
+class FakeKnowledgeBase:
+    def __init__(self, api_key: str, statuses=None):
+        self.api_key = api_key
+        self.statuses = dict(statuses or {})
+        self.status_queries = 0
+        self.retry_calls = 0
+        self.raise_on_query = None
+
+    def get_document_status(self, doc_ids):
+        if self.raise_on_query is not None:
+            raise self.raise_on_query
+        self.status_queries += 1
+        return [{"data_id": doc_id, "data_status": self.statuses.get(doc_id, "EMBEDDING")} for doc_id in doc_ids]
+
+    def retry_failed_embeddings(self):
+        self.retry_calls += 1
+        return {"code": 0}
+
+
+class _JobClient:
+    """上传任务的客户端：轮询线程不应调用它"""
+    api_key = "key-1"
+
+    def get_document_status(self, doc_ids):
+        raise AssertionError("轮询使用了上传任务的客户端")
+
+    retry_failed_embeddings = get_document_status
+
+
+class EmbeddingStatusPollerTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.store = EmbeddingStatusStore(str(Path(self._tmp.name) / "jobs.db"))
+        self.clients = {}
+        self.factory_calls = []
+        self.poller = EmbeddingStatusPoller(self.store, self._factory)
+        config = mock.patch.dict(EMBEDDING_STATUS_CONFIG, {
+            "enabled": True, "min_interval": 1.0, "max_interval": 8.0, "backoff_factor": 2.0,
+            "retry_cooldown": 120, "max_embedding_retries": 3, "max_wait_seconds": 3600
+        })
+        config.start()
+        self.addCleanup(config.stop)
+
+    def tearDown(self):
+        self.poller.stop()
+        self._tmp.cleanup()
+
+    def _factory(self, job_id, api_key):
+        self.factory_calls.append((job_id, api_key))
+        return self.clients.setdefault(api_key, FakeKnowledgeBase(api_key))
+
+    def _track(self, job_id, docs):
+        with mock.patch.object(EmbeddingStatusPoller, "start"):
+            self.poller.track(job_id, _JobClient(), docs)
+
+    def _poll(self, job_id):
+        # 让任务立即到期，返回本轮后的轮询间隔
+        self.poller._next_poll_at[job_id] = 0
+        self.poller.run_once()
+        return self.poller._intervals[job_id]
+
+    def test_polls_with_own_client(self):
+        self._track("job-1", {"doc-1": "a.md"})
+        self.clients["key-1"] = FakeKnowledgeBase("key-1", {"doc-1": "AVAILABLE"})
+
+        self._poll("job-1")
+
+        self.assertEqual(self.factory_calls, [("job-1", "key-1")])
+        self.assertEqual(self.clients["key-1"].status_queries, 1)
+        self.assertEqual(self.store.report("job-1")[AVAILABLE], 1)
+
+    def test_interval_backs_off_and_resets_on_change(self):
+        self._track("job-1", {"doc-1": "a.md", "doc-2": "b.md"})
+        client = self.clients["key-1"] = FakeKnowledgeBase("key-1")
+
+        self.assertEqual([self._poll("job-1") for _ in range(4)], [2.0, 4.0, 8.0, 8.0])
+
+        client.statuses["doc-1"] = "AVAILABLE"
+        self.assertEqual(self._poll("job-1"), 1.0)
+        self.assertEqual(self._poll("job-1"), 2.0)
+        self.assertEqual([doc["doc_id"] for doc in self.store.pending("job-1")], ["doc-2"])
+
+    def test_retry_cooldown_per_api_key(self):
+        self._track("job-1", {"doc-1": "a.md"})
+        self._track("job-2", {"doc-2": "b.md"})
+        self.clients["key-1"] = FakeKnowledgeBase("key-1", {"doc-1": "FAILED", "doc-2": "FAILED"})
+
+        self._poll("job-1")
+        self._poll("job-2")
+        self._poll("job-1")
+
+        # 两个任务共用一个API Key，冷却期内只触发一次重新嵌入
+        self.assertEqual(self.clients["key-1"].retry_calls, 1)
+        retries = {doc["doc_id"]: doc["retries"] for job in ("job-1", "job-2") for doc in self.store.pending(job)}
+        self.assertEqual(retries, {"doc-1": 1, "doc-2": 0})
+
+        with mock.patch.dict(EMBEDDING_STATUS_CONFIG, {"retry_cooldown": 0, "max_embedding_retries": 1}):
+            self._poll("job-1")
+            self._poll("job-2")
+        self.assertEqual(self.clients["key-1"].retry_calls, 2)
+        self.assertEqual(self.store.report("job-1")[FAILED], 1)
+        self.assertEqual(self.store.report("job-2")[EMBEDDING], 1)
+
+    def test_thread_restarts_after_unexpected_exit(self):
+        self.clients["key-1"] = FakeKnowledgeBase("key-1")
+        self.clients["key-1"].raise_on_query = _Killed()
+
+        with mock.patch.dict(EMBEDDING_STATUS_CONFIG, {"min_interval": 0.01}), \
+                mock.patch.object(threading, "excepthook"):
+            self.poller.track("job-1", _JobClient(), {"doc-1": "a.md"})
+            deadline = time.time() + 5
+            while self.poller._thread is not None and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertIsNone(self.poller._thread)
+
+            self.clients["key-1"].raise_on_query = None
+            self.poller.track("job-1", _JobClient(), {"doc-1": "a.md"})
+            deadline = time.time() + 5
+            while self.clients["key-1"].status_queries == 0 and time.time() < deadline:
+                time.sleep(0.01)
+        self.assertTrue(self.poller._thread.is_alive())
+        self.assertGreater(self.clients["key-1"].status_queries, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+对冲请求开关回归测试
+是否对冲由各GPTBots客户端单独决定，一个客户端启用对冲不影响共享同一对冲策略的其他客户端
+"""
+
+import time
+import unittest
+from unittest import mock
+
+from tools.api_clients.gptbots_api import GPTBotsAPI
+from tools.api_clients.hedging import HedgingPolicy
+
+
+def _warm_policy() -> HedgingPolicy:
+    policy = HedgingPolicy(min_delay_seconds=0.01, min_samples=1, budget_burst=3)
+    policy.latency.record(0.01)
+    return policy
+
+
+class PerClientHedgingTest(unittest.TestCase):
+    def make_client(self, policy: HedgingPolicy, hedging: bool) -> GPTBotsAPI:
+        client = GPTBotsAPI("app-test", base_url="http://127.0.0.1:1", hedging=hedging)
+        client.hedging = policy
+        return client
+
+    def test_disabled_client_never_hedges(self):
+        policy = _warm_policy()
+        hedged = self.make_client(policy, hedging=True)
+        plain = self.make_client(policy, hedging=False)
+
+        with mock.patch.object(GPTBotsAPI, "_timed_call_agent", return_value={"ok": True}) as call:
+            plain.call_agent("hello")
+        self.assertEqual(call.call_count, 1)
+        self.assertEqual(policy.hedges_sent + policy.hedges_skipped, 0)
+        self.assertTrue(hedged.hedging_enabled)
+        self.assertFalse(plain.hedging_enabled)
+
+    def test_enabled_client_hedges_slow_primary(self):
+        policy = _warm_policy()
+        client = self.make_client(policy, hedging=True)
+        calls = []
+
+        def slow_then_fast(query, timeout):
+            calls.append(query)
+            if len(calls) == 1:
+                time.sleep(0.2)
+            return {"call": len(calls)}
+
+        with mock.patch.object(GPTBotsAPI, "_timed_call_agent", side_effect=slow_then_fast):
+            result = client.call_agent("hello")
+        self.assertEqual(policy.hedges_sent, 1)
+        self.assertEqual(result, {"call": 2})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+LLM增量处理预估回归测试
+文件大小和修改时间未变时沿用记录的内容哈希，不在每次页面刷新时重新读取全部文件；
+只有修改时间变化的文件计算一次哈希并更新记录，内容变化的文件记为已变化
+"""
+
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from tools.jobs.file_state import FileStateStore, FileTracker, file_content_hash
+from tools.llm_engine.incremental import LLM_STAGE, llm_fingerprint, preview_llm_run
+
+
+class PreviewLLMRunTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        root = Path(self._tmp.name)
+        self.store = FileStateStore(str(root / "jobs.db"))
+        self.processed = root / "processed"
+        self.final = root / "final"
+        self.processed.mkdir()
+        self.final.mkdir()
+
+        files = []
+        for i in range(3):
+            path = self.processed / f"mail-{i}.md"
+            path.write_text(f"# 邮件 {i}\n\n正文 {i}\n", encoding="utf-8")
+            files.append(path)
+        tracker = FileTracker(self.store, LLM_STAGE)
+        tracker.plan(files, check_output=True, fingerprint=llm_fingerprint("bot-key"))
+        for path in files:
+            output = self.final / path.name
+            output.write_text("结果", encoding="utf-8")
+            tracker.done(path, str(output))
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def preview(self):
+        with mock.patch("tools.jobs.file_state.file_content_hash", side_effect=file_content_hash) as hashed:
+            summary = preview_llm_run(str(self.processed), "bot-key", self.store)
+        self.hashed = sorted(Path(call.args[0]).name for call in hashed.call_args_list)
+        return summary
+
+    def test_unchanged_files_are_not_hashed(self):
+        summary = self.preview()
+        self.assertEqual((summary["new"], summary["changed"], summary["up_to_date"]), (0, 0, 3))
+        self.assertEqual(self.hashed, [])
+
+    def test_touched_file_is_hashed_once(self):
+        path = self.processed / "mail-0.md"
+        stat = path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+        self.assertEqual(self.preview()["up_to_date"], 3)
+        self.assertEqual(self.hashed, ["mail-0.md"])
+        self.assertEqual(self.preview()["up_to_date"], 3)
+        self.assertEqual(self.hashed, [])
+
+    def test_modified_file_is_changed(self):
+        (self.processed / "mail-1.md").write_text("# 邮件 1\n\n修改后的正文\n", encoding="utf-8")
+        (self.processed / "mail-3.md").write_text("# 邮件 3\n\n新邮件\n", encoding="utf-8")
+
+        summary = self.preview()
+        self.assertEqual((summary["new"], summary["changed"], summary["up_to_date"]), (1, 1, 2))
+        self.assertEqual(self.hashed, ["mail-1.md", "mail-3.md"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+后台任务控制回归测试
+暂停/继续/取消与任务线程的状态写入不相互覆盖，排队中的任务继续后不会显示为运行中，
+重试退避期间也能立即响应取消
+"""
+
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+from tools.jobs.dead_letters import DeadLetterQueue
+from tools.jobs.file_state import FileStateStore
+from tools.jobs.runner import JobRunner, register_job_handler
+from tools.jobs.store import JobStore, QUEUED, RUNNING, PAUSED, SUCCEEDED, CANCELLED
+
+_release = threading.Event()
+_in_handler = threading.Event()
+
+
+@register_job_handler("test_block")
+def _blocking_handler(context, params):
+    _in_handler.set()
+    while not _release.wait(0.05):
+        context.checkpoint()
+    return {}
+
+
+@register_job_handler("test_backoff")
+def _backoff_handler(context, params):
+    _in_handler.set()
+    context.sleep(60)
+    return {}
+
+
+class JobControlTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        db_path = str(Path(self._tmp.name) / "jobs.db")
+        self.runner = JobRunner(JobStore(db_path), max_workers=1, file_states=FileStateStore(db_path),
+                                dead_letters=DeadLetterQueue(db_path))
+        _release.clear()
+        _in_handler.clear()
+
+    def tearDown(self):
+        _release.set()
+        self.runner._executor.shutdown(wait=True)
+        self._tmp.cleanup()
+
+    def wait_for(self, job_id, status, timeout=5.0):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.runner.get(job_id)["status"] == status:
+                return
+            time.sleep(0.02)
+        self.fail(f"任务状态为 {self.runner.get(job_id)['status']}，期望 {status}")
+
+    def test_resume_queued_job_stays_queued(self):
+        first = self.runner.submit("test_block", {})
+        self.assertTrue(_in_handler.wait(5))
+        second = self.runner.submit("test_block", {})
+
+        self.assertTrue(self.runner.pause(second))
+        self.assertEqual(self.runner.get(second)["status"], PAUSED)
+        self.assertTrue(self.runner.resume(second))
+        self.assertEqual(self.runner.get(second)["status"], QUEUED)
+
+        _release.set()
+        self.wait_for(first, SUCCEEDED)
+        self.wait_for(second, SUCCEEDED)
+
+    def test_pause_and_resume_running_job(self):
+        job_id = self.runner.submit("test_block", {})
+        self.assertTrue(_in_handler.wait(5))
+        self.wait_for(job_id, RUNNING)
+
+        self.assertTrue(self.runner.pause(job_id))
+        time.sleep(0.2)
+        self.assertEqual(self.runner.get(job_id)["status"], PAUSED)
+        self.assertTrue(self.runner.resume(job_id))
+        self.wait_for(job_id, RUNNING)
+
+        _release.set()
+        self.wait_for(job_id, SUCCEEDED)
+        self.assertFalse(self.runner.pause(job_id))
+        self.assertEqual(self.runner.get(job_id)["status"], SUCCEEDED)
+
+    def test_cancel_during_backoff(self):
+        job_id = self.runner.submit("test_backoff", {})
+        self.assertTrue(_in_handler.wait(5))
+
+        start = time.time()
+        self.assertTrue(self.runner.cancel(job_id))
+        self.wait_for(job_id, CANCELLED, timeout=2.0)
+        self.assertLess(time.time() - start, 2.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
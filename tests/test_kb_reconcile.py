@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+新增文档结果确认回归测试
+请求结果不确定时只扫描可能包含新文档的文档列表页面，不遍历整个知识库；
+本机与服务端时钟不一致时仍能按服务端的创建时间确认已创建的文档
+"""
+
+import json
+import time
+import unittest
+from email.utils import formatdate
+from unittest import mock
+
+import requests
+
+from tools.api_clients.knowledge_base_api import KnowledgeBaseAPI
+
+_SINCE = 1_700_000_000
+
+
+def _fake_listing(documents):
+    def get_documents(knowledge_base_id, page=1, page_size=10):
+        start = (page - 1) * page_size
+        return {"list": documents[start:start + page_size], "total": len(documents)}
+    return mock.Mock(side_effect=get_documents)
+
+
+def _corpus(old_count, new_names):
+    old = [{"id": f"old-{i}", "name": f"old-{i}.md", "create_time": _SINCE - 86400 + i} for i in range(old_count)]
+    new = [{"id": f"new-{name}", "name": name, "create_time": _SINCE + 5} for name in new_names]
+    return old + new
+
+
+class FindCreatedDocumentsTest(unittest.TestCase):
+    def setUp(self):
+        self.client = KnowledgeBaseAPI("app-test", base_url="http://127.0.0.1:1")
+
+    def test_oldest_first_scans_from_last_page(self):
+        self.client.get_documents = _fake_listing(_corpus(5000, ["a.md", "b.md"]))
+        created = self.client._find_created_documents("kb", ["a.md", "b.md"], _SINCE)
+
+        self.assertEqual(created, {"a.md": "new-a.md", "b.md": "new-b.md"})
+        pages = [call.kwargs["page"] for call in self.client.get_documents.call_args_list]
+        self.assertEqual(pages, [1, 51])
+
+    def test_newest_first_stops_at_older_page(self):
+        self.client.get_documents = _fake_listing(list(reversed(_corpus(5000, ["a.md", "b.md"]))))
+        created = self.client._find_created_documents("kb", ["a.md", "b.md", "missing.md"], _SINCE)
+
+        self.assertEqual(created, {"a.md": "new-a.md", "b.md": "new-b.md"})
+        self.assertEqual(self.client.get_documents.call_count, 1)
+
+    def test_missing_document_stops_after_stale_page(self):
+        self.client.get_documents = _fake_listing(_corpus(5000, ["a.md"]))
+        created = self.client._find_created_documents("kb", ["a.md", "missing.md"], _SINCE)
+
+        self.assertEqual(created, {"a.md": "new-a.md"})
+        pages = [call.kwargs["page"] for call in self.client.get_documents.call_args_list]
+        self.assertEqual(pages, [1, 51, 50])
+
+    def test_local_clock_ahead_within_margin(self):
+        # 没有 Date 响应头：服务端时间比本机慢两分钟，在容忍范围内
+        documents = _corpus(300, [])
+        documents.append({"id": "new-a.md", "name": "a.md", "create_time": _SINCE - 120})
+        self.client.get_documents = _fake_listing(documents)
+
+        self.assertEqual(self.client._find_created_documents("kb", ["a.md"], _SINCE), {"a.md": "new-a.md"})
+
+    def test_server_clock_offset_from_date_header(self):
+        # 服务端时钟比本机慢20分钟，超出容忍范围，按响应的 Date 头换算请求发出时间
+        since = time.time()
+        server_now = since - 1200
+        documents = [{"id": f"old-{i}", "name": "a.md" if i == 0 else f"old-{i}.md",
+                      "create_time": int((server_now - 86400 + i) * 1000)} for i in range(150)]
+        documents.append({"id": "new-a.md", "name": "a.md", "create_time": int((server_now + 1) * 1000)})
+
+        def request(method, url, params=None, **kwargs):
+            start = (params["page"] - 1) * params["page_size"]
+            response = requests.models.Response()
+            response.status_code = 200
+            response.headers["Date"] = formatdate(server_now + 2, usegmt=True)
+            response._content = json.dumps({"list": documents[start:start + params["page_size"]],
+                                            "total": len(documents)}).encode("utf-8")
+            return response
+
+        self.client.session = mock.Mock(request=mock.Mock(side_effect=request))
+        created = self.client._find_created_documents("kb", ["a.md"], since)
+
+        self.assertEqual(created, {"a.md": "new-a.md"})
+        self.assertAlmostEqual(self.client.server_clock_offset, -1200, delta=5)
+
+    def test_listing_failure_returns_none(self):
+        self.client.get_documents = mock.Mock(return_value={"error": "HTTP 500", "message": "服务错误"})
+        self.assertIsNone(self.client._find_created_documents("kb", ["a.md"], _SINCE))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+选中文件上传回归测试
+选中文件与目录上传走同一条分批并发上传路径，进度在批次完成后更新
+"""
+
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from benchmarks.mock_server import MockGPTBotsServer
+from tools.api_clients.knowledge_base_api import KnowledgeBaseAPI
+from tools.jobs.handlers import upload_selected_files
+
+
+class SelectedUploadTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.final_dir = Path(self._tmp.name)
+        self.files = []
+        for i in range(25):
+            path = self.final_dir / f"mail-{i:02d}.md"
+            path.write_text(f"# 邮件 {i}\n\n正文内容 {i}\n", encoding="utf-8")
+            self.files.append(path)
+        self.empty = self.final_dir / "empty.md"
+        self.empty.write_text("  \n", encoding="utf-8")
+        self.params = {"knowledge_base_id": "kb-test", "chunk_token": 600, "splitter": None,
+                       "final_dir": str(self.final_dir)}
+        patcher = mock.patch("tools.jobs.handlers.record_uploaded")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_selected_files_are_batched_and_report_on_completion(self):
+        progress = []
+        checkpoints = []
+
+        def on_progress(done, total, filename):
+            progress.append((done, total, threading.current_thread().name))
+
+        with MockGPTBotsServer() as server:
+            client = KnowledgeBaseAPI("app-test", base_url=server.url)
+            result = upload_selected_files(client, self.files + [self.empty], self.params,
+                                           progress_callback=on_progress, checkpoint=lambda: checkpoints.append(1))
+
+        self.assertEqual(result["successful_uploads"], 25)
+        self.assertEqual(result["failed_uploads"], 1)
+        self.assertEqual(result["total_files"], 26)
+        self.assertLess(result["batches_processed"], 25)
+        self.assertEqual(len(checkpoints), result["batches_processed"])
+        self.assertEqual([done for done, _, _ in progress], list(range(1, 26)))
+        self.assertTrue(all(total == 25 for _, total, _ in progress))
+        # 进度由批次完成后的上传线程回调，而不是在提交批次时更新
+        self.assertTrue(all(thread.startswith("kb-upload") for _, _, thread in progress))
+
+    def test_stop_after_failure_when_not_continuing(self):
+        client = KnowledgeBaseAPI("app-test", base_url="http://127.0.0.1:1")
+        client.add_text_documents_streaming = mock.Mock(return_value={"error": "HTTP 400", "message": "参数错误"})
+
+        params = dict(self.params, continue_on_error=False, concurrent_batches=1)
+        with mock.patch("tools.api_clients.knowledge_base_api.KB_UPLOAD_CONFIG",
+                        {"concurrent_batches": 1, "requests_per_second": 0, "max_batch_docs": 5,
+                         "max_request_bytes": 10 * 1024 * 1024}):
+            result = upload_selected_files(client, self.files, params)
+
+        self.assertEqual(result["successful_uploads"], 0)
+        self.assertEqual(result["failed_uploads"], 25)
+        self.assertLess(client.add_text_documents_streaming.call_count, 5)
+        self.assertTrue(any("已停止上传" in item["error"] for item in result["failed_files"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
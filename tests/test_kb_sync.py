@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+知识库增量同步回归测试
+同步计划按清单区分新增/更新/未变化/删除，大小和修改时间未变的文件不计算哈希；
+执行计划后清单记录文档ID，接口拒绝更新的文档（已不存在）移出清单，下次同步按新文件上传
+"""
+
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from benchmarks.mock_server import MockGPTBotsServer
+from tools.api_clients.knowledge_base_api import KnowledgeBaseAPI, UPLOAD_REJECTED
+from tools.jobs.chunk_index import ChunkIndex
+from tools.jobs.file_state import file_content_hash
+from tools.jobs.kb_manifest import KBManifest
+from tools.kb_sync import plan_kb_sync, apply_kb_sync
+
+
+class KBSyncTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        root = Path(self._tmp.name)
+        self.manifest = KBManifest(str(root / "jobs.db"))
+        index = ChunkIndex(str(root / "jobs.db"))
+        for target in ("tools.kb_sync.get_chunk_index", "tools.kb_chunker.get_chunk_index"):
+            patcher = mock.patch(target, return_value=index)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.dir = root / "final"
+        self.dir.mkdir()
+        self.server = MockGPTBotsServer().start()
+        self.addCleanup(self.server.stop)
+        self.client = KnowledgeBaseAPI("app-test", base_url=self.server.url)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def write(self, name, text):
+        path = self.dir / name
+        path.write_text(f"# {name}\n\n{text}\n", encoding="utf-8")
+        return path
+
+    def plan(self):
+        with mock.patch("tools.kb_sync.file_content_hash", side_effect=file_content_hash) as hashed:
+            plan = plan_kb_sync(str(self.dir), "kb", manifest=self.manifest)
+        self.hashed = sorted(Path(call.args[0]).name for call in hashed.call_args_list)
+        return plan
+
+    def sync(self):
+        names = []
+        result = apply_kb_sync(self.client, self.plan(), "kb", manifest=self.manifest,
+                               file_callback=lambda name, status, detail: names.append((name, status)))
+        return result, names
+
+    @staticmethod
+    def names(paths):
+        return sorted(path.name for path in paths)
+
+    def test_phases_and_manifest(self):
+        for name in ("a.md", "b.md", "c.md"):
+            self.write(name, f"{name} 初始内容")
+        result, _ = self.sync()
+        self.assertEqual((result["added"], result["updated"], result["deleted"]), (3, 0, 0))
+        entries = self.manifest.entries("kb")
+        self.assertEqual(len(entries), 3)
+        doc_ids = {Path(key).name: entry["doc_id"] for key, entry in entries.items()}
+
+        # 未变化的文件按大小和修改时间跳过，不计算哈希
+        plan = self.plan()
+        self.assertEqual(self.names(plan["unchanged"]), ["a.md", "b.md", "c.md"])
+        self.assertEqual(self.hashed, [])
+
+        # 只修改时间变化：计算一次哈希并更新清单，之后不再计算
+        stat = (self.dir / "a.md").stat()
+        os.utime(self.dir / "a.md", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertEqual(self.names(self.plan()["unchanged"]), ["a.md", "b.md", "c.md"])
+        self.assertEqual(self.hashed, ["a.md"])
+        self.plan()
+        self.assertEqual(self.hashed, [])
+
+        self.write("b.md", "b.md 修改后的内容")
+        (self.dir / "c.md").unlink()
+        self.write("d.md", "d.md 新文件")
+        plan = self.plan()
+        self.assertEqual((self.names(plan["new"]), self.names(plan["changed"]), self.names(plan["unchanged"])),
+                         (["d.md"], ["b.md"], ["a.md"]))
+        self.assertEqual([entry["name"] for entry in plan["removed"]], ["c.md"])
+        self.assertEqual(plan["doc_ids"], {"b.md": doc_ids["b.md"]})
+
+        result = apply_kb_sync(self.client, plan, "kb", manifest=self.manifest)
+        self.assertEqual((result["added"], result["updated"], result["deleted"], result["unchanged"]),
+                         (1, 1, 1, 1))
+        self.assertEqual(self.server.get_stats()["documents"], 3)
+        entries = {Path(key).name: entry for key, entry in self.manifest.entries("kb").items()}
+        self.assertEqual(sorted(entries), ["a.md", "b.md", "d.md"])
+        self.assertEqual(entries["b.md"]["doc_id"], doc_ids["b.md"])
+        self.assertEqual(self.names(self.plan()["unchanged"]), ["a.md", "b.md", "d.md"])
+
+    def test_rejected_update_is_dropped_from_manifest(self):
+        self.write("a.md", "初始内容")
+        self.write("b.md", "初始内容")
+        self.sync()
+        doc_id = {Path(key).name: entry["doc_id"] for key, entry in self.manifest.entries("kb").items()}["a.md"]
+
+        self.write("a.md", "修改后的内容")
+        # 接口在 failed 中按文档ID返回已不存在的文档
+        with mock.patch.object(self.client, "update_text_documents_streaming",
+                               return_value={"doc": [], "failed": [doc_id]}):
+            result, names = self.sync()
+
+        self.assertEqual(names, [("a.md", "in_flight"), ("a.md", "failed")])
+        self.assertEqual(result["failed_files"][0]["file_name"], "a.md")
+        self.assertEqual(result["failed_files"][0]["reason"], UPLOAD_REJECTED)
+        self.assertEqual(sorted(Path(key).name for key in self.manifest.entries("kb")), ["b.md"])
+        self.assertEqual(self.names(self.plan()["new"]), ["a.md"])
+
+    def test_failed_request_keeps_manifest_entry(self):
+        self.write("a.md", "初始内容")
+        self.sync()
+        self.write("a.md", "修改后的内容")
+        with mock.patch.object(self.client, "update_text_documents_streaming",
+                               return_value={"error": "HTTP 500", "message": "服务端错误"}):
+            result, _ = self.sync()
+
+        self.assertEqual(result["failed_uploads"], 1)
+        self.assertNotEqual(result["failed_files"][0]["reason"], UPLOAD_REJECTED)
+        self.assertEqual(self.names(self.plan()["changed"]), ["a.md"])
+
+
+if __name__ == "__main__":
+    unittest.main()
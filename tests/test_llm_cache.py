@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+LLM响应缓存回归测试
+合并处理的结果与单独处理的结果使用不同的缓存键，合并前的缓存预检查不计入命中统计
+"""
+
+import re
+import tempfile
+import unittest
+from unittest import mock
+
+from tools.llm_engine import LLMEmailProcessor, LLMResponseCache
+
+
+def _packed_reply(prompt: str) -> dict:
+    email_ids = re.findall(r"<<<EMAIL id=(\w+)>>>", prompt)
+    text = "\n".join(f"<<<RESULT id={email_id}>>>\n合并结果 {email_id}\n<<<END RESULT>>>" for email_id in email_ids)
+    return {"output": [{"content": {"text": text}}]}
+
+
+class PackedCacheKeyTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.cache = LLMResponseCache(cache_dir=self._tmp.name)
+        self.client = mock.Mock()
+        self.client.call_agent.side_effect = _packed_reply
+        self.emails = [("a.md", "第一封短邮件"), ("b.md", "第二封短邮件")]
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_packed_results_do_not_use_single_key(self):
+        processor = LLMEmailProcessor(self.client, "app-test", self.cache, split_threshold=10000)
+        self.assertEqual(processor.prefetch_packed(self.emails), 2)
+
+        for _, content in self.emails:
+            self.assertFalse(self.cache.contains(LLMResponseCache.make_key(content, "app-test")))
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 0))
+
+    def test_precheck_does_not_count_and_packed_result_is_reused(self):
+        LLMEmailProcessor(self.client, "app-test", self.cache).prefetch_packed(self.emails)
+        self.client.call_agent.reset_mock()
+
+        processor = LLMEmailProcessor(self.client, "app-test", self.cache, split_threshold=10000)
+        self.assertEqual(processor.prefetch_packed(self.emails), 0)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 0))
+
+        result = processor.process(self.emails[0][1], "a.md")
+        self.assertTrue(result["cached"])
+        self.assertEqual(result["content"], "合并结果 E1")
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 0))
+        self.client.call_agent.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+向量检索结果缓存测试
+相同问题（忽略大小写、全半角和多余空白）命中同一缓存，按有效期和最近最少使用淘汰；
+文档变更只使可能受影响的检索范围失效，检索期间发生失效的结果不写入缓存；
+批量检索中规范化后相同的问题只检索一次
+"""
+
+import unittest
+from unittest import mock
+
+from benchmarks.mock_server import MockGPTBotsServer
+from tools.api_clients.knowledge_base_api import KnowledgeBaseAPI
+from tools.api_clients.search_cache import VectorSearchCache
+
+
+def key(prompt="退货政策", api_key="key-1", group_ids=None, data_ids=None):
+    return VectorSearchCache.make_key(api_key, prompt, 1.0, group_ids, data_ids, 10, None, None)
+
+
+class VectorSearchCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = VectorSearchCache(max_entries=3, ttl_seconds=60)
+
+    def test_normalized_prompt_shares_key(self):
+        self.assertEqual(key("Return  Policy\n"), key("ｒｅｔｕｒｎ policy"))
+        self.assertNotEqual(key("退货政策"), key("退货政策", api_key="key-2"))
+        self.assertNotEqual(key(group_ids=[]), key(group_ids=None))
+        self.assertEqual(key(group_ids=["kb-2", "kb-1", "kb-1"]), key(group_ids=["kb-1", "kb-2"]))
+
+    def test_returns_copies(self):
+        self.cache.put(key(), {"list": [{"score": 0.9}]})
+        self.cache.get(key())["list"].clear()
+        self.assertEqual(self.cache.get(key()), {"list": [{"score": 0.9}]})
+
+    def test_entries_expire_after_ttl(self):
+        with mock.patch("tools.api_clients.search_cache.time.time", return_value=1000.0):
+            self.cache.put(key(), {"list": []})
+        with mock.patch("tools.api_clients.search_cache.time.time", return_value=1059.0):
+            self.assertEqual(self.cache.get(key()), {"list": []})
+        with mock.patch("tools.api_clients.search_cache.time.time", return_value=1060.0):
+            self.assertIsNone(self.cache.get(key()))
+
+        stats = self.cache.get_stats()
+        self.assertEqual((stats["entries"], stats["hits"], stats["misses"], stats["expired"]), (0, 1, 1, 1))
+
+    def test_evicts_least_recently_used(self):
+        for prompt in ("a", "b", "c"):
+            self.cache.put(key(prompt), {"prompt": prompt})
+        self.cache.get(key("a"))
+        self.cache.put(key("d"), {"prompt": "d"})
+
+        self.assertIsNone(self.cache.get(key("b")))
+        self.assertEqual([self.cache.get(key(prompt))["prompt"] for prompt in ("a", "c", "d")], ["a", "c", "d"])
+        self.assertEqual(self.cache.get_stats()["evictions"], 1)
+
+    def test_invalidation_is_scoped(self):
+        scopes = {
+            "all": key("all"),
+            "kb-1": key("kb-1", group_ids=["kb-1"]),
+            "kb-2": key("kb-2", group_ids=["kb-2"]),
+            "doc-1": key("doc-1", data_ids=["doc-1"]),
+            "doc-2": key("doc-2", data_ids=["doc-2"]),
+            "nothing": key("nothing", group_ids=[]),
+            "other-key": key("all", api_key="key-2")
+        }
+
+        def remaining():
+            return sorted(name for name, cache_key in scopes.items() if self.cache.get(cache_key) is not None)
+
+        def fill():
+            self.cache.clear()
+            for name, cache_key in scopes.items():
+                self.cache.put(cache_key, {"scope": name})
+
+        self.cache.max_entries = len(scopes)
+        fill()
+        self.assertEqual(self.cache.invalidate("key-1", "kb-1"), 2)
+        self.assertEqual(remaining(), ["doc-1", "doc-2", "kb-2", "nothing", "other-key"])
+
+        # 变更的知识库未知时所有按知识库检索的结果都失效
+        fill()
+        self.assertEqual(self.cache.invalidate("key-1", doc_ids=["doc-2"]), 4)
+        self.assertEqual(remaining(), ["doc-1", "nothing", "other-key"])
+
+    def test_result_started_before_invalidation_is_not_cached(self):
+        generation = self.cache.generation(key())
+        self.cache.invalidate("key-1", "kb-1")
+        self.cache.put(key(), {"list": ["旧结果"]}, generation)
+        self.assertIsNone(self.cache.get(key()))
+
+        # 其他API Key的失效不影响
+        generation = self.cache.generation(key())
+        self.cache.invalidate("key-2")
+        self.cache.put(key(), {"list": ["新结果"]}, generation)
+        self.assertEqual(self.cache.get(key()), {"list": ["新结果"]})
+
+
+class VectorSearchManyTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MockGPTBotsServer().start()
+        self.addCleanup(self.server.stop)
+        self.client = KnowledgeBaseAPI("app-test", base_url=self.server.url)
+        self.client.search_cache = VectorSearchCache()
+
+    def searches(self):
+        return self.server.get_stats()["requests"].get("/v1/vector/match", 0)
+
+    def run_batch(self, prompts, **kwargs):
+        results = list(self.client.vector_search_many(prompts, max_parallel=2, **kwargs))
+        return {result["prompt"]: result for result in results}
+
+    def test_same_normalized_prompt_searched_once(self):
+        prompts = ["退货 政策", "Return Policy", "退货  政策\n", "ｒｅｔｕｒｎ  policy", "发票", "退货 政策"]
+
+        results = self.run_batch(prompts, use_cache=False)
+
+        self.assertEqual(self.searches(), 3)
+        self.assertEqual({prompt: result["indices"] for prompt, result in results.items()},
+                         {"退货 政策": [0, 2, 5], "Return Policy": [1, 3], "发票": [4]})
+        self.assertTrue(all(result["result"] is not None and not result["cached"] for result in results.values()))
+
+    def test_repeated_batch_served_from_cache(self):
+        self.run_batch(["退货 政策", "发票"])
+        results = self.run_batch(["退货政策", "退货 政策", "发票 "])
+
+        self.assertEqual(self.searches(), 3)
+        self.assertFalse(results["退货政策"]["cached"])
+        self.assertTrue(results["退货 政策"]["cached"])
+        self.assertTrue(results["发票 "]["cached"])
+
+    def test_empty_batch(self):
+        self.assertEqual(self.run_batch([]), {})
+        self.assertEqual(self.searches(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
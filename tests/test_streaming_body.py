@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+流式文档请求体测试
+Content-Length 与实际发送的字节数一致，请求体是合法JSON且base64内容可还原；
+文件（mmap与回退的按块读取）和内存字节两种来源结果相同
+"""
+
+import base64
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from tools.api_clients.streaming_body import StreamingDocumentBody, UploadDocument, _CHUNK_BYTES
+
+
+class StreamingDocumentBodyTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self._tmp.name)
+        # 跨越多个编码块且长度不是3的倍数
+        self.large = ("邮件正文 " * (_CHUNK_BYTES // 5)).encode("utf-8") + b"xy"
+        self.contents = {"small.md": "# 标题\n\n正文".encode("utf-8"), "large.md": self.large, "empty.md": b""}
+        for name, content in self.contents.items():
+            (self.dir / name).write_bytes(content)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def check(self, body, expected):
+        raw = body.to_bytes()
+        self.assertEqual(len(body), len(raw))
+        self.assertEqual(raw, body.to_bytes())
+        payload = json.loads(raw.decode("utf-8"))
+        self.assertEqual([base64.b64decode(doc["file_base64"]) for doc in payload["files"]], expected)
+        return payload
+
+    def test_file_documents(self):
+        names = ["small.md", "large.md", "empty.md"]
+        documents = [UploadDocument.from_file(self.dir / name) for name in names]
+        payload = self.check(StreamingDocumentBody(documents, {"knowledge_base_id": "kb", "chunk_token": 600}),
+                             [self.contents[name] for name in names])
+
+        self.assertEqual((payload["knowledge_base_id"], payload["chunk_token"]), ("kb", 600))
+        self.assertEqual([doc["file_name"] for doc in payload["files"]], names)
+        self.assertEqual(payload["files"][0]["source_url"], "local://small.md")
+        self.assertNotIn("doc_id", payload["files"][0])
+
+    def test_mmap_fallback_matches(self):
+        documents = [UploadDocument.from_file(self.dir / "large.md")]
+        with mock.patch("tools.api_clients.streaming_body.mmap.mmap", side_effect=OSError("不支持mmap")):
+            self.check(StreamingDocumentBody(documents), [self.large])
+
+    def test_in_memory_documents(self):
+        documents = [UploadDocument("邮件 一.md", data=self.large, doc_id="doc-1"),
+                     UploadDocument("b.md", data=b"", source_url="https://example.com/b")]
+        payload = self.check(StreamingDocumentBody(documents, list_key="files"), [self.large, b""])
+
+        self.assertEqual(payload["files"][0]["doc_id"], "doc-1")
+        self.assertEqual(payload["files"][0]["file_name"], "邮件 一.md")
+        self.assertEqual(payload["files"][1]["source_url"], "https://example.com/b")
+
+    def test_no_documents(self):
+        body = StreamingDocumentBody([], {"knowledge_base_id": "kb"})
+        self.assertEqual(json.loads(body.to_bytes()), {"knowledge_base_id": "kb", "files": []})
+        self.assertEqual(len(body), len(body.to_bytes()))
+
+    def test_file_changed_after_planning(self):
+        path = self.dir / "small.md"
+        document = UploadDocument.from_file(path)
+        path.write_bytes(self.contents["small.md"] + b" changed")
+        with self.assertRaises(IOError):
+            StreamingDocumentBody([document]).to_bytes()
+
+
+if __name__ == "__main__":
+    unittest.main()
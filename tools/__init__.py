@@ -25,6 +25,9 @@ from .api_clients import GPTBotsAPI, KnowledgeBaseAPI
 # 自动处理流水线模块
 from .auto_pipeline import AutoProcessingPipeline, run_auto_processing_pipeline
 
+# 后台任务模块
+from .jobs import get_job_runner
+
 __all__ = [
     # 页面功能
     'show_homepage',
@@ -50,5 +53,8 @@ __all__ = [
     
     # 自动处理流水线
     'AutoProcessingPipeline',
-    'run_auto_processing_pipeline'
+    'run_auto_processing_pipeline',
+    
+    # 后台任务
+    'get_job_runner'
 ]
@@ -5,5 +5,36 @@ API客户端模块
 
 from .gptbots_api import GPTBotsAPI
 from .knowledge_base_api import KnowledgeBaseAPI
+from .concurrency import (
+    AdaptiveConcurrencyController,
+    get_concurrency_controller,
+    get_all_concurrency_stats
+)
+from .hedging import HedgingPolicy, get_hedging_policy
+from .circuit_breaker import CircuitBreaker, RetryQueue, get_circuit_breaker
+from .metrics import ApiMetrics, get_api_metrics, start_metrics_exporter
+from .transport import get_shared_session, get_transport_stats
+from .rate_limiter import RateLimiter, get_rate_limiter
+from .search_cache import VectorSearchCache, get_vector_search_cache
 
-__all__ = ['GPTBotsAPI', 'KnowledgeBaseAPI']
+__all__ = [
+    'GPTBotsAPI',
+    'KnowledgeBaseAPI',
+    'AdaptiveConcurrencyController',
+    'get_concurrency_controller',
+    'get_all_concurrency_stats',
+    'HedgingPolicy',
+    'get_hedging_policy',
+    'CircuitBreaker',
+    'RetryQueue',
+    'get_circuit_breaker',
+    'ApiMetrics',
+    'get_api_metrics',
+    'start_metrics_exporter',
+    'get_shared_session',
+    'get_transport_stats',
+    'RateLimiter',
+    'get_rate_limiter',
+    'VectorSearchCache',
+    'get_vector_search_cache'
+]
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+知识库上传批次规划
+按base64编码后的请求体大小和单批文档数上限对文件做装箱（首次适应递减算法），
+在不超过请求体上限的前提下尽量减少上传请求数
+"""
+
+import json
+import math
+from pathlib import Path
+from typing import List, Tuple
+
+# 单个文档在请求体JSON中除base64内容外的开销（字段名、引号、分隔符）
+_DOC_OVERHEAD_BYTES = len(json.dumps({"file_name": "", "file_base64": "", "source_url": "local://"})) + 2
+# 请求体中文档列表以外的开销（知识库ID、分块参数等）
+_REQUEST_OVERHEAD_BYTES = 256
+
+
+def encoded_doc_size(raw_bytes: int, file_name: str) -> int:
+    """
+    估算单个文档在上传请求体中的字节数
+
+    Args:
+        raw_bytes: 文件内容的UTF-8字节数
+        file_name: 文件名（出现在file_name和source_url中）
+
+    Returns:
+        base64编码后的内容加JSON字段开销的字节数
+    """
+    # 非ASCII文件名在JSON中按 \uXXXX 转义，按最长6字节估算
+    name_bytes = len(file_name) * 6
+    return 4 * math.ceil(raw_bytes / 3) + 2 * name_bytes + _DOC_OVERHEAD_BYTES
+
+
+def plan_upload_batches(files: List[Path], max_docs: int, max_bytes: int) -> List[List[Path]]:
+    """
+    将文件装箱为上传批次：每批不超过 max_docs 个文档、请求体不超过 max_bytes 字节
+
+    按编码后大小从大到小依次放入第一个放得下的批次（First Fit Decreasing），批次数不超过最优解的 11/9 倍加一；
+    单个文件超过请求体上限时单独成批。无法读取大小的文件按0字节计，读取失败在上传时报告。
+
+    Args:
+        files: 待上传的文件列表
+        max_docs: 单批最大文档数
+        max_bytes: 单次请求体最大字节数
+
+    Returns:
+        批次列表，每个批次内保持文件的原始顺序
+    """
+    max_docs = max(1, int(max_docs))
+    capacity = max(1, int(max_bytes) - _REQUEST_OVERHEAD_BYTES)
+
+    sized: List[Tuple[int, int, Path]] = []
+    for index, path in enumerate(files):
+        try:
+            raw_bytes = Path(path).stat().st_size
+        except OSError:
+            raw_bytes = 0
+        sized.append((encoded_doc_size(raw_bytes, Path(path).name), index, path))
+    sized.sort(key=lambda item: (-item[0], item[1]))
+
+    # 每个批次: [已用字节数, [(原始序号, 文件)]]
+    bins: List[List] = []
+    for size, index, path in sized:
+        for batch in bins:
+            if len(batch[1]) < max_docs and batch[0] + size <= capacity:
+                batch[0] += size
+                batch[1].append((index, path))
+                break
+        else:
+            bins.append([size, [(index, path)]])
+
+    # 按批次中最靠前的文件排序，使上传顺序与输入顺序大致一致
+    batches = [sorted(items, key=lambda item: item[0]) for _, items in bins]
+    batches.sort(key=lambda items: items[0][0])
+    return [[path for _, path in items] for items in batches]
+
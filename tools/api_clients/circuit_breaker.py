@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+熔断器
+后端连续失败时进入熔断状态，期间请求立即失败，不再逐个等待超时；
+恢复等待时间到期后放行探测请求，探测成功即自动恢复
+"""
+
+import threading
+import time
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Callable, Dict, List
+
+from config import CIRCUIT_BREAKER_CONFIG
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+STATE_LABELS = {
+    CLOSED: "正常",
+    OPEN: "熔断",
+    HALF_OPEN: "探测中"
+}
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0,
+                 max_recovery_timeout: float = 300.0, half_open_max_calls: int = 1):
+        """
+        初始化熔断器
+
+        Args:
+            name: 熔断器名称
+            failure_threshold: 连续失败多少次后熔断
+            recovery_timeout: 熔断后等待多久放行探测请求（秒）
+            max_recovery_timeout: 探测连续失败时等待时间翻倍的上限（秒）
+            half_open_max_calls: 半开状态下允许同时进行的探测请求数
+        """
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_timeout = recovery_timeout
+        self.max_recovery_timeout = max(recovery_timeout, max_recovery_timeout)
+        self.half_open_max_calls = max(1, half_open_max_calls)
+
+        self._condition = threading.Condition()
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._current_timeout = recovery_timeout
+        self._probes_in_flight = 0
+
+        # 状态变化记录
+        self._events = deque(maxlen=50)
+
+        self.total_rejected = 0
+        self.total_opened = 0
+
+    @property
+    def state(self) -> str:
+        """当前状态（closed / open / half_open）"""
+        with self._condition:
+            self._refresh_state()
+            return self._state
+
+    def allow_request(self) -> bool:
+        """
+        判断是否放行一次请求
+
+        半开状态下放行的请求视为探测请求，调用方必须随后调用 record_success 或 record_failure。
+
+        Returns:
+            是否放行；熔断中返回False，调用方应立即失败
+        """
+        with self._condition:
+            self._refresh_state()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._probes_in_flight < self.half_open_max_calls:
+                self._probes_in_flight += 1
+                return True
+            self.total_rejected += 1
+            return False
+
+    def record_success(self):
+        """记录一次成功请求；半开状态下探测成功则恢复正常"""
+        with self._condition:
+            self._consecutive_failures = 0
+            if self._state == HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                self._current_timeout = self.recovery_timeout
+                self._transition(CLOSED, "探测请求成功，恢复正常")
+
+    def record_failure(self, reason: str = "请求失败"):
+        """
+        记录一次后端故障（连接错误、超时、5xx）
+
+        Args:
+            reason: 失败原因
+        """
+        with self._condition:
+            self._consecutive_failures += 1
+            if self._state == HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                # 探测失败时加倍等待时间，避免频繁探测已宕机的后端
+                self._current_timeout = min(self.max_recovery_timeout, self._current_timeout * 2)
+                self._open(f"探测请求失败: {reason}")
+            elif self._state == CLOSED and self._consecutive_failures >= self.failure_threshold:
+                self._open(f"连续失败 {self._consecutive_failures} 次: {reason}")
+
+    def wait_until_ready(self, timeout: float = None) -> bool:
+        """
+        阻塞等待熔断器允许探测或已恢复正常
+
+        Args:
+            timeout: 最长等待时间（秒），None表示一直等待
+
+        Returns:
+            是否可以发起请求
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        with self._condition:
+            while True:
+                self._refresh_state()
+                if self._state == CLOSED:
+                    return True
+                if self._state == HALF_OPEN and self._probes_in_flight < self.half_open_max_calls:
+                    return True
+
+                now = time.time()
+                if deadline is not None and now >= deadline:
+                    return False
+                wait_time = 1.0
+                if self._state == OPEN:
+                    wait_time = max(0.05, self._opened_at + self._current_timeout - now)
+                if deadline is not None:
+                    wait_time = min(wait_time, deadline - now)
+                self._condition.wait(wait_time)
+
+    def retry_after(self) -> float:
+        """距离下一次允许探测的剩余秒数"""
+        with self._condition:
+            self._refresh_state()
+            if self._state != OPEN:
+                return 0.0
+            return max(0.0, self._opened_at + self._current_timeout - time.time())
+
+    def reset(self):
+        """手动恢复为正常状态"""
+        with self._condition:
+            self._consecutive_failures = 0
+            self._probes_in_flight = 0
+            self._current_timeout = self.recovery_timeout
+            if self._state != CLOSED:
+                self._transition(CLOSED, "手动重置")
+
+    def _open(self, reason: str):
+        """进入熔断状态（需持有锁）"""
+        self._opened_at = time.time()
+        self.total_opened += 1
+        self._transition(OPEN, reason)
+
+    def _refresh_state(self):
+        """熔断等待时间到期后转为半开状态（需持有锁）"""
+        if self._state == OPEN and time.time() - self._opened_at >= self._current_timeout:
+            self._probes_in_flight = 0
+            self._transition(HALF_OPEN, "等待结束，放行探测请求")
+
+    def _transition(self, new_state: str, reason: str):
+        """切换状态并记录（需持有锁）"""
+        old_state = self._state
+        self._state = new_state
+        self._events.append({
+            "time": datetime.now().strftime("%H:%M:%S"),
+            "from": old_state,
+            "to": new_state,
+            "reason": reason
+        })
+        log = logging.warning if new_state == OPEN else logging.info
+        log(f"[{self.name}] 熔断器 {STATE_LABELS[old_state]} -> {STATE_LABELS[new_state]}: {reason}")
+        self._condition.notify_all()
+
+    def get_stats(self) -> Dict:
+        """
+        获取熔断器当前状态
+
+        Returns:
+            包含状态、连续失败次数、剩余等待时间和状态变化记录的字典
+        """
+        with self._condition:
+            self._refresh_state()
+            retry_after = 0.0
+            if self._state == OPEN:
+                retry_after = max(0.0, self._opened_at + self._current_timeout - time.time())
+            return {
+                "name": self.name,
+                "state": self._state,
+                "state_label": STATE_LABELS[self._state],
+                "consecutive_failures": self._consecutive_failures,
+                "retry_after": retry_after,
+                "total_opened": self.total_opened,
+                "total_rejected": self.total_rejected,
+                "events": list(self._events)
+            }
+
+
+class RetryQueue:
+    def __init__(self, breaker: CircuitBreaker, max_wait: float = 1800):
+        """
+        初始化熔断期间的重试队列
+
+        熔断期间失败的任务暂存于此，熔断器放行探测后按顺序重新处理；
+        首个任务即作为探测请求，成功后其余任务随之恢复处理。
+
+        Args:
+            breaker: 熔断器
+            max_wait: 整个队列的最长等待时间（秒）
+        """
+        self.breaker = breaker
+        self.max_wait = max_wait
+        self._items = deque()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def park(self, item):
+        """暂存一个任务"""
+        self._items.append(item)
+
+    def drain(self, handler: Callable[[object], bool],
+              status_callback: Callable[[int, float], None] = None) -> List:
+        """
+        等待熔断恢复并依次处理暂存的任务
+
+        Args:
+            handler: 任务处理函数，返回False表示因熔断再次失败、需要继续等待
+            status_callback: 等待期间的状态回调，参数为 (剩余任务数, 距下次探测的秒数)
+
+        Returns:
+            超过最长等待时间仍未处理的任务列表
+        """
+        deadline = time.time() + self.max_wait
+        while self._items:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            if status_callback:
+                status_callback(len(self._items), self.breaker.retry_after())
+            if not self.breaker.wait_until_ready(min(remaining, 5.0)):
+                continue
+
+            item = self._items.popleft()
+            if not handler(item):
+                self._items.appendleft(item)
+
+        left = list(self._items)
+        self._items.clear()
+        return left
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name: str = "gptbots") -> CircuitBreaker:
+    """
+    获取进程内共享的熔断器
+
+    Args:
+        name: 熔断器名称，对应 CIRCUIT_BREAKER_CONFIG 中的键
+
+    Returns:
+        CircuitBreaker实例
+    """
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name, **CIRCUIT_BREAKER_CONFIG.get(name, {}))
+        return _breakers[name]
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+自适应并发控制器
+基于AIMD（加性增、乘性减）算法动态调整同时在途的API请求数
+"""
+
+import threading
+import time
+import logging
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List
+
+from config import CONCURRENCY_CONFIG
+
+
+class AdaptiveConcurrencyController:
+    def __init__(self, name: str, initial_limit: int = 2, min_limit: int = 1,
+                 max_limit: int = 16, additive_step: int = 1,
+                 multiplicative_factor: float = 0.5, latency_target: float = 60.0,
+                 error_rate_threshold: float = 0.1, window_size: int = 20,
+                 cooldown_seconds: float = 5.0):
+        """
+        初始化自适应并发控制器
+
+        Args:
+            name: 控制器名称（如 "llm"、"kb"）
+            initial_limit: 初始并发上限
+            min_limit: 并发上限的最小值
+            max_limit: 并发上限的最大值
+            additive_step: 每轮健康时增加的并发数
+            multiplicative_factor: 触发限流/超时时的缩减系数
+            latency_target: 平均延迟目标（秒），超过视为不健康
+            error_rate_threshold: 错误率阈值，超过视为不健康
+            window_size: 统计窗口内保留的请求数
+            cooldown_seconds: 两次缩减之间的最短间隔（秒）
+        """
+        self.name = name
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = min(max(initial_limit, self.min_limit), self.max_limit)
+        self.additive_step = additive_step
+        self.multiplicative_factor = multiplicative_factor
+        self.latency_target = latency_target
+        self.error_rate_threshold = error_rate_threshold
+        self.cooldown_seconds = cooldown_seconds
+
+        self._condition = threading.Condition()
+        self._in_flight = 0
+        self._saturated = False
+        self._round_completed = 0
+        self._last_decrease = 0.0
+
+        # 统计窗口: (延迟, 是否成功)
+        self._window = deque(maxlen=window_size)
+        # 最近完成请求的时间戳，用于计算吞吐量
+        self._completions = deque(maxlen=1000)
+        # 并发上限变化记录
+        self._events = deque(maxlen=50)
+
+        self.total_requests = 0
+        self.total_throttled = 0
+        self.total_errors = 0
+
+    def acquire(self, timeout: float = None) -> bool:
+        """
+        获取一个并发槽位，超过当前上限时阻塞等待
+
+        Args:
+            timeout: 最长等待时间（秒），None表示一直等待
+
+        Returns:
+            是否成功获取槽位
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        with self._condition:
+            while self._in_flight >= self.limit:
+                self._saturated = True
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            self._in_flight += 1
+            if self._in_flight >= self.limit:
+                self._saturated = True
+            return True
+
+    def release(self):
+        """释放一个并发槽位"""
+        with self._condition:
+            self._in_flight = max(0, self._in_flight - 1)
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self, timeout: float = None):
+        """
+        并发槽位上下文管理器
+
+        Args:
+            timeout: 最长等待时间（秒）
+        """
+        if not self.acquire(timeout):
+            raise TimeoutError(f"等待并发槽位超时 ({self.name})")
+        try:
+            yield
+        finally:
+            self.release()
+
+    def record_response(self, status_code: int, latency: float):
+        """
+        根据HTTP状态码记录一次请求结果
+
+        只有2xx/3xx视为成功并可能提高并发上限；429视为限流，5xx视为错误；
+        其他4xx（如鉴权失败、请求参数错误）与服务端负载无关，不影响并发上限。
+
+        Args:
+            status_code: HTTP状态码
+            latency: 请求耗时（秒）
+        """
+        if status_code == 429:
+            self.record_throttle("HTTP 429 限流")
+        elif status_code >= 500:
+            self.record_error(latency)
+        elif status_code < 400:
+            self.record_success(latency)
+
+    def record_success(self, latency: float):
+        """记录一次成功请求"""
+        with self._condition:
+            self.total_requests += 1
+            self._window.append((latency, True))
+            self._completions.append(time.time())
+            self._finish_round()
+
+    def record_error(self, latency: float = None):
+        """记录一次普通错误（5xx、连接错误等）"""
+        with self._condition:
+            self.total_requests += 1
+            self.total_errors += 1
+            self._window.append((latency if latency is not None else 0.0, False))
+            self._finish_round()
+
+    def record_throttle(self, reason: str):
+        """
+        记录一次限流或超时，立即按乘性系数缩减并发上限
+
+        Args:
+            reason: 缩减原因
+        """
+        with self._condition:
+            self.total_requests += 1
+            self.total_throttled += 1
+            self._window.append((0.0, False))
+            self._decrease(reason)
+
+    def _finish_round(self):
+        """每完成约一个并发上限数量的请求评估一次健康状况（需持有锁）"""
+        self._round_completed += 1
+        if self._round_completed < self.limit:
+            return
+
+        self._round_completed = 0
+        avg_latency, error_rate = self._window_health()
+
+        if error_rate > self.error_rate_threshold:
+            self._decrease(f"错误率过高 ({error_rate:.0%})")
+        elif avg_latency > self.latency_target:
+            self._decrease(f"平均延迟过高 ({avg_latency:.1f}s)")
+        elif self._saturated and self.limit < self.max_limit:
+            old_limit = self.limit
+            self.limit = min(self.max_limit, self.limit + self.additive_step)
+            self._record_event(old_limit, f"健康 (延迟 {avg_latency:.1f}s, 错误率 {error_rate:.0%})")
+            self._condition.notify_all()
+
+        self._saturated = False
+
+    def _decrease(self, reason: str):
+        """按乘性系数缩减并发上限（需持有锁）"""
+        now = time.time()
+        if now - self._last_decrease < self.cooldown_seconds:
+            return
+
+        self._last_decrease = now
+        self._round_completed = 0
+        old_limit = self.limit
+        self.limit = max(self.min_limit, int(self.limit * self.multiplicative_factor))
+        if self.limit != old_limit:
+            self._record_event(old_limit, reason)
+
+    def _window_health(self):
+        """计算窗口内的平均延迟和错误率（需持有锁）"""
+        if not self._window:
+            return 0.0, 0.0
+        latencies = [latency for latency, ok in self._window if ok]
+        failures = sum(1 for _, ok in self._window if not ok)
+        avg_latency = sum(latencies) / len(latencies) if latencies else 0.0
+        return avg_latency, failures / len(self._window)
+
+    def _record_event(self, old_limit: int, reason: str):
+        """记录并发上限变化（需持有锁）"""
+        event = {
+            "time": datetime.now().strftime("%H:%M:%S"),
+            "old_limit": old_limit,
+            "new_limit": self.limit,
+            "reason": reason
+        }
+        self._events.append(event)
+        logging.info(f"[{self.name}] 并发上限调整 {old_limit} -> {self.limit}: {reason}")
+
+    def get_stats(self) -> Dict:
+        """
+        获取控制器当前状态
+
+        Returns:
+            包含并发上限、在途请求数、吞吐量和调整记录的字典
+        """
+        with self._condition:
+            now = time.time()
+            recent = [t for t in self._completions if now - t <= 60]
+            avg_latency, error_rate = self._window_health()
+            return {
+                "name": self.name,
+                "limit": self.limit,
+                "in_flight": self._in_flight,
+                "throughput_per_min": len(recent),
+                "avg_latency": avg_latency,
+                "error_rate": error_rate,
+                "total_requests": self.total_requests,
+                "total_throttled": self.total_throttled,
+                "total_errors": self.total_errors,
+                "events": list(self._events)
+            }
+
+
+_controllers: Dict[str, AdaptiveConcurrencyController] = {}
+_controllers_lock = threading.Lock()
+
+
+def get_concurrency_controller(name: str) -> AdaptiveConcurrencyController:
+    """
+    获取进程内共享的并发控制器
+
+    Args:
+        name: 控制器名称，对应 CONCURRENCY_CONFIG 中的键
+
+    Returns:
+        AdaptiveConcurrencyController实例
+    """
+    with _controllers_lock:
+        if name not in _controllers:
+            _controllers[name] = AdaptiveConcurrencyController(name, **CONCURRENCY_CONFIG.get(name, {}))
+        return _controllers[name]
+
+
+def get_all_concurrency_stats() -> List[Dict]:
+    """获取所有并发控制器的状态"""
+    with _controllers_lock:
+        controllers = list(_controllers.values())
+    return [controller.get_stats() for controller in controllers]
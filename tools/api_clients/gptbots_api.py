@@ -8,39 +8,67 @@ import requests
 import json
 import time
 import logging
-from typing import Dict, Optional
+from typing import Callable, Dict, Optional
 from datetime import datetime
 
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from config import HEDGING_CONFIG, get_api_base_url
+from .concurrency import get_concurrency_controller
+from .hedging import get_hedging_policy
+from .circuit_breaker import get_circuit_breaker
+from .metrics import get_api_metrics, record_http, record_retry
+from .transport import get_shared_session
+
 # 配置日志
 import os
-os.makedirs("logs", exist_ok=True)
+from config import LOGGING_CONFIG
+os.makedirs(os.path.dirname(LOGGING_CONFIG["api_log"]) or ".", exist_ok=True)
 
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s',
     handlers=[
-        logging.FileHandler('logs/gptbots_api.log'),
+        logging.FileHandler(LOGGING_CONFIG["api_log"]),
         logging.StreamHandler()
     ]
 )
 
 class GPTBotsAPI:
-    def __init__(self, app_key: str):
+    def __init__(self, app_key: str, base_url: str = None, hedging: bool = None,
+                 retry_wait: Callable[[float], None] = None):
         """
         初始化GPTBots API客户端
         
         Args:
             app_key: API应用密钥
+            base_url: API服务地址，默认读取配置（可用 GPTBOTS_BASE_URL 覆盖）
+            hedging: 是否对 call_agent 启用对冲请求，默认读取配置
+            retry_wait: 重试退避的等待函数，默认 time.sleep（后台任务中传入可响应暂停/取消的等待）
         """
         self.app_key = app_key
-        # 根据文档设置正确的API地址
-        # 使用新的内网IP地址
-        self.base_url = "http://10.52.20.41:19080"
+        self.base_url = (base_url or get_api_base_url()).rstrip("/")
         
         # 根据官方文档设置正确的API endpoints
         self.create_conversation_url = f"{self.base_url}/v1/conversation"
         self.send_message_url = f"{self.base_url}/v2/conversation/message"
-        self.session = requests.Session()
+        # 进程内共享的连接池，复用长连接
+        self.session = get_shared_session()
+        
+        # 进程内共享的自适应并发控制器
+        self.concurrency = get_concurrency_controller("llm")
+        
+        # 进程内共享的对冲请求策略（延迟统计和对冲预算），是否对冲由本客户端决定
+        self.hedging = get_hedging_policy()
+        self.hedging_enabled = HEDGING_CONFIG["enabled"] if hedging is None else hedging
+        
+        # 与知识库API共享的熔断器，后端故障时快速失败
+        self.circuit = get_circuit_breaker("gptbots")
+        
+        # 进程内共享的API调用指标
+        self.metrics = get_api_metrics()
+        
+        self.retry_wait = retry_wait or time.sleep
         
     def create_conversation(self, user_id: str = "api-user", timeout: int = 180) -> Optional[str]:
         """
@@ -62,13 +90,30 @@ class GPTBotsAPI:
             "user_id": user_id
         }
         
+        if not self.circuit.allow_request():
+            logging.warning(f"服务熔断中，跳过创建对话（{self.circuit.retry_after():.0f} 秒后探测）")
+            return None
+        
+        recorded = False
         try:
-            response = self.session.post(
-                self.create_conversation_url,
-                headers=headers,
-                json=payload,
-                timeout=timeout
-            )
+            start_time = time.time()
+            try:
+                response = self.session.post(
+                    self.create_conversation_url,
+                    headers=headers,
+                    json=payload,
+                    timeout=timeout
+                )
+            except requests.exceptions.RequestException as e:
+                self.circuit.record_failure(type(e).__name__)
+                recorded = True
+                record_http("gptbots", self.create_conversation_url, self.app_key,
+                            time.time() - start_time, error=e)
+                raise
+            self._record_circuit(response.status_code)
+            recorded = True
+            record_http("gptbots", self.create_conversation_url, self.app_key,
+                        time.time() - start_time, response)
             
             if response.status_code == 200:
                 result = response.json()
@@ -80,6 +125,9 @@ class GPTBotsAPI:
                 return None
                 
         except Exception as e:
+            if not recorded:
+                # 放行的请求必须记录结果，否则半开状态的探测名额无法归还
+                self.circuit.record_failure(type(e).__name__)
             logging.error(f"创建对话ID出错: {str(e)}")
             return None
 
@@ -121,13 +169,27 @@ class GPTBotsAPI:
         import random
         
         for attempt in range(max_retries):
+            if not self.circuit.allow_request():
+                logging.warning(f"服务熔断中，放弃发送消息（{self.circuit.retry_after():.0f} 秒后探测）")
+                return None
+            
+            if attempt > 0:
+                record_retry("gptbots", self.send_message_url, self.app_key)
+            
+            recorded = False
             try:
-                response = self.session.post(
-                    self.send_message_url,
-                    headers=headers,
-                    json=payload,
-                    timeout=timeout
-                )
+                with self.concurrency.slot():
+                    start_time = time.time()
+                    response = self.session.post(
+                        self.send_message_url,
+                        headers=headers,
+                        json=payload,
+                        timeout=timeout
+                    )
+                self._record_circuit(response.status_code)
+                recorded = True
+                self.concurrency.record_response(response.status_code, time.time() - start_time)
+                record_http("gptbots", self.send_message_url, self.app_key, time.time() - start_time, response)
                 
                 if response.status_code == 200:
                     result = response.json()
@@ -136,7 +198,7 @@ class GPTBotsAPI:
                 elif response.status_code == 429:  # Rate limit
                     wait_time = (2 ** attempt) + random.uniform(0, 1)
                     logging.warning(f"触发限流，等待 {wait_time:.2f} 秒后重试...")
-                    time.sleep(wait_time)
+                    self.retry_wait(wait_time)
                     continue
                 else:
                     logging.error(f"发送消息失败 - 状态码: {response.status_code}, 响应: {response.text}")
@@ -144,25 +206,46 @@ class GPTBotsAPI:
                         return None
                     
             except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                self.circuit.record_failure(type(e).__name__)
+                recorded = True
+                if isinstance(e, requests.exceptions.Timeout):
+                    self.concurrency.record_throttle("请求超时")
+                else:
+                    self.concurrency.record_error()
+                record_http("gptbots", self.send_message_url, self.app_key, time.time() - start_time,
+                            error=e, bytes_sent=len(json.dumps(payload).encode("utf-8")))
                 wait_time = (2 ** attempt) + random.uniform(0, 1)
                 logging.warning(f"网络错误 (尝试 {attempt + 1}/{max_retries}): {str(e)}, 等待 {wait_time:.2f} 秒后重试...")
                 if attempt < max_retries - 1:
-                    time.sleep(wait_time)
+                    self.retry_wait(wait_time)
                 else:
                     logging.error(f"网络请求最终失败: {str(e)}")
                     return None
                     
             except Exception as e:
+                if not recorded:
+                    # 放行的请求必须记录结果（如 ChunkedEncodingError、指标记录异常），否则半开状态的探测名额无法归还
+                    self.circuit.record_failure(type(e).__name__)
                 logging.error(f"发送消息出错 (尝试 {attempt + 1}/{max_retries}): {str(e)}")
                 if attempt == max_retries - 1:
                     return None
                     
         return None
 
+    def _record_circuit(self, status_code: int):
+        """根据HTTP状态码更新熔断器：5xx视为后端故障，其余说明后端可用"""
+        if status_code >= 500:
+            self.circuit.record_failure(f"HTTP {status_code}")
+        else:
+            self.circuit.record_success()
+
     def call_agent(self, query: str, timeout: int = 180) -> Optional[Dict]:
         """
         调用GPTBots Agent（完整流程：创建对话->发送消息）
         
+        启用对冲时，主请求超过历史延迟分位数仍未返回则在新对话上发起一次重复请求，
+        取先成功的结果，另一个请求的结果被忽略。
+        
         Args:
             query: 查询内容
             timeout: 超时时间（秒）
@@ -170,6 +253,45 @@ class GPTBotsAPI:
         Returns:
             API响应内容或None（如果失败）
         """
+        self.hedging.on_primary()
+        hedge_delay = self.hedging.hedge_delay() if self.hedging_enabled else None
+        if hedge_delay is None:
+            return self._timed_call_agent(query, timeout)
+        
+        executor = ThreadPoolExecutor(max_workers=2)
+        try:
+            primary = executor.submit(self._timed_call_agent, query, timeout)
+            done, _ = wait([primary], timeout=hedge_delay)
+            if done or not self.hedging.try_hedge():
+                return primary.result()
+            
+            logging.warning(f"主请求超过 {hedge_delay:.1f} 秒未返回，发起对冲请求")
+            hedge = executor.submit(self._timed_call_agent, query, timeout)
+            pending = {primary, hedge}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    if result:
+                        if future is hedge:
+                            self.hedging.record_hedge_win()
+                            logging.info("对冲请求先于主请求返回")
+                        return result
+            return None
+        finally:
+            # 不等待落后的请求，其结果直接丢弃
+            executor.shutdown(wait=False)
+    
+    def _timed_call_agent(self, query: str, timeout: int) -> Optional[Dict]:
+        """执行一次完整调用，并记录成功调用的延迟用于计算对冲等待时间"""
+        start_time = time.time()
+        result = self._call_agent_once(query, timeout)
+        if result:
+            self.hedging.latency.record(time.time() - start_time)
+        return result
+    
+    def _call_agent_once(self, query: str, timeout: int) -> Optional[Dict]:
+        """创建新对话并发送消息"""
         logging.info(f"正在查询: {query}")
         
         # 步骤1: 创建对话ID
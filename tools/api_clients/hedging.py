@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+对冲请求策略
+主请求超过历史延迟分位数仍未返回时发起一次重复请求，取先成功的结果，用于削减长尾延迟
+"""
+
+import threading
+from collections import deque
+from typing import Dict, Optional
+
+from config import HEDGING_CONFIG
+
+
+class LatencyTracker:
+    def __init__(self, window_size: int = 500):
+        """
+        初始化延迟统计
+
+        Args:
+            window_size: 保留的最近样本数
+        """
+        self._samples = deque(maxlen=window_size)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float):
+        """记录一次成功请求的延迟（秒）"""
+        with self._lock:
+            self._samples.append(latency)
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._samples)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        """
+        计算延迟分位数
+
+        Args:
+            percentile: 分位数（0-100）
+
+        Returns:
+            延迟（秒），无样本时返回None
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * percentile / 100))
+        return samples[index]
+
+
+class HedgeBudget:
+    def __init__(self, ratio: float = 0.1, burst: int = 3):
+        """
+        初始化对冲预算（令牌桶）
+
+        每个主请求存入 ratio 个令牌，每次对冲消耗1个令牌，保证对冲带来的额外负载不超过 ratio。
+
+        Args:
+            ratio: 对冲请求占主请求的最大比例
+            burst: 令牌桶容量
+        """
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = float(burst)
+        self._lock = threading.Lock()
+
+    def on_request(self):
+        """记录一次主请求"""
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def try_acquire(self) -> bool:
+        """尝试消耗一个对冲令牌"""
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+class HedgingPolicy:
+    def __init__(self, percentile: float = 95, min_delay_seconds: float = 5.0, min_samples: int = 20,
+                 window_size: int = 500, budget_ratio: float = 0.1, budget_burst: int = 3):
+        """
+        初始化对冲策略（是否对冲由各客户端决定，策略只负责延迟统计和对冲预算）
+
+        Args:
+            percentile: 以该延迟分位数作为对冲等待时间
+            min_delay_seconds: 对冲等待时间下限（秒）
+            min_samples: 延迟样本不足时不发起对冲
+            window_size: 延迟统计窗口
+            budget_ratio: 对冲请求最多占主请求的比例
+            budget_burst: 对冲预算的突发上限
+        """
+        self.percentile = percentile
+        self.min_delay_seconds = min_delay_seconds
+        self.min_samples = min_samples
+        self.latency = LatencyTracker(window_size)
+        self.budget = HedgeBudget(budget_ratio, budget_burst)
+
+        self._lock = threading.Lock()
+        self.primary_requests = 0
+        self.hedges_sent = 0
+        self.hedge_wins = 0
+        self.hedges_skipped = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        """
+        获取对冲等待时间
+
+        Returns:
+            等待秒数；样本不足时返回None
+        """
+        if self.latency.count() < self.min_samples:
+            return None
+        return max(self.min_delay_seconds, self.latency.percentile(self.percentile))
+
+    def on_primary(self):
+        """记录一次主请求"""
+        self.budget.on_request()
+        with self._lock:
+            self.primary_requests += 1
+
+    def try_hedge(self) -> bool:
+        """尝试发起一次对冲，超出预算时返回False"""
+        acquired = self.budget.try_acquire()
+        with self._lock:
+            if acquired:
+                self.hedges_sent += 1
+            else:
+                self.hedges_skipped += 1
+        return acquired
+
+    def record_hedge_win(self):
+        """记录一次对冲请求先于主请求成功"""
+        with self._lock:
+            self.hedge_wins += 1
+
+    def get_stats(self) -> Dict:
+        """获取对冲统计信息"""
+        with self._lock:
+            return {
+                "hedge_delay": self.hedge_delay(),
+                "p50": self.latency.percentile(50),
+                "p99": self.latency.percentile(99),
+                "primary_requests": self.primary_requests,
+                "hedges_sent": self.hedges_sent,
+                "hedge_wins": self.hedge_wins,
+                "hedges_skipped": self.hedges_skipped,
+                "win_rate": self.hedge_wins / self.hedges_sent if self.hedges_sent else 0.0
+            }
+
+
+_policy: Optional[HedgingPolicy] = None
+_policy_lock = threading.Lock()
+
+
+def get_hedging_policy() -> HedgingPolicy:
+    """获取进程内共享的对冲策略"""
+    global _policy
+    with _policy_lock:
+        if _policy is None:
+            _policy = HedgingPolicy(**{key: value for key, value in HEDGING_CONFIG.items() if key != "enabled"})
+        return _policy
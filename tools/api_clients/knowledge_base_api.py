@@ -8,38 +8,105 @@ import requests
 import json
 import time
 import logging
-import base64
-from typing import Dict, List, Optional, Any
+import gzip
+import math
+import random
+import threading
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Any
 from datetime import datetime
+from email.utils import parsedate_to_datetime
 from pathlib import Path
 
+from urllib3.exceptions import NewConnectionError
+
+from config import get_api_base_url
+from .concurrency import get_concurrency_controller
+from .circuit_breaker import get_circuit_breaker
+from .metrics import get_api_metrics, record_http, record_retry
+from .transport import get_shared_session, encode_json_body
+from .rate_limiter import get_rate_limiter
+from .batch_planner import plan_upload_batches
+from .streaming_body import UploadDocument, StreamingDocumentBody
+from .search_cache import get_vector_search_cache, normalize_prompt
+from config import (TRANSPORT_CONFIG, KB_UPLOAD_CONFIG, KB_REQUEST_CONFIG, KB_MIRROR_CONFIG,
+                    VECTOR_SEARCH_CACHE_CONFIG, VECTOR_SEARCH_BATCH_CONFIG)
+
 # 配置日志
 import os
-os.makedirs("logs", exist_ok=True)
+from config import LOGGING_CONFIG
+os.makedirs(os.path.dirname(LOGGING_CONFIG["kb_log"]) or ".", exist_ok=True)
 
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s',
     handlers=[
-        logging.FileHandler('logs/knowledge_base_api.log'),
+        logging.FileHandler(LOGGING_CONFIG["kb_log"]),
         logging.StreamHandler()
     ]
 )
 
+def _payload_size(request_kwargs: Dict) -> int:
+    """估算请求体字节数（请求未完成时无法从响应中读取）"""
+    if request_kwargs.get("json") is not None:
+        return len(json.dumps(request_kwargs["json"]).encode("utf-8"))
+    return len(request_kwargs.get("data") or b"")
+
+
+# 重复发送不会产生额外副作用的HTTP方法
+_IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+# 批量上传结果 failed_files 中的失败类型（reason）
+UPLOAD_REJECTED = "rejected"   # 接口在返回结果的 failed 中列出（更新时通常是文档已不存在）
+UPLOAD_ERROR = "error"         # 读取文件失败、请求失败或已停止上传
+
+
+def _not_sent(error: Exception) -> bool:
+    """请求是否确定未到达服务端（连接超时或无法建立连接）"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(error, requests.exceptions.ConnectionError) and isinstance(reason, NewConnectionError)
+
+
+def _retry_after(response) -> Optional[float]:
+    """解析以秒为单位的 Retry-After 响应头"""
+    try:
+        return max(0.0, float(response.headers.get("Retry-After")))
+    except (TypeError, ValueError):
+        return None
+
+
+def _timestamp(value) -> float:
+    """文档列表中的时间戳统一为秒（接口可能返回毫秒）"""
+    value = float(value or 0)
+    return value / 1000 if value > 1e11 else value
+
+
+def _server_time(response) -> Optional[float]:
+    """解析响应头 Date 中的服务端时间（秒级精度），缺失或格式错误时返回None"""
+    try:
+        return parsedate_to_datetime(response.headers["Date"]).timestamp()
+    except (KeyError, TypeError, ValueError, IndexError):
+        return None
+
+
 class KnowledgeBaseAPI:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, base_url: str = None, retry_wait: Callable[[float], None] = None):
         """
         初始化GPTBots知识库API客户端
         
         Args:
             api_key: API密钥
+            base_url: API服务地址，默认读取配置（可用 GPTBOTS_BASE_URL 覆盖）
+            retry_wait: 重试退避的等待函数，默认 time.sleep（后台任务中传入可响应暂停/取消的等待）
         """
         self.api_key = api_key
         self.logger = logging.getLogger(__name__)
         
-        # 根据endpoint设置基础URL
-        # 使用新的内网IP地址
-        self.base_url = "http://10.52.20.41:19080"
+        self.base_url = (base_url or get_api_base_url()).rstrip("/")
         
         # API端点URLs
         self.knowledge_base_list_url = f"{self.base_url}/v1/bot/knowledge/base/page"
@@ -54,7 +121,25 @@ class KnowledgeBaseAPI:
         self.vector_match_url = f"{self.base_url}/v1/vector/match"
         self.retry_embedding_url = f"{self.base_url}/v1/bot/data/retry/batch"
         
-        self.session = requests.Session()
+        # 进程内共享的连接池，复用长连接
+        self.session = get_shared_session()
+        
+        # 进程内共享的自适应并发控制器
+        self.concurrency = get_concurrency_controller("kb")
+        
+        # 与GPTBots API共享的熔断器，后端故障时快速失败
+        self.circuit = get_circuit_breaker("gptbots")
+        
+        # 进程内共享的API调用指标
+        self.metrics = get_api_metrics()
+        
+        # 进程内共享的向量检索结果缓存
+        self.search_cache = get_vector_search_cache()
+        
+        # 服务端时间减本机时间（秒），按最近一次响应的 Date 头估算，用于比较文档创建时间
+        self.server_clock_offset: Optional[float] = None
+        
+        self.retry_wait = retry_wait or time.sleep
         
     def _get_headers(self) -> Dict[str, str]:
         """获取标准请求头"""
@@ -63,30 +148,119 @@ class KnowledgeBaseAPI:
             "Content-Type": "application/json"
         }
     
-    def _make_request(self, method: str, url: str, **kwargs) -> Optional[Dict]:
+    def _make_request(self, method: str, url: str, idempotent: bool = None, **kwargs) -> Optional[Dict]:
         """
         统一的HTTP请求处理
         
+        未指定超时时使用 KB_REQUEST_CONFIG 的连接/读取超时。重复发送安全的请求在超时、连接错误和
+        可重试状态码时按随机退避重试（优先遵循 Retry-After）；新增类请求携带同一个 Idempotency-Key，
+        只在确定未被服务端处理时（无法建立连接、429限流）重试，结果不确定时返回的错误带 "ambiguous": True。
+        
         Args:
             method: HTTP方法
             url: 请求URL
+            idempotent: 重复发送是否安全，默认 GET/PUT/DELETE 为安全
             **kwargs: 其他请求参数
             
         Returns:
             响应数据或None
         """
+        if idempotent is None:
+            idempotent = method.upper() in _IDEMPOTENT_METHODS
+        kwargs.setdefault("timeout", (KB_REQUEST_CONFIG["connect_timeout"], KB_REQUEST_CONFIG["read_timeout"]))
+        if not idempotent:
+            # 重试时保持不变，支持幂等键的服务端可据此去重
+            kwargs["headers"] = {"Idempotency-Key": uuid.uuid4().hex, **kwargs.get("headers", {})}
+        
+        # 较大的JSON请求体（如base64编码的文档）按配置进行gzip压缩
+        if TRANSPORT_CONFIG["gzip_requests"] and kwargs.get("json") is not None:
+            body, body_headers = encode_json_body(kwargs.pop("json"))
+            kwargs["data"] = body
+            kwargs["headers"] = {**kwargs.get("headers", {}), **body_headers}
+        
+        max_retries = max(0, KB_REQUEST_CONFIG["max_retries"])
+        for attempt in range(max_retries + 1):
+            if attempt:
+                record_retry("knowledge_base", url, self.api_key)
+            result, retryable, retry_after = self._send_request(method, url, idempotent, **kwargs)
+            if not retryable or attempt == max_retries:
+                return result
+            
+            backoff = min(KB_REQUEST_CONFIG["backoff_max"], KB_REQUEST_CONFIG["backoff_base"] * 2 ** attempt)
+            wait_time = min(KB_REQUEST_CONFIG["backoff_max"], retry_after) if retry_after is not None \
+                else random.uniform(0, backoff)
+            logging.warning(f"知识库API请求失败（{result['error']}），{wait_time:.1f} 秒后重试 "
+                            f"({attempt + 1}/{max_retries}): {url}")
+            self.retry_wait(wait_time)
+        return None
+    
+    def _send_request(self, method: str, url: str, idempotent: bool,
+                      **kwargs) -> Tuple[Optional[Dict], bool, Optional[float]]:
+        """
+        发送一次请求
+        
+        Returns:
+            (响应数据或错误, 是否可以重试, 服务端要求的等待时间)
+        """
+        if not self.circuit.allow_request():
+            retry_after = self.circuit.retry_after()
+            logging.warning(f"服务熔断中，请求被拒绝（{retry_after:.0f} 秒后探测）: {url}")
+            return {"error": "CircuitOpen", "message": f"服务暂不可用，{retry_after:.0f} 秒后重试"}, False, None
+        
+        start_time = time.time()
+        recorded = False
         try:
-            response = self.session.request(method, url, **kwargs)
+            with self.concurrency.slot():
+                start_time = time.time()
+                response = self.session.request(method, url, **kwargs)
+            server_time = _server_time(response)
+            if server_time is not None:
+                self.server_clock_offset = server_time - time.time()
+            if response.status_code >= 500:
+                self.circuit.record_failure(f"HTTP {response.status_code}")
+            else:
+                self.circuit.record_success()
+            recorded = True
+            self.concurrency.record_response(response.status_code, time.time() - start_time)
+            record_http("knowledge_base", url, self.api_key, time.time() - start_time, response)
             
             if response.status_code == 200:
-                return response.json()
-            else:
-                logging.error(f"API请求失败 - 状态码: {response.status_code}, 响应: {response.text}")
-                return {"error": f"HTTP {response.status_code}", "message": response.text}
+                return response.json(), False, None
+            
+            logging.error(f"API请求失败 - 状态码: {response.status_code}, 响应: {response.text}")
+            result = {"error": f"HTTP {response.status_code}", "message": response.text}
+            if not idempotent and response.status_code >= 500:
+                # 新增类请求遇到5xx时服务端可能已经处理
+                result["ambiguous"] = True
+            retryable = response.status_code in KB_REQUEST_CONFIG["retry_statuses"] and (
+                idempotent or response.status_code == 429)
+            return result, retryable, _retry_after(response) if retryable else None
                 
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            self.circuit.record_failure(type(e).__name__)
+            recorded = True
+            if isinstance(e, requests.exceptions.Timeout):
+                self.concurrency.record_throttle("请求超时")
+                error = "Timeout"
+                logging.error(f"API请求超时: {str(e)}")
+            else:
+                self.concurrency.record_error()
+                error = "ConnectionError"
+                logging.error(f"API连接错误: {str(e)}")
+            record_http("knowledge_base", url, self.api_key, time.time() - start_time,
+                        error=e, bytes_sent=_payload_size(kwargs))
+            result = {"error": error, "message": str(e)}
+            not_sent = _not_sent(e)
+            if not idempotent and not not_sent:
+                result["ambiguous"] = True
+            return result, idempotent or not_sent, None
+            
         except Exception as e:
+            if not recorded:
+                # 放行的请求必须记录结果（如 ChunkedEncodingError、指标记录异常），否则半开状态的探测名额无法归还
+                self.circuit.record_failure(type(e).__name__)
             logging.error(f"API请求异常: {str(e)}")
-            return {"error": "Exception", "message": str(e)}
+            return {"error": "Exception", "message": str(e)}, False, None
     
     def get_knowledge_bases(self) -> Optional[Dict]:
         """
@@ -130,6 +304,71 @@ class KnowledgeBaseAPI:
             params=params
         )
     
+    def iter_documents(self, knowledge_base_id: str, page_size: int = None, prefetch_pages: int = None,
+                       progress_callback: Callable[[int, int], None] = None) -> Iterator[Dict]:
+        """
+        按页遍历知识库的全部文档，后续页面并发预取
+        
+        先请求第一页获得文档总数，之后最多 prefetch_pages 个页面同时在途，按页码顺序产出文档，
+        单页失败时按退避间隔重试；
+        遍历期间知识库有增删时，相邻页面之间可能出现重复或遗漏的文档。
+        
+        Args:
+            knowledge_base_id: 知识库ID
+            page_size: 每页数量（10-100），默认读取配置
+            prefetch_pages: 同时请求的页数，默认读取配置
+            progress_callback: 进度回调，参数为 (已获取文档数, 文档总数)，每获取一页调用一次
+            
+        Yields:
+            文档信息字典（id, name, format, status, chunk, token, char_count, create_time, update_time 等）
+            
+        Raises:
+            RuntimeError: 某一页获取失败
+        """
+        page_size = min(100, max(10, int(page_size or KB_MIRROR_CONFIG["page_size"])))
+        prefetch_pages = max(1, int(prefetch_pages or KB_MIRROR_CONFIG["prefetch_pages"]))
+        
+        def fetch(page):
+            for attempt in range(KB_MIRROR_CONFIG["page_retries"] + 1):
+                if attempt:
+                    self.retry_wait(2 ** (attempt - 1))
+                result = self.get_documents(knowledge_base_id, page=page, page_size=page_size)
+                if result and "error" not in result:
+                    return result
+            error = result.get("message", "未知错误") if result else "API调用失败"
+            raise RuntimeError(f"获取文档列表第 {page} 页失败: {error}")
+        
+        first = fetch(1)
+        total = first.get("total", 0)
+        fetched = len(first.get("list", []))
+        if progress_callback:
+            progress_callback(fetched, total)
+        yield from first.get("list", [])
+        
+        pages = math.ceil(total / page_size)
+        if pages <= 1:
+            return
+        
+        executor = ThreadPoolExecutor(max_workers=prefetch_pages, thread_name_prefix="kb-doc-page")
+        try:
+            # 按页码顺序产出，每取走一页补充提交下一页，在途页数不超过 prefetch_pages
+            next_page = 2
+            in_flight = deque()
+            while next_page <= pages and len(in_flight) < prefetch_pages:
+                in_flight.append(executor.submit(fetch, next_page))
+                next_page += 1
+            while in_flight:
+                documents = in_flight.popleft().result().get("list", [])
+                if next_page <= pages:
+                    in_flight.append(executor.submit(fetch, next_page))
+                    next_page += 1
+                fetched += len(documents)
+                if progress_callback:
+                    progress_callback(fetched, total)
+                yield from documents
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+    
     def add_text_documents(self, files: List[Dict], knowledge_base_id: str = None, 
                           chunk_token: int = 600, splitter: str = None) -> Optional[Dict]:
         """
@@ -160,12 +399,177 @@ class KnowledgeBaseAPI:
         else:
             payload["chunk_token"] = chunk_token
         
-        return self._make_request(
+        result = self._make_request(
             "POST",
             self.add_text_doc_url,
             headers=self._get_headers(),
             json=payload
         )
+        self.search_cache.invalidate(self.api_key, knowledge_base_id)
+        return result
+    
+    def add_text_documents_streaming(self, documents: List[UploadDocument], knowledge_base_id: str = None,
+                                     chunk_token: int = 600, splitter: str = None,
+                                     timeout: float = None) -> Optional[Dict]:
+        """
+        添加文本类文档，请求体边读取文件边base64编码，不在内存中保留完整的编码结果
+        
+        Args:
+            documents: 待上传的文档
+            knowledge_base_id: 目标知识库ID（可选）
+            chunk_token: 分块Token数（默认600）
+            splitter: 分隔符（可选）
+            timeout: 请求超时时间（秒），默认读取配置
+            
+        Returns:
+            上传结果或None，请求结果不确定时只重发未创建的文档（见 _send_documents）
+        """
+        logging.info(f"正在添加 {len(documents)} 个文本文档...")
+        
+        fields = {}
+        if knowledge_base_id:
+            fields["knowledge_base_id"] = knowledge_base_id
+        if splitter:
+            fields["splitter"] = splitter
+        else:
+            fields["chunk_token"] = chunk_token
+        
+        result = self._send_documents("POST", self.add_text_doc_url, documents, fields, timeout)
+        self.search_cache.invalidate(self.api_key, knowledge_base_id)
+        return result
+    
+    def update_text_documents_streaming(self, documents: List[UploadDocument], chunk_token: int = 600,
+                                        splitter: str = None, timeout: float = None) -> Optional[Dict]:
+        """
+        更新文本类文档（流式请求体）
+        
+        Args:
+            documents: 待更新的文档（需包含doc_id）
+            chunk_token: 分块Token数（默认600）
+            splitter: 分隔符（可选）
+            timeout: 请求超时时间（秒），默认读取配置
+            
+        Returns:
+            更新结果或None
+        """
+        logging.info(f"正在更新 {len(documents)} 个文本文档...")
+        
+        fields = {"splitter": splitter} if splitter else {"chunk_token": chunk_token}
+        result = self._send_documents("PUT", self.update_text_doc_url, documents, fields, timeout)
+        self.search_cache.invalidate(self.api_key, doc_ids=[doc.doc_id for doc in documents])
+        return result
+    
+    def _send_documents(self, method: str, url: str, documents: List[UploadDocument], fields: Dict,
+                        timeout: float = None) -> Optional[Dict]:
+        """
+        以流式请求体发送文档列表
+        
+        新增文档的请求结果不确定（超时、连接中断、5xx）时，按文档名和创建时间在知识库中查找本次请求已创建的文档，
+        只重发缺失的文档，避免重试产生重复文档；已确认创建的文档合并到返回结果的 doc 列表中，
+        最终仍失败的文档列入 failed。未指定知识库ID时无法查询，直接返回错误。
+        """
+        knowledge_base_id = fields.get("knowledge_base_id")
+        reconcile = method == "POST" and knowledge_base_id and KB_REQUEST_CONFIG["reconcile_adds"]
+        pending = documents
+        confirmed = []
+        for _ in range(KB_REQUEST_CONFIG["max_retries"] + 1):
+            since = time.time()
+            result = self._send_document_body(method, url, pending, fields, timeout)
+            if not (reconcile and result and result.get("ambiguous")):
+                break
+            created = self._find_created_documents(knowledge_base_id, [doc.file_name for doc in pending], since)
+            if created is None:
+                break
+            confirmed += [{"doc_id": created[doc.file_name], "doc_name": doc.file_name}
+                          for doc in pending if doc.file_name in created]
+            pending = [doc for doc in pending if doc.file_name not in created]
+            logging.warning(f"新增文档请求结果不确定（{result['error']}），已确认创建 {len(created)} 个，"
+                            f"重发 {len(pending)} 个")
+            if not pending:
+                return {"doc": confirmed, "failed": []}
+        
+        if not confirmed:
+            return result
+        if result and "error" not in result:
+            return {**result, "doc": confirmed + result.get("doc", [])}
+        return {"doc": confirmed, "failed": [doc.file_name for doc in pending]}
+    
+    def _find_created_documents(self, knowledge_base_id: str, names: List[str],
+                                since: float) -> Optional[Dict[str, str]]:
+        """
+        查找请求发出后创建的同名文档
+        
+        文档创建时间由服务端记录：请求发出时间按最近一次响应的 Date 头换算为服务端时间，
+        并放宽 reconcile_time_margin 秒，容忍时钟偏差和秒级时间戳。
+        只扫描可能包含新文档的页面：按第一页的创建时间判断列表顺序，倒序时从第一页向后、
+        正序时从最后一页向前扫描，扫描到包含早于该时间的文档的页面或已找到全部文档时停止；
+        无法判断顺序时从第一页向后扫描，找到全部文档后停止。
+        
+        Args:
+            knowledge_base_id: 知识库ID
+            names: 待确认的文档名
+            since: 请求发出时的本机时间
+        
+        Returns:
+            文档名 -> 最新创建的文档ID，文档列表获取失败时返回None
+        """
+        wanted = set(names)
+        page_size = 100
+        candidates: List[Tuple[str, float, str]] = []
+        
+        def scan(page: int) -> Tuple[int, List[float]]:
+            result = self.get_documents(knowledge_base_id, page=page, page_size=page_size)
+            if not result or "error" in result:
+                raise RuntimeError(f"获取文档列表第 {page} 页失败: "
+                                   f"{result.get('message', '未知错误') if result else 'API调用失败'}")
+            times = []
+            for doc in result.get("list", []):
+                create_time = _timestamp(doc.get("create_time"))
+                times.append(create_time)
+                if doc.get("name") in wanted:
+                    candidates.append((doc["name"], create_time, doc.get("id")))
+            return result.get("total", 0), times
+        
+        try:
+            total, times = scan(1)
+            # 第一页的响应已更新服务端时钟偏差
+            since += (self.server_clock_offset or 0.0) - KB_REQUEST_CONFIG["reconcile_time_margin"]
+            pages = math.ceil(total / page_size)
+            newest_first = bool(times) and times[0] > times[-1]
+            oldest_first = bool(times) and times[0] < times[-1]
+            order = range(pages, 1, -1) if oldest_first else range(2, pages + 1)
+            stale = newest_first and min(times) < since
+            for page in order:
+                if stale or wanted <= {name for name, create_time, _ in candidates if create_time >= since}:
+                    break
+                _, times = scan(page)
+                # 按创建时间排序的列表中，页面已包含早于 since 的文档时之后扫描的页面更早
+                stale = (newest_first or oldest_first) and bool(times) and min(times) < since
+        except RuntimeError as e:
+            logging.error(f"确认已创建的文档失败: {e}")
+            return None
+        
+        # 同名文档取最新创建的
+        created = {}
+        for name, create_time, doc_id in sorted(candidates, key=lambda candidate: candidate[1]):
+            if create_time >= since:
+                created[name] = doc_id
+        return created
+    
+    def _send_document_body(self, method: str, url: str, documents: List[UploadDocument], fields: Dict,
+                            timeout: float = None) -> Optional[Dict]:
+        """发送一次文档列表请求体"""
+        body = StreamingDocumentBody(documents, fields)
+        headers = self._get_headers()
+        if TRANSPORT_CONFIG["gzip_requests"] and len(body) >= TRANSPORT_CONFIG["gzip_min_bytes"]:
+            # 压缩需要完整请求体，不再流式发送
+            data = gzip.compress(body.to_bytes(), compresslevel=TRANSPORT_CONFIG["gzip_level"])
+            headers["Content-Encoding"] = "gzip"
+        else:
+            data = body
+        
+        request_kwargs = {"timeout": timeout} if timeout else {}
+        return self._make_request(method, url, headers=headers, data=data, **request_kwargs)
     
     def add_spreadsheet_documents(self, files: List[Dict], knowledge_base_id: str = None,
                                  chunk_token: int = 600, header_row: int = 1) -> Optional[Dict]:
@@ -192,12 +596,14 @@ class KnowledgeBaseAPI:
         if knowledge_base_id:
             payload["knowledge_base_id"] = knowledge_base_id
         
-        return self._make_request(
+        result = self._make_request(
             "POST",
             self.add_spreadsheet_doc_url,
             headers=self._get_headers(),
             json=payload
         )
+        self.search_cache.invalidate(self.api_key, knowledge_base_id)
+        return result
     
     def update_text_documents(self, files: List[Dict], chunk_token: int = 600, 
                              splitter: str = None) -> Optional[Dict]:
@@ -224,12 +630,14 @@ class KnowledgeBaseAPI:
         else:
             payload["chunk_token"] = chunk_token
         
-        return self._make_request(
+        result = self._make_request(
             "PUT",
             self.update_text_doc_url,
             headers=self._get_headers(),
             json=payload
         )
+        self.search_cache.invalidate(self.api_key, doc_ids=[file.get("doc_id") for file in files])
+        return result
     
     def delete_documents(self, doc_ids: List[str]) -> Optional[Dict]:
         """
@@ -247,12 +655,14 @@ class KnowledgeBaseAPI:
             "doc": ",".join(doc_ids)
         }
         
-        return self._make_request(
+        result = self._make_request(
             "DELETE",
             self.delete_doc_url,
             headers=self._get_headers(),
             params=params
         )
+        self.search_cache.invalidate(self.api_key, doc_ids=doc_ids)
+        return result
     
     def add_document_chunks(self, doc_id: str, chunks: List[Dict]) -> Optional[Dict]:
         """
@@ -272,28 +682,28 @@ class KnowledgeBaseAPI:
             "chunks": chunks
         }
         
-        return self._make_request(
+        result = self._make_request(
             "POST",
             self.add_chunks_url,
             headers=self._get_headers(),
             json=payload
         )
+        self.search_cache.invalidate(self.api_key, doc_ids=[doc_id])
+        return result
     
-    def get_document_status(self, data_ids: List[str]) -> Optional[Dict]:
+    def get_document_status(self, data_ids: List[str]) -> Optional[Any]:
         """
         查询文档状态
         
         Args:
-            data_ids: 文档ID列表
+            data_ids: 文档ID列表，编码为重复的查询参数 data_ids=a&data_ids=b
             
         Returns:
-            文档状态或None
+            文档状态列表 [{"data_id", "data_status"}]，失败时返回含error的字典
         """
         logging.info(f"正在查询 {len(data_ids)} 个文档的状态...")
         
-        params = {}
-        for i, data_id in enumerate(data_ids):
-            params[f"data_ids"] = data_id if i == 0 else params["data_ids"] + f"&data_ids={data_id}"
+        params = {"data_ids": list(data_ids)}
         
         return self._make_request(
             "GET",
@@ -305,10 +715,13 @@ class KnowledgeBaseAPI:
     def vector_similarity_search(self, prompt: str, embedding_rate: float = 1.0,
                                 group_ids: List[str] = None, data_ids: List[str] = None,
                                 top_k: int = 10, rerank_version: str = None,
-                                doc_correlation: float = None) -> Optional[Dict]:
+                                doc_correlation: float = None, use_cache: bool = True) -> Optional[Dict]:
         """
         向量相似度匹配
         
+        相同的问题（忽略大小写、全半角和多余空白）和检索参数在缓存有效期内直接返回缓存结果，
+        本应用对相关知识库上传/更新/删除文档后缓存立即失效。
+        
         Args:
             prompt: 查询关键词
             embedding_rate: 关键词和语义检索权重占比
@@ -317,10 +730,27 @@ class KnowledgeBaseAPI:
             top_k: 返回相似度最高的K个值
             rerank_version: 知识重排模型名称
             doc_correlation: 知识相关性得分
+            use_cache: 是否使用检索结果缓存
             
         Returns:
             匹配结果或None
         """
+        return self._vector_search(prompt, embedding_rate, group_ids, data_ids, top_k,
+                                   rerank_version, doc_correlation, use_cache)[0]
+    
+    def _vector_search(self, prompt: str, embedding_rate: float, group_ids: Optional[List[str]],
+                       data_ids: Optional[List[str]], top_k: int, rerank_version: Optional[str],
+                       doc_correlation: Optional[float], use_cache: bool) -> Tuple[Optional[Dict], bool]:
+        """向量相似度匹配，返回 (匹配结果, 是否命中缓存)"""
+        use_cache = use_cache and VECTOR_SEARCH_CACHE_CONFIG["enabled"]
+        if use_cache:
+            cache_key = self.search_cache.make_key(self.api_key, prompt, embedding_rate, group_ids, data_ids,
+                                                   top_k, rerank_version, doc_correlation)
+            cached = self.search_cache.get(cache_key)
+            if cached is not None:
+                return cached, True
+            generation = self.search_cache.generation(cache_key)
+        
         logging.info(f"正在进行向量相似度匹配: {prompt[:50]}...")
         
         payload = {
@@ -338,12 +768,83 @@ class KnowledgeBaseAPI:
         if doc_correlation is not None:
             payload["doc_correlation"] = doc_correlation
         
-        return self._make_request(
+        result = self._make_request(
             "POST",
             self.vector_match_url,
+            idempotent=True,
             headers=self._get_headers(),
             json=payload
         )
+        if use_cache and result and "error" not in result:
+            self.search_cache.put(cache_key, result, generation)
+        return result, False
+    
+    def vector_search_many(self, prompts: Iterable[str], embedding_rate: float = 1.0,
+                           group_ids: List[str] = None, data_ids: List[str] = None,
+                           top_k: int = 10, rerank_version: str = None,
+                           doc_correlation: float = None, use_cache: bool = True,
+                           max_parallel: int = None) -> Iterator[Dict]:
+        """
+        批量向量相似度匹配，按完成顺序逐条产出结果
+        
+        同一批中相同的问题（规范化规则与检索结果缓存一致）只检索一次；最多 max_parallel 个检索同时在途，
+        实际并发仍受自适应并发控制和熔断限制。提前停止遍历时尚未开始的检索会被取消。
+        
+        Args:
+            prompts: 查询关键词列表
+            embedding_rate: 关键词和语义检索权重占比
+            group_ids: 知识库ID列表
+            data_ids: 文档ID列表
+            top_k: 返回相似度最高的K个值
+            rerank_version: 知识重排模型名称
+            doc_correlation: 知识相关性得分
+            use_cache: 是否使用检索结果缓存
+            max_parallel: 同时在途的检索数，默认读取配置
+            
+        Yields:
+            {"prompt": 查询关键词, "indices": 该问题在 prompts 中的全部位置, "result": 匹配结果或None,
+             "latency": 检索耗时（秒，不含排队）, "elapsed": 自批量开始到完成的时间（秒）, "cached": 是否命中缓存}
+        """
+        max_parallel = max(1, int(max_parallel or VECTOR_SEARCH_BATCH_CONFIG["max_parallel"]))
+        
+        # 规范化问题 -> (首次出现的原始问题, 全部位置)
+        queries: Dict[str, Tuple[str, List[int]]] = {}
+        for index, prompt in enumerate(prompts):
+            queries.setdefault(normalize_prompt(prompt), (prompt, []))[1].append(index)
+        if not queries:
+            return
+        logging.info(f"批量向量相似度匹配: {sum(len(q[1]) for q in queries.values())} 个问题, "
+                     f"去重后 {len(queries)} 个")
+        
+        batch_start = time.perf_counter()
+        
+        def search(prompt, indices):
+            start = time.perf_counter()
+            result, cached = self._vector_search(prompt, embedding_rate, group_ids, data_ids, top_k,
+                                                 rerank_version, doc_correlation, use_cache)
+            end = time.perf_counter()
+            return {"prompt": prompt, "indices": indices, "result": result, "latency": end - start,
+                    "elapsed": end - batch_start, "cached": cached}
+        
+        pending_queries = iter(queries.values())
+        executor = ThreadPoolExecutor(max_workers=min(max_parallel, len(queries)),
+                                      thread_name_prefix="kb-vector-search")
+        try:
+            # 每完成一个检索补充提交下一个，在途检索数不超过 max_parallel
+            in_flight = set()
+            for prompt, indices in pending_queries:
+                in_flight.add(executor.submit(search, prompt, indices))
+                if len(in_flight) >= max_parallel:
+                    break
+            while in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    following = next(pending_queries, None)
+                    if following is not None:
+                        in_flight.add(executor.submit(search, *following))
+                    yield future.result()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
     
     def retry_failed_embeddings(self) -> Optional[Dict]:
         """
@@ -357,6 +858,7 @@ class KnowledgeBaseAPI:
         return self._make_request(
             "POST",
             self.retry_embedding_url,
+            idempotent=True,
             headers=self._get_headers(),
             json={}
         )
@@ -365,25 +867,45 @@ class KnowledgeBaseAPI:
                                            knowledge_base_id: str = None,
                                            chunk_token: int = 600,
                                            splitter: str = None,
-                                           batch_size: int = 20) -> Dict:
+                                           batch_size: int = 20,
+                                           progress_callback: Callable[[int, int], None] = None,
+                                           files: List[Path] = None,
+                                           file_callback: Callable[[str, str, str], None] = None,
+                                           concurrent_batches: int = None,
+                                           max_request_bytes: int = None,
+                                           update_doc_ids: Dict[str, str] = None,
+                                           should_stop: Callable[[], bool] = None) -> Dict:
         """
         批量上传目录中的Markdown文件到知识库
         
+        文件按base64编码后的大小装箱分批：每批不超过 batch_size 个文档且请求体不超过 max_request_bytes，
+        小文件合并为较少的请求，大文件不会挤在同一批中导致超时。
+        文件内容在发送请求时按块读取并base64编码，单个请求的内存占用与文档大小无关；
+        上一批在途时预先准备下一批，最多 concurrent_batches 个批次同时在途，请求发起速率受 KB_UPLOAD_CONFIG 限制。
+        
         Args:
             directory_path: 包含Markdown文件的目录路径
             knowledge_base_id: 目标知识库ID
             chunk_token: 分块Token数
             splitter: 分隔符
-            batch_size: 批处理大小（最多20个）
+            batch_size: 单批最大文档数（最多20个）
+            progress_callback: 进度回调，参数为 (已处理文件数, 总文件数)，在每个批次开始前调用
+            files: 只上传这些文件，默认上传目录下全部Markdown文件
+            file_callback: 文件状态回调，参数为 (文件名, 状态: in_flight/done/failed, 文档ID或失败原因)，
+                           并发上传时在工作线程中调用
+            concurrent_batches: 同时在途的批次数，默认读取配置
+            max_request_bytes: 单次请求体字节数上限，默认读取配置
+            update_doc_ids: 文件名 -> 文档ID，提供时改为更新这些已有文档（files中的文件都需有对应文档ID）
+            should_stop: 每个批次提交前检查，返回True时不再提交新的批次，剩余文件记为失败
             
         Returns:
-            上传结果统计
+            上传结果统计，failed_files 中每项为 {"file_name", "error", "reason": UPLOAD_REJECTED/UPLOAD_ERROR}
         """
         directory = Path(directory_path)
         if not directory.exists() or not directory.is_dir():
             return {"error": "目录不存在或不是有效目录"}
         
-        md_files = list(directory.glob("*.md"))
+        md_files = sorted(directory.glob("*.md")) if files is None else list(files)
         if not md_files:
             return {"error": "目录中没有找到Markdown文件"}
         
@@ -398,102 +920,128 @@ class KnowledgeBaseAPI:
             "failed_files": [],
             "batches_processed": 0
         }
+        results_lock = threading.Lock()
         
-        # 分批处理文件
-        for i in range(0, len(md_files), batch_size):
-            batch_files = md_files[i:i + batch_size]
-            batch_num = i // batch_size + 1
-            
-            logging.info(f"处理批次 {batch_num}: {len(batch_files)} 个文件")
-            
-            # 准备文件数据
-            files_data = []
-            for md_file in batch_files:
-                try:
-                    # 读取文件内容
-                    with open(md_file, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                    
-                    # 编码为base64
-                    content_base64 = base64.b64encode(content.encode('utf-8')).decode('utf-8')
-                    
-                    file_data = {
-                        "file_name": md_file.name,
-                        "file_base64": content_base64,
-                        "source_url": f"local://{md_file.name}"
-                    }
-                    files_data.append(file_data)
-                    
-                except Exception as e:
-                    logging.error(f"读取文件 {md_file.name} 失败: {str(e)}")
-                    results["failed_files"].append({
-                        "file_name": md_file.name,
-                        "error": f"读取文件失败: {str(e)}"
-                    })
-                    results["failed_uploads"] += 1
-            
-            if not files_data:
-                continue
-            
-            # 调用API上传
+        concurrent_batches = max(1, int(concurrent_batches or KB_UPLOAD_CONFIG["concurrent_batches"]))
+        rate_limiter = get_rate_limiter("kb_upload", KB_UPLOAD_CONFIG["requests_per_second"])
+        in_flight = threading.BoundedSemaphore(concurrent_batches)
+        
+        batches = plan_upload_batches(
+            md_files,
+            max_docs=min(batch_size, KB_UPLOAD_CONFIG["max_batch_docs"]),
+            max_bytes=max_request_bytes or KB_UPLOAD_CONFIG["max_request_bytes"]
+        )
+        logging.info(f"按请求体大小规划为 {len(batches)} 个上传批次")
+        
+        def record_failure(file_name, error):
+            with results_lock:
+                results["failed_files"].append({"file_name": file_name, "error": error, "reason": UPLOAD_ERROR})
+                results["failed_uploads"] += 1
+            if file_callback:
+                file_callback(file_name, "failed", error)
+        
+        def upload_batch(batch_num, files_data):
             try:
-                upload_result = self.add_text_documents(
-                    files=files_data,
-                    knowledge_base_id=knowledge_base_id,
-                    chunk_token=chunk_token,
-                    splitter=splitter
-                )
+                rate_limiter.acquire()
+                self._upload_batch(batch_num, files_data, knowledge_base_id, chunk_token, splitter,
+                                   results, results_lock, file_callback)
+            finally:
+                in_flight.release()
+        
+        # 分批处理文件：在途批次达到上限时等待，线程池退出时等待全部批次完成
+        with ThreadPoolExecutor(max_workers=concurrent_batches, thread_name_prefix="kb-upload") as executor:
+            planned_files = 0
+            for batch_num, batch_files in enumerate(batches, 1):
+                if should_stop and should_stop():
+                    for md_file in (path for remaining in batches[batch_num - 1:] for path in remaining):
+                        record_failure(md_file.name, "已停止上传（之前的文件上传失败）")
+                    break
+                if progress_callback:
+                    progress_callback(planned_files, len(md_files))
+                planned_files += len(batch_files)
                 
-                if upload_result and "doc" in upload_result:
-                    # 上传成功
-                    successful_docs = upload_result.get("doc", [])
-                    failed_docs = upload_result.get("failed", [])
-                    
-                    results["successful_uploads"] += len(successful_docs)
-                    results["failed_uploads"] += len(failed_docs)
-                    
-                    for doc in successful_docs:
-                        results["uploaded_files"].append(doc)
-                    
-                    for failed_file in failed_docs:
-                        results["failed_files"].append({
-                            "file_name": failed_file,
-                            "error": "API上传失败"
-                        })
-                    
-                    logging.info(f"批次 {batch_num} 完成: 成功 {len(successful_docs)}, 失败 {len(failed_docs)}")
-                    
-                else:
-                    # API调用失败
-                    error_msg = upload_result.get("message", "未知错误") if upload_result else "API调用失败"
-                    logging.error(f"批次 {batch_num} API调用失败: {error_msg}")
-                    
-                    for file_data in files_data:
-                        results["failed_files"].append({
-                            "file_name": file_data["file_name"],
-                            "error": f"API调用失败: {error_msg}"
-                        })
-                    results["failed_uploads"] += len(files_data)
+                logging.info(f"处理批次 {batch_num}: {len(batch_files)} 个文件")
                 
-            except Exception as e:
-                logging.error(f"批次 {batch_num} 处理异常: {str(e)}")
-                for file_data in files_data:
-                    results["failed_files"].append({
-                        "file_name": file_data["file_name"],
-                        "error": f"处理异常: {str(e)}"
-                    })
-                results["failed_uploads"] += len(files_data)
-            
-            results["batches_processed"] += 1
-            
-            # 批次间延迟，避免API限流
-            if i + batch_size < len(md_files):
-                time.sleep(1)
+                # 准备文件数据（只记录文件大小，内容在发送时读取）
+                files_data = []
+                for md_file in batch_files:
+                    try:
+                        doc_id = update_doc_ids.get(md_file.name) if update_doc_ids else None
+                        files_data.append(UploadDocument.from_file(md_file, doc_id=doc_id))
+                    except Exception as e:
+                        logging.error(f"读取文件 {md_file.name} 失败: {str(e)}")
+                        record_failure(md_file.name, f"读取文件失败: {str(e)}")
+                
+                if not files_data:
+                    continue
+                
+                in_flight.acquire()
+                if file_callback:
+                    for file_data in files_data:
+                        file_callback(file_data.file_name, "in_flight", "")
+                executor.submit(upload_batch, batch_num, files_data)
         
         logging.info(f"批量上传完成: 总计 {results['total_files']} 个文件, "
                     f"成功 {results['successful_uploads']} 个, 失败 {results['failed_uploads']} 个")
         
         return results
+    
+    def _upload_batch(self, batch_num: int, files_data: List[UploadDocument], knowledge_base_id: str,
+                      chunk_token: int, splitter: str, results: Dict, results_lock: threading.Lock,
+                      file_callback: Callable[[str, str, str], None] = None):
+        """上传一个批次并将结果合并到 results 中"""
+        successful_docs = []
+        failed_files = []
+        # 接口返回的 failed 可能是文件名，也可能是（更新时的）文档ID
+        file_names = {file_data.file_name: file_data.file_name for file_data in files_data}
+        file_names.update((file_data.doc_id, file_data.file_name) for file_data in files_data if file_data.doc_id)
+        try:
+            if files_data[0].doc_id:
+                upload_result = self.update_text_documents_streaming(
+                    documents=files_data,
+                    chunk_token=chunk_token,
+                    splitter=splitter
+                )
+            else:
+                upload_result = self.add_text_documents_streaming(
+                    documents=files_data,
+                    knowledge_base_id=knowledge_base_id,
+                    chunk_token=chunk_token,
+                    splitter=splitter
+                )
+            
+            if upload_result and "doc" in upload_result:
+                # 上传成功
+                successful_docs = upload_result.get("doc", [])
+                failed_files = [(file_names.get(failed_file, failed_file), "API上传失败", UPLOAD_REJECTED)
+                                for failed_file in upload_result.get("failed", [])]
+                logging.info(f"批次 {batch_num} 完成: 成功 {len(successful_docs)}, 失败 {len(failed_files)}")
+            else:
+                # API调用失败
+                error_msg = upload_result.get("message", "未知错误") if upload_result else "API调用失败"
+                logging.error(f"批次 {batch_num} API调用失败: {error_msg}")
+                failed_files = [(file_data.file_name, f"API调用失败: {error_msg}", UPLOAD_ERROR)
+                                for file_data in files_data]
+        
+        except Exception as e:
+            logging.error(f"批次 {batch_num} 处理异常: {str(e)}")
+            failed_files = [(file_data.file_name, f"处理异常: {str(e)}", UPLOAD_ERROR) for file_data in files_data]
+        
+        with results_lock:
+            results["successful_uploads"] += len(successful_docs)
+            results["failed_uploads"] += len(failed_files)
+            results["uploaded_files"].extend(successful_docs)
+            results["failed_files"].extend(
+                {"file_name": file_name, "error": error, "reason": reason} for file_name, error, reason in failed_files
+            )
+            results["batches_processed"] += 1
+        
+        if file_callback:
+            for doc in successful_docs:
+                file_name = file_names.get(doc.get("doc_id")) or doc.get("doc_name", "")
+                file_callback(file_name, "done", doc.get("doc_id", ""))
+            for file_name, error, _ in failed_files:
+                file_callback(file_name, "failed", error)
 
 
     def upload_markdown_content(self, content: str, filename: str = "document.md",
@@ -514,68 +1062,47 @@ class KnowledgeBaseAPI:
             dict: 上传结果
         """
         try:
-            # 编码内容为base64
-            content_base64 = base64.b64encode(content.encode('utf-8')).decode('utf-8')
-            
-            # 准备文件数据（与批量上传格式一致）
-            file_data = {
-                "file_name": filename,
-                "file_base64": content_base64,
-                "source_url": f"local://{filename}"
-            }
-            
-            # 准备上传数据
-            upload_data = {
-                "files": [file_data]  # 包装成文件列表
-            }
-            
-            # 可选参数
-            if knowledge_base_id:
-                upload_data["knowledge_base_id"] = knowledge_base_id
-            
-            # 分块参数（二选一）
-            if splitter:
-                upload_data["splitter"] = splitter
-            else:
-                upload_data["chunk_token"] = chunk_token
-            
-            # 发送上传请求
-            response = requests.post(
-                self.add_text_doc_url,
-                headers=self._get_headers(),
-                json=upload_data,
+            # 发送上传请求（与批量上传格式一致，base64编码在发送时逐块进行）
+            result = self.add_text_documents_streaming(
+                [UploadDocument(filename, data=content.encode('utf-8'))],
+                knowledge_base_id=knowledge_base_id,
+                chunk_token=chunk_token,
+                splitter=splitter,
                 timeout=300  # 5分钟超时
             )
             
-            if response.status_code == 200:
-                result = response.json()
+            if result and "error" not in result:
                 self.logger.info(f"单文件上传成功: {filename}")
                 return {
                     "success": True,
                     "filename": filename,
                     "chunks_count": result.get("data", {}).get("chunks_count", 0),
+                    "doc_id": (result.get("doc") or [{}])[0].get("doc_id", ""),
                     "message": "上传成功"
                 }
-            else:
-                error_msg = f"上传失败: HTTP {response.status_code}"
+            
+            if result and result.get("error") == "Timeout":
+                self.logger.error(f"单文件上传超时: {filename}")
+                return {"error": "上传超时", "filename": filename}
+            
+            error_msg = "上传失败: API调用失败"
+            status_code = None
+            if result:
+                error_msg = f"上传失败: {result['error']}"
+                if result["error"].startswith("HTTP "):
+                    status_code = int(result["error"][5:])
                 try:
-                    error_data = response.json()
-                    error_msg = error_data.get("message", error_msg)
-                except:
+                    error_msg = json.loads(result.get("message") or "").get("message", error_msg)
+                except (ValueError, AttributeError):
                     pass
-                    
-                self.logger.error(f"单文件上传失败: {filename} - {error_msg}")
-                return {
-                    "error": error_msg,
-                    "filename": filename,
-                    "status_code": response.status_code
-                }
-                
-        except requests.exceptions.Timeout:
-            error_msg = "上传超时"
-            self.logger.error(f"单文件上传超时: {filename}")
-            return {"error": error_msg, "filename": filename}
             
+            self.logger.error(f"单文件上传失败: {filename} - {error_msg}")
+            return {
+                "error": error_msg,
+                "filename": filename,
+                "status_code": status_code
+            }
+                
         except Exception as e:
             error_msg = f"上传异常: {str(e)}"
             self.logger.error(f"单文件上传异常: {filename} - {error_msg}")
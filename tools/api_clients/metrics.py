@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+"""
+API调用指标
+按 客户端/接口/API Key 记录延迟直方图、状态码、重试次数和收发字节数，
+并导出为Prometheus文本格式（文件或本地HTTP接口）
+"""
+
+import os
+import threading
+import time
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from config import METRICS_CONFIG
+from .transport import get_transport_stats
+from .search_cache import get_vector_search_cache
+
+# 每个2的幂区间划分的子桶数（2^5=32），相对误差不超过 1/16
+_SUB_BUCKET_BITS = 5
+_QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+
+def _bucket(value_us: int) -> Tuple[int, int]:
+    """将微秒值映射到 (指数, 尾数) 桶"""
+    if value_us < (1 << _SUB_BUCKET_BITS):
+        return 0, value_us
+    exponent = value_us.bit_length() - _SUB_BUCKET_BITS
+    return exponent, value_us >> exponent
+
+
+def _bucket_midpoint(bucket: Tuple[int, int]) -> float:
+    """桶的代表值（微秒）"""
+    exponent, mantissa = bucket
+    lower = mantissa << exponent
+    upper = ((mantissa + 1) << exponent) - 1
+    return (lower + upper) / 2
+
+
+def mask_key(api_key: str) -> str:
+    """对API Key脱敏，用作指标标签"""
+    if not api_key:
+        return "-"
+    if len(api_key) <= 12:
+        return api_key[:4] + "..."
+    return f"{api_key[:8]}...{api_key[-4:]}"
+
+
+class LatencyHistogram:
+    def __init__(self):
+        """
+        初始化延迟直方图
+
+        采用HDR风格的对数-线性分桶：每个2的幂区间再等分为32个子桶，
+        以固定的相对精度覆盖从微秒到数分钟的延迟范围。
+        """
+        self._counts: Dict[Tuple[int, int], int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, seconds: float):
+        """记录一次延迟（秒）"""
+        value_us = max(0, int(seconds * 1_000_000))
+        bucket = _bucket(value_us)
+        self._counts[bucket] = self._counts.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+    def merge(self, other: "LatencyHistogram"):
+        """合并另一个直方图"""
+        for bucket, count in other._counts.items():
+            self._counts[bucket] = self._counts.get(bucket, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def percentile(self, quantile: float) -> Optional[float]:
+        """
+        计算延迟分位数
+
+        Args:
+            quantile: 分位（0-1）
+
+        Returns:
+            延迟（秒），无样本时返回None
+        """
+        if not self.count:
+            return None
+        target = max(1, int(round(quantile * self.count)))
+        seen = 0
+        for bucket in sorted(self._counts):
+            seen += self._counts[bucket]
+            if seen >= target:
+                value = _bucket_midpoint(bucket) / 1_000_000
+                return min(max(value, self.min), self.max)
+        return self.max
+
+
+class EndpointMetrics:
+    def __init__(self):
+        """单个 客户端/接口/API Key 组合的指标"""
+        self.latency = LatencyHistogram()
+        self.status_counts: Dict[str, int] = {}
+        self.requests = 0
+        self.retries = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+
+class ApiMetrics:
+    def __init__(self):
+        """初始化API指标注册表"""
+        self._lock = threading.Lock()
+        self._metrics: Dict[Tuple[str, str, str], EndpointMetrics] = {}
+        self.started_at = time.time()
+
+    def _get(self, client: str, endpoint: str, api_key: str) -> EndpointMetrics:
+        """获取指标项（需持有锁）"""
+        label = (client, endpoint, mask_key(api_key))
+        if label not in self._metrics:
+            self._metrics[label] = EndpointMetrics()
+        return self._metrics[label]
+
+    def record_request(self, client: str, endpoint: str, api_key: str, status, latency: float,
+                       bytes_sent: int = 0, bytes_received: int = 0):
+        """
+        记录一次HTTP请求
+
+        Args:
+            client: 客户端名称（"gptbots" / "knowledge_base"）
+            endpoint: 接口路径
+            api_key: 使用的API Key（记录时脱敏）
+            status: HTTP状态码或异常类型名
+            latency: 耗时（秒）
+            bytes_sent: 请求体字节数
+            bytes_received: 响应体字节数
+        """
+        with self._lock:
+            metrics = self._get(client, endpoint, api_key)
+            metrics.requests += 1
+            metrics.latency.record(latency)
+            metrics.status_counts[str(status)] = metrics.status_counts.get(str(status), 0) + 1
+            metrics.bytes_sent += bytes_sent
+            metrics.bytes_received += bytes_received
+
+    def record_retry(self, client: str, endpoint: str, api_key: str):
+        """记录一次重试"""
+        with self._lock:
+            self._get(client, endpoint, api_key).retries += 1
+
+    def get_stats(self, by_key: bool = False) -> List[Dict]:
+        """
+        获取各接口的指标汇总
+
+        Args:
+            by_key: 是否按API Key分别统计
+
+        Returns:
+            每个接口一行的统计列表，按请求数降序
+        """
+        with self._lock:
+            grouped: Dict[Tuple, EndpointMetrics] = {}
+            for (client, endpoint, key), metrics in self._metrics.items():
+                label = (client, endpoint, key) if by_key else (client, endpoint)
+                target = grouped.setdefault(label, EndpointMetrics())
+                target.latency.merge(metrics.latency)
+                for status, count in metrics.status_counts.items():
+                    target.status_counts[status] = target.status_counts.get(status, 0) + count
+                target.requests += metrics.requests
+                target.retries += metrics.retries
+                target.bytes_sent += metrics.bytes_sent
+                target.bytes_received += metrics.bytes_received
+
+        rows = []
+        for label, metrics in grouped.items():
+            errors = sum(count for status, count in metrics.status_counts.items()
+                         if not (status.isdigit() and int(status) < 400))
+            row = {
+                "client": label[0],
+                "endpoint": label[1],
+                "requests": metrics.requests,
+                "errors": errors,
+                "retries": metrics.retries,
+                "status_counts": dict(metrics.status_counts),
+                "p50": metrics.latency.percentile(0.5),
+                "p90": metrics.latency.percentile(0.9),
+                "p99": metrics.latency.percentile(0.99),
+                "max": metrics.latency.max,
+                "avg": metrics.latency.total / metrics.latency.count if metrics.latency.count else None,
+                "bytes_sent": metrics.bytes_sent,
+                "bytes_received": metrics.bytes_received
+            }
+            if by_key:
+                row["key"] = label[2]
+            rows.append(row)
+
+        rows.sort(key=lambda row: row["requests"], reverse=True)
+        return rows
+
+    def render_prometheus(self) -> str:
+        """
+        生成Prometheus文本格式的指标
+
+        Returns:
+            Prometheus exposition format 文本
+        """
+        lines = [
+            "# HELP gptbots_api_requests_total API请求数（按状态码）",
+            "# TYPE gptbots_api_requests_total counter",
+        ]
+        with self._lock:
+            items = sorted(self._metrics.items())
+            for (client, endpoint, key), metrics in items:
+                for status, count in sorted(metrics.status_counts.items()):
+                    lines.append(
+                        f'gptbots_api_requests_total{{{_labels(client, endpoint, key)},status="{status}"}} {count}'
+                    )
+
+            lines += ["# HELP gptbots_api_retries_total API重试次数",
+                      "# TYPE gptbots_api_retries_total counter"]
+            for (client, endpoint, key), metrics in items:
+                lines.append(f"gptbots_api_retries_total{{{_labels(client, endpoint, key)}}} {metrics.retries}")
+
+            lines += ["# HELP gptbots_api_request_bytes_total 请求体字节数",
+                      "# TYPE gptbots_api_request_bytes_total counter"]
+            for (client, endpoint, key), metrics in items:
+                lines.append(f"gptbots_api_request_bytes_total{{{_labels(client, endpoint, key)}}} {metrics.bytes_sent}")
+
+            lines += ["# HELP gptbots_api_response_bytes_total 响应体字节数",
+                      "# TYPE gptbots_api_response_bytes_total counter"]
+            for (client, endpoint, key), metrics in items:
+                lines.append(
+                    f"gptbots_api_response_bytes_total{{{_labels(client, endpoint, key)}}} {metrics.bytes_received}"
+                )
+
+            lines += ["# HELP gptbots_api_latency_seconds API请求延迟",
+                      "# TYPE gptbots_api_latency_seconds summary"]
+            for (client, endpoint, key), metrics in items:
+                labels = _labels(client, endpoint, key)
+                for quantile in _QUANTILES:
+                    value = metrics.latency.percentile(quantile)
+                    if value is not None:
+                        lines.append(f'gptbots_api_latency_seconds{{{labels},quantile="{quantile}"}} {value:.6f}')
+                lines.append(f"gptbots_api_latency_seconds_sum{{{labels}}} {metrics.latency.total:.6f}")
+                lines.append(f"gptbots_api_latency_seconds_count{{{labels}}} {metrics.latency.count}")
+
+        transport = get_transport_stats()
+        lines += [
+            "# HELP gptbots_http_requests_total 经共享连接池发出的HTTP请求数",
+            "# TYPE gptbots_http_requests_total counter",
+            f"gptbots_http_requests_total {transport['requests']}",
+            "# HELP gptbots_http_connections_opened_total 新建的TCP连接数",
+            "# TYPE gptbots_http_connections_opened_total counter",
+            f"gptbots_http_connections_opened_total {transport['new_connections']}",
+            "# HELP gptbots_http_connection_reuse_ratio 连接复用率",
+            "# TYPE gptbots_http_connection_reuse_ratio gauge",
+            f"gptbots_http_connection_reuse_ratio {transport['reuse_rate']:.4f}"
+        ]
+
+        search_cache = get_vector_search_cache().get_stats()
+        lines += [
+            "# HELP gptbots_vector_search_cache_lookups_total 向量检索缓存查询次数（按是否命中）",
+            "# TYPE gptbots_vector_search_cache_lookups_total counter",
+            f'gptbots_vector_search_cache_lookups_total{{result="hit"}} {search_cache["hits"]}',
+            f'gptbots_vector_search_cache_lookups_total{{result="miss"}} {search_cache["misses"]}',
+            "# HELP gptbots_vector_search_cache_hit_ratio 向量检索缓存命中率",
+            "# TYPE gptbots_vector_search_cache_hit_ratio gauge",
+            f"gptbots_vector_search_cache_hit_ratio {search_cache['hit_rate']:.4f}",
+            "# HELP gptbots_vector_search_cache_removed_total 向量检索缓存移除数（按原因）",
+            "# TYPE gptbots_vector_search_cache_removed_total counter",
+            f'gptbots_vector_search_cache_removed_total{{reason="expired"}} {search_cache["expired"]}',
+            f'gptbots_vector_search_cache_removed_total{{reason="evicted"}} {search_cache["evictions"]}',
+            f'gptbots_vector_search_cache_removed_total{{reason="invalidated"}} {search_cache["invalidations"]}',
+            "# HELP gptbots_vector_search_cache_entries 向量检索缓存条目数",
+            "# TYPE gptbots_vector_search_cache_entries gauge",
+            f"gptbots_vector_search_cache_entries {search_cache['entries']}"
+        ]
+
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str):
+        """
+        将指标写入Prometheus文本文件（供node_exporter textfile collector采集）
+
+        Args:
+            path: 输出文件路径
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(self.render_prometheus())
+        os.replace(temp_path, path)
+
+    def reset(self):
+        """清空所有指标"""
+        with self._lock:
+            self._metrics.clear()
+            self.started_at = time.time()
+
+
+def _labels(client: str, endpoint: str, key: str) -> str:
+    return f'client="{client}",endpoint="{endpoint}",key="{key}"'
+
+
+def record_http(client: str, url: str, api_key: str, latency: float,
+                response=None, error: Exception = None, bytes_sent: int = None):
+    """
+    根据requests响应或异常记录一次请求
+
+    Args:
+        client: 客户端名称
+        url: 请求URL（只取路径作为接口标签）
+        api_key: 使用的API Key
+        latency: 耗时（秒）
+        response: requests.Response，请求失败时为None
+        error: 请求异常
+        bytes_sent: 请求体字节数，默认从 response.request.body 读取
+    """
+    if bytes_sent is None:
+        body = getattr(getattr(response, "request", None), "body", None) or b""
+        bytes_sent = len(body)
+    status = response.status_code if response is not None else type(error).__name__
+    bytes_received = len(response.content) if response is not None else 0
+    get_api_metrics().record_request(
+        client, urlparse(url).path, api_key, status, latency, bytes_sent, bytes_received
+    )
+
+
+def record_retry(client: str, url: str, api_key: str):
+    """
+    记录一次重试
+
+    Args:
+        client: 客户端名称
+        url: 请求URL（只取路径作为接口标签）
+        api_key: 使用的API Key
+    """
+    get_api_metrics().record_retry(client, urlparse(url).path, api_key)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = get_api_metrics().render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_metrics: Optional[ApiMetrics] = None
+_metrics_lock = threading.Lock()
+_exporter_started = False
+
+
+def get_api_metrics() -> ApiMetrics:
+    """获取进程内共享的API指标注册表，首次调用时按配置启动导出"""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = ApiMetrics()
+    if METRICS_CONFIG["enabled"]:
+        start_metrics_exporter()
+    return _metrics
+
+
+def start_metrics_exporter(textfile_path: str = None, http_port: int = None,
+                           interval: float = None) -> bool:
+    """
+    启动指标导出（进程内只启动一次）
+
+    Args:
+        textfile_path: Prometheus文本文件路径，默认读取配置
+        http_port: 本地HTTP端口（提供 /metrics），0表示不启动，默认读取配置
+        interval: 写文件的间隔（秒）
+
+    Returns:
+        是否本次调用启动了导出
+    """
+    global _exporter_started
+    with _metrics_lock:
+        if _exporter_started:
+            return False
+        _exporter_started = True
+
+    textfile_path = textfile_path or METRICS_CONFIG["textfile_path"]
+    if http_port is None:
+        http_port = int(os.getenv("GPTBOTS_METRICS_PORT") or METRICS_CONFIG["http_port"])
+    interval = interval or METRICS_CONFIG["export_interval"]
+
+    if textfile_path:
+        def export_loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    get_api_metrics().write_textfile(textfile_path)
+                except OSError as e:
+                    logging.warning(f"写入指标文件失败: {str(e)}")
+
+        threading.Thread(target=export_loop, name="metrics-textfile", daemon=True).start()
+
+    if http_port:
+        try:
+            server = ThreadingHTTPServer((METRICS_CONFIG["http_host"], http_port), _MetricsHandler)
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+            logging.info(f"指标接口已启动: http://{METRICS_CONFIG['http_host']}:{http_port}/metrics")
+        except OSError as e:
+            logging.warning(f"指标接口启动失败（端口 {http_port}）: {str(e)}")
+
+    return True
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+请求速率限制器
+限制同一类请求的发起速率（每秒请求数），多个线程共享同一个限制器时按先后顺序错开发起时间
+"""
+
+import threading
+import time
+from typing import Dict
+
+
+class RateLimiter:
+    def __init__(self, name: str, requests_per_second: float):
+        """
+        初始化速率限制器
+
+        Args:
+            name: 限制器名称
+            requests_per_second: 每秒最多发起的请求数，小于等于0表示不限制
+        """
+        self.name = name
+        self.interval = 1.0 / requests_per_second if requests_per_second > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_at = 0.0
+        self.total_waited = 0.0
+
+    def acquire(self) -> float:
+        """
+        等待到允许发起下一个请求的时间
+
+        Returns:
+            本次等待的秒数
+        """
+        if self.interval <= 0:
+            return 0.0
+        with self._lock:
+            now = time.time()
+            start_at = max(now, self._next_at)
+            self._next_at = start_at + self.interval
+        wait = start_at - now
+        if wait > 0:
+            time.sleep(wait)
+            with self._lock:
+                self.total_waited += wait
+        return wait
+
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(name: str, requests_per_second: float) -> RateLimiter:
+    """
+    获取进程内共享的速率限制器，速率配置变化时重新创建
+
+    Args:
+        name: 限制器名称
+        requests_per_second: 每秒最多发起的请求数
+
+    Returns:
+        RateLimiter实例
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        interval = 1.0 / requests_per_second if requests_per_second > 0 else 0.0
+        if limiter is None or limiter.interval != interval:
+            limiter = RateLimiter(name, requests_per_second)
+            _limiters[name] = limiter
+        return limiter
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+向量检索结果缓存
+以 (API Key, 规范化后的问题, 检索参数) 为键缓存向量相似度匹配结果，按有效期和最近最少使用淘汰；
+本应用新增/更新/删除文档或文档变为可检索时，使可能受影响的缓存立即失效
+"""
+
+import copy
+import hashlib
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import VECTOR_SEARCH_CACHE_CONFIG
+
+
+def normalize_prompt(prompt: str) -> str:
+    """规范化检索问题：全角转半角、合并空白、忽略大小写"""
+    return " ".join(unicodedata.normalize("NFKC", prompt).split()).casefold()
+
+
+def _fingerprint(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def _scope(ids: Optional[List[str]]) -> Optional[Tuple[str, ...]]:
+    # None 表示不限范围，[] 表示不检索任何内容，二者含义不同需区分
+    return tuple(sorted(set(ids))) if ids is not None else None
+
+
+class VectorSearchCache:
+    def __init__(self, max_entries: int = None, ttl_seconds: float = None):
+        """
+        初始化向量检索结果缓存
+
+        Args:
+            max_entries: 最多缓存的结果数，默认读取配置
+            ttl_seconds: 缓存有效期（秒），默认读取配置
+        """
+        self.max_entries = max_entries or VECTOR_SEARCH_CACHE_CONFIG["max_entries"]
+        self.ttl_seconds = ttl_seconds or VECTOR_SEARCH_CACHE_CONFIG["ttl_seconds"]
+        # 键 -> (过期时间, 知识库范围, 文档范围, 结果)，按最近使用顺序排列
+        self._entries: "OrderedDict[Tuple, Tuple[float, Optional[Tuple], Optional[Tuple], Dict]]" = OrderedDict()
+        # API Key指纹 -> 失效次数，检索期间发生失效的结果不写入缓存
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(api_key: str, prompt: str, embedding_rate: float, group_ids: Optional[List[str]],
+                 data_ids: Optional[List[str]], top_k: int, rerank_version: Optional[str],
+                 doc_correlation: Optional[float]) -> Tuple:
+        """
+        生成缓存键
+
+        Returns:
+            (API Key指纹, 规范化问题, embedding_rate, 知识库范围, 文档范围, top_k, rerank_version, doc_correlation)
+        """
+        return (_fingerprint(api_key), normalize_prompt(prompt), float(embedding_rate), _scope(group_ids),
+                _scope(data_ids), int(top_k), rerank_version or None,
+                float(doc_correlation) if doc_correlation is not None else None)
+
+    def get(self, key: Tuple) -> Optional[Dict]:
+        """获取未过期的缓存结果，未命中时返回None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                del self._entries[key]
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            result = entry[3]
+        return copy.deepcopy(result)
+
+    def generation(self, key: Tuple) -> int:
+        """缓存键所属API Key当前的失效次数，发起检索前获取，写入缓存时传入"""
+        with self._lock:
+            return self._generations.get(key[0], 0)
+
+    def put(self, key: Tuple, result: Dict, generation: int = None):
+        """
+        缓存检索结果，超出容量时淘汰最久未使用的结果
+
+        Args:
+            key: 缓存键
+            result: 检索结果
+            generation: 发起检索前 generation() 的返回值，检索期间发生过失效时不缓存
+        """
+        entry = (time.time() + self.ttl_seconds, key[3], key[4], copy.deepcopy(result))
+        with self._lock:
+            if generation is not None and generation != self._generations.get(key[0], 0):
+                return
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, api_key: str, knowledge_base_id: Optional[str] = None,
+                   doc_ids: Iterable[str] = None) -> int:
+        """
+        使可能受文档变更影响的缓存失效
+
+        不限范围的检索总是失效；按知识库检索的结果在变更知识库未知（None）或包含在检索范围内时失效；
+        按文档检索的结果在检索范围包含被更新/删除的文档时失效。
+
+        Args:
+            api_key: 发生变更的API Key
+            knowledge_base_id: 发生变更的知识库，None表示未知（如默认知识库、只知道文档ID）
+            doc_ids: 被更新/删除的文档ID
+
+        Returns:
+            失效的缓存数
+        """
+        key_fingerprint = _fingerprint(api_key)
+        changed_docs = set(doc_ids or ())
+        with self._lock:
+            self._generations[key_fingerprint] = self._generations.get(key_fingerprint, 0) + 1
+            stale = []
+            for key, (_, group_ids, data_ids, _) in self._entries.items():
+                if key[0] != key_fingerprint:
+                    continue
+                if group_ids is None and data_ids is None:
+                    stale.append(key)
+                elif group_ids and (knowledge_base_id is None or knowledge_base_id in group_ids):
+                    stale.append(key)
+                elif data_ids and changed_docs.intersection(data_ids):
+                    stale.append(key)
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+        return len(stale)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict:
+        """获取缓存统计"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
+
+
+_vector_search_cache: Optional[VectorSearchCache] = None
+_vector_search_cache_lock = threading.Lock()
+
+
+def get_vector_search_cache() -> VectorSearchCache:
+    """获取进程内共享的向量检索结果缓存"""
+    global _vector_search_cache
+    with _vector_search_cache_lock:
+        if _vector_search_cache is None:
+            _vector_search_cache = VectorSearchCache()
+        return _vector_search_cache
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+流式文档上传请求体
+按块读取文档字节（文件尽量使用mmap映射）并逐块base64编码，直接写入发出的JSON请求体；
+不再为每个文档保留文本、UTF-8字节、base64字符串和JSON字符串多份完整副本，
+单个请求的内存占用只与块大小有关，与文档大小无关
+"""
+
+import json
+import math
+import mmap
+from base64 import b64encode
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Union
+
+# 每次编码的原始字节数，需为3的倍数以保证分块编码结果可直接拼接
+_CHUNK_BYTES = 3 * 64 * 1024
+
+
+class UploadDocument:
+    def __init__(self, file_name: str, path: Path = None, data: bytes = None, source_url: str = None,
+                 doc_id: str = None):
+        """
+        待上传的文档，内容来自文件或内存中的字节
+
+        Args:
+            file_name: 文档名
+            path: 文件路径（与data二选一），记录创建时的文件大小，发送时大小变化则报错
+            data: 文档内容字节
+            source_url: 来源地址，默认 local://文档名
+            doc_id: 更新已有文档时的文档ID
+        """
+        if (path is None) == (data is None):
+            raise ValueError("path 与 data 必须且只能提供一个")
+        self.file_name = file_name
+        self.path = Path(path) if path is not None else None
+        self.data = data
+        self.source_url = source_url or f"local://{file_name}"
+        self.doc_id = doc_id
+        self.size = self.path.stat().st_size if self.path is not None else len(data)
+
+    @classmethod
+    def from_file(cls, path: Union[str, Path], doc_id: str = None) -> "UploadDocument":
+        """由文件创建文档，文档名为文件名"""
+        path = Path(path)
+        return cls(path.name, path=path, doc_id=doc_id)
+
+    @property
+    def encoded_size(self) -> int:
+        """base64编码后的字节数"""
+        return 4 * math.ceil(self.size / 3)
+
+    def iter_base64(self) -> Iterator[bytes]:
+        """逐块产生base64编码后的内容"""
+        if self.data is not None:
+            view = memoryview(self.data)
+            for offset in range(0, len(view), _CHUNK_BYTES):
+                yield b64encode(view[offset:offset + _CHUNK_BYTES])
+            return
+
+        with open(self.path, "rb") as f:
+            size = f.seek(0, 2)
+            if size != self.size:
+                raise IOError(f"文件 {self.path.name} 在上传过程中发生变化")
+            if size == 0:
+                return
+            try:
+                source = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                # 部分文件系统不支持mmap，回退为按块读取
+                source = None
+
+            if source is None:
+                f.seek(0)
+                for block in iter(lambda: f.read(_CHUNK_BYTES), b""):
+                    yield b64encode(block)
+                return
+
+            with source:
+                view = memoryview(source)
+                try:
+                    for offset in range(0, size, _CHUNK_BYTES):
+                        yield b64encode(view[offset:offset + _CHUNK_BYTES])
+                finally:
+                    view.release()
+
+
+def _json_bytes(value) -> bytes:
+    return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+
+class StreamingDocumentBody:
+    def __init__(self, documents: List[UploadDocument], fields: Optional[Dict] = None, list_key: str = "files"):
+        """
+        文档上传的流式JSON请求体：
+        {**fields, list_key: [{"doc_id"（仅更新时）, "file_name", "source_url", "file_base64"}, ...]}
+
+        可作为 requests 的 data 参数：提供 __len__ 以发送 Content-Length，每次迭代重新生成内容，可用于重试。
+
+        Args:
+            documents: 待上传的文档
+            fields: 请求体中的其他字段（如 knowledge_base_id、chunk_token）
+            list_key: 文档列表的字段名
+        """
+        self.documents = documents
+        self.fields = dict(fields or {})
+        self.list_key = list_key
+
+        fields_json = _json_bytes(self.fields)
+        # 其他字段在前，文档列表在后
+        self._prefix = (fields_json[:-1] + b", " if self.fields else b"{") + _json_bytes(list_key) + b": ["
+        self._suffix = b"]}"
+        self._headers = [
+            (b'{"doc_id": ' + _json_bytes(doc.doc_id) + b', ' if doc.doc_id else b"{")
+            + b'"file_name": ' + _json_bytes(doc.file_name) + b', "source_url": ' + _json_bytes(doc.source_url)
+            + b', "file_base64": "'
+            for doc in documents
+        ]
+        self._length = (
+            len(self._prefix) + len(self._suffix) + 2 * max(0, len(documents) - 1)
+            + sum(len(header) + doc.encoded_size + 2 for header, doc in zip(self._headers, documents))
+        )
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self) -> Iterator[bytes]:
+        yield self._prefix
+        for index, (header, doc) in enumerate(zip(self._headers, self.documents)):
+            if index:
+                yield b", "
+            yield header
+            yield from doc.iter_base64()
+            yield b'"}'
+        yield self._suffix
+
+    def to_bytes(self) -> bytes:
+        """生成完整请求体（用于调试或不支持流式发送的场景）"""
+        return b"".join(self)
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+共享HTTP传输层
+进程内所有API客户端共用一个连接池（长连接复用），并统计连接复用率；
+支持对较大的JSON请求体进行gzip压缩
+"""
+
+import gzip
+import json
+import threading
+from typing import Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from config import CONCURRENCY_CONFIG, TRANSPORT_CONFIG
+
+
+class _ConnectionStats:
+    def __init__(self):
+        """连接使用统计"""
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+
+    def on_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def on_new_connection(self):
+        with self._lock:
+            self.new_connections += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            requests_count = self.requests
+            new_connections = self.new_connections
+        reused = max(0, requests_count - new_connections)
+        return {
+            "requests": requests_count,
+            "new_connections": new_connections,
+            "reused_connections": reused,
+            "reuse_rate": reused / requests_count if requests_count else 0.0
+        }
+
+
+_stats = _ConnectionStats()
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        _stats.on_new_connection()
+        return super()._new_conn()
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        _stats.on_new_connection()
+        return super()._new_conn()
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """统计请求数与新建连接数的连接池适配器"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CountingHTTPConnectionPool,
+            "https": _CountingHTTPSConnectionPool
+        }
+
+    def send(self, request, *args, **kwargs):
+        _stats.on_request()
+        return super().send(request, *args, **kwargs)
+
+
+def default_pool_size() -> int:
+    """
+    根据并发配置计算连接池大小
+
+    Returns:
+        所有并发控制器上限之和的2倍（为对冲请求预留连接）
+    """
+    return max(10, 2 * sum(limits.get("max_limit", 1) for limits in CONCURRENCY_CONFIG.values()))
+
+
+def create_session(pool_maxsize: int = None) -> requests.Session:
+    """
+    创建带连接池的Session
+
+    Args:
+        pool_maxsize: 每个主机的最大连接数，默认按并发配置计算
+
+    Returns:
+        requests.Session
+    """
+    pool_maxsize = pool_maxsize or TRANSPORT_CONFIG["pool_maxsize"] or default_pool_size()
+    adapter = PooledHTTPAdapter(
+        pool_connections=TRANSPORT_CONFIG["pool_connections"],
+        pool_maxsize=pool_maxsize,
+        pool_block=TRANSPORT_CONFIG["pool_block"],
+        max_retries=0  # 重试由各客户端自行处理
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({
+        "Connection": "keep-alive",
+        "Accept-Encoding": "gzip, deflate"
+    })
+    return session
+
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def get_shared_session() -> requests.Session:
+    """获取进程内共享的Session"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = create_session()
+        return _session
+
+
+def get_transport_stats() -> Dict:
+    """
+    获取连接复用统计
+
+    Returns:
+        包含请求数、新建连接数和连接复用率的字典
+    """
+    return _stats.snapshot()
+
+
+def encode_json_body(payload, compress: bool = None) -> Tuple[bytes, Dict[str, str]]:
+    """
+    将JSON请求体编码为字节，超过阈值时按配置进行gzip压缩
+
+    Args:
+        payload: 请求体对象
+        compress: 是否允许压缩，默认读取配置
+
+    Returns:
+        (请求体字节, 需要附加的请求头)
+    """
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    headers = {"Content-Type": "application/json"}
+
+    if compress is None:
+        compress = TRANSPORT_CONFIG["gzip_requests"]
+    if compress and len(body) >= TRANSPORT_CONFIG["gzip_min_bytes"]:
+        body = gzip.compress(body, compresslevel=TRANSPORT_CONFIG["gzip_level"])
+        headers["Content-Encoding"] = "gzip"
+
+    return body, headers
@@ -0,0 +1,103 @@
+"""
+API调用指标面板组件
+展示各接口的延迟分位数、状态码、重试次数和收发字节数
+"""
+
+import os
+import streamlit as st
+from config import METRICS_CONFIG
+
+
+def _format_ms(seconds):
+    return f"{seconds * 1000:.0f}" if seconds is not None else "-"
+
+
+def show_api_metrics_panel(key_prefix="api_metrics"):
+    """
+    显示API调用指标面板
+
+    Args:
+        key_prefix: Streamlit组件key前缀，同一页面多次使用时需区分
+    """
+    from .api_clients import get_api_metrics, get_transport_stats, get_vector_search_cache
+
+    metrics = get_api_metrics()
+    transport = get_transport_stats()
+    search_cache = get_vector_search_cache().get_stats()
+
+    by_key = st.checkbox("按API Key分别统计", value=False, key=f"{key_prefix}_by_key")
+    rows = metrics.get_stats(by_key=by_key)
+
+    if not rows:
+        st.info("暂无API调用记录")
+    else:
+        total_requests = sum(row["requests"] for row in rows)
+        total_retries = sum(row["retries"] for row in rows)
+        total_errors = sum(row["errors"] for row in rows)
+        total_sent = sum(row["bytes_sent"] for row in rows)
+
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("请求总数", total_requests)
+        with col2:
+            st.metric("错误", total_errors)
+        with col3:
+            st.metric("重试", total_retries)
+        with col4:
+            st.metric("发送数据(MB)", f"{total_sent / 1024 / 1024:.2f}")
+
+        table = []
+        for row in rows:
+            item = {
+                "客户端": row["client"],
+                "接口": row["endpoint"],
+                "请求数": row["requests"],
+                "错误": row["errors"],
+                "重试": row["retries"],
+                "P50(ms)": _format_ms(row["p50"]),
+                "P90(ms)": _format_ms(row["p90"]),
+                "P99(ms)": _format_ms(row["p99"]),
+                "最大(ms)": _format_ms(row["max"]),
+                "发送(KB)": f"{row['bytes_sent'] / 1024:.1f}",
+                "接收(KB)": f"{row['bytes_received'] / 1024:.1f}",
+                "状态码": ", ".join(f"{status}×{count}" for status, count in sorted(row["status_counts"].items()))
+            }
+            if by_key:
+                item["API Key"] = row["key"]
+            table.append(item)
+        st.dataframe(table, use_container_width=True, hide_index=True)
+
+    st.caption(
+        f"连接池: HTTP请求 {transport['requests']} 次，新建连接 {transport['new_connections']} 个，"
+        f"连接复用率 {transport['reuse_rate']:.1%}"
+    )
+    if search_cache["hits"] or search_cache["misses"]:
+        st.caption(
+            f"向量检索缓存: 命中 {search_cache['hits']} 次 / 未命中 {search_cache['misses']} 次"
+            f"（命中率 {search_cache['hit_rate']:.1%}），当前 {search_cache['entries']} 条，"
+            f"过期 {search_cache['expired']} / 淘汰 {search_cache['evictions']} / 失效 {search_cache['invalidations']}"
+        )
+
+    # 导出说明
+    export_notes = []
+    if METRICS_CONFIG["textfile_path"]:
+        export_notes.append(f"Prometheus文本文件: `{METRICS_CONFIG['textfile_path']}`")
+    http_port = int(os.getenv("GPTBOTS_METRICS_PORT") or METRICS_CONFIG["http_port"])
+    if http_port:
+        export_notes.append(f"HTTP接口: `http://{METRICS_CONFIG['http_host']}:{http_port}/metrics`")
+    if export_notes:
+        st.caption("指标导出 - " + "；".join(export_notes))
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button(
+            "📥 下载Prometheus指标",
+            data=metrics.render_prometheus(),
+            file_name="api_metrics.prom",
+            mime="text/plain",
+            key=f"{key_prefix}_download"
+        )
+    with col2:
+        if st.button("🧹 清空指标", key=f"{key_prefix}_reset"):
+            metrics.reset()
+            st.rerun()
@@ -5,29 +5,42 @@
 
 import streamlit as st
 import os
+import threading
 import time
 from pathlib import Path
 from .utils import log_activity
 from .email_processing import EmailCleaner
-from .api_clients import GPTBotsAPI, KnowledgeBaseAPI
-from config import DIRECTORIES
+from .api_clients import GPTBotsAPI, KnowledgeBaseAPI, RetryQueue, get_hedging_policy
+from .llm_engine import LLMResponseCache, LLMEmailProcessor, LLMWorkerPool, LLM_STAGE, llm_fingerprint
+from .jobs import FileTracker, get_file_state_store, get_dead_letter_queue, track_uploaded
+from .pipeline_stream import StreamStage, StreamPipeline
+from .kb_sync import record_uploaded
+from config import DIRECTORIES, CIRCUIT_RETRY_CONFIG, PIPELINE_CONFIG
 
 
 class AutoProcessingPipeline:
     """全自动处理流水线类"""
     
-    def __init__(self, config, progress_callback=None, status_callback=None):
+    def __init__(self, config, progress_callback=None, status_callback=None, checkpoint=None, job_id=None,
+                 retry_wait=None):
         """
         初始化自动处理流水线
         
         Args:
-            config: 配置参数字典
+            config: 配置参数字典，resume 为True时跳过上次已完成且内容未变化的文件
             progress_callback: 进度回调函数
             status_callback: 状态回调函数
+            checkpoint: 每个文件/批次开始前调用，作为后台任务运行时用于响应暂停和取消
+            job_id: 所属后台任务ID，记录在文件处理状态中
+            retry_wait: API重试退避的等待函数，作为后台任务运行时在退避期间响应暂停和取消
         """
         self.config = config
         self.progress_callback = progress_callback or (lambda x: None)
         self.status_callback = status_callback or (lambda x: None)
+        self.checkpoint = checkpoint or (lambda: None)
+        self.job_id = job_id
+        self.retry_wait = retry_wait
+        self.resume = config.get("resume", False)
         
         # 处理状态
         self.current_step = 0
@@ -46,6 +59,7 @@ class AutoProcessingPipeline:
             "cleaned_count": 0,
             "llm_processed_count": 0,
             "kb_uploaded_count": 0,
+            "llm_cache_hits": 0,
             "errors": [],
             "success": False
         }
@@ -55,6 +69,10 @@ class AutoProcessingPipeline:
         total_progress = (self.current_step * 100 + step_progress) / self.total_steps
         self.progress_callback(min(int(total_progress), 100))
     
+    def _tracker(self, stage):
+        """获取某处理阶段的文件状态记录器"""
+        return FileTracker(get_file_state_store(), stage, self.job_id, get_dead_letter_queue())
+    
     def update_status(self, message):
         """更新状态信息"""
         step_name = self.step_names[self.current_step] if self.current_step < len(self.step_names) else "处理中"
@@ -62,29 +80,6 @@ class AutoProcessingPipeline:
         self.status_callback(full_message)
         log_activity(full_message)
     
-    def extract_llm_content(self, result):
-        """从LLM API响应中提取内容"""
-        try:
-            if "output" in result:
-                output_list = result.get("output", [])
-                content = ""
-                for output_item in output_list:
-                    if "content" in output_item:
-                        content_obj = output_item["content"]
-                        if "text" in content_obj:
-                            content += content_obj["text"] + "\n"
-                return content.strip() if content else None
-            
-            # 备用提取方法
-            return (result.get("answer") or 
-                    result.get("content") or 
-                    result.get("message") or
-                    None)
-                    
-        except Exception as e:
-            self.results["errors"].append(f"内容提取失败: {str(e)}")
-            return None
-    
     def save_uploaded_files(self, uploaded_files):
         """步骤1: 保存上传的文件"""
         self.current_step = 0
@@ -127,7 +122,7 @@ class AutoProcessingPipeline:
         try:
             # 检查输入文件
             upload_dir = DIRECTORIES["upload_dir"]
-            eml_files = list(Path(upload_dir).glob("*.eml"))
+            eml_files = sorted(Path(upload_dir).glob("*.eml"))
             
             if not eml_files:
                 error_msg = "未找到EML文件进行清洗"
@@ -147,11 +142,25 @@ class AutoProcessingPipeline:
             self.update_progress(20)
             self.update_status("执行邮件清洗处理...")
             
+            # 去重需要全部邮件参与比较，续跑时整体重新清洗，内容未变化的Markdown文件不会被改写
+            tracker = self._tracker("cleaning")
+            tracker.plan(eml_files)
+            
             # 执行清洗
-            result = cleaner.process_all_emails()
+            def on_progress(phase, done, total):
+                self.checkpoint()
+                self.update_progress(20 + done * 70 // total if phase == "write" else 20)
+            
+            def on_file(filename, status, detail):
+                if status == "done":
+                    tracker.done(Path(upload_dir) / filename, detail)
+                else:
+                    tracker.failed(Path(upload_dir) / filename, detail)
+            
+            result = cleaner.process_all_emails(progress_callback=on_progress, file_callback=on_file)
             
             if result["success"]:
-                self.results["cleaned_count"] = result.get("processed_count", 0)
+                self.results["cleaned_count"] = result["report"]["unique_emails"]
                 self.update_progress(100)
                 self.update_status(f"数据清洗完成，处理了 {self.results['cleaned_count']} 个文件")
                 return True
@@ -177,81 +186,126 @@ class AutoProcessingPipeline:
             self.update_progress(5)
             self.update_status("初始化GPTBots API客户端...")
             
-            client = GPTBotsAPI(
-                self.config["llm_api_key"]
-            )
+            client, processor = self._create_llm_processor()
+            
+            # 服务熔断期间失败的文件暂存于此，恢复后自动重试
+            park_on_open = self.config.get("park_on_open", CIRCUIT_RETRY_CONFIG["park_on_open"])
+            retry_queue = RetryQueue(client.circuit, CIRCUIT_RETRY_CONFIG["max_wait_seconds"])
             
             # 获取待处理文件
             processed_dir = Path(DIRECTORIES["processed_dir"])
-            md_files = list(processed_dir.glob("*.md"))
-            md_files = [f for f in md_files if f.name != "processing_report.json"]
+            input_files = sorted(processed_dir.glob("*.md"))
             
-            if not md_files:
+            if not input_files:
                 error_msg = "未找到待处理的Markdown文件"
                 self.results["errors"].append(error_msg)
                 self.update_status(error_msg)
                 return False
             
+            tracker = self._tracker(LLM_STAGE)
+            md_files, skipped_files = tracker.plan(
+                input_files, resume=self.resume, check_output=True,
+                fingerprint=llm_fingerprint(self.config["llm_api_key"])
+            )
+            files_by_name = {md_file.name: md_file for md_file in md_files}
+            self.results["llm_skipped_count"] = len(skipped_files)
+            
             self.update_progress(10)
-            self.update_status(f"发现 {len(md_files)} 个文件，开始LLM处理...")
+            if skipped_files:
+                self.update_status(f"跳过已完成的 {len(skipped_files)} 个文件，开始处理剩余 {len(md_files)} 个文件...")
+            else:
+                self.update_status(f"发现 {len(md_files)} 个文件，开始LLM处理...")
             
-            # LLM提示词模板
-            llm_prompt_template = """
-            以下是需要处理的邮件内容：
-
-            {email_content}"""
+            # 合并短邮件：预先批量处理，后续逐个处理时直接取用结果
+            if self.config.get("pack_small_emails", False):
+                self.update_status("合并处理短邮件...")
+                pack_items = []
+                for md_file in md_files:
+                    with open(md_file, 'r', encoding='utf-8') as f:
+                        pack_items.append((md_file.name, f.read()))
+                packed = processor.prefetch_packed(pack_items)
+                self.update_status(f"合并处理完成: {processor.packed_calls} 次调用处理 {packed} 封短邮件")
             
-            # 处理文件
+            # 并发处理文件，结果按顺序回调
             processed_count = 0
             failed_count = 0
             
-            for i, md_file in enumerate(md_files):
-                try:
-                    # 更新进度
-                    progress = int((i + 1) / len(md_files) * 90) + 10
-                    self.update_progress(progress)
-                    self.update_status(f"处理文件 {md_file.name}...")
-                    
-                    # 读取文件内容
-                    with open(md_file, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                    
-                    # 调用LLM API
-                    prompt = llm_prompt_template.format(email_content=content)
-                    response = client.call_agent(prompt)
-                    
-                    if response:
-                        # 提取LLM处理结果
-                        processed_content = self.extract_llm_content(response)
-                        
-                        if processed_content:
-                            # 保存处理结果
-                            output_file = Path(DIRECTORIES["final_dir"]) / md_file.name
-                            output_file.parent.mkdir(parents=True, exist_ok=True)
-                            
-                            with open(output_file, 'w', encoding='utf-8') as f:
-                                f.write(processed_content)
-                            
-                            processed_count += 1
-                        else:
-                            failed_count += 1
-                            self.results["errors"].append(f"LLM处理失败: {md_file.name} - 无法提取处理结果")
-                    else:
+            def handle_result(index, item, outcome):
+                nonlocal processed_count, failed_count
+                md_file, content = item
+                self.update_progress(int((index + 1) / len(md_files) * 90) + 10)
+                self.update_status(f"已完成 {md_file.name} ({index + 1}/{len(md_files)})")
+                
+                if outcome["content"]:
+                    try:
+                        tracker.done(md_file, self._save_llm_output(md_file, outcome["content"]))
+                        processed_count += 1
+                    except Exception as e:
                         failed_count += 1
-                        self.results["errors"].append(f"LLM处理失败: {md_file.name} - API调用失败")
-                    
-                    # 延迟避免API限流
-                    time.sleep(self.config.get("delay", 2))
-                    
-                except Exception as e:
+                        self.results["errors"].append(f"处理文件 {md_file.name} 时出错: {str(e)}")
+                        tracker.failed(md_file, str(e))
+                elif outcome["circuit_open"] and park_on_open:
+                    # 服务熔断中：暂存文件，不再逐个等待超时
+                    retry_queue.park((md_file, content))
+                else:
                     failed_count += 1
-                    error_msg = f"处理文件 {md_file.name} 时出错: {str(e)}"
-                    self.results["errors"].append(error_msg)
+                    self.results["errors"].append(f"LLM处理失败: {md_file.name} - {outcome['error']}")
+                    tracker.failed(md_file, outcome["error"])
+            
+            items = []
+            for md_file in md_files:
+                with open(md_file, 'r', encoding='utf-8') as f:
+                    content = f.read()
+                items.append(((md_file, content), md_file.name, content))
+            
+            pool = LLMWorkerPool(
+                processor,
+                workers=self.config.get("workers"),
+                delay=self.config.get("delay", 2),
+                retry_wait=self.retry_wait
+            )
+            self.update_status(f"{pool.workers} 个工作线程并发处理中...")
+            
+            def before_item(source_name):
+                self.checkpoint()
+                tracker.start(files_by_name[source_name])
+            
+            pool.run(items, handle_result, before_item=before_item)
+            
+            # 等待熔断恢复后处理暂存的文件
+            if len(retry_queue):
+                def retry_parked(item):
+                    nonlocal processed_count, failed_count
+                    md_file, content = item
+                    self.checkpoint()
+                    tracker.start(md_file)
+                    outcome = processor.process(content, md_file.name)
+                    if outcome["content"]:
+                        tracker.done(md_file, self._save_llm_output(md_file, outcome["content"]))
+                        processed_count += 1
+                        return True
+                    if outcome["circuit_open"]:
+                        return False
+                    failed_count += 1
+                    self.results["errors"].append(f"LLM处理失败: {md_file.name} - {outcome['error']}")
+                    tracker.failed(md_file, outcome["error"])
+                    return True
+                
+                def show_waiting(pending, retry_after):
+                    self.update_status(f"服务熔断中，{pending} 个文件等待自动重试（{retry_after:.0f} 秒后探测）")
+                
+                for md_file, _ in retry_queue.drain(retry_parked, show_waiting):
+                    failed_count += 1
+                    self.results["errors"].append(f"LLM处理失败: {md_file.name} - 服务长时间不可用，已放弃重试")
+                    tracker.failed(md_file, "服务长时间不可用，已放弃重试")
             
             self.results["llm_processed_count"] = processed_count
+            self.results["llm_cache_hits"] = processor.cache_hits
+            self.results["llm_retried_files"] = pool.retried_files
+            self.results["llm_hedge_stats"] = get_hedging_policy().get_stats()
             self.update_progress(100)
             
-            if processed_count > 0:
+            if processed_count > 0 or (skipped_files and failed_count == 0):
                 self.update_status(f"LLM处理完成，成功处理 {processed_count} 个文件")
                 return True
             else:
@@ -266,6 +320,26 @@ class AutoProcessingPipeline:
             self.update_status(error_msg)
             return False
     
+    def _create_llm_processor(self):
+        """创建GPTBots客户端和带响应缓存的邮件处理器"""
+        client = GPTBotsAPI(self.config["llm_api_key"], hedging=self.config.get("enable_hedging", False),
+                            retry_wait=self.retry_wait)
+        
+        # 初始化响应缓存，命中缓存的文件不再调用LLM
+        cache = LLMResponseCache(bypass=self.config.get("bypass_llm_cache", False))
+        cache.evict()
+        processor = LLMEmailProcessor(client, self.config["llm_api_key"], cache)
+        return client, processor
+    
+    def _save_llm_output(self, md_file: Path, processed_content: str):
+        """保存单个文件的LLM处理结果，返回输出文件路径"""
+        output_file = Path(DIRECTORIES["final_dir"]) / md_file.name
+        output_file.parent.mkdir(parents=True, exist_ok=True)
+        
+        with open(output_file, 'w', encoding='utf-8') as f:
+            f.write(processed_content)
+        return str(output_file)
+    
     def run_knowledge_base_upload(self):
         """步骤4: 执行知识库上传"""
         self.current_step = 3
@@ -276,30 +350,53 @@ class AutoProcessingPipeline:
             self.update_progress(5)
             self.update_status("初始化知识库API客户端...")
             
-            client = KnowledgeBaseAPI(
-                self.config["kb_api_key"]
-            )
+            client = KnowledgeBaseAPI(self.config["kb_api_key"], retry_wait=self.retry_wait)
             
             # 检查要上传的文件
             final_dir = Path(DIRECTORIES["final_dir"])
-            files_to_upload = list(final_dir.glob("*.md"))
+            candidates = sorted(final_dir.glob("*.md"))
             
-            if not files_to_upload:
+            if not candidates:
                 error_msg = "没有找到要上传的文件"
                 self.results["errors"].append(error_msg)
                 self.update_status(error_msg)
                 return False
             
+            tracker = self._tracker("kb_upload")
+            files_to_upload, skipped_files = tracker.plan(candidates, resume=self.resume)
+            self.results["kb_skipped_count"] = len(skipped_files)
+            if not files_to_upload:
+                self.update_progress(100)
+                self.update_status(f"全部 {len(skipped_files)} 个文件已在上次运行中上传，无需重复上传")
+                return True
+            
             self.update_progress(10)
             self.update_status(f"准备上传 {len(files_to_upload)} 个文件到知识库...")
             
+            def on_batch(done, total):
+                self.checkpoint()
+                self.update_progress(10 + done * 80 // total)
+            
+            def on_upload_state(filename, status, detail):
+                if status == "in_flight":
+                    tracker.start(final_dir / filename)
+                elif status == "done":
+                    tracker.done(final_dir / filename, detail)
+                    record_uploaded(self.config.get("knowledge_base_id"), final_dir / filename, detail)
+                    track_uploaded(self.job_id, client, {detail: filename})
+                else:
+                    tracker.failed(final_dir / filename, detail)
+            
             # 执行批量上传
             upload_result = client.upload_markdown_files_from_directory(
                 directory_path=str(final_dir),
                 knowledge_base_id=self.config.get("knowledge_base_id", ""),
                 chunk_token=self.config.get("chunk_token"),
                 splitter=self.config.get("splitter"),
-                batch_size=10
+                batch_size=10,
+                progress_callback=on_batch,
+                files=files_to_upload,
+                file_callback=on_upload_state
             )
             
             self.update_progress(90)
@@ -361,6 +458,22 @@ class AutoProcessingPipeline:
             if not self.save_uploaded_files(uploaded_files):
                 return self.results
             
+            return self.run_processing_steps()
+            
+        except Exception as e:
+            error_msg = f"自动处理流水线异常: {str(e)}"
+            self.results["errors"].append(error_msg)
+            self.update_status(error_msg)
+            log_activity(error_msg)
+            return self.results
+    
+    def run_processing_steps(self):
+        """运行上传文件保存之后的处理步骤（数据清洗、LLM处理、知识库上传）"""
+        # 合并短邮件需要预先拿到全部邮件，此时按阶段依次执行
+        if self.config.get("streaming", PIPELINE_CONFIG["streaming"]) and not self.config.get("pack_small_emails"):
+            return self.run_streaming_steps()
+        
+        try:
             # 步骤2: 数据清洗
             if not self.run_data_cleaning():
                 return self.results
@@ -389,6 +502,218 @@ class AutoProcessingPipeline:
             self.update_status(error_msg)
             log_activity(error_msg)
             return self.results
+    
+    def run_streaming_steps(self):
+        """
+        流式运行数据清洗、LLM处理和知识库上传
+        
+        各阶段通过有界队列连接并行运行：每写出一个Markdown文件即进入LLM处理，LLM结果凑批后即上传知识库，
+        下游处理不过来时上游阻塞。去重需要比较全部邮件，清洗阶段先完成解析和去重，再逐个写出文件。
+        """
+        self.current_step = 1
+        self.update_status("开始流式处理: 数据清洗 → LLM处理 → 知识库上传")
+        
+        upload_dir = Path(DIRECTORIES["upload_dir"])
+        eml_files = sorted(upload_dir.glob("*.eml"))
+        if not eml_files:
+            error_msg = "未找到EML文件进行清洗"
+            self.results["errors"].append(error_msg)
+            self.update_status(error_msg)
+            return self.results
+        
+        final_dir = Path(DIRECTORIES["final_dir"])
+        file_states = get_file_state_store()
+        cleaning_tracker = self._tracker("cleaning")
+        llm_tracker = self._tracker(LLM_STAGE)
+        kb_tracker = self._tracker("kb_upload")
+        fingerprint = llm_fingerprint(self.config["llm_api_key"])
+        park_on_open = self.config.get("park_on_open", CIRCUIT_RETRY_CONFIG["park_on_open"])
+        
+        client, processor = self._create_llm_processor()
+        kb_client = KnowledgeBaseAPI(self.config["kb_api_key"], retry_wait=self.retry_wait)
+        pool = LLMWorkerPool(processor, workers=self.config.get("workers"), delay=self.config.get("delay", 2),
+                             retry_wait=self.retry_wait)
+        
+        lock = threading.Lock()
+        counts = {
+            "total": len(eml_files), "cleaned": 0,
+            "llm_done": 0, "llm_failed": 0, "llm_skipped": 0,
+            "uploaded": 0, "upload_failed": 0, "kb_skipped": 0
+        }
+        
+        def bump(name, amount=1, error=None):
+            with lock:
+                counts[name] += amount
+                if error:
+                    self.results["errors"].append(error)
+                snapshot = dict(counts)
+            
+            # 三个阶段各占三分之一进度
+            finished = (snapshot["cleaned"]
+                        + snapshot["llm_done"] + snapshot["llm_failed"] + snapshot["llm_skipped"]
+                        + snapshot["uploaded"] + snapshot["upload_failed"] + snapshot["kb_skipped"])
+            self.progress_callback(min(finished * 100 // (snapshot["total"] * 3), 99))
+            self.status_callback(
+                f"[流式处理] 清洗 {snapshot['cleaned']}/{snapshot['total']}，"
+                f"LLM处理 {snapshot['llm_done'] + snapshot['llm_skipped']}（失败 {snapshot['llm_failed']}），"
+                f"知识库上传 {snapshot['uploaded'] + snapshot['kb_skipped']}（失败 {snapshot['upload_failed']}）"
+            )
+        
+        def process_llm(md_file, emit):
+            _, skipped = llm_tracker.plan([md_file], resume=self.resume, check_output=True, fingerprint=fingerprint)
+            if skipped:
+                bump("llm_skipped")
+                emit(Path(file_states.get(LLM_STAGE, md_file)["output"]))
+                return
+            
+            with open(md_file, 'r', encoding='utf-8') as f:
+                content = f.read()
+            llm_tracker.start(md_file)
+            outcome = pool.process_one(md_file.name, content)
+            
+            # 服务熔断时在本线程等待恢复后重试，队列写满后上游随之暂停
+            deadline = time.time() + CIRCUIT_RETRY_CONFIG["max_wait_seconds"]
+            while outcome["circuit_open"] and park_on_open and time.time() < deadline:
+                self.checkpoint()
+                self.status_callback(f"服务熔断中，{client.circuit.retry_after():.0f} 秒后探测，LLM处理等待恢复")
+                if client.circuit.wait_until_ready(min(deadline - time.time(), 5.0)):
+                    outcome = pool.process_one(md_file.name, content)
+            
+            if outcome["content"]:
+                try:
+                    output = self._save_llm_output(md_file, outcome["content"])
+                except Exception as e:
+                    llm_tracker.failed(md_file, str(e))
+                    bump("llm_failed", error=f"处理文件 {md_file.name} 时出错: {str(e)}")
+                    return
+                llm_tracker.done(md_file, output)
+                bump("llm_done")
+                emit(Path(output))
+            else:
+                error = "服务长时间不可用，已放弃重试" if outcome["circuit_open"] else outcome["error"]
+                llm_tracker.failed(md_file, error)
+                bump("llm_failed", error=f"LLM处理失败: {md_file.name} - {error}")
+        
+        def upload_batch(outputs, emit):
+            files_to_upload, skipped = kb_tracker.plan(outputs, resume=self.resume)
+            if skipped:
+                bump("kb_skipped", len(skipped))
+            if not files_to_upload:
+                return
+            
+            def on_upload_state(filename, status, detail):
+                if status == "in_flight":
+                    kb_tracker.start(final_dir / filename)
+                elif status == "done":
+                    kb_tracker.done(final_dir / filename, detail)
+                    record_uploaded(self.config.get("knowledge_base_id"), final_dir / filename, detail)
+                    track_uploaded(self.job_id, kb_client, {detail: filename})
+                else:
+                    kb_tracker.failed(final_dir / filename, detail)
+            
+            upload_result = kb_client.upload_markdown_files_from_directory(
+                directory_path=str(final_dir),
+                knowledge_base_id=self.config.get("knowledge_base_id", ""),
+                chunk_token=self.config.get("chunk_token"),
+                splitter=self.config.get("splitter"),
+                batch_size=len(files_to_upload),
+                files=files_to_upload,
+                file_callback=on_upload_state
+            )
+            if "error" in upload_result:
+                bump("upload_failed", len(files_to_upload), error=f"知识库上传失败: {upload_result['error']}")
+                return
+            
+            for failed_file in upload_result.get("failed_files", []):
+                bump("upload_failed", error=f"文件上传失败: {failed_file.get('file_name', 'unknown')} - "
+                                            f"{failed_file.get('error', 'unknown error')}")
+            bump("uploaded", upload_result.get("successful_uploads", 0))
+            for doc in upload_result.get("uploaded_files", []):
+                emit(doc)
+        
+        queue_size = self.config.get("queue_size") or PIPELINE_CONFIG["queue_size"]
+        stream = StreamPipeline([
+            StreamStage("llm", process_llm, workers=pool.workers, queue_size=queue_size),
+            StreamStage(
+                "kb_upload", upload_batch,
+                workers=self.config.get("upload_workers") or PIPELINE_CONFIG["upload_workers"],
+                queue_size=queue_size,
+                batch_size=PIPELINE_CONFIG["upload_batch_size"],
+                linger=PIPELINE_CONFIG["upload_linger_seconds"]
+            )
+        ], checkpoint=self.checkpoint)
+        
+        # 清洗阶段在当前线程运行，作为流水线的输入源
+        cleaner = EmailCleaner(input_dir=str(upload_dir), output_dir=DIRECTORIES["processed_dir"])
+        cleaning_tracker.plan(eml_files)
+        fed = set()
+        
+        def on_progress(phase, done, total):
+            self.checkpoint()
+            if phase == "write" and done == 0:
+                with lock:
+                    counts["total"] = max(total, 1)
+        
+        def on_file(filename, status, detail):
+            if status != "done":
+                cleaning_tracker.failed(upload_dir / filename, detail)
+                return
+            cleaning_tracker.done(upload_dir / filename, detail)
+            # 被包含的重复邮件与容器邮件对应同一个Markdown文件，只输入一次
+            if detail not in fed:
+                fed.add(detail)
+                bump("cleaned")
+                stream.feed(Path(detail))
+        
+        stream.start()
+        try:
+            result = cleaner.process_all_emails(progress_callback=on_progress, file_callback=on_file)
+            if not result["success"]:
+                stream.abort()
+                error_msg = f"数据清洗失败: {result.get('message', '未知错误')}"
+                self.results["errors"].append(error_msg)
+                self.update_status(error_msg)
+                return self.results
+            stage_stats = stream.finish()
+        except Exception as e:
+            stream.abort(e)
+            error_msg = f"流式处理异常: {str(e)}"
+            self.results["errors"].append(error_msg)
+            self.update_status(error_msg)
+            log_activity(error_msg)
+            return self.results
+        except BaseException as e:
+            # 任务取消等需要向上抛出的情况：先停止各阶段工作线程
+            stream.abort(e)
+            raise
+        
+        self.results.update({
+            "cleaned_count": counts["cleaned"],
+            "llm_processed_count": counts["llm_done"],
+            "llm_skipped_count": counts["llm_skipped"],
+            "llm_cache_hits": processor.cache_hits,
+            "llm_retried_files": pool.retried_files,
+            "llm_hedge_stats": get_hedging_policy().get_stats(),
+            "kb_uploaded_count": counts["uploaded"],
+            "kb_skipped_count": counts["kb_skipped"],
+            "stream_stats": stage_stats
+        })
+        
+        if counts["llm_done"] + counts["llm_skipped"] == 0:
+            self.results["errors"].append("LLM处理失败，没有文件被成功处理")
+        elif counts["uploaded"] + counts["kb_skipped"] == 0:
+            self.results["errors"].append("知识库上传失败: 没有文件上传成功")
+        else:
+            self.current_step = 4
+            self.update_progress(100)
+            first_upload = stage_stats[-1]["first_output_seconds"]
+            self.update_status(
+                "全自动处理流水线完成！" + (f"首个文档在 {first_upload:.1f} 秒后进入知识库" if first_upload else "")
+            )
+            self.results["success"] = True
+            log_activity("全自动处理流水线成功完成（流式）")
+        
+        return self.results
 
 
 def run_auto_processing_pipeline(uploaded_files, config):
@@ -0,0 +1,36 @@
+"""
+API客户端缓存
+使用 st.cache_resource 在Streamlit会话和页面重跑之间复用客户端实例，
+避免每次重跑都重新创建客户端
+"""
+
+import streamlit as st
+from .api_clients import GPTBotsAPI, KnowledgeBaseAPI
+
+
+@st.cache_resource(show_spinner=False)
+def get_gptbots_client(api_key: str) -> GPTBotsAPI:
+    """
+    获取缓存的GPTBots API客户端
+
+    Args:
+        api_key: API密钥
+
+    Returns:
+        GPTBotsAPI实例
+    """
+    return GPTBotsAPI(api_key)
+
+
+@st.cache_resource(show_spinner=False)
+def get_knowledge_base_client(api_key: str) -> KnowledgeBaseAPI:
+    """
+    获取缓存的知识库API客户端
+
+    Args:
+        api_key: API密钥
+
+    Returns:
+        KnowledgeBaseAPI实例
+    """
+    return KnowledgeBaseAPI(api_key)
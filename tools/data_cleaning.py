@@ -7,6 +7,8 @@ import streamlit as st
 import pandas as pd
 from pathlib import Path
 from .utils import count_files, log_activity
+from .jobs import is_active
+from .job_panel import get_current_job, submit_job, show_job_panel, refresh_while_active
 
 
 def show_cleaning_page():
@@ -26,10 +28,13 @@ def show_cleaning_page():
     
     st.success(f"✅ 发现 {eml_files} 个EML邮件文件待处理")
     
-    # 开始清洗按钮
-    if st.button("🚀 开始数据清洗", type="primary"):
+    # 开始清洗按钮（清洗在后台任务中执行，页面只轮询任务状态）
+    current_job = get_current_job("cleaning", "cleaning")
+    if st.button("🚀 开始数据清洗", type="primary", disabled=is_active(current_job)):
         start_data_cleaning(CONFIG)
     
+    job_active = show_job_panel("cleaning", "cleaning", render_result=show_cleaning_result)
+    
     # 导航按钮
     st.markdown("---")
     col1, col2, col3 = st.columns([1, 2, 1])
@@ -46,142 +51,106 @@ def show_cleaning_page():
                 st.rerun()
             else:
                 st.warning("⚠️ 请先完成数据清洗再进入下一步")
+    
+    refresh_while_active(job_active)
 
 
 def start_data_cleaning(config):
-    """开始数据清洗"""
-    st.info("🚀 开始邮件清洗处理...")
-    log_activity("开始数据清洗")
-    
-    # 创建进度条
-    progress_bar = st.progress(0)
-    status_text = st.empty()
-    result_container = st.empty()
+    """提交数据清洗后台任务"""
+    # 检查输入目录
+    eml_dir = config["upload_dir"]
+    eml_files = list(Path(eml_dir).glob("*.eml"))
     
-    try:
-        # 检查输入目录
-        eml_dir = config["upload_dir"]
+    if not eml_files:
+        # 如果uploads目录没有文件，尝试从Eml目录读取示例文件
+        eml_dir = "Eml"
         eml_files = list(Path(eml_dir).glob("*.eml"))
         
-        if not eml_files:
-            # 如果uploads目录没有文件，尝试从Eml目录读取示例文件
-            eml_dir = "Eml"
-            eml_files = list(Path(eml_dir).glob("*.eml"))
-            
-            if eml_files:
-                status_text.info(f"📁 未在uploads目录发现文件，使用示例邮件目录: {eml_dir}")
-            else:
-                st.error("❌ 未找到任何EML文件进行处理")
-                return
-        
-        progress_bar.progress(10)
-        status_text.text("🔍 初始化邮件清洗器...")
-        
-        # 创建邮件清洗器实例
-        from .email_processing import EmailCleaner
-        cleaner = EmailCleaner(
-            input_dir=eml_dir,
-            output_dir=config["processed_dir"]
-        )
-        
-        progress_bar.progress(20)
-        status_text.text(f"📧 发现 {len(eml_files)} 个EML文件，开始解析...")
-        
-        # 执行清洗处理
-        result = cleaner.process_all_emails()
-        
-        progress_bar.progress(90)
-        status_text.text("📝 生成处理报告...")
+        if eml_files:
+            st.info(f"📁 未在uploads目录发现文件，使用示例邮件目录: {eml_dir}")
+        else:
+            st.error("❌ 未找到任何EML文件进行处理")
+            return
+    
+    submit_job(
+        "cleaning",
+        {"input_dir": eml_dir, "output_dir": config["processed_dir"]},
+        f"数据清洗（{len(eml_files)} 个EML文件）",
+        key_prefix="cleaning"
+    )
+    log_activity("开始数据清洗")
+
+
+def show_cleaning_result(job):
+    """显示数据清洗任务的结果"""
+    from app import CONFIG
+    report = job["result"]["report"]
+    
+    st.success("🎉 邮件清洗完成！")
+    
+    # 统计信息
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        st.metric("原始邮件", report["total_input_files"])
+    
+    with col2:
+        st.metric("解析成功", report["successfully_parsed"])
+    
+    with col3:
+        st.metric("去重后邮件", report["unique_emails"])
+    
+    with col4:
+        st.metric("压缩率", report["compression_ratio"])
+    
+    # 详细信息
+    st.subheader("📊 处理详情")
+    
+    if report["duplicate_emails"] > 0:
+        st.info(f"🗑️ 发现 {report['duplicate_emails']} 封重复邮件已合并")
         
-        if result["success"]:
-            progress_bar.progress(100)
-            status_text.empty()
-            
-            # 显示处理结果
-            report = result["report"]
+        with st.expander("查看重复邮件详情"):
+            duplicate_details = report["duplicate_details"]
+            st.info(f"📊 共发现 {len(duplicate_details)} 封重复邮件")
             
-            with result_container.container():
-                st.success("🎉 邮件清洗完成！")
-                
-                # 统计信息
-                col1, col2, col3, col4 = st.columns(4)
-                
-                with col1:
-                    st.metric("原始邮件", report["total_input_files"])
-                
-                with col2:
-                    st.metric("解析成功", report["successfully_parsed"])
-                
-                with col3:
-                    st.metric("去重后邮件", report["unique_emails"])
-                
-                with col4:
-                    st.metric("压缩率", report["compression_ratio"])
-                
-                # 详细信息
-                st.subheader("📊 处理详情")
-                
-                if report["duplicate_emails"] > 0:
-                    st.info(f"🗑️ 发现 {report['duplicate_emails']} 封重复邮件已合并")
-                    
-                    with st.expander("查看重复邮件详情"):
-                        duplicate_details = report["duplicate_details"]
-                        st.info(f"📊 共发现 {len(duplicate_details)} 封重复邮件")
-                        
-                        if duplicate_details:
-                            # 直接显示所有重复邮件，支持滚动
-                            duplicate_data = []
-                            for dup in duplicate_details:
-                                duplicate_data.append({
-                                    "重复文件": dup["duplicate_file"],
-                                    "被包含于": dup["contained_by_file"],
-                                    "重复主题": dup["duplicate_subject"][:50] + "..." if len(dup["duplicate_subject"]) > 50 else dup["duplicate_subject"]
-                                })
-                            
-                            st.dataframe(pd.DataFrame(duplicate_data), width='stretch', height=400)
-                            st.caption(f"共 {len(duplicate_details)} 封重复邮件，可滚动查看全部")
-                        else:
-                            st.info("没有发现重复邮件")
-                
-                # 生成的文件列表
-                st.subheader("📁 生成的Markdown文件")
-                
-                generated_files = report["generated_markdown_files"]
-                st.info(f"📊 共生成 {len(generated_files)} 个Markdown文件")
-                
-                if generated_files:
-                    # 显示文件网格
-                    num_cols = 3
-                    for i in range(0, len(generated_files), num_cols):
-                        cols = st.columns(num_cols)
-                        for j, filename in enumerate(generated_files[i:i+num_cols]):
-                            with cols[j]:
-                                st.code(filename)
-                
-                # 路径信息
-                st.subheader("📂 文件位置")
-                col1, col2 = st.columns(2)
+            if duplicate_details:
+                # 直接显示所有重复邮件，支持滚动
+                duplicate_data = []
+                for dup in duplicate_details:
+                    duplicate_data.append({
+                        "重复文件": dup["duplicate_file"],
+                        "被包含于": dup["contained_by_file"],
+                        "重复主题": dup["duplicate_subject"][:50] + "..." if len(dup["duplicate_subject"]) > 50 else dup["duplicate_subject"]
+                    })
                 
-                with col1:
-                    st.success("📁 Markdown文件保存至:")
-                    st.code(config["processed_dir"])
-                
-                with col2:
-                    st.success("📋 处理报告保存至:")
-                    st.code(f"{config['processed_dir']}/processing_report.json")
-                
-                # 记录成功日志
-                log_activity(f"邮件清洗完成: {report['total_input_files']} -> {report['unique_emails']} 封")
-        
-        else:
-            progress_bar.progress(0)
-            status_text.empty()
-            result_container.error(f"❌ 处理失败: {result.get('message', '未知错误')}")
-            log_activity(f"邮件清洗失败: {result.get('message', '未知错误')}")
-    
-    except Exception as e:
-        progress_bar.progress(0)
-        status_text.empty()
-        result_container.error(f"❌ 处理过程中发生错误: {str(e)}")
-        log_activity(f"邮件清洗错误: {str(e)}")
-        st.exception(e)
+                st.dataframe(pd.DataFrame(duplicate_data), width='stretch', height=400)
+                st.caption(f"共 {len(duplicate_details)} 封重复邮件，可滚动查看全部")
+            else:
+                st.info("没有发现重复邮件")
+    
+    # 生成的文件列表
+    st.subheader("📁 生成的Markdown文件")
+    
+    generated_files = report["generated_markdown_files"]
+    st.info(f"📊 共生成 {len(generated_files)} 个Markdown文件")
+    
+    if generated_files:
+        # 显示文件网格
+        num_cols = 3
+        for i in range(0, len(generated_files), num_cols):
+            cols = st.columns(num_cols)
+            for j, filename in enumerate(generated_files[i:i+num_cols]):
+                with cols[j]:
+                    st.code(filename)
+    
+    # 路径信息
+    st.subheader("📂 文件位置")
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        st.success("📁 Markdown文件保存至:")
+        st.code(CONFIG["processed_dir"])
+    
+    with col2:
+        st.success("📋 处理报告保存至:")
+        st.code(f"{CONFIG['processed_dir']}/processing_report.json")
@@ -11,7 +11,7 @@ import json
 from pathlib import Path
 from email.header import decode_header
 from email.utils import parsedate_to_datetime
-from typing import Dict, List, Tuple, Optional
+from typing import Callable, Dict, List, Tuple, Optional
 from datetime import datetime
 import hashlib
 
@@ -281,6 +281,13 @@ class EmailCleaner:
         # 生成Markdown内容
         md_content = self.generate_markdown(email_info)
         
+        # 除处理时间外内容未变化时保留原文件，避免下游阶段因文件哈希变化而重复处理
+        if md_path.exists():
+            with open(md_path, 'r', encoding='utf-8') as f:
+                existing_content = f.read()
+            if existing_content.rsplit('\n', 1)[0] == md_content.rsplit('\n', 1)[0]:
+                return str(md_path)
+        
         # 保存文件
         try:
             with open(md_path, 'w', encoding='utf-8') as f:
@@ -290,12 +297,19 @@ class EmailCleaner:
             print(f"❌ 保存Markdown文件失败 {md_filename}: {e}")
             return ""
     
-    def process_all_emails(self) -> Dict:
-        """处理所有邮件文件"""
+    def process_all_emails(self, progress_callback: Callable[[str, int, int], None] = None,
+                           file_callback: Callable[[str, str, str], None] = None) -> Dict:
+        """
+        处理所有邮件文件
+
+        Args:
+            progress_callback: 进度回调，参数为 (阶段: parse/write, 已完成数, 总数)，在每个文件处理前调用
+            file_callback: 文件结果回调，参数为 (EML文件名, 状态: done/failed, 输出文件路径或失败原因)
+        """
         print(f"🔍 扫描目录: {self.input_dir}")
         
         # 获取所有EML文件
-        eml_files = list(self.input_dir.glob("*.eml"))
+        eml_files = sorted(self.input_dir.glob("*.eml"))
         
         if not eml_files:
             print(f"❌ 未在 {self.input_dir} 中找到EML文件")
@@ -307,7 +321,9 @@ class EmailCleaner:
         emails = []
         failed_files = []
         
-        for eml_file in eml_files:
+        for index, eml_file in enumerate(eml_files):
+            if progress_callback:
+                progress_callback("parse", index, len(eml_files))
             print(f"📖 解析: {eml_file.name}")
             email_info = self.parse_eml_file(eml_file)
             
@@ -315,6 +331,8 @@ class EmailCleaner:
                 emails.append(email_info)
             else:
                 failed_files.append(eml_file.name)
+                if file_callback:
+                    file_callback(eml_file.name, "failed", "解析失败")
         
         if not emails:
             return {"success": False, "message": "所有邮件解析失败"}
@@ -332,11 +350,21 @@ class EmailCleaner:
         print("📝 生成Markdown文件...")
         generated_files = []
         
-        for email_info in unique_emails:
+        for index, email_info in enumerate(unique_emails):
+            if progress_callback:
+                progress_callback("write", index, len(unique_emails))
             md_path = self.save_markdown_file(email_info)
             if md_path:
                 generated_files.append(md_path)
                 print(f"✅ 生成: {Path(md_path).name}")
+            if file_callback:
+                if md_path:
+                    file_callback(email_info['filename'], "done", md_path)
+                    # 被包含的重复邮件随容器邮件一起完成
+                    for contained_file in email_info.get('contained_files', []):
+                        file_callback(contained_file, "done", md_path)
+                else:
+                    file_callback(email_info['filename'], "failed", "保存Markdown文件失败")
         
         # 保存处理报告
         report = {
@@ -8,7 +8,10 @@ import os
 from pathlib import Path
 from .utils import count_files, log_activity
 from .api_selector import create_api_selector_with_guide
-from config import DIRECTORIES
+from .jobs import is_active
+from .job_panel import (get_current_job, submit_job, show_job_panel, show_restart_button,
+                        show_embedding_status, refresh_while_active)
+from config import DIRECTORIES, LOGGING_CONFIG
 
 
 def show_homepage():
@@ -136,8 +139,8 @@ def show_process_introduction():
         # 最近活动
         st.markdown("---")
         st.subheader("📅 最近活动")
-        if os.path.exists("logs/activity.log"):
-            with open("logs/activity.log", "r", encoding="utf-8") as f:
+        if os.path.exists(LOGGING_CONFIG["activity_log"]):
+            with open(LOGGING_CONFIG["activity_log"], "r", encoding="utf-8") as f:
                 activities = f.readlines()[-5:]  # 显示最近5条活动
                 for activity in activities:
                     st.text(activity.strip())
@@ -159,6 +162,7 @@ def show_auto_run_configuration():
             'kb_key_number': None,
             'endpoint': 'sg',
             'delay': 2,
+            'workers': 4,
             'chunk_token': 600,
             'knowledge_base_id': '',
             'splitter': None,
@@ -313,8 +317,9 @@ def show_auto_run_configuration():
     with col2:
         st.markdown("**LLM处理参数**")
         
-        # 使用固定的内网API地址
-        st.info("🌐 **API服务地址**: http://10.52.20.41:19080")
+        # 使用配置的API地址（默认内网地址）
+        from config import get_api_base_url
+        st.info(f"🌐 **API服务地址**: {get_api_base_url()}")
         endpoint = "internal"  # 使用固定标识
         st.session_state.auto_config['endpoint'] = endpoint
         
@@ -324,10 +329,66 @@ def show_auto_run_configuration():
             max_value=10,
             value=2,
             key="auto_delay",
-            help="API请求间隔，避免限流"
+            help="每个工作线程的API请求间隔，避免限流"
         )
         st.session_state.auto_config['delay'] = delay
         
+        from config import LLM_CONFIG
+        workers = st.slider(
+            "并发工作线程数",
+            min_value=1,
+            max_value=16,
+            value=LLM_CONFIG["workers"],
+            key="auto_workers",
+            help="同时处理的文件数；实际并发调用数仍受自适应并发控制限制"
+        )
+        st.session_state.auto_config['workers'] = workers
+        
+        bypass_llm_cache = st.checkbox(
+            "跳过LLM缓存",
+            value=False,
+            key="auto_bypass_llm_cache",
+            help="勾选后忽略已缓存的LLM结果，强制重新调用API"
+        )
+        st.session_state.auto_config['bypass_llm_cache'] = bypass_llm_cache
+        
+        pack_small_emails = st.checkbox(
+            "合并短邮件批量处理",
+            value=False,
+            key="auto_pack_small_emails",
+            help="将多封短邮件合并为一次LLM调用，减少调用次数"
+        )
+        st.session_state.auto_config['pack_small_emails'] = pack_small_emails
+        
+        enable_hedging = st.checkbox(
+            "启用对冲请求",
+            value=False,
+            key="auto_enable_hedging",
+            help="请求超过历史P95延迟仍未返回时发起一次重复请求，削减长尾延迟"
+        )
+        st.session_state.auto_config['enable_hedging'] = enable_hedging
+        
+        from config import PIPELINE_CONFIG
+        streaming = st.checkbox(
+            "流式处理",
+            value=PIPELINE_CONFIG["streaming"],
+            key="auto_streaming",
+            help="清洗、LLM处理、知识库上传并行运行，每处理完一批文件即上传知识库；"
+                 "合并短邮件需要预先拿到全部邮件，勾选合并时按阶段依次执行"
+        )
+        st.session_state.auto_config['streaming'] = streaming
+        
+        if streaming:
+            upload_workers = st.slider(
+                "知识库上传线程数",
+                min_value=1,
+                max_value=4,
+                value=PIPELINE_CONFIG["upload_workers"],
+                key="auto_upload_workers",
+                help="知识库上传阶段同时进行的批量上传数"
+            )
+            st.session_state.auto_config['upload_workers'] = upload_workers
+        
         # LLM处理说明
         with st.expander("🔧 LLM处理说明"):
             st.markdown("""
@@ -533,57 +594,95 @@ def show_auto_run_configuration():
         for item in config_status['missing']:
             st.error(f"❌ {item}")
     
+    current_job = get_current_job("auto_pipeline", "auto_pipeline")
     if st.button(
          "🤖 开始全自动运行",
          type="primary",
-         disabled=not config_status['ready'],
+         disabled=not config_status['ready'] or is_active(current_job),
          key="start_auto_run",
          help="一键完成所有处理步骤" if config_status['ready'] else "请先完成配置"
      ):
          start_auto_processing(uploaded_files)
     
-    # 检查是否有已完成的处理结果需要显示后续操作
-    if st.session_state.get('auto_processing_completed', False):
-        results = st.session_state.get('auto_processing_results', {})
-        
-        st.markdown("---")
-        st.markdown("### 🎉 处理完成")
-        
-        # 显示处理结果摘要
-        if results:
-            col1, col2, col3, col4 = st.columns(4)
-            with col1:
-                st.metric("📤 上传文件", results.get("upload_count", 0))
-            with col2:
-                st.metric("🧹 清洗文件", results.get("cleaned_count", 0))
-            with col3:
-                st.metric("🤖 LLM处理", results.get("llm_processed_count", 0))
-            with col4:
-                st.metric("📚 知识库上传", results.get("kb_uploaded_count", 0))
-        
-        # 提供后续操作选项
-        st.markdown("### 🎯 后续操作")
-        
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            if st.button("📊 查看结果", key="persistent_view_results_btn"):
-                st.session_state.current_step = "结果查看"
-                st.success("🔄 正在跳转到结果查看页面...")
-                st.rerun()
-        
-        with col2:
-            if st.button("💬 开始问答", key="persistent_start_qa_btn"):
-                st.session_state.current_step = "问答系统"
-                st.rerun()
-        
-        with col3:
-            if st.button("🔄 重新处理", key="persistent_restart_processing_btn"):
-                # 清理session state，准备重新处理
-                if 'auto_config' in st.session_state:
-                    st.session_state.auto_config['files_uploaded'] = False
-                st.session_state.auto_processing_completed = False
-                st.session_state.auto_processing_results = None
-                st.rerun()
+    # 流水线在后台任务中运行，页面只轮询任务状态
+    job_active = show_job_panel("auto_pipeline", "auto_pipeline", render_result=show_auto_processing_result)
+    refresh_while_active(job_active)
+
+
+def show_auto_processing_result(job):
+    """显示全自动处理任务的结果和后续操作"""
+    results = job["result"]
+    
+    st.markdown("---")
+    st.markdown("### 📋 处理结果")
+    
+    if not results["success"]:
+        st.error("❌ 全自动处理失败")
+        st.markdown("**错误详情：**")
+        for error in results["errors"]:
+            st.error(f"• {error}")
+        show_restart_button(job, "auto_pipeline")
+        return
+    
+    st.success("🎉 全自动处理完成！")
+    
+    # 显示处理结果摘要
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("📤 上传文件", results.get("upload_count", 0))
+    with col2:
+        st.metric("🧹 清洗文件", results.get("cleaned_count", 0))
+    with col3:
+        st.metric("🤖 LLM处理", results.get("llm_processed_count", 0))
+    with col4:
+        st.metric("📚 知识库上传", results.get("kb_uploaded_count", 0))
+    
+    if results.get("stream_stats"):
+        with st.expander("🌊 流式处理各阶段统计"):
+            st.dataframe([
+                {
+                    "阶段": {"llm": "LLM处理", "kb_upload": "知识库上传"}.get(stage["stage"], stage["stage"]),
+                    "线程数": stage["workers"],
+                    "处理数": stage["processed"],
+                    "累计处理耗时(秒)": stage["busy_seconds"],
+                    "队列最大积压": stage["max_queue_depth"],
+                    "首个输出(秒)": stage["first_output_seconds"]
+                }
+                for stage in results["stream_stats"]
+            ], use_container_width=True, hide_index=True)
+    
+    show_embedding_status(job, "auto_pipeline")
+    
+    if results.get("llm_skipped_count") or results.get("kb_skipped_count"):
+        st.info(f"⏭️ 续跑跳过已完成的文件: LLM处理 {results.get('llm_skipped_count', 0)} 个，"
+                f"知识库上传 {results.get('kb_skipped_count', 0)} 个")
+    
+    if results["errors"]:
+        with st.expander("⚠️ 处理过程中的警告"):
+            for error in results["errors"]:
+                st.warning(error)
+    
+    # 提供后续操作选项
+    st.markdown("### 🎯 后续操作")
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        if st.button("📊 查看结果", key="persistent_view_results_btn"):
+            st.session_state.current_step = "结果查看"
+            st.success("🔄 正在跳转到结果查看页面...")
+            st.rerun()
+    
+    with col2:
+        if st.button("💬 开始问答", key="persistent_start_qa_btn"):
+            st.session_state.current_step = "问答系统"
+            st.rerun()
+    
+    with col3:
+        if st.button("🔄 重新处理", key="persistent_restart_processing_btn"):
+            # 清理session state，准备重新处理
+            if 'auto_config' in st.session_state:
+                st.session_state.auto_config['files_uploaded'] = False
+            st.rerun()
 
 
 def check_auto_config_status():
@@ -628,57 +727,31 @@ def start_auto_processing(uploaded_files):
         'kb_api_key': config['kb_api_key'],
         'endpoint': config['endpoint'],
         'delay': config['delay'],
+        'workers': config.get('workers'),
         'chunk_token': config['chunk_token'],
         'knowledge_base_id': config['knowledge_base_id'],
-        'splitter': config['splitter']
+        'splitter': config['splitter'],
+        'bypass_llm_cache': config.get('bypass_llm_cache', False),
+        'pack_small_emails': config.get('pack_small_emails', False),
+        'enable_hedging': config.get('enable_hedging', False)
     }
     
-    # 运行自动处理流水线
-    from .auto_pipeline import run_auto_processing_pipeline
+    # 先在页面中保存上传的文件，其余步骤提交为后台任务
+    from .auto_pipeline import AutoProcessingPipeline
     
-    try:
-        results = run_auto_processing_pipeline(uploaded_files, pipeline_config)
-        
-        # 处理完成后的操作
-        if results["success"]:
-            st.balloons()  # 显示庆祝动画
-            
-            # 保存处理结果到session state
-            st.session_state.auto_processing_completed = True
-            st.session_state.auto_processing_results = results
-            
-            # 提供后续操作选项
-            st.markdown("---")
-            st.markdown("### 🎯 后续操作")
-            
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                if st.button("📊 查看结果", key="view_results_btn"):
-                    st.session_state.current_step = "结果查看"
-                    st.success("🔄 正在跳转到结果查看页面...")
-                    st.rerun()
-            
-            with col2:
-                if st.button("💬 开始问答", key="start_qa_btn"):
-                    st.session_state.current_step = "问答系统"
-                    st.rerun()
-            
-            with col3:
-                if st.button("🔄 重新处理", key="restart_processing_btn"):
-                    # 清理session state，准备重新处理
-                    if 'auto_config' in st.session_state:
-                        st.session_state.auto_config['files_uploaded'] = False
-                    st.session_state.auto_processing_completed = False
-                    st.session_state.auto_processing_results = None
-                    st.rerun()
-        else:
-            # 处理失败时也清理状态
-            st.session_state.auto_processing_completed = False
-            st.session_state.auto_processing_results = None
-        
-    except Exception as e:
-        st.error(f"❌ 自动处理过程中发生错误: {str(e)}")
-        st.error("请检查配置和网络连接，然后重试")
+    pipeline = AutoProcessingPipeline(config=pipeline_config)
+    if not pipeline.save_uploaded_files(uploaded_files):
+        for error in pipeline.results["errors"]:
+            st.error(f"❌ {error}")
+        return
+    
+    pipeline_config['upload_count'] = pipeline.results["upload_count"]
+    submit_job(
+        "auto_pipeline",
+        pipeline_config,
+        f"全自动处理（{len(uploaded_files)} 个邮件文件）",
+        key_prefix="auto_pipeline"
+    )
 
 
 def get_knowledge_base_list_for_auto(api_key):
@@ -693,10 +766,10 @@ def get_knowledge_base_list_for_auto(api_key):
         知识库列表或None
     """
     try:
-        from .api_clients import KnowledgeBaseAPI
+        from .client_cache import get_knowledge_base_client
         
         # 初始化API客户端
-        client = KnowledgeBaseAPI(api_key)
+        client = get_knowledge_base_client(api_key)
         
         # 获取知识库列表
         response = client.get_knowledge_bases()
@@ -0,0 +1,230 @@
+"""
+后台任务面板组件
+显示任务进度并提供暂停/继续/取消操作，任务运行期间页面定时刷新
+"""
+
+import time
+from datetime import datetime
+import streamlit as st
+from config import JOBS_CONFIG
+from .jobs import get_job_runner, is_active, plan_replays, submit_replay, get_embedding_poller
+
+
+def _format_time(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime("%m-%d %H:%M:%S") if timestamp else "-"
+
+
+def get_current_job(kind, key_prefix):
+    """
+    获取页面当前关注的任务：优先取本会话提交的任务，浏览器会话丢失后回退为该类型最近的任务
+
+    Args:
+        kind: 任务类型
+        key_prefix: session_state 键前缀
+
+    Returns:
+        任务信息字典或None
+    """
+    runner = get_job_runner()
+    job_id = st.session_state.get(f"{key_prefix}_job_id")
+    job = runner.get(job_id) if job_id else None
+    if job is None:
+        job = runner.latest(kind)
+        if job:
+            st.session_state[f"{key_prefix}_job_id"] = job["id"]
+    return job
+
+
+def submit_job(kind, params, title, key_prefix):
+    """
+    提交后台任务并记录到 session_state
+
+    Returns:
+        任务ID
+    """
+    job_id = get_job_runner().submit(kind, params, title)
+    st.session_state[f"{key_prefix}_job_id"] = job_id
+    return job_id
+
+
+def show_restart_button(job, key_prefix):
+    """显示续跑按钮：以相同参数重新提交任务，跳过上次已完成且内容未变化的文件"""
+    if st.button("🔁 续跑（跳过已完成的文件）", key=f"{key_prefix}_restart"):
+        new_job_id = get_job_runner().restart(job["id"])
+        if new_job_id:
+            st.session_state[f"{key_prefix}_job_id"] = new_job_id
+        st.rerun()
+
+
+def show_job_panel(kind, key_prefix, render_result=None):
+    """
+    显示任务状态面板
+
+    Args:
+        kind: 任务类型
+        key_prefix: Streamlit组件key前缀
+        render_result: 任务完成后显示结果的函数，参数为任务信息字典
+
+    Returns:
+        任务是否仍在进行中（调用方应在页面末尾调用 refresh_while_active）
+    """
+    runner = get_job_runner()
+    job = get_current_job(kind, key_prefix)
+    if job is None:
+        return False
+
+    active = is_active(job)
+    status_icons = {
+        "queued": "🕒", "running": "🔄", "paused": "⏸️", "succeeded": "✅",
+        "failed": "❌", "cancelled": "🛑", "interrupted": "⚠️"
+    }
+    st.markdown(f"**{status_icons.get(job['status'], '')} {job['title']}** · {job['status_label']} · 任务ID `{job['id']}`")
+    st.progress(job["progress"] / 100)
+    if job["message"]:
+        st.caption(job["message"])
+
+    if active:
+        col1, col2 = st.columns(2)
+        with col1:
+            if job["status"] == "paused":
+                if st.button("▶️ 继续", type="primary", key=f"{key_prefix}_resume"):
+                    runner.resume(job["id"])
+                    st.rerun()
+            elif st.button("⏸️ 暂停", key=f"{key_prefix}_pause"):
+                runner.pause(job["id"])
+                st.rerun()
+        with col2:
+            if st.button("🛑 取消", key=f"{key_prefix}_cancel"):
+                runner.cancel(job["id"])
+                st.rerun()
+        st.caption("💡 任务在后台运行，切换页面或刷新不会中断处理")
+    elif job["status"] == "succeeded":
+        if render_result:
+            render_result(job)
+    else:
+        if job["status"] == "failed":
+            st.error(f"❌ 任务失败: {job['error']}")
+        elif job["status"] == "interrupted":
+            st.warning("⚠️ 应用重启导致任务中断，可从中断处续跑")
+        show_restart_button(job, key_prefix)
+
+    history = runner.list_jobs(kind=kind, limit=JOBS_CONFIG["history_limit"])
+    if len(history) > 1:
+        with st.expander("🗂️ 历史任务"):
+            st.dataframe([
+                {
+                    "任务ID": item["id"],
+                    "状态": item["status_label"],
+                    "进度": f"{item['progress']}%",
+                    "提交时间": _format_time(item["created_at"]),
+                    "结束时间": _format_time(item["finished_at"]),
+                    "信息": item["error"] or item["message"] or ""
+                }
+                for item in history
+            ], use_container_width=True, hide_index=True)
+
+    return active
+
+
+def show_dead_letter_panel(stage, key_prefix):
+    """
+    显示某处理阶段的死信（失败文件），提供立即重放和清空操作
+
+    Args:
+        stage: 处理阶段（llm/kb_upload）
+        key_prefix: 与该阶段任务面板相同的key前缀，重放任务提交后显示在任务面板中
+    """
+    runner = get_job_runner()
+    letters = runner.dead_letters.list_letters(stage)
+    if not letters:
+        return
+
+    summary = runner.dead_letters.summary(stage)
+    with st.expander(f"📮 失败文件（死信队列 {summary['total']} 个）"):
+        st.caption(
+            "失败的文件按退避间隔自动重试，累计失败次数过多或重放任务被取消后停止自动重试；"
+            "也可立即只重放这些文件，无需重新处理全部文件"
+        )
+        st.dataframe([
+            {
+                "文件": letter["name"],
+                "状态": letter["status_label"],
+                "失败次数": letter["failures"],
+                "下次重试": _format_time(letter["next_retry_at"]),
+                "最近失败": _format_time(letter["last_failed_at"]),
+                "失败原因": letter["error"] or ""
+            }
+            for letter in letters
+        ], use_container_width=True, hide_index=True)
+
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("🔁 立即重放死信", type="primary", key=f"{key_prefix}_replay_dead_letters",
+                         disabled=bool(runner.active_jobs(stage))):
+                replays, unplayable = plan_replays(letters, runner.get)
+                for replay_stage, params, group in replays:
+                    submit_replay(runner, runner.dead_letters, replay_stage, params, group,
+                                  lambda kind, params, title: submit_job(kind, params, title, key_prefix))
+                if unplayable:
+                    st.warning(f"⚠️ {len(unplayable)} 个文件的原任务参数不可用，请重新提交处理")
+                if replays:
+                    st.rerun()
+        with col2:
+            if st.button("🗑️ 清空死信", key=f"{key_prefix}_clear_dead_letters"):
+                runner.dead_letters.clear(stage)
+                st.rerun()
+
+
+def show_embedding_status(job, key_prefix):
+    """
+    显示上传任务中文档的向量化状态和“上传到可检索”耗时分位数
+
+    Args:
+        job: 上传任务（知识库上传或全自动处理）
+        key_prefix: Streamlit组件key前缀
+    """
+    store = get_embedding_poller().store
+    report = store.report(job["id"])
+    if report is None:
+        return
+
+    def seconds(value):
+        return f"{value} 秒" if value is not None else "-"
+
+    with st.expander(f"🔎 文档向量化状态（可检索 {report['available']}/{report['total']}）",
+                     expanded=bool(report["embedding"])):
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("向量化中", report["embedding"])
+        with col2:
+            st.metric("可检索", report["available"])
+        with col3:
+            st.metric("向量化失败", report["failed"])
+        with col4:
+            st.metric("跟踪超时", report["timeout"])
+
+        st.caption(
+            f"上传到可检索耗时: P50 {seconds(report['p50'])} · P90 {seconds(report['p90'])} · "
+            f"P99 {seconds(report['p99'])} · 最长 {seconds(report['max'])}；"
+            f"自动重新嵌入 {report['retries']} 次"
+        )
+
+        problems = store.problems(job["id"])
+        if problems:
+            st.dataframe([
+                {"文档": doc["name"] or doc["doc_id"], "文档ID": doc["doc_id"], "状态": doc["status_label"],
+                 "重新嵌入次数": doc["retries"]}
+                for doc in problems
+            ], use_container_width=True, hide_index=True)
+
+        if report["embedding"]:
+            st.caption("💡 文档向量化完成后才能被问答检索到，后台会继续查询状态")
+            if st.button("🔄 刷新向量化状态", key=f"{key_prefix}_refresh_embedding"):
+                st.rerun()
+
+
+def refresh_while_active(active):
+    """任务进行中时等待轮询间隔后重跑页面，应在页面所有内容渲染完后调用"""
+    if active:
+        time.sleep(JOBS_CONFIG["poll_interval"])
+        st.rerun()
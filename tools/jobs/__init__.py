@@ -0,0 +1,50 @@
+"""
+后台任务模块
+包含持久化任务表、文件处理状态表、死信队列、知识库同步清单、知识块哈希索引、知识库文档镜像、文档向量化状态跟踪、后台任务执行器和各处理阶段的任务处理函数
+"""
+
+from .store import JobStore, STATUS_LABELS, ACTIVE_STATUSES
+from .file_state import FileStateStore, FileTracker, FILE_STATUS_LABELS, get_file_state_store
+from .dead_letters import (DeadLetterQueue, RetryScheduler, DEAD_LETTER_STATUS_LABELS, REPLAYABLE_STAGES,
+                           get_dead_letter_queue, plan_replays, replay_title, submit_replay)
+from .kb_manifest import KBManifest, get_kb_manifest
+from .embedding_status import (EmbeddingStatusStore, EmbeddingStatusPoller, EMBEDDING_STATUS_LABELS,
+                               get_embedding_poller, track_uploaded)
+from .kb_mirror import KBDocumentMirror, get_kb_mirror
+from .chunk_index import ChunkIndex, get_chunk_index
+from .runner import JobRunner, JobContext, JobCancelled, get_job_runner, register_job_handler, is_active
+
+__all__ = [
+    'JobStore',
+    'STATUS_LABELS',
+    'ACTIVE_STATUSES',
+    'FileStateStore',
+    'FileTracker',
+    'FILE_STATUS_LABELS',
+    'get_file_state_store',
+    'DeadLetterQueue',
+    'RetryScheduler',
+    'DEAD_LETTER_STATUS_LABELS',
+    'REPLAYABLE_STAGES',
+    'get_dead_letter_queue',
+    'plan_replays',
+    'replay_title',
+    'submit_replay',
+    'KBManifest',
+    'get_kb_manifest',
+    'EmbeddingStatusStore',
+    'EmbeddingStatusPoller',
+    'EMBEDDING_STATUS_LABELS',
+    'get_embedding_poller',
+    'track_uploaded',
+    'KBDocumentMirror',
+    'get_kb_mirror',
+    'ChunkIndex',
+    'get_chunk_index',
+    'JobRunner',
+    'JobContext',
+    'JobCancelled',
+    'get_job_runner',
+    'register_job_handler',
+    'is_active'
+]
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+知识块哈希索引
+记录本地分块上传到各知识库的知识块内容哈希及其所属文档，再次上传相同内容的知识块
+（如邮件往来中反复引用的历史邮件）时直接跳过，减少向量化数量和上传字节数；
+同时记录每个文件引用的全部知识块，删除文档时找出仍被其他文件引用的知识块以便重新上传
+"""
+
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Set
+
+from config import JOBS_CONFIG
+from .kb_manifest import _kb_key, _file_key
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunk_index (
+    knowledge_base_id TEXT NOT NULL,
+    chunk_hash TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (knowledge_base_id, chunk_hash)
+);
+CREATE INDEX IF NOT EXISTS idx_chunk_index_doc ON chunk_index (knowledge_base_id, doc_id);
+CREATE TABLE IF NOT EXISTS chunk_refs (
+    knowledge_base_id TEXT NOT NULL,
+    path TEXT NOT NULL,
+    chunk_hash TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    PRIMARY KEY (knowledge_base_id, path, chunk_hash)
+);
+CREATE INDEX IF NOT EXISTS idx_chunk_refs_hash ON chunk_refs (knowledge_base_id, chunk_hash);
+CREATE INDEX IF NOT EXISTS idx_chunk_refs_doc ON chunk_refs (knowledge_base_id, doc_id);
+"""
+
+# 单条查询语句中的最大参数数（SQLite默认上限999）
+_QUERY_BATCH_SIZE = 500
+
+
+class ChunkIndex:
+    def __init__(self, db_path: str = None):
+        """
+        初始化知识块哈希索引（与任务表共用数据库文件）
+
+        Args:
+            db_path: SQLite数据库路径，默认读取配置
+        """
+        self.db_path = Path(db_path or JOBS_CONFIG["db_path"])
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(str(self.db_path), timeout=30)
+
+    def known(self, knowledge_base_id: Optional[str], hashes: Iterable[str]) -> Set[str]:
+        """
+        返回已上传到该知识库的知识块哈希
+
+        Args:
+            knowledge_base_id: 知识库ID
+            hashes: 待检查的知识块哈希
+
+        Returns:
+            其中已存在的哈希
+        """
+        hashes = list(set(hashes))
+        found = set()
+        with self._lock, closing(self._connect()) as conn:
+            for i in range(0, len(hashes), _QUERY_BATCH_SIZE):
+                batch = hashes[i:i + _QUERY_BATCH_SIZE]
+                rows = conn.execute(
+                    f"SELECT chunk_hash FROM chunk_index WHERE knowledge_base_id = ? "
+                    f"AND chunk_hash IN ({', '.join('?' * len(batch))})",
+                    (_kb_key(knowledge_base_id), *batch)
+                ).fetchall()
+                found.update(row[0] for row in rows)
+        return found
+
+    def record(self, knowledge_base_id: Optional[str], doc_id: str, hashes: Iterable[str]):
+        """记录上传成功的知识块"""
+        now = time.time()
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO chunk_index (knowledge_base_id, chunk_hash, doc_id, created_at) "
+                "VALUES (?, ?, ?, ?)",
+                [(_kb_key(knowledge_base_id), chunk_hash, doc_id, now) for chunk_hash in hashes]
+            )
+
+    def add_references(self, knowledge_base_id: Optional[str], path, doc_id: str, hashes: Iterable[str]):
+        """
+        记录文件引用的全部知识块（含因重复而跳过的知识块），替换该文件之前的引用记录
+
+        Args:
+            knowledge_base_id: 知识库ID
+            path: 本地文件路径
+            doc_id: 该文件创建的文档ID，全部知识块重复、未创建文档时为空
+            hashes: 文件的全部知识块哈希
+        """
+        kb_key, path_key = _kb_key(knowledge_base_id), _file_key(path)
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM chunk_refs WHERE knowledge_base_id = ? AND path = ?", (kb_key, path_key))
+            conn.executemany(
+                "INSERT OR REPLACE INTO chunk_refs (knowledge_base_id, path, chunk_hash, doc_id) VALUES (?, ?, ?, ?)",
+                [(kb_key, path_key, chunk_hash, doc_id or "") for chunk_hash in set(hashes)]
+            )
+
+    def remove_documents(self, knowledge_base_id: Optional[str], doc_ids: Iterable[str],
+                         paths: Iterable = ()) -> Dict[str, Dict]:
+        """
+        移除文档的全部知识块记录（文档被删除或整体更新后，其中的知识块需允许重新上传），
+        同时移除这些文档及文件的引用记录
+
+        被移除的知识块仍被其他文件引用时，为每个知识块选出一个仍引用它的文件（优先选择已有文档的文件），
+        由调用方将知识块重新上传到该文件的文档中，否则这些文件的内容将在知识库中缺失。
+
+        Args:
+            knowledge_base_id: 知识库ID
+            doc_ids: 被删除或整体更新的文档ID
+            paths: 这些文档对应的本地文件路径
+
+        Returns:
+            文件路径 -> {"doc_id": 该文件的文档ID（可能为空）, "hashes": 需重新上传的知识块哈希集合}
+        """
+        kb_key = _kb_key(knowledge_base_id)
+        doc_ids = [doc_id for doc_id in doc_ids if doc_id]
+        orphaned = set()
+        with self._lock, closing(self._connect()) as conn, conn:
+            for doc_id in doc_ids:
+                rows = conn.execute("SELECT chunk_hash FROM chunk_index WHERE knowledge_base_id = ? AND doc_id = ?",
+                                    (kb_key, doc_id)).fetchall()
+                orphaned.update(row[0] for row in rows)
+            conn.executemany("DELETE FROM chunk_index WHERE knowledge_base_id = ? AND doc_id = ?",
+                             [(kb_key, doc_id) for doc_id in doc_ids])
+            conn.executemany("DELETE FROM chunk_refs WHERE knowledge_base_id = ? AND doc_id = ?",
+                             [(kb_key, doc_id) for doc_id in doc_ids])
+            conn.executemany("DELETE FROM chunk_refs WHERE knowledge_base_id = ? AND path = ?",
+                             [(kb_key, _file_key(path)) for path in paths])
+
+            survivors: Dict[str, Dict] = {}
+            hashes = list(orphaned)
+            for i in range(0, len(hashes), _QUERY_BATCH_SIZE):
+                batch = hashes[i:i + _QUERY_BATCH_SIZE]
+                rows = conn.execute(
+                    f"SELECT chunk_hash, path, doc_id FROM chunk_refs WHERE knowledge_base_id = ? "
+                    f"AND chunk_hash IN ({', '.join('?' * len(batch))}) ORDER BY doc_id = '', path",
+                    (kb_key, *batch)
+                ).fetchall()
+                for chunk_hash, path, doc_id in rows:
+                    if chunk_hash in orphaned:
+                        orphaned.discard(chunk_hash)
+                        survivors.setdefault(path, {"doc_id": doc_id, "hashes": set()})["hashes"].add(chunk_hash)
+        return survivors
+
+    def set_reference_document(self, knowledge_base_id: Optional[str], path, doc_id: str):
+        """为未创建文档的文件记录新创建的文档ID（重新上传共享知识块时创建）"""
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.execute("UPDATE chunk_refs SET doc_id = ? WHERE knowledge_base_id = ? AND path = ?",
+                         (doc_id, _kb_key(knowledge_base_id), _file_key(path)))
+
+    def count(self, knowledge_base_id: Optional[str]) -> int:
+        """该知识库已记录的知识块数"""
+        with self._lock, closing(self._connect()) as conn:
+            return conn.execute("SELECT COUNT(*) FROM chunk_index WHERE knowledge_base_id = ?",
+                                (_kb_key(knowledge_base_id),)).fetchone()[0]
+
+
+_chunk_index: Optional[ChunkIndex] = None
+_chunk_index_lock = threading.Lock()
+
+
+def get_chunk_index() -> ChunkIndex:
+    """获取进程内共享的知识块哈希索引"""
+    global _chunk_index
+    with _chunk_index_lock:
+        if _chunk_index is None:
+            _chunk_index = ChunkIndex()
+        return _chunk_index
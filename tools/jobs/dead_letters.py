@@ -0,0 +1,516 @@
+#!/usr/bin/env python3
+"""
+死信队列
+LLM处理和知识库上传阶段失败的文件持久化记录失败原因、失败次数和下次重试时间，
+由重试调度器按指数退避自动重放，也可在页面或命令行中只重放死信，无需重新处理全部文件
+
+命令行用法:
+    python -m tools.jobs.dead_letters                  # 列出死信
+    python -m tools.jobs.dead_letters --replay         # 重放到期的死信并等待完成
+    python -m tools.jobs.dead_letters --replay --all   # 重放全部死信（包括未到期和已放弃自动重试的）
+"""
+
+import argparse
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import JOBS_CONFIG, DEAD_LETTER_CONFIG, DIRECTORIES
+from .store import ACTIVE_STATUSES, CANCELLED
+
+# 支持按文件重放的处理阶段（数据清洗需要全部邮件参与去重，不单独重放）
+REPLAYABLE_STAGES = ("llm", "kb_upload")
+
+# 死信状态
+WAITING = "waiting"
+EXHAUSTED = "exhausted"
+HELD = "held"
+
+DEAD_LETTER_STATUS_LABELS = {
+    WAITING: "等待重试",
+    EXHAUSTED: "已放弃自动重试",
+    HELD: "重放已取消"
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dead_letters (
+    stage TEXT NOT NULL,
+    path TEXT NOT NULL,
+    name TEXT NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT,
+    failures INTEGER NOT NULL DEFAULT 0,
+    job_id TEXT,
+    first_failed_at REAL NOT NULL,
+    last_failed_at REAL NOT NULL,
+    next_retry_at REAL,
+    replay_job_id TEXT,
+    PRIMARY KEY (stage, path)
+);
+CREATE INDEX IF NOT EXISTS idx_dead_letters_next_retry ON dead_letters (status, next_retry_at);
+"""
+
+
+def _file_key(path) -> str:
+    return str(Path(path).resolve())
+
+
+def retry_delay(failures: int) -> float:
+    """
+    计算第 N 次失败后的重试等待时间：基础间隔按失败次数指数增长，不超过上限
+
+    Args:
+        failures: 累计失败次数（从1开始）
+
+    Returns:
+        等待秒数
+    """
+    delay = DEAD_LETTER_CONFIG["retry_base_seconds"] * (2 ** max(0, failures - 1))
+    return min(delay, DEAD_LETTER_CONFIG["retry_max_seconds"])
+
+
+def _schedule(failures: int, now: float) -> Tuple[str, Optional[float]]:
+    """按累计失败次数决定死信状态和下次重试时间"""
+    if failures >= DEAD_LETTER_CONFIG["max_attempts"]:
+        return EXHAUSTED, None
+    return WAITING, now + retry_delay(failures)
+
+
+class DeadLetterQueue:
+    def __init__(self, db_path: str = None):
+        """
+        初始化死信队列（与任务表共用数据库文件）
+
+        Args:
+            db_path: SQLite数据库路径，默认读取配置
+        """
+        self.db_path = Path(db_path or JOBS_CONFIG["db_path"])
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.executescript(_SCHEMA)
+            # 兼容早期版本创建的表
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(dead_letters)")}
+            if "replay_job_id" not in columns:
+                conn.execute("ALTER TABLE dead_letters ADD COLUMN replay_job_id TEXT")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def record(self, stage: str, path, error: str, job_id: str = None) -> Dict:
+        """
+        记录一次失败：累计失败次数并按退避策略计算下次重试时间，
+        达到最大自动重试次数后不再自动重试
+
+        Args:
+            stage: 处理阶段
+            path: 文件路径
+            error: 失败原因
+            job_id: 失败所在的任务ID
+
+        Returns:
+            更新后的死信
+        """
+        key = _file_key(path)
+        now = time.time()
+        with self._lock, closing(self._connect()) as conn, conn:
+            row = conn.execute(
+                "SELECT failures, first_failed_at FROM dead_letters WHERE stage = ? AND path = ?", (stage, key)
+            ).fetchone()
+            failures = (row["failures"] if row else 0) + 1
+            status, next_retry_at = _schedule(failures, now)
+            # 整行替换会清空 replay_job_id：该文件已按文件记录结果，不再等待所在重放任务的整体结果
+            conn.execute(
+                "INSERT OR REPLACE INTO dead_letters (stage, path, name, status, error, failures, job_id, "
+                "first_failed_at, last_failed_at, next_retry_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (stage, key, Path(path).name, status, error, failures, job_id,
+                 row["first_failed_at"] if row else now, now, next_retry_at)
+            )
+        return {"stage": stage, "path": key, "status": status, "failures": failures, "next_retry_at": next_retry_at}
+
+    def mark_replaying(self, stage: str, paths: Iterable, job_id: str, submitted_at: float):
+        """
+        记录死信已提交到重放任务，任务结束前不再自动提交
+
+        Args:
+            stage: 处理阶段
+            paths: 重放的文件路径
+            job_id: 重放任务ID
+            submitted_at: 提交任务前的时间；之后已按文件记录过结果的死信不再标记
+        """
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "UPDATE dead_letters SET replay_job_id = ? WHERE stage = ? AND path = ? AND last_failed_at <= ?",
+                [(job_id, stage, _file_key(path), submitted_at) for path in paths]
+            )
+
+    def replay_job_ids(self) -> List[str]:
+        """仍在等待整体结果的重放任务ID"""
+        with self._lock, closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT DISTINCT replay_job_id FROM dead_letters WHERE replay_job_id IS NOT NULL"
+            ).fetchall()
+        return [row["replay_job_id"] for row in rows]
+
+    def settle_replay(self, job_id: str, job_status: Optional[str], error: str = None) -> int:
+        """
+        重放任务结束后处理其中没有按文件记录结果的死信（任务被取消、整体失败或中断）
+
+        被取消的重放不再自动重试，等待手动重放；其他情况记一次失败并按退避策略重新安排重试，
+        避免调度器对同一批死信反复立即提交。
+
+        Args:
+            job_id: 重放任务ID
+            job_status: 任务最终状态，任务记录已删除时为None
+            error: 任务的错误信息
+
+        Returns:
+            处理的死信数
+        """
+        now = time.time()
+        with self._lock, closing(self._connect()) as conn, conn:
+            rows = conn.execute("SELECT stage, path, failures FROM dead_letters WHERE replay_job_id = ?",
+                                (job_id,)).fetchall()
+            if job_status == CANCELLED:
+                conn.execute("UPDATE dead_letters SET status = ?, next_retry_at = NULL, replay_job_id = NULL "
+                             "WHERE replay_job_id = ?", (HELD, job_id))
+                return len(rows)
+
+            error = error or "重放任务结束但未处理该文件"
+            updates = []
+            for row in rows:
+                failures = row["failures"] + 1
+                status, next_retry_at = _schedule(failures, now)
+                updates.append((status, error, failures, now, next_retry_at, row["stage"], row["path"]))
+            conn.executemany(
+                "UPDATE dead_letters SET status = ?, error = ?, failures = ?, last_failed_at = ?, "
+                "next_retry_at = ?, replay_job_id = NULL WHERE stage = ? AND path = ?", updates
+            )
+        return len(rows)
+
+    def resolve(self, stage: str, path):
+        """文件处理成功后移出死信队列"""
+        self.remove(stage, [path])
+
+    def remove(self, stage: str, paths: Iterable):
+        """删除死信"""
+        keys = [_file_key(path) for path in paths]
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.executemany("DELETE FROM dead_letters WHERE stage = ? AND path = ?", [(stage, key) for key in keys])
+
+    def clear(self, stage: str = None) -> int:
+        """
+        清空死信
+
+        Args:
+            stage: 处理阶段，为None时清空全部
+
+        Returns:
+            删除的死信数
+        """
+        with self._lock, closing(self._connect()) as conn, conn:
+            if stage:
+                cursor = conn.execute("DELETE FROM dead_letters WHERE stage = ?", (stage,))
+            else:
+                cursor = conn.execute("DELETE FROM dead_letters")
+            return cursor.rowcount
+
+    def list_letters(self, stage: str = None, due_only: bool = False, now: float = None) -> List[Dict]:
+        """
+        按下次重试时间列出死信
+
+        Args:
+            stage: 处理阶段，为None时列出全部
+            due_only: 只列出已到重试时间且未放弃自动重试的死信
+            now: 判断是否到期的时间，默认当前时间
+        """
+        conditions = []
+        values = []
+        if stage:
+            conditions.append("stage = ?")
+            values.append(stage)
+        if due_only:
+            conditions.append("status = ? AND next_retry_at <= ? AND replay_job_id IS NULL")
+            values.extend([WAITING, now if now is not None else time.time()])
+
+        sql = "SELECT * FROM dead_letters"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY next_retry_at IS NULL, next_retry_at, last_failed_at"
+
+        with self._lock, closing(self._connect()) as conn:
+            rows = conn.execute(sql, values).fetchall()
+        letters = []
+        for row in rows:
+            letter = dict(row)
+            letter["status_label"] = DEAD_LETTER_STATUS_LABELS.get(letter["status"], letter["status"])
+            letters.append(letter)
+        return letters
+
+    def summary(self, stage: str = None) -> Dict[str, int]:
+        """统计死信数：{"total": 总数, "due": 已到期, "exhausted": 已放弃自动重试}"""
+        letters = self.list_letters(stage)
+        now = time.time()
+        return {
+            "total": len(letters),
+            "due": sum(1 for letter in letters
+                       if letter["status"] == WAITING and letter["next_retry_at"] <= now
+                       and not letter["replay_job_id"]),
+            "exhausted": sum(1 for letter in letters if letter["status"] == EXHAUSTED)
+        }
+
+
+def replay_params(stage: str, job: Optional[Dict]) -> Optional[Dict]:
+    """
+    根据死信所在的原任务生成重放任务的参数
+
+    全自动流水线中失败的文件按对应阶段的单独任务重放（LLM结果按LLM处理页面的格式保存）。
+
+    Args:
+        stage: 处理阶段
+        job: 原任务信息
+
+    Returns:
+        重放任务参数（不含文件列表），原任务不存在或缺少API Key时返回None
+    """
+    if not job or not job.get("params"):
+        return None
+    params = job["params"]
+    kind = job["kind"]
+
+    if kind == stage:
+        replay = dict(params)
+    elif kind == "auto_pipeline" and stage == "llm":
+        replay = {
+            "api_key": params.get("llm_api_key"),
+            "delay": params.get("delay", 0),
+            "workers": params.get("workers"),
+            "bypass_cache": params.get("bypass_llm_cache", False),
+            "split_threshold": params.get("split_threshold"),
+            "park_on_open": params.get("park_on_open", True),
+            "final_dir": DIRECTORIES["final_dir"]
+        }
+    elif kind == "auto_pipeline" and stage == "kb_upload":
+        replay = {
+            "api_key": params.get("kb_api_key"),
+            "knowledge_base_id": params.get("knowledge_base_id"),
+            "chunk_token": params.get("chunk_token"),
+            "splitter": params.get("splitter"),
+            "continue_on_error": True,
+            "final_dir": DIRECTORIES["final_dir"]
+        }
+    else:
+        return None
+
+    if not replay.get("api_key"):
+        return None
+    # 重放只处理死信中的文件，不沿用原任务的文件选择和续跑设置
+    for key in ("selected_files", "files", "resume", "incremental", "pack_small_emails", "create_backup"):
+        replay.pop(key, None)
+    return replay
+
+
+def plan_replays(letters: List[Dict], get_job) -> Tuple[List[Tuple[str, Dict, List[Dict]]], List[Dict]]:
+    """
+    将死信按 (处理阶段, 原任务) 分组，生成重放任务
+
+    Args:
+        letters: 死信列表
+        get_job: 按任务ID获取任务信息的函数
+
+    Returns:
+        ([(任务类型, 任务参数, 死信列表)], 无法重放的死信列表)
+    """
+    groups: Dict[Tuple[str, str], List[Dict]] = {}
+    for letter in letters:
+        groups.setdefault((letter["stage"], letter["job_id"]), []).append(letter)
+
+    replays = []
+    unplayable = []
+    for (stage, job_id), group in groups.items():
+        params = replay_params(stage, get_job(job_id) if job_id else None)
+        if params is None:
+            unplayable.extend(group)
+            continue
+        params["files"] = [letter["path"] for letter in group]
+        replays.append((stage, params, group))
+    return replays, unplayable
+
+
+def replay_title(stage: str, count: int) -> str:
+    """重放任务的显示名称"""
+    stage_name = "LLM处理" if stage == "llm" else "知识库上传"
+    return f"{stage_name}（重放 {count} 个死信）"
+
+
+def submit_replay(runner, dead_letters: DeadLetterQueue, stage: str, params: Dict, group: List[Dict],
+                  submit=None) -> str:
+    """
+    提交一组死信的重放任务，并记录死信所在的重放任务
+
+    Args:
+        runner: 任务执行器
+        dead_letters: 死信队列
+        stage: 处理阶段
+        params: 重放任务参数
+        group: 重放的死信
+        submit: 提交任务的函数 (任务类型, 参数, 显示名称) -> 任务ID，默认 runner.submit
+
+    Returns:
+        任务ID
+    """
+    submitted_at = time.time()
+    job_id = (submit or runner.submit)(stage, params, replay_title(stage, len(group)))
+    dead_letters.mark_replaying(stage, [letter["path"] for letter in group], job_id, submitted_at)
+    return job_id
+
+
+class RetryScheduler:
+    def __init__(self, runner, dead_letters: DeadLetterQueue, interval: float = None):
+        """
+        死信重试调度器：后台线程定时检查到期的死信，以原任务参数提交重放任务
+
+        同一处理阶段已有进行中的任务时本轮不提交，避免与正在处理的文件重复。
+        重放任务被取消后其中的死信不再自动重放，整体失败时记一次失败并按退避策略重新安排。
+
+        Args:
+            runner: 任务执行器
+            dead_letters: 死信队列
+            interval: 检查间隔（秒），默认读取配置
+        """
+        self.runner = runner
+        self.dead_letters = dead_letters
+        self.interval = interval or DEAD_LETTER_CONFIG["scheduler_interval"]
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """启动调度线程"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="dead-letter-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """停止调度线程"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                logging.error(f"死信重试调度失败: {e}")
+
+    def run_once(self) -> List[str]:
+        """
+        提交一轮到期死信的重放任务
+
+        Returns:
+            提交的任务ID列表
+        """
+        self.settle_replays()
+        due = self.dead_letters.list_letters(due_only=True)
+        if not due:
+            return []
+
+        replays, _ = plan_replays(due, self.runner.get)
+        busy_stages = set()
+        job_ids = []
+        for stage, params, group in replays:
+            if stage in busy_stages or self.runner.active_jobs(stage):
+                busy_stages.add(stage)
+                continue
+            busy_stages.add(stage)
+            job_ids.append(submit_replay(self.runner, self.dead_letters, stage, params, group))
+        return job_ids
+
+    def settle_replays(self) -> int:
+        """
+        处理已结束的重放任务中没有按文件记录结果的死信
+
+        Returns:
+            处理的死信数
+        """
+        settled = 0
+        for job_id in self.dead_letters.replay_job_ids():
+            job = self.runner.get(job_id)
+            if job and job["status"] in ACTIVE_STATUSES:
+                continue
+            settled += self.dead_letters.settle_replay(job_id, job["status"] if job else None,
+                                                       job["error"] if job else None)
+        return settled
+
+
+_dead_letter_queue: Optional[DeadLetterQueue] = None
+_dead_letter_lock = threading.Lock()
+
+
+def get_dead_letter_queue() -> DeadLetterQueue:
+    """获取进程内共享的死信队列"""
+    global _dead_letter_queue
+    with _dead_letter_lock:
+        if _dead_letter_queue is None:
+            _dead_letter_queue = DeadLetterQueue()
+        return _dead_letter_queue
+
+
+def _format_time(timestamp):
+    return time.strftime("%m-%d %H:%M:%S", time.localtime(timestamp)) if timestamp else "-"
+
+
+def main():
+    """命令行入口：列出或重放死信"""
+    parser = argparse.ArgumentParser(description="查看和重放LLM处理/知识库上传失败的文件")
+    parser.add_argument("--stage", choices=REPLAYABLE_STAGES, help="只处理某个阶段的死信")
+    parser.add_argument("--replay", action="store_true", help="重放死信并等待重放任务完成")
+    parser.add_argument("--all", action="store_true", help="重放全部死信，包括未到期和已放弃自动重试的")
+    parser.add_argument("--clear", action="store_true", help="清空死信")
+    args = parser.parse_args()
+
+    queue = get_dead_letter_queue()
+    if args.clear:
+        print(f"已清空 {queue.clear(args.stage)} 条死信")
+        return
+
+    letters = queue.list_letters(args.stage, due_only=args.replay and not args.all)
+    if not args.replay:
+        for letter in letters:
+            print(f"[{letter['stage']}] {letter['name']}  {letter['status_label']}  失败 {letter['failures']} 次  "
+                  f"下次重试 {_format_time(letter['next_retry_at'])}  原因: {letter['error']}")
+        print(f"共 {len(letters)} 条死信")
+        return
+
+    if not letters:
+        print("没有需要重放的死信")
+        return
+
+    from .runner import get_job_runner
+    runner = get_job_runner()
+    replays, unplayable = plan_replays(letters, runner.get)
+    for letter in unplayable:
+        print(f"无法重放（原任务参数不可用）: [{letter['stage']}] {letter['name']}")
+
+    job_ids = [submit_replay(runner, queue, stage, params, group) for stage, params, group in replays]
+    for job_id in job_ids:
+        print(f"已提交重放任务 {job_id}")
+    while any(runner.get(job_id)["status"] in ACTIVE_STATUSES for job_id in job_ids):
+        time.sleep(1)
+    for job_id in job_ids:
+        job = runner.get(job_id)
+        print(f"{job['title']}: {job['status_label']} {job['error'] or ''}")
+    remaining = queue.summary(args.stage)
+    print(f"剩余死信 {remaining['total']} 条（其中 {remaining['exhausted']} 条已放弃自动重试）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,481 @@
+#!/usr/bin/env python3
+"""
+文档向量化状态跟踪
+上传成功的文档按所属任务记录上传时间，后台轮询线程分批查询文档状态，记录文档变为可检索的时间；
+有状态变化时缩短轮询间隔，连续无变化时按倍数拉长，向量化失败的文档自动触发重新嵌入。
+按任务汇总“上传到可检索”耗时的分位数，用于判断上传后多久可以开始问答
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import JOBS_CONFIG, EMBEDDING_STATUS_CONFIG
+
+# 文档向量化状态
+EMBEDDING = "embedding"
+AVAILABLE = "available"
+FAILED = "failed"
+TIMEOUT = "timeout"
+
+EMBEDDING_STATUS_LABELS = {
+    EMBEDDING: "向量化中",
+    AVAILABLE: "可检索",
+    FAILED: "向量化失败",
+    TIMEOUT: "跟踪超时"
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embedding_status (
+    job_id TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    name TEXT,
+    status TEXT NOT NULL,
+    uploaded_at REAL NOT NULL,
+    ready_at REAL,
+    retries INTEGER NOT NULL DEFAULT 0,
+    checked_at REAL,
+    PRIMARY KEY (job_id, doc_id)
+);
+CREATE INDEX IF NOT EXISTS idx_embedding_status_status ON embedding_status (status);
+"""
+
+_QUANTILES = (50, 90, 99)
+
+
+def parse_data_status(data_status: Optional[str]) -> str:
+    """
+    将接口返回的文档状态映射为跟踪状态
+
+    Args:
+        data_status: 接口返回的 data_status（如 AVAILABLE）
+
+    Returns:
+        available / failed / embedding
+    """
+    value = (data_status or "").upper()
+    if value == "AVAILABLE":
+        return AVAILABLE
+    if "FAIL" in value or "ERROR" in value:
+        return FAILED
+    return EMBEDDING
+
+
+def _percentile(values: List[float], percentile: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+
+class EmbeddingStatusStore:
+    def __init__(self, db_path: str = None):
+        """
+        初始化文档向量化状态表（与任务表共用数据库文件）
+
+        Args:
+            db_path: SQLite数据库路径，默认读取配置
+        """
+        self.db_path = Path(db_path or JOBS_CONFIG["db_path"])
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def track(self, job_id: str, docs: Dict[str, str], uploaded_at: float = None):
+        """
+        开始跟踪文档的向量化状态
+
+        Args:
+            job_id: 上传任务ID
+            docs: 文档ID -> 文档名
+            uploaded_at: 上传完成时间，默认当前时间
+        """
+        uploaded_at = uploaded_at or time.time()
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embedding_status (job_id, doc_id, name, status, uploaded_at, retries) "
+                "VALUES (?, ?, ?, ?, ?, 0)",
+                [(job_id, doc_id, name, EMBEDDING, uploaded_at) for doc_id, name in docs.items()]
+            )
+
+    def pending(self, job_id: str = None) -> List[Dict]:
+        """获取仍在向量化中的文档（可按任务过滤）"""
+        sql = "SELECT * FROM embedding_status WHERE status = ?"
+        args = [EMBEDDING]
+        if job_id:
+            sql += " AND job_id = ?"
+            args.append(job_id)
+        with self._lock, closing(self._connect()) as conn:
+            return [dict(row) for row in conn.execute(sql + " ORDER BY uploaded_at", args).fetchall()]
+
+    def pending_jobs(self) -> List[str]:
+        """仍有文档在向量化中的任务ID"""
+        with self._lock, closing(self._connect()) as conn:
+            rows = conn.execute("SELECT DISTINCT job_id FROM embedding_status WHERE status = ?",
+                                (EMBEDDING,)).fetchall()
+        return [row["job_id"] for row in rows]
+
+    def update(self, job_id: str, changes: List[Dict]):
+        """
+        批量更新文档状态
+
+        Args:
+            job_id: 任务ID
+            changes: [{"doc_id", "status", "ready_at", "retries", "checked_at"}]
+        """
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "UPDATE embedding_status SET status = ?, ready_at = ?, retries = ?, checked_at = ? "
+                "WHERE job_id = ? AND doc_id = ?",
+                [(change["status"], change.get("ready_at"), change["retries"], change["checked_at"],
+                  job_id, change["doc_id"]) for change in changes]
+            )
+
+    def report(self, job_id: str) -> Optional[Dict]:
+        """
+        汇总任务的向量化状态
+
+        Returns:
+            {"total", "embedding", "available", "failed", "timeout", "retries",
+             "p50", "p90", "p99", "max"（上传到可检索的秒数）}，任务没有跟踪的文档时返回None
+        """
+        with self._lock, closing(self._connect()) as conn:
+            rows = conn.execute("SELECT * FROM embedding_status WHERE job_id = ?", (job_id,)).fetchall()
+        if not rows:
+            return None
+
+        report = {status: 0 for status in EMBEDDING_STATUS_LABELS}
+        report["total"] = len(rows)
+        report["retries"] = sum(row["retries"] for row in rows)
+        durations = []
+        for row in rows:
+            report[row["status"]] += 1
+            if row["status"] == AVAILABLE and row["ready_at"]:
+                durations.append(row["ready_at"] - row["uploaded_at"])
+        for quantile in _QUANTILES:
+            value = _percentile(durations, quantile)
+            report[f"p{quantile}"] = round(value, 1) if value is not None else None
+        report["max"] = round(max(durations), 1) if durations else None
+        return report
+
+    def problems(self, job_id: str) -> List[Dict]:
+        """任务中向量化失败或跟踪超时的文档"""
+        with self._lock, closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT * FROM embedding_status WHERE job_id = ? AND status IN (?, ?) ORDER BY name",
+                (job_id, FAILED, TIMEOUT)
+            ).fetchall()
+        return [{**dict(row), "status_label": EMBEDDING_STATUS_LABELS[row["status"]]} for row in rows]
+
+
+class EmbeddingStatusPoller:
+    def __init__(self, store: EmbeddingStatusStore,
+                 client_factory: Callable[[str, Optional[str]], object] = None):
+        """
+        文档向量化状态轮询器：后台线程按任务分批查询仍在向量化中的文档
+
+        每个任务单独维护轮询间隔：本轮有文档状态变化时恢复为最小间隔，否则按倍数增长到上限。
+        向量化失败的文档按API Key触发一次重新嵌入（接口对该Agent下所有失败文档生效），
+        同一API Key在冷却时间内只触发一次，单个文档重新嵌入次数用尽后标记为失败。
+        轮询使用自己创建的客户端：上传任务的客户端在重试退避时会响应任务的暂停/取消，
+        不能在任务结束后继续使用。
+
+        Args:
+            store: 文档向量化状态表
+            client_factory: 根据 (任务ID, API Key) 创建知识库客户端；API Key为None时按任务参数查找，
+                用于应用重启后继续跟踪上次未完成的任务
+        """
+        self.store = store
+        self.client_factory = client_factory
+        self._api_keys: Dict[str, str] = {}
+        self._clients: Dict[str, object] = {}
+        self._intervals: Dict[str, float] = {}
+        self._next_poll_at: Dict[str, float] = {}
+        self._last_retry_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def track(self, job_id: str, client, docs: Dict[str, str]):
+        """
+        跟踪上传成功的文档
+
+        Args:
+            job_id: 上传任务ID
+            client: 上传所用的知识库客户端（只取其API Key，查询状态和重新嵌入使用同一API Key）
+            docs: 文档ID -> 文档名
+        """
+        docs = {doc_id: name for doc_id, name in docs.items() if doc_id}
+        if not EMBEDDING_STATUS_CONFIG["enabled"] or not job_id or not docs:
+            return
+        self.store.track(job_id, docs)
+        with self._lock:
+            api_key = getattr(client, "api_key", None)
+            if api_key and self._api_keys.get(job_id) != api_key:
+                self._api_keys[job_id] = api_key
+                self._clients.pop(job_id, None)
+            self._intervals[job_id] = EMBEDDING_STATUS_CONFIG["min_interval"]
+            poll_at = time.time() + EMBEDDING_STATUS_CONFIG["min_interval"]
+            self._next_poll_at[job_id] = min(self._next_poll_at.get(job_id, poll_at), poll_at)
+        self.start()
+        self._wakeup.set()
+
+    def start(self):
+        """启动轮询线程"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._loop, name="embedding-status-poller", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """停止轮询线程"""
+        self._stop.set()
+        self._wakeup.set()
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
+
+    def resume(self) -> int:
+        """
+        继续跟踪上次进程退出时仍在向量化中的任务
+
+        Returns:
+            继续跟踪的任务数
+        """
+        job_ids = self.store.pending_jobs()
+        if job_ids:
+            self.start()
+        return len(job_ids)
+
+    def _loop(self):
+        try:
+            while not self._stop.is_set():
+                self._wakeup.clear()
+                try:
+                    wait = self.run_once()
+                except Exception as e:
+                    logging.error(f"文档向量化状态轮询失败: {e}")
+                    wait = EMBEDDING_STATUS_CONFIG["max_interval"]
+                self._wakeup.wait(wait)
+        except BaseException as e:
+            logging.error(f"文档向量化状态轮询线程意外退出: {type(e).__name__} {e}")
+            raise
+        finally:
+            # 线程退出后允许下次 track()/resume() 重新启动
+            with self._lock:
+                if self._thread is threading.current_thread():
+                    self._thread = None
+
+    def _client(self, job_id: str):
+        with self._lock:
+            client = self._clients.get(job_id)
+            api_key = self._api_keys.get(job_id)
+        if client is None and self.client_factory:
+            client = self.client_factory(job_id, api_key)
+            if client is not None:
+                with self._lock:
+                    self._clients[job_id] = client
+        return client
+
+    def run_once(self, now: float = None) -> float:
+        """
+        轮询一轮到期的任务
+
+        Returns:
+            距下一个任务到期的秒数
+        """
+        now = now or time.time()
+        job_ids = self.store.pending_jobs()
+        with self._lock:
+            for job_id in list(self._next_poll_at):
+                if job_id not in job_ids:
+                    self._forget(job_id)
+            due = [job_id for job_id in job_ids if self._next_poll_at.get(job_id, 0) <= now]
+
+        for job_id in due:
+            changed = self.poll_job(job_id, now)
+            with self._lock:
+                interval = self._intervals.get(job_id, EMBEDDING_STATUS_CONFIG["min_interval"])
+                if changed:
+                    interval = EMBEDDING_STATUS_CONFIG["min_interval"]
+                else:
+                    interval = min(EMBEDDING_STATUS_CONFIG["max_interval"],
+                                   interval * EMBEDDING_STATUS_CONFIG["backoff_factor"])
+                self._intervals[job_id] = interval
+                self._next_poll_at[job_id] = time.time() + interval
+
+        with self._lock:
+            pending_at = [self._next_poll_at[job_id] for job_id in job_ids if job_id in self._next_poll_at]
+        if not pending_at:
+            return EMBEDDING_STATUS_CONFIG["max_interval"]
+        return max(0.1, min(pending_at) - time.time())
+
+    def _forget(self, job_id: str):
+        self._api_keys.pop(job_id, None)
+        self._clients.pop(job_id, None)
+        self._intervals.pop(job_id, None)
+        self._next_poll_at.pop(job_id, None)
+
+    def poll_job(self, job_id: str, now: float = None) -> bool:
+        """
+        查询一个任务中仍在向量化的文档状态
+
+        Returns:
+            本轮是否有文档状态变化
+        """
+        now = now or time.time()
+        docs = self.store.pending(job_id)
+        client = self._client(job_id)
+        if not docs:
+            return False
+
+        changes = []
+        if client is None:
+            # 原任务参数不可用（如任务记录已删除），无法继续查询
+            changes = [{**doc, "status": TIMEOUT, "checked_at": now} for doc in docs]
+            self.store.update(job_id, changes)
+            return True
+
+        statuses = {}
+        batch_size = max(1, EMBEDDING_STATUS_CONFIG["query_batch_size"])
+        for i in range(0, len(docs), batch_size):
+            batch = docs[i:i + batch_size]
+            response = client.get_document_status([doc["doc_id"] for doc in batch])
+            if not isinstance(response, list):
+                error = response.get("message", "未知错误") if isinstance(response, dict) else "API调用失败"
+                logging.warning(f"查询文档向量化状态失败（任务 {job_id}）: {error}")
+                continue
+            for item in response:
+                statuses[item.get("data_id")] = parse_data_status(item.get("data_status"))
+        checked_at = time.time()
+
+        failed = []
+        changed = False
+        for doc in docs:
+            status = statuses.get(doc["doc_id"])
+            if status == AVAILABLE:
+                changes.append({**doc, "status": AVAILABLE, "ready_at": checked_at, "checked_at": checked_at})
+                changed = True
+            elif status == FAILED:
+                failed.append(doc)
+            elif now - doc["uploaded_at"] > EMBEDDING_STATUS_CONFIG["max_wait_seconds"]:
+                changes.append({**doc, "status": TIMEOUT, "checked_at": checked_at})
+                changed = True
+            elif status is not None:
+                changes.append({**doc, "checked_at": checked_at})
+
+        if failed:
+            retry_changes, retried = self._retry_failed(client, failed, checked_at)
+            changes.extend(retry_changes)
+            changed = changed or retried
+
+        if changes:
+            self.store.update(job_id, changes)
+        if any(change["status"] == AVAILABLE for change in changes):
+            from ..api_clients import get_vector_search_cache
+
+            # 文档变为可检索后，此前缓存的检索结果可能缺少这些文档
+            get_vector_search_cache().invalidate(getattr(client, "api_key", ""))
+        return changed
+
+    def _retry_failed(self, client, failed: List[Dict], checked_at: float) -> Tuple[List[Dict], bool]:
+        """
+        对向量化失败的文档触发重新嵌入
+
+        Returns:
+            (状态变更列表, 是否有文档触发了重新嵌入或被标记为失败)
+        """
+        max_retries = EMBEDDING_STATUS_CONFIG["max_embedding_retries"]
+        exhausted = [doc for doc in failed if doc["retries"] >= max_retries]
+        retryable = [doc for doc in failed if doc["retries"] < max_retries]
+        changes = [{**doc, "status": FAILED, "checked_at": checked_at} for doc in exhausted]
+        if not retryable:
+            return changes, bool(exhausted)
+
+        api_key = getattr(client, "api_key", "")
+        with self._lock:
+            cooling = checked_at - self._last_retry_at.get(api_key, 0) < EMBEDDING_STATUS_CONFIG["retry_cooldown"]
+            if not cooling:
+                self._last_retry_at[api_key] = checked_at
+        if cooling:
+            # 冷却期内已触发过重新嵌入，等待其生效
+            return changes + [{**doc, "checked_at": checked_at} for doc in retryable], bool(exhausted)
+
+        response = client.retry_failed_embeddings()
+        if response and "error" not in response:
+            logging.info(f"已触发重新嵌入: {len(retryable)} 个文档向量化失败")
+            changes.extend({**doc, "retries": doc["retries"] + 1, "checked_at": checked_at} for doc in retryable)
+            return changes, True
+
+        error = response.get("message", "未知错误") if response else "API调用失败"
+        logging.warning(f"触发重新嵌入失败: {error}")
+        return changes + [{**doc, "checked_at": checked_at} for doc in retryable], bool(exhausted)
+
+
+def poller_client_factory(get_job: Callable[[str], Optional[Dict]]) -> Callable[[str, Optional[str]], object]:
+    """
+    为轮询线程创建独立的知识库客户端（重试退避使用普通 time.sleep，不受任务暂停/取消影响）
+
+    Args:
+        get_job: 按任务ID获取任务信息的函数，未提供API Key时从任务参数中查找
+
+    Returns:
+        (任务ID, API Key) -> KnowledgeBaseAPI客户端（任务或API Key不存在时返回None）
+    """
+    def factory(job_id: str, api_key: Optional[str] = None):
+        from ..api_clients import KnowledgeBaseAPI
+
+        if not api_key:
+            job = get_job(job_id)
+            params = (job or {}).get("params") or {}
+            api_key = params.get("api_key") or params.get("kb_api_key")
+        return KnowledgeBaseAPI(api_key) if api_key else None
+
+    return factory
+
+
+_embedding_poller: Optional[EmbeddingStatusPoller] = None
+_embedding_poller_lock = threading.Lock()
+
+
+def get_embedding_poller() -> EmbeddingStatusPoller:
+    """获取进程内共享的文档向量化状态轮询器"""
+    global _embedding_poller
+    with _embedding_poller_lock:
+        if _embedding_poller is None:
+            from .store import JobStore
+
+            _embedding_poller = EmbeddingStatusPoller(EmbeddingStatusStore(),
+                                                      poller_client_factory(JobStore().get))
+        return _embedding_poller
+
+
+def track_uploaded(job_id: Optional[str], client, docs: Dict[str, str]):
+    """
+    记录上传成功的文档，由后台轮询其向量化状态（未开启跟踪或没有任务ID时忽略）
+
+    Args:
+        job_id: 上传任务ID
+        client: 知识库客户端
+        docs: 文档ID -> 文档名
+    """
+    if not job_id or not docs:
+        return
+    try:
+        get_embedding_poller().track(job_id, client, docs)
+    except sqlite3.Error as e:
+        logging.warning(f"记录文档向量化跟踪失败: {e}")
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+文件处理状态表
+按 (处理阶段, 文件路径) 持久化每个文件的处理状态和内容哈希，
+进程崩溃或重启后可按文件身份精确续跑，而不依赖遍历顺序或浏览器会话
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import JOBS_CONFIG
+from .dead_letters import DeadLetterQueue, REPLAYABLE_STAGES
+
+# 文件状态
+PENDING = "pending"
+IN_FLIGHT = "in_flight"
+DONE = "done"
+FAILED = "failed"
+
+FILE_STATUS_LABELS = {
+    PENDING: "待处理",
+    IN_FLIGHT: "处理中",
+    DONE: "已完成",
+    FAILED: "失败"
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS file_states (
+    stage TEXT NOT NULL,
+    path TEXT NOT NULL,
+    name TEXT NOT NULL,
+    status TEXT NOT NULL,
+    content_hash TEXT,
+    size INTEGER,
+    mtime_ns INTEGER,
+    fingerprint TEXT,
+    job_id TEXT,
+    output TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (stage, path)
+);
+CREATE INDEX IF NOT EXISTS idx_file_states_stage_status ON file_states (stage, status);
+"""
+
+# 文件大小和修改时间描述 content_hash 对应的文件内容，随内容哈希一起更新
+_UPSERT = (
+    "INSERT INTO file_states (stage, path, name, status, content_hash, size, mtime_ns, fingerprint, job_id, "
+    "output, error, attempts, updated_at) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT (stage, path) DO UPDATE SET "
+    "status = excluded.status, "
+    "size = CASE WHEN excluded.content_hash IS NULL THEN size ELSE excluded.size END, "
+    "mtime_ns = CASE WHEN excluded.content_hash IS NULL THEN mtime_ns ELSE excluded.mtime_ns END, "
+    "content_hash = COALESCE(excluded.content_hash, content_hash), "
+    "fingerprint = COALESCE(excluded.fingerprint, fingerprint), "
+    "job_id = COALESCE(excluded.job_id, job_id), "
+    "output = CASE WHEN excluded.status = 'done' THEN excluded.output ELSE output END, "
+    "error = excluded.error, "
+    "attempts = attempts + excluded.attempts, "
+    "updated_at = excluded.updated_at"
+)
+
+
+def file_content_hash(path: Path) -> str:
+    """计算文件内容的SHA-256哈希"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _file_key(path) -> str:
+    return str(Path(path).resolve())
+
+
+class FileStateStore:
+    def __init__(self, db_path: str = None):
+        """
+        初始化文件处理状态表（与任务表共用数据库文件）
+
+        Args:
+            db_path: SQLite数据库路径，默认读取配置
+        """
+        self.db_path = Path(db_path or JOBS_CONFIG["db_path"])
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.executescript(_SCHEMA)
+            # 兼容早期版本创建的表
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(file_states)")}
+            if "fingerprint" not in columns:
+                conn.execute("ALTER TABLE file_states ADD COLUMN fingerprint TEXT")
+            for column in ("size", "mtime_ns"):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE file_states ADD COLUMN {column} INTEGER")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def get(self, stage: str, path) -> Optional[Dict]:
+        """获取单个文件的状态，不存在时返回None"""
+        with self._lock, closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT * FROM file_states WHERE stage = ? AND path = ?", (stage, _file_key(path))
+            ).fetchone()
+        return dict(row) if row else None
+
+    def get_many(self, stage: str, paths: Iterable) -> Dict[str, Dict]:
+        """批量获取文件状态，返回 文件路径键 -> 状态"""
+        keys = [_file_key(path) for path in paths]
+        states = {}
+        with self._lock, closing(self._connect()) as conn:
+            # SQLite单条语句的参数数量有限，分段查询
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = conn.execute(
+                    f"SELECT * FROM file_states WHERE stage = ? AND path IN ({', '.join('?' for _ in chunk)})",
+                    (stage, *chunk)
+                ).fetchall()
+                states.update((row["path"], dict(row)) for row in rows)
+        return states
+
+    def set_status(self, stage: str, path, status: str, content_hash: str = None, job_id: str = None,
+                   output: str = None, error: str = None, fingerprint: str = None,
+                   file_stat: Tuple[int, int] = None):
+        """
+        写入文件状态
+
+        Args:
+            stage: 处理阶段
+            path: 文件路径
+            status: 文件状态
+            content_hash: 内容哈希，为None时保留原值
+            job_id: 所属任务ID，为None时保留原值
+            output: 输出文件路径或远端文档ID
+            error: 失败原因
+            fingerprint: 处理参数指纹（如提示词版本与Bot Key），为None时保留原值
+            file_stat: 计算内容哈希时的 (文件大小, 修改时间ns)，与 content_hash 一起写入
+        """
+        # 每次进入处理中状态计为一次尝试
+        attempts = 1 if status == IN_FLIGHT else 0
+        size, mtime_ns = file_stat or (None, None)
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.execute(_UPSERT, (stage, _file_key(path), Path(path).name, status, content_hash, size, mtime_ns,
+                                   fingerprint, job_id, output, error, attempts, time.time()))
+
+    def mark_pending(self, stage: str, files: List[Tuple[Path, str, Tuple[int, int]]], job_id: str = None):
+        """
+        在同一事务中将多个文件标记为待处理
+
+        Args:
+            stage: 处理阶段
+            files: (文件路径, 内容哈希, (文件大小, 修改时间ns)) 列表
+            job_id: 所属任务ID
+        """
+        now = time.time()
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.executemany(_UPSERT, [
+                (stage, _file_key(path), Path(path).name, PENDING, content_hash, *file_stat, None, job_id,
+                 None, None, 0, now)
+                for path, content_hash, file_stat in files
+            ])
+
+    def touch(self, stage: str, entries: List[Tuple[str, int, int]]):
+        """
+        只更新文件大小和修改时间（内容哈希未变化，如文件被重新保存）
+
+        Args:
+            stage: 处理阶段
+            entries: (文件路径键, 文件大小, 修改时间ns) 列表
+        """
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "UPDATE file_states SET size = ?, mtime_ns = ? WHERE stage = ? AND path = ?",
+                [(size, mtime_ns, stage, key) for key, size, mtime_ns in entries]
+            )
+
+    def classify(self, stage: str, paths: List[Path], fingerprint: str = None,
+                 check_output: bool = False) -> Tuple[Dict[str, List[Path]], Dict[str, Tuple[str, Tuple[int, int]]]]:
+        """
+        按上次处理状态将文件分为新文件/已变化/无需处理三类
+
+        已完成、内容哈希与处理参数指纹均未变化（且要求时输出文件仍存在）的文件无需处理；
+        曾经处理完成但哈希、指纹或输出不再匹配的为已变化；其余为新文件。
+        文件大小和修改时间与记录一致时直接沿用记录的内容哈希，不重新计算；
+        修改时间变化但内容未变的文件只更新记录的大小和修改时间。
+
+        Args:
+            stage: 处理阶段
+            paths: 输入文件列表
+            fingerprint: 处理参数指纹，为None时不比较
+            check_output: 要求输出文件仍存在
+
+        Returns:
+            ({"new": [...], "changed": [...], "up_to_date": [...]},
+             文件路径键 -> (内容哈希, (文件大小, 修改时间ns)))
+        """
+        previous = self.get_many(stage, paths)
+        groups = {"new": [], "changed": [], "up_to_date": []}
+        hashes = {}
+        touched = []
+        for path in paths:
+            key = _file_key(path)
+            stat = Path(path).stat()
+            file_stat = (stat.st_size, stat.st_mtime_ns)
+            state = previous.get(key)
+            if state and state["content_hash"] and (state["size"], state["mtime_ns"]) == file_stat:
+                content_hash = state["content_hash"]
+            else:
+                content_hash = file_content_hash(path)
+                if state and state["content_hash"] == content_hash:
+                    touched.append((key, *file_stat))
+            hashes[key] = (content_hash, file_stat)
+
+            if not state or (state["status"] != DONE and not state["output"]):
+                groups["new"].append(path)
+            elif (state["status"] == DONE and state["content_hash"] == content_hash
+                    and (fingerprint is None or state["fingerprint"] == fingerprint)
+                    and (not check_output or (state["output"] and Path(state["output"]).exists()))):
+                groups["up_to_date"].append(path)
+            else:
+                groups["changed"].append(path)
+
+        if touched:
+            self.touch(stage, touched)
+        return groups, hashes
+
+    def find_orphans(self, stage: str) -> List[Dict]:
+        """列出源文件已不存在的文件状态"""
+        return [state for state in self.list_states(stage) if not Path(state["path"]).exists()]
+
+    def remove(self, stage: str, paths: Iterable):
+        """删除文件状态"""
+        keys = [_file_key(path) for path in paths]
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.executemany("DELETE FROM file_states WHERE stage = ? AND path = ?", [(stage, key) for key in keys])
+
+    def list_states(self, stage: str = None, status: str = None) -> List[Dict]:
+        """按更新时间倒序列出文件状态"""
+        conditions = []
+        values = []
+        if stage:
+            conditions.append("stage = ?")
+            values.append(stage)
+        if status:
+            conditions.append("status = ?")
+            values.append(status)
+
+        sql = "SELECT * FROM file_states"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY updated_at DESC"
+
+        with self._lock, closing(self._connect()) as conn:
+            rows = conn.execute(sql, values).fetchall()
+        return [dict(row) for row in rows]
+
+    def summary(self, stage: str) -> Dict[str, int]:
+        """统计某阶段各状态的文件数"""
+        with self._lock, closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT status, COUNT(*) AS count FROM file_states WHERE stage = ? GROUP BY status", (stage,)
+            ).fetchall()
+        return {row["status"]: row["count"] for row in rows}
+
+    def reset_in_flight(self) -> int:
+        """
+        将上次进程退出时处理中的文件恢复为待处理
+
+        Returns:
+            恢复的文件数
+        """
+        with self._lock, closing(self._connect()) as conn, conn:
+            cursor = conn.execute(
+                "UPDATE file_states SET status = ?, updated_at = ? WHERE status = ?",
+                (PENDING, time.time(), IN_FLIGHT)
+            )
+            return cursor.rowcount
+
+
+class FileTracker:
+    def __init__(self, store: FileStateStore, stage: str, job_id: str = None,
+                 dead_letters: DeadLetterQueue = None):
+        """
+        单次运行中某处理阶段的文件状态记录器
+
+        Args:
+            store: 文件处理状态表
+            stage: 处理阶段（cleaning/llm/kb_upload）
+            job_id: 所属任务ID
+            dead_letters: 死信队列，可按文件重放的阶段失败时记录死信、成功时移出
+        """
+        self.store = store
+        self.stage = stage
+        self.job_id = job_id
+        self.dead_letters = dead_letters if stage in REPLAYABLE_STAGES else None
+        self.fingerprint = None
+        self.groups: Dict[str, List[Path]] = {}
+        self._hashes: Dict[str, Tuple[str, Tuple[int, int]]] = {}
+
+    def plan(self, paths: List[Path], resume: bool = False, check_output: bool = False,
+             fingerprint: str = None) -> Tuple[List[Path], List[Path]]:
+        """
+        计算内容哈希并登记待处理文件
+
+        续跑时跳过上次已完成且内容未变化的文件，其余文件标记为待处理。
+        分类结果（新文件/已变化/无需处理）累计保存在 groups 中，流式处理时可逐个文件调用。
+
+        Args:
+            paths: 本阶段的全部输入文件
+            resume: 是否跳过已完成的文件
+            check_output: 输出为本地文件时，要求输出文件仍存在才跳过
+            fingerprint: 处理参数指纹，与上次不同的文件视为已变化，完成时记录
+
+        Returns:
+            (待处理文件列表, 跳过的文件列表)
+        """
+        self.fingerprint = fingerprint
+        groups, hashes = self.store.classify(self.stage, paths, fingerprint, check_output)
+        self._hashes.update(hashes)
+        for name, files in groups.items():
+            self.groups.setdefault(name, []).extend(files)
+        skipped = groups["up_to_date"] if resume else []
+        skipped_keys = {_file_key(path) for path in skipped}
+        to_process = [path for path in paths if _file_key(path) not in skipped_keys]
+
+        self.store.mark_pending(
+            self.stage, [(path, *self._hashes[_file_key(path)]) for path in to_process], self.job_id
+        )
+        return to_process, skipped
+
+    def start(self, path):
+        """标记文件开始处理"""
+        self.store.set_status(self.stage, path, IN_FLIGHT, job_id=self.job_id)
+
+    def done(self, path, output: str = None):
+        """标记文件处理完成，记录开始处理时的内容哈希"""
+        content_hash, file_stat = self._hashes.get(_file_key(path), (None, None))
+        self.store.set_status(self.stage, path, DONE, content_hash=content_hash, file_stat=file_stat,
+                              job_id=self.job_id, output=output, fingerprint=self.fingerprint)
+        if self.dead_letters:
+            self.dead_letters.resolve(self.stage, path)
+
+    def failed(self, path, error: str):
+        """标记文件处理失败，并记入死信队列等待重试"""
+        self.store.set_status(self.stage, path, FAILED, job_id=self.job_id, error=error)
+        if self.dead_letters:
+            self.dead_letters.record(self.stage, path, error, self.job_id)
+
+
+_file_state_store: Optional[FileStateStore] = None
+_file_state_lock = threading.Lock()
+
+
+def get_file_state_store() -> FileStateStore:
+    """获取进程内共享的文件处理状态表"""
+    global _file_state_store
+    with _file_state_lock:
+        if _file_state_store is None:
+            _file_state_store = FileStateStore()
+        return _file_state_store
@@ -0,0 +1,548 @@
+#!/usr/bin/env python3
+"""
+各处理阶段的后台任务处理函数
+不依赖Streamlit，进度与状态通过 JobContext 写入任务表，结果需可JSON序列化
+"""
+
+import json
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from config import CIRCUIT_RETRY_CONFIG
+from ..kb_sync import plan_kb_sync, apply_kb_sync, record_uploaded
+from ..kb_chunker import upload_chunked_files
+from .file_state import FileTracker
+from .embedding_status import track_uploaded
+from .kb_mirror import get_kb_mirror
+from .runner import JobContext, register_job_handler
+
+
+@register_job_handler("cleaning")
+def run_cleaning_job(context: JobContext, params: Dict) -> Dict:
+    """
+    数据清洗任务
+
+    去重需要全部邮件参与比较，续跑时整体重新清洗；内容未变化的Markdown文件不会被改写，
+    下游阶段按内容哈希判断无需重复处理。
+
+    Args:
+        params: {"input_dir": EML目录, "output_dir": Markdown输出目录}
+    """
+    from ..email_processing import EmailCleaner
+
+    context.update(5, "初始化邮件清洗器...")
+    cleaner = EmailCleaner(input_dir=params["input_dir"], output_dir=params["output_dir"])
+    tracker = context.tracker("cleaning")
+    tracker.plan(sorted(Path(params["input_dir"]).glob("*.eml")))
+
+    def on_progress(phase, done, total):
+        context.checkpoint()
+        if phase == "parse":
+            context.update(10 + done * 50 // total, f"解析邮件 {done + 1}/{total}")
+        else:
+            context.update(60 + done * 35 // total, f"生成Markdown {done + 1}/{total}")
+
+    def on_file(filename, status, detail):
+        eml_file = Path(params["input_dir"]) / filename
+        if status == "done":
+            tracker.done(eml_file, detail)
+        else:
+            tracker.failed(eml_file, detail)
+
+    result = cleaner.process_all_emails(progress_callback=on_progress, file_callback=on_file)
+    if not result["success"]:
+        raise RuntimeError(result.get("message", "未知错误"))
+
+    return {"report": result["report"]}
+
+
+def existing_files(paths: List[str], stage: str, context: JobContext) -> List[Path]:
+    """
+    过滤出仍存在的文件，源文件已删除的死信直接移出死信队列
+
+    Args:
+        paths: 文件路径列表
+        stage: 处理阶段
+        context: 任务执行上下文
+
+    Returns:
+        仍存在的文件路径列表
+    """
+    files = [Path(path) for path in paths]
+    missing = [path for path in files if not path.exists()]
+    if missing:
+        context.runner.dead_letters.remove(stage, missing)
+    return [path for path in files if path.exists()]
+
+
+@register_job_handler("llm")
+def run_llm_job(context: JobContext, params: Dict) -> Dict:
+    """
+    LLM处理任务
+
+    Args:
+        params: api_key, endpoint, delay, workers, bypass_cache, enable_hedging, pack_small_emails, pack_token_budget,
+                split_threshold, park_on_open, processed_dir, final_dir,
+                files（只处理这些文件，用于重放死信）,
+                incremental（只处理内容、提示词模板版本或Bot Key变化的文件，并清理源文件已删除的结果）,
+                resume（续跑，同样跳过已完成且未变化的文件）
+    """
+    from ..api_clients import GPTBotsAPI, RetryQueue
+    from ..llm_engine import (LLMResponseCache, LLMEmailProcessor, LLMWorkerPool, save_llm_result,
+                              LLM_STAGE, llm_fingerprint, collect_orphan_outputs)
+
+    api_key = params["api_key"]
+    endpoint = params.get("endpoint", "sg")
+    park_on_open = params.get("park_on_open", CIRCUIT_RETRY_CONFIG["park_on_open"])
+
+    context.update(2, "初始化GPTBots API客户端...")
+    client = GPTBotsAPI(api_key, hedging=params.get("enable_hedging", False), retry_wait=context.sleep)
+
+    # 初始化响应缓存，命中缓存的文件不再调用LLM
+    cache = LLMResponseCache(bypass=params.get("bypass_cache", False))
+    cache.evict()
+    processor = LLMEmailProcessor(client, api_key, cache, split_threshold=params.get("split_threshold"))
+
+    # 服务熔断期间失败的文件暂存于此，恢复后自动重试
+    retry_queue = RetryQueue(client.circuit, CIRCUIT_RETRY_CONFIG["max_wait_seconds"])
+
+    if params.get("files"):
+        input_files = existing_files(params["files"], LLM_STAGE, context)
+    else:
+        input_files = sorted(Path(params["processed_dir"]).glob("*.md"))
+    if not input_files:
+        raise RuntimeError("未找到待处理的Markdown文件")
+
+    incremental = params.get("incremental", False)
+    removed_outputs = collect_orphan_outputs(context.runner.file_states) if incremental else []
+
+    tracker = context.tracker(LLM_STAGE)
+    md_files, skipped_files = tracker.plan(
+        input_files,
+        resume=incremental or params.get("resume", False),
+        check_output=True,
+        fingerprint=llm_fingerprint(api_key)
+    )
+    files_by_name = {md_file.name: md_file for md_file in md_files}
+
+    contents = {}
+    for md_file in md_files:
+        with open(md_file, 'r', encoding='utf-8') as f:
+            contents[md_file.name] = f.read()
+
+    if skipped_files:
+        context.update(5, f"发现 {len(input_files)} 个Markdown文件：新文件 {len(tracker.groups['new'])} 个，"
+                          f"已变化 {len(tracker.groups['changed'])} 个，无需处理 {len(skipped_files)} 个")
+    else:
+        context.update(5, f"发现 {len(md_files)} 个Markdown文件待处理")
+
+    # 合并短邮件：预先批量处理，后续逐个处理时直接取用结果
+    if params.get("pack_small_emails"):
+        def on_pack_progress(done, total):
+            context.checkpoint()
+            context.update(5 + done * 5 // total, f"合并处理短邮件: 第 {done}/{total} 批")
+
+        processor.prefetch_packed(
+            [(md_file.name, contents[md_file.name]) for md_file in md_files],
+            token_budget=params.get("pack_token_budget"),
+            progress_callback=on_pack_progress
+        )
+
+    processed_files = []
+    failed_files = []
+
+    def save_result(md_file, llm_response):
+        output_filename = save_llm_result(
+            md_file, contents[md_file.name], llm_response, params["final_dir"], endpoint, api_key
+        )
+        processed_files.append(output_filename)
+        tracker.done(md_file, str(Path(params["final_dir"]) / output_filename))
+
+    def fail(md_file, error):
+        failed_files.append({"file": md_file.name, "error": error})
+        tracker.failed(md_file, error)
+
+    def handle_result(index, md_file, outcome):
+        context.update(10 + (index + 1) * 85 // len(md_files), f"已完成: {md_file.name} ({index + 1}/{len(md_files)})")
+        if outcome["content"]:
+            try:
+                save_result(md_file, outcome["content"])
+            except Exception as e:
+                fail(md_file, f"处理出错: {e}")
+        elif outcome["circuit_open"] and park_on_open:
+            # 服务熔断中：暂存文件，不再逐个等待超时
+            retry_queue.park(md_file)
+        else:
+            fail(md_file, f"LLM处理失败（尝试 {outcome['attempts']} 次）: {outcome['error']}")
+
+    def before_item(source_name):
+        context.checkpoint()
+        tracker.start(files_by_name[source_name])
+
+    pool = LLMWorkerPool(processor, workers=params.get("workers"), delay=params.get("delay", 0),
+                         retry_wait=context.sleep)
+    pool.run(
+        [(md_file, md_file.name, contents[md_file.name]) for md_file in md_files],
+        handle_result,
+        before_item=before_item
+    )
+
+    # 等待熔断恢复后处理暂存的文件
+    if len(retry_queue):
+        def retry_parked(md_file):
+            context.checkpoint()
+            context.update(message=f"重试暂存文件: {md_file.name}")
+            tracker.start(md_file)
+            outcome = processor.process(contents[md_file.name], md_file.name)
+            if outcome["content"]:
+                save_result(md_file, outcome["content"])
+                return True
+            if outcome["circuit_open"]:
+                return False
+            fail(md_file, f"LLM处理失败: {outcome['error']}")
+            return True
+
+        def show_waiting(pending, retry_after):
+            context.checkpoint()
+            context.update(message=f"服务熔断中，{pending} 个文件等待自动重试（{retry_after:.0f} 秒后探测）")
+
+        for md_file in retry_queue.drain(retry_parked, show_waiting):
+            fail(md_file, "服务长时间不可用，已放弃重试")
+
+    return {
+        "input_files": len(input_files),
+        "new_files": len(tracker.groups["new"]),
+        "changed_files": len(tracker.groups["changed"]),
+        "skipped_files": len(skipped_files),
+        "removed_outputs": removed_outputs,
+        "processed_files": processed_files,
+        "failed_files": failed_files,
+        "cache_hits": processor.cache_hits,
+        "api_calls": processor.api_calls,
+        "packed_calls": processor.packed_calls,
+        "packed_emails": processor.packed_emails,
+        "map_reduce_emails": processor.map_reduce_emails,
+        "retried_files": pool.retried_files,
+        "final_dir": params["final_dir"]
+    }
+
+
+def upload_selected_files(client, files_to_upload: List[Path], params: Dict,
+                          progress_callback: Callable[[int, int, str], None] = None,
+                          tracker: FileTracker = None, job_id: str = None,
+                          checkpoint: Callable[[], None] = None) -> Dict:
+    """
+    上传选中的文件到知识库
+
+    与目录上传相同，按请求体大小装箱分批、多个批次并发上传，请求速率受 KB_UPLOAD_CONFIG 限制；
+    内容为空的文件不上传，直接记为失败。
+
+    Args:
+        client: KnowledgeBaseAPI客户端
+        files_to_upload: 要上传的文件路径列表
+        params: 上传参数，continue_on_error 为False时出现失败后不再提交新的批次
+        progress_callback: 进度回调，参数为 (已完成数, 总数, 最近完成的文件名)，每个批次完成后在工作线程中调用
+        tracker: 文件状态记录器
+        job_id: 上传任务ID，提供时跟踪上传文档的向量化状态
+        checkpoint: 每个批次提交前在调用线程中调用，用于响应暂停和取消
+
+    Returns:
+        与目录批量上传相同格式的结果
+    """
+    files_by_name = {path.name: path for path in files_to_upload}
+    empty_files = []
+    non_empty = []
+    for file_path in files_to_upload:
+        try:
+            is_empty = not file_path.read_text(encoding="utf-8").strip()
+        except (OSError, UnicodeDecodeError):
+            # 读取失败的文件交由批量上传记为失败
+            is_empty = False
+        (empty_files if is_empty else non_empty).append(file_path)
+
+    lock = threading.Lock()
+    finished = {"count": 0, "failed": len(empty_files)}
+
+    def on_file(filename, status, detail):
+        file_path = files_by_name.get(filename)
+        if file_path is None:
+            return
+        if status == "in_flight":
+            if tracker:
+                tracker.start(file_path)
+            return
+        if status == "done":
+            if tracker:
+                tracker.done(file_path, detail)
+            record_uploaded(params["knowledge_base_id"], file_path, detail)
+            track_uploaded(job_id, client, {detail: filename})
+        elif tracker:
+            tracker.failed(file_path, detail)
+        with lock:
+            finished["count"] += 1
+            finished["failed"] += status == "failed"
+            done = finished["count"]
+        if progress_callback:
+            progress_callback(done, len(non_empty), filename)
+
+    def stop_requested():
+        return not params.get("continue_on_error", True) and finished["failed"] > 0
+
+    if non_empty:
+        upload_result = client.upload_markdown_files_from_directory(
+            directory_path=params["final_dir"],
+            knowledge_base_id=params["knowledge_base_id"],
+            chunk_token=params["chunk_token"] or 600,
+            splitter=params["splitter"],
+            progress_callback=(lambda done, total: checkpoint()) if checkpoint else None,
+            files=non_empty,
+            file_callback=on_file,
+            concurrent_batches=params.get("concurrent_batches"),
+            should_stop=stop_requested
+        )
+        if "error" in upload_result:
+            return upload_result
+    else:
+        upload_result = {"total_files": 0, "successful_uploads": 0, "failed_uploads": 0,
+                         "uploaded_files": [], "failed_files": [], "batches_processed": 0}
+
+    for file_path in empty_files:
+        if tracker:
+            tracker.failed(file_path, "文件内容为空")
+        upload_result["failed_files"].append({"file_name": file_path.name, "error": "文件内容为空"})
+    upload_result["total_files"] += len(empty_files)
+    upload_result["failed_uploads"] += len(empty_files)
+    return upload_result
+
+
+@register_job_handler("kb_upload")
+def run_kb_upload_job(context: JobContext, params: Dict) -> Dict:
+    """
+    知识库上传任务
+
+    Args:
+        params: api_key, knowledge_base_id, chunk_token, splitter, continue_on_error,
+                create_backup, concurrent_batches（同时在途的上传批次数）,
+                sync（按同步清单新增/更新/删除，跳过未变化的文件）,
+                client_chunking（本地分块上传，跳过已上传的重复知识块；优先于sync）,
+                selected_files（None表示上传整个目录）, final_dir,
+                files（只上传这些文件，用于重放死信）,
+                resume（跳过上次已上传且内容未变化的文件）
+    """
+    from ..api_clients import KnowledgeBaseAPI
+
+    context.update(2, "初始化知识库API客户端...")
+    client = KnowledgeBaseAPI(params["api_key"], retry_wait=context.sleep)
+    final_dir = Path(params["final_dir"])
+    tracker = context.tracker("kb_upload")
+
+    if params.get("sync") and not params.get("client_chunking"):
+        upload_result = run_kb_sync(context, client, params, tracker)
+        return save_upload_record(upload_result, params, final_dir)
+
+    if params.get("files"):
+        candidates = existing_files(params["files"], "kb_upload", context)
+    elif params.get("selected_files"):
+        candidates = [final_dir / filename for filename in params["selected_files"]]
+    else:
+        candidates = sorted(final_dir.glob("*.md"))
+    files_to_upload, skipped_files = tracker.plan(candidates, resume=params.get("resume", False))
+    if skipped_files:
+        context.update(4, f"跳过已上传的 {len(skipped_files)} 个文件，待上传 {len(files_to_upload)} 个")
+
+    if not files_to_upload and skipped_files:
+        upload_result = {"total_files": 0, "successful_uploads": 0, "failed_uploads": 0,
+                         "uploaded_files": [], "failed_files": [], "batches_processed": 0}
+    elif params.get("client_chunking"):
+        upload_result = run_kb_chunked_upload(context, client, params, files_to_upload, tracker)
+    elif params.get("selected_files") or params.get("files"):
+        def on_file(done, total, filename):
+            context.update(5 + done * 90 // max(1, total), f"已完成 {done}/{total} 个文件: {filename}")
+
+        upload_result = upload_selected_files(client, files_to_upload, params, on_file, tracker, context.job_id,
+                                              checkpoint=context.checkpoint)
+    else:
+        def on_batch(done, total):
+            context.checkpoint()
+            context.update(5 + done * 90 // total, f"正在上传文件（已提交 {done}/{total} 个）")
+
+        def on_upload_state(filename, status, detail):
+            md_file = final_dir / filename
+            if status == "in_flight":
+                tracker.start(md_file)
+            elif status == "done":
+                tracker.done(md_file, detail)
+                record_uploaded(params["knowledge_base_id"], md_file, detail)
+                track_uploaded(context.job_id, client, {detail: filename})
+            else:
+                tracker.failed(md_file, detail)
+
+        # 使用批量上传功能（上传整个目录）
+        upload_result = client.upload_markdown_files_from_directory(
+            directory_path=str(final_dir),
+            knowledge_base_id=params["knowledge_base_id"],
+            chunk_token=params["chunk_token"] or 600,
+            splitter=params["splitter"],
+            batch_size=10,
+            progress_callback=on_batch,
+            files=files_to_upload,
+            file_callback=on_upload_state,
+            concurrent_batches=params.get("concurrent_batches")
+        )
+
+    if "error" in upload_result:
+        raise RuntimeError(upload_result["error"])
+    upload_result["skipped_files"] = len(skipped_files)
+    return save_upload_record(upload_result, params, final_dir)
+
+
+def run_kb_sync(context: JobContext, client, params: Dict, tracker: FileTracker) -> Dict:
+    """
+    按同步清单增量同步知识库：新增新文件、更新已变化的文件、删除本地已移除的文件
+
+    Args:
+        context: 任务执行上下文
+        client: KnowledgeBaseAPI客户端
+        params: 上传参数，files 非空时只同步这些文件（重放死信），不删除其他文档
+        tracker: 文件状态记录器
+
+    Returns:
+        同步结果
+    """
+    if params.get("files"):
+        files = existing_files(params["files"], "kb_upload", context)
+    elif params.get("selected_files"):
+        files = [Path(params["final_dir"]) / filename for filename in params["selected_files"]]
+    else:
+        files = None
+
+    context.update(3, "比较本地文件与同步清单...")
+    plan = plan_kb_sync(params["final_dir"], params["knowledge_base_id"], files)
+    tracker.plan(plan["new"] + plan["changed"])
+    context.update(5, f"同步计划: 新增 {len(plan['new'])} 个, 更新 {len(plan['changed'])} 个, "
+                      f"删除 {len(plan['removed'])} 个, 未变化 {len(plan['unchanged'])} 个")
+
+    def on_progress(done, total):
+        context.checkpoint()
+        context.update(5 + done * 90 // total, f"正在同步文件（已提交 {done}/{total} 个）")
+
+    def on_file(filename, status, detail):
+        md_file = files_by_name.get(filename)
+        if md_file is None:
+            return
+        if status == "in_flight":
+            tracker.start(md_file)
+        elif status == "done":
+            tracker.done(md_file, detail)
+            track_uploaded(context.job_id, client, {detail: filename})
+        else:
+            tracker.failed(md_file, detail)
+
+    files_by_name = {path.name: path for path in plan["new"] + plan["changed"]}
+    return apply_kb_sync(
+        client, plan, params["knowledge_base_id"],
+        chunk_token=params["chunk_token"] or 600,
+        splitter=params["splitter"],
+        progress_callback=on_progress,
+        file_callback=on_file,
+        concurrent_batches=params.get("concurrent_batches")
+    )
+
+
+def run_kb_chunked_upload(context: JobContext, client, params: Dict, files: List[Path],
+                          tracker: FileTracker) -> Dict:
+    """
+    本地分块后上传文件，跳过已上传到该知识库的重复知识块
+
+    Args:
+        context: 任务执行上下文
+        client: KnowledgeBaseAPI客户端
+        params: 上传参数
+        files: 待上传的文件
+        tracker: 文件状态记录器
+
+    Returns:
+        上传结果
+    """
+    files_by_name = {path.name: path for path in files}
+
+    def on_progress(done, total):
+        context.checkpoint()
+        context.update(5 + done * 90 // total, f"正在本地分块上传文件（已完成 {done}/{total} 个）")
+
+    def on_file(filename, status, detail):
+        md_file = files_by_name.get(filename)
+        if md_file is None:
+            return
+        if status == "in_flight":
+            tracker.start(md_file)
+        elif status == "done":
+            tracker.done(md_file, detail)
+            if detail:
+                record_uploaded(params["knowledge_base_id"], md_file, detail)
+                track_uploaded(context.job_id, client, {detail: filename})
+        else:
+            tracker.failed(md_file, detail)
+
+    return upload_chunked_files(
+        client, files, params["knowledge_base_id"],
+        chunk_token=params["chunk_token"] or 600,
+        progress_callback=on_progress,
+        file_callback=on_file
+    )
+
+
+def save_upload_record(upload_result: Dict, params: Dict, final_dir: Path) -> Dict:
+    """按参数保存上传记录文件"""
+    if params.get("create_backup"):
+        backup_filename = f"kb_upload_result_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        with open(final_dir / backup_filename, 'w', encoding='utf-8') as f:
+            json.dump(upload_result, f, indent=2, ensure_ascii=False)
+        upload_result["backup_filename"] = backup_filename
+
+    return upload_result
+
+
+@register_job_handler("kb_mirror")
+def run_kb_mirror_job(context: JobContext, params: Dict) -> Dict:
+    """
+    刷新知识库文档本地镜像：并发分页获取全部文档，只写入新增和变化的文档
+
+    Args:
+        params: api_key, knowledge_base_id
+    """
+    from ..api_clients import KnowledgeBaseAPI
+
+    client = KnowledgeBaseAPI(params["api_key"], retry_wait=context.sleep)
+
+    def on_page(fetched, total):
+        context.update(min(99, fetched * 100 // max(1, total)), f"正在获取文档列表（{fetched}/{total}）")
+
+    context.update(1, "正在获取文档列表...")
+    documents = client.iter_documents(params["knowledge_base_id"], progress_callback=on_page)
+    return get_kb_mirror().refresh(params["knowledge_base_id"], documents, checkpoint=context.checkpoint)
+
+
+@register_job_handler("auto_pipeline")
+def run_auto_pipeline_job(context: JobContext, params: Dict) -> Dict:
+    """
+    全自动处理任务：数据清洗 -> LLM处理 -> 知识库上传
+
+    Args:
+        params: 流水线配置（见 AutoProcessingPipeline），upload_count 为已保存的上传文件数，
+                resume 为True时各阶段跳过上次已完成且内容未变化的文件
+    """
+    from ..auto_pipeline import AutoProcessingPipeline
+
+    pipeline = AutoProcessingPipeline(
+        config=params,
+        progress_callback=lambda progress: context.update(progress=progress),
+        status_callback=lambda message: context.update(message=message),
+        checkpoint=context.checkpoint,
+        job_id=context.job_id,
+        retry_wait=context.sleep
+    )
+    pipeline.results["upload_count"] = params.get("upload_count", 0)
+    return pipeline.run_processing_steps()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+知识库同步清单
+按 (知识库ID, 本地文件路径) 记录已上传文档的 doc_id、内容哈希、文件大小和修改时间，
+同步时据此只新增新文件、更新已变化的文件、删除本地已移除的文件，跳过未变化的文件
+"""
+
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import JOBS_CONFIG
+from .file_state import file_content_hash
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS kb_manifest (
+    knowledge_base_id TEXT NOT NULL,
+    path TEXT NOT NULL,
+    name TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    synced_at REAL NOT NULL,
+    PRIMARY KEY (knowledge_base_id, path)
+);
+"""
+
+_UPSERT = (
+    "INSERT OR REPLACE INTO kb_manifest (knowledge_base_id, path, name, doc_id, content_hash, size, mtime_ns, "
+    "synced_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+def _kb_key(knowledge_base_id: Optional[str]) -> str:
+    # 未指定知识库ID时上传到API Key对应的默认知识库
+    return knowledge_base_id or ""
+
+
+def _file_key(path) -> str:
+    return str(Path(path).resolve())
+
+
+class KBManifest:
+    def __init__(self, db_path: str = None):
+        """
+        初始化知识库同步清单（与任务表共用数据库文件）
+
+        Args:
+            db_path: SQLite数据库路径，默认读取配置
+        """
+        self.db_path = Path(db_path or JOBS_CONFIG["db_path"])
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def entries(self, knowledge_base_id: Optional[str]) -> Dict[str, Dict]:
+        """获取某知识库的全部清单记录，返回 文件路径键 -> 记录"""
+        with self._lock, closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT * FROM kb_manifest WHERE knowledge_base_id = ?", (_kb_key(knowledge_base_id),)
+            ).fetchall()
+        return {row["path"]: dict(row) for row in rows}
+
+    def record(self, knowledge_base_id: Optional[str], path, doc_id: str, content_hash: str = None):
+        """
+        记录文件已同步到知识库
+
+        Args:
+            knowledge_base_id: 知识库ID
+            path: 本地文件路径
+            doc_id: 知识库文档ID
+            content_hash: 上传时的内容哈希，为None时重新计算
+        """
+        path = Path(path)
+        stat = path.stat()
+        content_hash = content_hash or file_content_hash(path)
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.execute(_UPSERT, (_kb_key(knowledge_base_id), _file_key(path), path.name, doc_id, content_hash,
+                                   stat.st_size, stat.st_mtime_ns, time.time()))
+
+    def touch(self, knowledge_base_id: Optional[str], entries: List[Tuple[str, int, int]]):
+        """
+        内容未变化但修改时间变化的文件：更新记录的大小和修改时间，下次同步无需重新计算哈希
+
+        Args:
+            knowledge_base_id: 知识库ID
+            entries: (文件路径键, 文件大小, 修改时间ns) 列表
+        """
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "UPDATE kb_manifest SET size = ?, mtime_ns = ? WHERE knowledge_base_id = ? AND path = ?",
+                [(size, mtime_ns, _kb_key(knowledge_base_id), key) for key, size, mtime_ns in entries]
+            )
+
+    def remove(self, knowledge_base_id: Optional[str], paths: Iterable):
+        """删除清单记录"""
+        keys = [_file_key(path) for path in paths]
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "DELETE FROM kb_manifest WHERE knowledge_base_id = ? AND path = ?",
+                [(_kb_key(knowledge_base_id), key) for key in keys]
+            )
+
+    def count(self, knowledge_base_id: Optional[str]) -> int:
+        """某知识库已同步的文件数"""
+        with self._lock, closing(self._connect()) as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM kb_manifest WHERE knowledge_base_id = ?", (_kb_key(knowledge_base_id),)
+            ).fetchone()[0]
+
+
+_kb_manifest: Optional[KBManifest] = None
+_kb_manifest_lock = threading.Lock()
+
+
+def get_kb_manifest() -> KBManifest:
+    """获取进程内共享的知识库同步清单"""
+    global _kb_manifest
+    with _kb_manifest_lock:
+        if _kb_manifest is None:
+            _kb_manifest = KBManifest()
+        return _kb_manifest
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+知识库文档本地镜像
+将知识库的完整文档列表保存到本地SQLite，知识库页面可直接浏览、筛选和搜索全部文档，无需逐页调用接口。
+文档列表接口不提供变更查询，刷新时重新遍历全部页面（并发预取），只写入新增和更新时间变化的文档，
+并删除知识库中已不存在的文档
+"""
+
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from config import JOBS_CONFIG, KB_MIRROR_CONFIG
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS kb_documents (
+    knowledge_base_id TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    name TEXT,
+    format TEXT,
+    source_url TEXT,
+    status TEXT,
+    chunk INTEGER,
+    token INTEGER,
+    char_count INTEGER,
+    create_time INTEGER,
+    update_time INTEGER,
+    PRIMARY KEY (knowledge_base_id, doc_id)
+);
+CREATE INDEX IF NOT EXISTS idx_kb_documents_name ON kb_documents (knowledge_base_id, name);
+CREATE TABLE IF NOT EXISTS kb_mirror_state (
+    knowledge_base_id TEXT PRIMARY KEY,
+    refreshed_at REAL NOT NULL,
+    total INTEGER NOT NULL
+);
+"""
+
+_FIELDS = ("name", "format", "source_url", "status", "chunk", "token", "char_count", "create_time", "update_time")
+
+_UPSERT = (
+    f"INSERT OR REPLACE INTO kb_documents (knowledge_base_id, doc_id, {', '.join(_FIELDS)}) "
+    f"VALUES ({', '.join('?' * (len(_FIELDS) + 2))})"
+)
+
+
+def _like_pattern(text: str) -> str:
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+class KBDocumentMirror:
+    def __init__(self, db_path: str = None):
+        """
+        初始化知识库文档镜像（与任务表共用数据库文件）
+
+        Args:
+            db_path: SQLite数据库路径，默认读取配置
+        """
+        self.db_path = Path(db_path or JOBS_CONFIG["db_path"])
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def refresh(self, knowledge_base_id: str, documents: Iterable[Dict],
+                checkpoint: Callable[[], None] = None) -> Dict:
+        """
+        用完整的文档列表增量刷新镜像
+
+        遍历中途失败时已写入的新增/更新保留，不删除任何文档（下次刷新时再比较）。
+
+        Args:
+            knowledge_base_id: 知识库ID
+            documents: 知识库全部文档（如 KnowledgeBaseAPI.iter_documents 的结果）
+            checkpoint: 每写入一批文档后调用，用于响应任务暂停/取消
+
+        Returns:
+            {"total", "added", "updated", "removed", "unchanged"}
+        """
+        with self._lock, closing(self._connect()) as conn:
+            existing = dict(conn.execute(
+                "SELECT doc_id, update_time FROM kb_documents WHERE knowledge_base_id = ?", (knowledge_base_id,)
+            ).fetchall())
+
+        stats = {"total": 0, "added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+        seen = set()
+        batch: List[Tuple] = []
+        batch_size = max(1, KB_MIRROR_CONFIG["write_batch_size"])
+
+        def flush():
+            if batch:
+                with self._lock, closing(self._connect()) as conn, conn:
+                    conn.executemany(_UPSERT, batch)
+                batch.clear()
+            if checkpoint:
+                checkpoint()
+
+        for doc in documents:
+            doc_id = doc.get("id")
+            if not doc_id or doc_id in seen:
+                continue
+            seen.add(doc_id)
+            stats["total"] += 1
+            if doc_id not in existing:
+                stats["added"] += 1
+            elif existing[doc_id] != doc.get("update_time"):
+                stats["updated"] += 1
+            else:
+                stats["unchanged"] += 1
+                continue
+            batch.append((knowledge_base_id, doc_id, *(doc.get(field) for field in _FIELDS)))
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+
+        removed = [(knowledge_base_id, doc_id) for doc_id in existing if doc_id not in seen]
+        stats["removed"] = len(removed)
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.executemany("DELETE FROM kb_documents WHERE knowledge_base_id = ? AND doc_id = ?", removed)
+            conn.execute(
+                "INSERT OR REPLACE INTO kb_mirror_state (knowledge_base_id, refreshed_at, total) VALUES (?, ?, ?)",
+                (knowledge_base_id, time.time(), stats["total"])
+            )
+        return stats
+
+    def state(self, knowledge_base_id: str) -> Optional[Dict]:
+        """上次刷新时间和文档数，从未刷新时返回None"""
+        with self._lock, closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM kb_mirror_state WHERE knowledge_base_id = ?",
+                               (knowledge_base_id,)).fetchone()
+        return dict(row) if row else None
+
+    def status_counts(self, knowledge_base_id: str) -> Dict[str, int]:
+        """按文档状态统计文档数"""
+        with self._lock, closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT status, COUNT(*) AS count FROM kb_documents WHERE knowledge_base_id = ? "
+                "GROUP BY status ORDER BY count DESC", (knowledge_base_id,)
+            ).fetchall()
+        return {row["status"] or "": row["count"] for row in rows}
+
+    def search(self, knowledge_base_id: str, query: str = None, status: str = None,
+               limit: int = None, offset: int = 0) -> Tuple[List[Dict], int]:
+        """
+        筛选和搜索镜像中的文档
+
+        Args:
+            knowledge_base_id: 知识库ID
+            query: 按文档名或文档ID包含的文字搜索（不区分大小写）
+            status: 只返回该状态的文档
+            limit: 最多返回的文档数，默认读取配置
+            offset: 跳过的文档数
+
+        Returns:
+            (按创建时间倒序的文档列表, 符合条件的文档总数)
+        """
+        where = "knowledge_base_id = ?"
+        args: List = [knowledge_base_id]
+        if query:
+            where += " AND (name LIKE ? ESCAPE '\\' OR doc_id LIKE ? ESCAPE '\\')"
+            args += [_like_pattern(query)] * 2
+        if status:
+            where += " AND status = ?"
+            args.append(status)
+
+        with self._lock, closing(self._connect()) as conn:
+            total = conn.execute(f"SELECT COUNT(*) FROM kb_documents WHERE {where}", args).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT * FROM kb_documents WHERE {where} ORDER BY create_time DESC, name LIMIT ? OFFSET ?",
+                (*args, limit or KB_MIRROR_CONFIG["display_limit"], offset)
+            ).fetchall()
+        return [dict(row) for row in rows], total
+
+
+_kb_mirror: Optional[KBDocumentMirror] = None
+_kb_mirror_lock = threading.Lock()
+
+
+def get_kb_mirror() -> KBDocumentMirror:
+    """获取进程内共享的知识库文档镜像"""
+    global _kb_mirror
+    with _kb_mirror_lock:
+        if _kb_mirror is None:
+            _kb_mirror = KBDocumentMirror()
+        return _kb_mirror
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+后台任务执行器
+在独立线程池中运行各处理阶段，与Streamlit脚本重跑解耦；
+任务通过 JobContext.checkpoint() 响应暂停/继续/取消
+"""
+
+import logging
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from config import JOBS_CONFIG, DEAD_LETTER_CONFIG, EMBEDDING_STATUS_CONFIG
+from ..utils import log_activity
+from .store import JobStore, QUEUED, RUNNING, PAUSED, SUCCEEDED, FAILED, CANCELLED, ACTIVE_STATUSES
+from .file_state import FileStateStore, FileTracker, get_file_state_store
+from .dead_letters import DeadLetterQueue, RetryScheduler, get_dead_letter_queue
+from .embedding_status import get_embedding_poller
+
+# 任务类型 -> 处理函数，处理函数签名为 handler(context, params) -> 结果字典
+_HANDLERS: Dict[str, Callable] = {}
+
+
+def register_job_handler(kind: str):
+    """注册任务处理函数的装饰器"""
+    def decorator(func: Callable) -> Callable:
+        _HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+class JobCancelled(BaseException):
+    """任务被取消（继承BaseException，避免被各处理阶段的 except Exception 捕获）"""
+
+
+class _JobControl:
+    def __init__(self):
+        """单个任务的控制信号（started/resumed 在执行器锁内读写）"""
+        self.running = threading.Event()
+        self.running.set()
+        self.cancelled = threading.Event()
+        # 任务是否已通过首个检查点开始执行
+        self.started = False
+        # 已继续但尚未由任务线程恢复为运行中状态
+        self.resumed = False
+
+
+class JobContext:
+    def __init__(self, runner: "JobRunner", job_id: str, control: _JobControl):
+        """
+        任务执行上下文，传递给任务处理函数
+
+        Args:
+            runner: 所属的任务执行器
+            job_id: 任务ID
+            control: 控制信号
+        """
+        self.runner = runner
+        self.job_id = job_id
+        self._control = control
+
+    @property
+    def cancelled(self) -> bool:
+        return self._control.cancelled.is_set()
+
+    def update(self, progress: int = None, message: str = None):
+        """
+        更新任务进度
+
+        Args:
+            progress: 进度百分比（0-100）
+            message: 状态信息
+        """
+        fields = {}
+        if progress is not None:
+            fields["progress"] = max(0, min(100, int(progress)))
+        if message is not None:
+            fields["message"] = message
+        self.runner.store.update(self.job_id, **fields)
+
+    def tracker(self, stage: str) -> FileTracker:
+        """获取本任务在某处理阶段的文件状态记录器"""
+        return FileTracker(self.runner.file_states, stage, self.job_id, self.runner.dead_letters)
+
+    def checkpoint(self):
+        """
+        检查控制信号：暂停时阻塞直到继续，取消时抛出 JobCancelled
+
+        处理函数应在每个文件/批次开始前调用，可在工作线程中调用。
+        """
+        while not self._control.running.wait(0.5):
+            if self._control.cancelled.is_set():
+                break
+        if self._control.cancelled.is_set():
+            raise JobCancelled()
+        if self._control.resumed:
+            self.runner._mark_resumed(self.job_id, self._control)
+
+    def sleep(self, seconds: float):
+        """
+        可响应控制信号的等待，用于重试退避：等待期间取消立即抛出 JobCancelled，暂停时等待结束后阻塞直到继续
+
+        Args:
+            seconds: 等待秒数
+        """
+        if self._control.cancelled.wait(max(0.0, seconds)):
+            raise JobCancelled()
+        self.checkpoint()
+
+
+class JobRunner:
+    def __init__(self, store: JobStore = None, max_workers: int = None, file_states: FileStateStore = None,
+                 dead_letters: DeadLetterQueue = None):
+        """
+        初始化任务执行器
+
+        上次进程退出时未结束的任务会被标记为已中断，处理中的文件恢复为待处理。
+
+        Args:
+            store: 任务表
+            max_workers: 同时运行的任务数
+            file_states: 文件处理状态表
+            dead_letters: 死信队列
+        """
+        self.store = store or JobStore()
+        self.file_states = file_states or get_file_state_store()
+        self.dead_letters = dead_letters or get_dead_letter_queue()
+        self.retry_scheduler = RetryScheduler(self, self.dead_letters)
+        self.embedding_poller = get_embedding_poller()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or JOBS_CONFIG["max_workers"],
+            thread_name_prefix="job"
+        )
+        self._controls: Dict[str, _JobControl] = {}
+        self._lock = threading.Lock()
+
+        interrupted = self.store.mark_interrupted()
+        if interrupted:
+            logging.warning(f"{interrupted} 个未完成的后台任务已标记为中断")
+        reset_files = self.file_states.reset_in_flight()
+        if reset_files:
+            logging.warning(f"{reset_files} 个处理中的文件已恢复为待处理")
+
+    def submit(self, kind: str, params: Dict, title: str = None) -> str:
+        """
+        提交后台任务
+
+        Args:
+            kind: 任务类型（需已注册处理函数）
+            params: 任务参数（需可JSON序列化）
+            title: 显示名称
+
+        Returns:
+            任务ID
+        """
+        if kind not in _HANDLERS:
+            raise ValueError(f"未知的任务类型: {kind}")
+
+        job = self.store.create(kind, params, title)
+        with self._lock:
+            self._controls[job["id"]] = _JobControl()
+        self._executor.submit(self._run, job["id"], kind, params)
+        log_activity(f"提交后台任务: {job['title']} ({job['id']})")
+        return job["id"]
+
+    def restart(self, job_id: str) -> Optional[str]:
+        """
+        续跑已中断/失败/取消的任务：以相同参数提交新任务，跳过上次已完成且内容未变化的文件
+
+        Returns:
+            新任务ID，原任务不存在或仍在进行中时返回None
+        """
+        job = self.store.get(job_id)
+        if job is None or is_active(job):
+            return None
+        params = dict(job["params"] or {}, resume=True)
+        title = job["title"] if job["title"].endswith("（续跑）") else f"{job['title']}（续跑）"
+        return self.submit(job["kind"], params, title)
+
+    def _run(self, job_id: str, kind: str, params: Dict):
+        control = self._controls[job_id]
+        context = JobContext(self, job_id, control)
+        try:
+            context.checkpoint()
+            with self._lock:
+                if control.cancelled.is_set():
+                    raise JobCancelled()
+                control.started = True
+                control.resumed = False
+                # 通过检查点后立即被暂停的任务保持暂停状态，由下一个检查点恢复
+                if control.running.is_set():
+                    self.store.update(job_id, status=RUNNING, started_at=time.time(), message="开始执行")
+                else:
+                    self.store.update(job_id, started_at=time.time())
+            result = _HANDLERS[kind](context, params)
+            self._finish(job_id, status=SUCCEEDED, progress=100, result=result, message="任务完成")
+            log_activity(f"后台任务完成: {job_id}")
+        except JobCancelled:
+            self._finish(job_id, status=CANCELLED, message="任务已取消")
+            log_activity(f"后台任务已取消: {job_id}")
+        except Exception as e:
+            logging.error(f"后台任务 {job_id} 失败: {traceback.format_exc()}")
+            self._finish(job_id, status=FAILED, error=str(e), message=f"任务失败: {e}")
+            log_activity(f"后台任务失败: {job_id} - {e}")
+        finally:
+            with self._lock:
+                self._controls.pop(job_id, None)
+
+    def _finish(self, job_id: str, **fields):
+        """写入最终状态并移除控制信号，之后的暂停/继续/取消不会再改写任务状态"""
+        with self._lock:
+            self.store.update(job_id, finished_at=time.time(), **fields)
+            self._controls.pop(job_id, None)
+
+    def _mark_resumed(self, job_id: str, control: _JobControl):
+        """继续后由任务线程在检查点处将状态恢复为运行中（期间再次暂停或取消时不改写）"""
+        with self._lock:
+            if not control.resumed or not control.running.is_set() or control.cancelled.is_set():
+                return
+            control.resumed = False
+            job = self.store.get(job_id)
+            if job and job["status"] == PAUSED:
+                self.store.update(job_id, status=RUNNING, message="继续执行")
+
+    def pause(self, job_id: str) -> bool:
+        """
+        暂停任务：立即标记为已暂停，各工作线程在下一个检查点（文件/批次开始前或重试退避期间）停下，
+        已发出的请求完成后不再发起新的请求
+
+        Returns:
+            任务是否处于可暂停状态
+        """
+        with self._lock:
+            control = self._controls.get(job_id)
+            if control is None or control.cancelled.is_set():
+                return False
+            control.running.clear()
+            control.resumed = False
+            self.store.update(job_id, status=PAUSED, message="已暂停")
+            return True
+
+    def resume(self, job_id: str) -> bool:
+        """
+        继续已暂停的任务：尚未开始执行的任务恢复为排队中，已开始的任务由任务线程在检查点处恢复为运行中
+
+        Returns:
+            任务是否处于可继续状态
+        """
+        with self._lock:
+            control = self._controls.get(job_id)
+            if control is None or control.cancelled.is_set():
+                return False
+            if control.started:
+                control.resumed = True
+                self.store.update(job_id, message="正在继续...")
+            else:
+                self.store.update(job_id, status=QUEUED, message="等待执行")
+            control.running.set()
+            return True
+
+    def cancel(self, job_id: str) -> bool:
+        """取消任务：尚未开始执行的任务立即标记为已取消，运行中的任务在下一个检查点或重试退避期间停止"""
+        with self._lock:
+            control = self._controls.get(job_id)
+            if control is None:
+                return False
+            control.cancelled.set()
+            control.running.set()
+            if control.started:
+                self.store.update(job_id, message="正在取消...")
+            else:
+                self.store.update(job_id, status=CANCELLED, message="任务已取消", finished_at=time.time())
+            return True
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """获取任务信息"""
+        return self.store.get(job_id)
+
+    def list_jobs(self, kind: str = None, limit: int = None) -> List[Dict]:
+        """按创建时间倒序列出任务"""
+        return self.store.list_jobs(kind=kind, limit=limit)
+
+    def active_jobs(self, kind: str = None) -> List[Dict]:
+        """列出排队中/运行中/已暂停的任务"""
+        return self.store.list_jobs(kind=kind, active_only=True)
+
+    def latest(self, kind: str) -> Optional[Dict]:
+        """获取某类型最近提交的任务"""
+        jobs = self.store.list_jobs(kind=kind, limit=1)
+        return jobs[0] if jobs else None
+
+
+_runner: Optional[JobRunner] = None
+_runner_lock = threading.Lock()
+
+
+def get_job_runner() -> JobRunner:
+    """获取进程内共享的任务执行器"""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            # 导入时注册各处理阶段的任务处理函数
+            from . import handlers  # noqa: F401
+            _runner = JobRunner()
+            if DEAD_LETTER_CONFIG["auto_retry"]:
+                _runner.retry_scheduler.start()
+            if EMBEDDING_STATUS_CONFIG["enabled"]:
+                _runner.embedding_poller.resume()
+        return _runner
+
+
+def is_active(job: Optional[Dict]) -> bool:
+    """任务是否仍在排队/运行/暂停中"""
+    return bool(job) and job["status"] in ACTIVE_STATUSES
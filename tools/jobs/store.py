@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+后台任务表
+使用SQLite持久化任务的状态、进度和结果，页面刷新或浏览器会话结束后仍可查询
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from config import JOBS_CONFIG
+
+# 任务状态
+QUEUED = "queued"
+RUNNING = "running"
+PAUSED = "paused"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+INTERRUPTED = "interrupted"
+
+ACTIVE_STATUSES = (QUEUED, RUNNING, PAUSED)
+
+STATUS_LABELS = {
+    QUEUED: "排队中",
+    RUNNING: "运行中",
+    PAUSED: "已暂停",
+    SUCCEEDED: "已完成",
+    FAILED: "失败",
+    CANCELLED: "已取消",
+    INTERRUPTED: "已中断"
+}
+
+_JSON_FIELDS = ("params", "result")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    title TEXT,
+    status TEXT NOT NULL,
+    progress INTEGER NOT NULL DEFAULT 0,
+    message TEXT,
+    params TEXT,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_kind_created ON jobs (kind, created_at);
+"""
+
+
+class JobStore:
+    def __init__(self, db_path: str = None):
+        """
+        初始化任务表
+
+        Args:
+            db_path: SQLite数据库路径，默认读取配置
+        """
+        self.db_path = Path(db_path or JOBS_CONFIG["db_path"])
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict:
+        job = dict(row)
+        for field in _JSON_FIELDS:
+            job[field] = json.loads(job[field]) if job[field] else None
+        job["status_label"] = STATUS_LABELS.get(job["status"], job["status"])
+        return job
+
+    def create(self, kind: str, params: Dict, title: str = None) -> Dict:
+        """
+        创建排队中的任务
+
+        Args:
+            kind: 任务类型
+            params: 任务参数（需可JSON序列化）
+            title: 显示名称
+
+        Returns:
+            任务信息字典
+        """
+        job_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, title, status, progress, message, params, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, 0, ?, ?, ?, ?)",
+                (job_id, kind, title or kind, QUEUED, "等待执行", json.dumps(params, ensure_ascii=False), now, now)
+            )
+        return self.get(job_id)
+
+    def update(self, job_id: str, **fields):
+        """
+        更新任务字段
+
+        Args:
+            job_id: 任务ID
+            **fields: 要更新的字段，params/result 会自动序列化
+        """
+        if not fields:
+            return
+        for field in _JSON_FIELDS:
+            if field in fields and fields[field] is not None:
+                fields[field] = json.dumps(fields[field], ensure_ascii=False)
+        fields["updated_at"] = time.time()
+
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """获取单个任务，不存在时返回None"""
+        with self._lock, closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list_jobs(self, kind: str = None, limit: int = None, active_only: bool = False) -> List[Dict]:
+        """
+        按创建时间倒序列出任务
+
+        Args:
+            kind: 只列出该类型的任务
+            limit: 最大条数
+            active_only: 只列出排队中/运行中/已暂停的任务
+
+        Returns:
+            任务信息列表
+        """
+        conditions = []
+        values = []
+        if kind:
+            conditions.append("kind = ?")
+            values.append(kind)
+        if active_only:
+            conditions.append(f"status IN ({', '.join('?' for _ in ACTIVE_STATUSES)})")
+            values.extend(ACTIVE_STATUSES)
+
+        sql = "SELECT * FROM jobs"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY created_at DESC"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+
+        with self._lock, closing(self._connect()) as conn:
+            rows = conn.execute(sql, values).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def mark_interrupted(self) -> int:
+        """
+        将上次进程退出时仍未结束的任务标记为已中断
+
+        Returns:
+            标记的任务数
+        """
+        now = time.time()
+        with self._lock, closing(self._connect()) as conn, conn:
+            cursor = conn.execute(
+                f"UPDATE jobs SET status = ?, message = ?, finished_at = ?, updated_at = ? "
+                f"WHERE status IN ({', '.join('?' for _ in ACTIVE_STATUSES)})",
+                (INTERRUPTED, "应用重启，任务已中断", now, now, *ACTIVE_STATUSES)
+            )
+            return cursor.rowcount
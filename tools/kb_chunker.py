@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+知识库本地分块上传
+在本地按Markdown标题和Token数切分文档，每个知识块附带邮件主题/发件人/时间和章节标题作为上下文；
+按知识块内容哈希跳过已上传到同一知识库的知识块（如邮件往来中反复引用的历史邮件），
+只为仍有新知识块的文件创建文档，并通过添加知识块接口并行上传；
+持有共享知识块的文档被删除时，将知识块重新上传到仍引用它的文件的文档中
+"""
+
+import hashlib
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import KB_CHUNKING_CONFIG
+from .llm_engine import estimate_tokens, split_into_chunks
+from .jobs.chunk_index import ChunkIndex, get_chunk_index
+
+_HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+# 邮件信息行，如 "- **发件人**: sender@example.com"
+_META_LINE = re.compile(r"^\s*[-*]\s*\*\*(.+?)\*\*\s*[:：]\s*(.*?)\s*$")
+# 每次处理都会变化的页脚（处理时间、节点、API Key），不计入知识块
+_FOOTER_LINE = re.compile(r"^\*(LLM处理时间|处理时间|使用节点|API Key)[:：]")
+# 引用的历史邮件起始行，从此处开始新的知识块，使同一段历史邮件在不同邮件中切出相同的知识块
+_QUOTE_START = re.compile(
+    r"^\s*(-{2,}\s*(Original Message|原始邮件|Forwarded message|转发邮件)|On\s.+\swrote:$|在.+写道[:：]$|"
+    r"(From|发件人)\s*[:：])",
+    re.IGNORECASE
+)
+# 作为上下文附加到每个知识块的邮件信息字段
+_CONTEXT_FIELDS = ("主题", "发件人", "时间")
+# 创建文档时使用的分隔符：正文中不会出现，服务端将首个知识块整体保存为一个知识块
+_NO_SPLIT = "␞"
+
+
+def _chunk_hash(body: str) -> str:
+    return hashlib.sha256(" ".join(body.split()).encode("utf-8")).hexdigest()
+
+
+def parse_email_metadata(text: str) -> Dict[str, str]:
+    """
+    解析数据清洗生成的邮件信息（"- **字段**: 值" 形式的列表项）
+
+    Args:
+        text: 邮件Markdown内容
+
+    Returns:
+        字段名 -> 值，同名字段只保留第一次出现的值
+    """
+    metadata = {}
+    for line in text.splitlines():
+        match = _META_LINE.match(line)
+        if match:
+            metadata.setdefault(match.group(1).strip(), match.group(2).strip("` "))
+    return metadata
+
+
+def _split_sections(text: str) -> List[Tuple[Tuple[str, ...], str]]:
+    """按标题切分为 (标题路径, 正文) 列表，代码块中的 # 行不视为标题"""
+    sections = []
+    path: List[Tuple[int, str]] = []
+    lines: List[str] = []
+    in_code = False
+
+    def flush():
+        body = "\n".join(lines).strip()
+        if body:
+            sections.append((tuple(title for _, title in path), body))
+        lines.clear()
+
+    for line in text.splitlines():
+        if line.lstrip().startswith("```"):
+            in_code = not in_code
+        match = None if in_code else _HEADING.match(line)
+        if match:
+            flush()
+            level = len(match.group(1))
+            while path and path[-1][0] >= level:
+                path.pop()
+            path.append((level, match.group(2)))
+        elif not _FOOTER_LINE.match(line.strip()):
+            lines.append(line)
+    flush()
+    return sections
+
+
+def _split_quotes(body: str) -> List[str]:
+    """在引用的历史邮件起始行处切分正文（连续的起始行，如分隔线后紧跟的发件人行，只切分一次）"""
+    segments = []
+    current: List[str] = []
+    header_only = False
+    for line in body.splitlines():
+        is_start = bool(_QUOTE_START.match(line))
+        if is_start and current and not header_only:
+            segments.append("\n".join(current))
+            current = []
+            header_only = True
+        elif line.strip() and not is_start:
+            header_only = False
+        current.append(line)
+    if current:
+        segments.append("\n".join(current))
+    return segments
+
+
+def chunk_markdown(text: str, chunk_token: int = 600) -> List[Dict]:
+    """
+    将Markdown文档切分为知识块
+
+    按标题切分章节，章节内在引用的历史邮件处断开，再按段落合并为不超过 chunk_token 的知识块；
+    每个知识块以邮件信息（主题/发件人/时间）和章节标题路径开头，哈希只按正文计算（忽略空白差异），
+    因此不同邮件中相同的引用内容得到相同的哈希。
+
+    Args:
+        text: Markdown内容
+        chunk_token: 单个知识块的Token上限（含上下文）
+
+    Returns:
+        [{"content": 知识块内容, "hash": 正文哈希, "tokens": 估算Token数}]
+    """
+    metadata = parse_email_metadata(text)
+    context = " | ".join(f"{field}: {metadata[field]}" for field in _CONTEXT_FIELDS if metadata.get(field))
+
+    chunks = []
+    for path, body in _split_sections(text):
+        prefix = "\n".join(part for part in (context, " > ".join(path)) if part)
+        prefix = f"{prefix}\n\n" if prefix else ""
+        # 上下文过长时至少为正文保留一半的Token数
+        budget = max(chunk_token // 2, chunk_token - estimate_tokens(prefix))
+        for segment in _split_quotes(body):
+            for piece in split_into_chunks(segment, budget):
+                if not piece.strip("-*_ \n"):
+                    continue
+                content = prefix + piece
+                chunks.append({"content": content, "hash": _chunk_hash(piece), "tokens": estimate_tokens(content)})
+    return chunks
+
+
+class _ChunkClaim:
+    """本次上传中某个文件认领的新知识块：认领的文件上传结束后确认是否上传成功"""
+
+    def __init__(self):
+        self.settled = threading.Event()
+        self.uploaded = False
+
+    def settle(self, uploaded: bool):
+        self.uploaded = uploaded
+        self.settled.set()
+
+
+def _send_chunks(client, index: ChunkIndex, knowledge_base_id: Optional[str], filename: str,
+                 doc_id: Optional[str], chunks: List[Dict], per_request: int) -> Dict:
+    """
+    上传知识块：没有文档时以第一个知识块创建文档，其余知识块分批添加到文档，每批成功后记入索引
+
+    Returns:
+        {"doc_id": 文档ID, "uploaded": 已上传的知识块数（按顺序）, "batches": 请求次数, "error": 失败原因或None}
+    """
+    outcome = {"doc_id": doc_id, "uploaded": 0, "batches": 0, "error": None}
+    start = 0
+    if not doc_id:
+        created = client.upload_markdown_content(chunks[0]["content"], filename=filename,
+                                                 knowledge_base_id=knowledge_base_id, splitter=_NO_SPLIT)
+        outcome["batches"] += 1
+        outcome["doc_id"] = created.get("doc_id") if "error" not in created else None
+        if not outcome["doc_id"]:
+            outcome["error"] = created.get("error") or "未返回文档ID"
+            return outcome
+        index.record(knowledge_base_id, outcome["doc_id"], [chunks[0]["hash"]])
+        outcome["uploaded"] = start = 1
+
+    for i in range(start, len(chunks), per_request):
+        batch = chunks[i:i + per_request]
+        response = client.add_document_chunks(outcome["doc_id"], [{"content": chunk["content"]} for chunk in batch])
+        outcome["batches"] += 1
+        if not response or "error" in response:
+            outcome["error"] = f"添加知识块失败: {response.get('message', '未知错误') if response else 'API调用失败'}"
+            return outcome
+        index.record(knowledge_base_id, outcome["doc_id"], [chunk["hash"] for chunk in batch])
+        outcome["uploaded"] += len(batch)
+    return outcome
+
+
+def upload_chunked_files(client, files: List[Path], knowledge_base_id: Optional[str], chunk_token: int = 600,
+                         index: ChunkIndex = None,
+                         progress_callback: Callable[[int, int], None] = None,
+                         file_callback: Callable[[str, str, str], None] = None,
+                         max_parallel: int = None) -> Dict:
+    """
+    本地分块后上传文件，跳过已上传到该知识库的重复知识块
+
+    每个文件以第一个新知识块创建文档，其余新知识块按 chunks_per_request 分批添加到该文档；
+    同时处理的文件之间也不会重复上传相同的知识块：知识块由先处理的文件认领上传，其他文件等待认领的
+    知识块确认上传成功后才记为完成并记录引用，认领的文件上传失败时由等待的文件重新认领并上传到自己的文档。
+    全部知识块都已存在的文件不创建文档。
+    部分知识块添加失败时，已添加的知识块仍记入索引，文件记为失败，重试时只上传剩余的知识块。
+
+    Args:
+        client: KnowledgeBaseAPI客户端
+        files: 待上传的Markdown文件
+        knowledge_base_id: 知识库ID
+        chunk_token: 单个知识块的Token上限
+        index: 知识块哈希索引
+        progress_callback: 进度回调，参数为 (已完成文件数, 文件总数)，在调用线程中每完成一个文件调用一次
+        file_callback: 文件状态回调，参数为 (文件名, 状态: in_flight/done/failed, 文档ID或失败原因)，
+                       全部知识块重复的文件以空文档ID记为 done
+        max_parallel: 同时上传的文件数，默认读取配置
+
+    Returns:
+        与目录批量上传相同格式的结果，另含 duplicate_files 列表和
+        chunks_total/chunks_uploaded/chunks_skipped/tokens_skipped 统计
+    """
+    index = index or get_chunk_index()
+    max_parallel = max(1, int(max_parallel or KB_CHUNKING_CONFIG["max_parallel"]))
+    per_request = max(1, KB_CHUNKING_CONFIG["chunks_per_request"])
+    results = {
+        "total_files": len(files),
+        "successful_uploads": 0,
+        "failed_uploads": 0,
+        "uploaded_files": [],
+        "failed_files": [],
+        "duplicate_files": [],
+        "batches_processed": 0,
+        "chunks_total": 0,
+        "chunks_uploaded": 0,
+        "chunks_skipped": 0,
+        "tokens_skipped": 0
+    }
+    # 本次上传中已被某个文件认领的知识块，避免同时处理的文件重复上传
+    claims: Dict[str, _ChunkClaim] = {}
+    lock = threading.Lock()
+
+    def report(path: Path, status: str, detail: str):
+        if file_callback:
+            file_callback(path.name, status, detail)
+
+    def claim_pending(borrowed: Dict[str, Tuple[Dict, _ChunkClaim]],
+                      mine: Dict[str, _ChunkClaim]) -> Tuple[List[Dict], List[Dict]]:
+        """
+        等待其他文件认领的知识块确认结果
+
+        Returns:
+            (已由其他文件上传成功的知识块, 上传失败、改由本文件认领重新上传的知识块)
+        """
+        confirmed, requeued = [], []
+        for chunk_hash, (chunk, claim) in list(borrowed.items()):
+            claim.settled.wait()
+            if claim.uploaded:
+                del borrowed[chunk_hash]
+                confirmed.append(chunk)
+                continue
+            with lock:
+                current = claims.get(chunk_hash)
+                if current is claim:
+                    claims[chunk_hash] = mine[chunk_hash] = _ChunkClaim()
+                    del borrowed[chunk_hash]
+                    requeued.append(chunk)
+                else:
+                    # 已被其他等待的文件重新认领，继续等待新的认领结果
+                    borrowed[chunk_hash] = (chunk, current)
+        return confirmed, requeued
+
+    def upload_file(path: Path) -> Tuple[str, Dict]:
+        report(path, "in_flight", "")
+        chunks = chunk_markdown(path.read_text(encoding="utf-8"), chunk_token)
+        known = index.known(knowledge_base_id, (chunk["hash"] for chunk in chunks))
+        new_chunks, skipped = [], []
+        mine: Dict[str, _ChunkClaim] = {}
+        borrowed: Dict[str, Tuple[Dict, _ChunkClaim]] = {}
+        with lock:
+            for chunk in chunks:
+                if chunk["hash"] in known or chunk["hash"] in mine or chunk["hash"] in borrowed:
+                    skipped.append(chunk)
+                elif chunk["hash"] in claims:
+                    borrowed[chunk["hash"]] = (chunk, claims[chunk["hash"]])
+                else:
+                    claims[chunk["hash"]] = mine[chunk["hash"]] = _ChunkClaim()
+                    new_chunks.append(chunk)
+        stats = {"chunks_total": len(chunks), "chunks_uploaded": 0, "chunks_skipped": len(skipped),
+                 "tokens_skipped": sum(chunk["tokens"] for chunk in skipped), "batches_processed": 0}
+
+        doc_id = None
+        try:
+            while new_chunks or borrowed:
+                if new_chunks:
+                    sent = _send_chunks(client, index, knowledge_base_id, path.name, doc_id, new_chunks,
+                                        per_request)
+                    for position, chunk in enumerate(new_chunks):
+                        mine[chunk["hash"]].settle(position < sent["uploaded"])
+                    doc_id = sent["doc_id"]
+                    stats["batches_processed"] += sent["batches"]
+                    stats["chunks_uploaded"] += sent["uploaded"]
+                    if sent["error"]:
+                        report(path, "failed", sent["error"])
+                        failed = {**stats, "error": sent["error"]}
+                        if doc_id:
+                            failed["doc_id"] = doc_id
+                        return "failed", failed
+
+                # 其他文件认领的知识块确认上传成功后本文件才算完成
+                confirmed, new_chunks = claim_pending(borrowed, mine)
+                stats["chunks_skipped"] += len(confirmed)
+                stats["tokens_skipped"] += sum(chunk["tokens"] for chunk in confirmed)
+        finally:
+            # 异常退出时认领的知识块视为未上传，等待的文件会重新认领
+            for claim in mine.values():
+                if not claim.settled.is_set():
+                    claim.settle(False)
+
+        index.add_references(knowledge_base_id, path, doc_id or "", (chunk["hash"] for chunk in chunks))
+        report(path, "done", doc_id or "")
+        if not doc_id:
+            return "duplicate", stats
+        return "done", {**stats, "doc_id": doc_id}
+
+    executor = ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix="kb-chunk-upload")
+    try:
+        futures = {executor.submit(upload_file, path): path for path in files}
+        for done, future in enumerate(as_completed(futures), 1):
+            path = futures[future]
+            try:
+                outcome, stats = future.result()
+            except (OSError, UnicodeDecodeError) as e:
+                outcome, stats = "failed", {"error": f"读取文件失败: {e}"}
+                report(path, "failed", stats["error"])
+            for key in ("chunks_total", "chunks_uploaded", "chunks_skipped", "tokens_skipped", "batches_processed"):
+                results[key] += stats.get(key, 0)
+            if outcome == "done":
+                results["successful_uploads"] += 1
+                results["uploaded_files"].append({"doc_id": stats["doc_id"], "doc_name": path.name})
+            elif outcome == "duplicate":
+                results["successful_uploads"] += 1
+                results["duplicate_files"].append(path.name)
+            else:
+                results["failed_uploads"] += 1
+                results["failed_files"].append({"file_name": path.name, "error": stats["error"]})
+            if progress_callback:
+                progress_callback(done, len(files))
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    logging.info(f"本地分块上传完成: {results['successful_uploads']}/{len(files)} 个文件, "
+                 f"上传 {results['chunks_uploaded']} 个知识块, 跳过重复 {results['chunks_skipped']} 个")
+    return results
+
+
+def reupload_shared_chunks(client, knowledge_base_id: Optional[str], survivors: Dict[str, Dict],
+                           chunk_token: int = 600, index: ChunkIndex = None) -> Dict:
+    """
+    将被删除文档持有、但仍被其他文件引用的知识块重新上传到这些文件的文档中
+
+    文件尚无文档（其知识块全部与其他文件重复）时以第一个知识块为其创建文档。
+    文件已不存在或重新分块后找不到对应知识块时跳过，这些知识块在下次上传该文件时作为新知识块上传。
+
+    Args:
+        client: KnowledgeBaseAPI客户端
+        knowledge_base_id: 知识库ID
+        survivors: ChunkIndex.remove_documents 的返回值
+        chunk_token: 单个知识块的Token上限（需与原先上传时一致）
+        index: 知识块哈希索引
+
+    Returns:
+        {"chunks_reuploaded": 重新上传的知识块数, "failed_files": [{"file_name", "error"}]}
+    """
+    index = index or get_chunk_index()
+    per_request = max(1, KB_CHUNKING_CONFIG["chunks_per_request"])
+    results = {"chunks_reuploaded": 0, "failed_files": []}
+
+    for file_key, survivor in survivors.items():
+        path = Path(file_key)
+        try:
+            chunks = chunk_markdown(path.read_text(encoding="utf-8"), chunk_token)
+        except (OSError, UnicodeDecodeError) as e:
+            logging.warning(f"无法重新上传共享知识块，读取文件失败 {path.name}: {e}")
+            results["failed_files"].append({"file_name": path.name, "error": f"读取文件失败: {e}"})
+            continue
+
+        pending = {}
+        for chunk in chunks:
+            if chunk["hash"] in survivor["hashes"]:
+                pending.setdefault(chunk["hash"], chunk)
+        if not pending:
+            continue
+
+        sent = _send_chunks(client, index, knowledge_base_id, path.name, survivor["doc_id"] or None,
+                            list(pending.values()), per_request)
+        results["chunks_reuploaded"] += sent["uploaded"]
+        if sent["doc_id"] and not survivor["doc_id"]:
+            index.set_reference_document(knowledge_base_id, path, sent["doc_id"])
+        if sent["error"]:
+            logging.error(f"重新上传共享知识块失败 {path.name}: {sent['error']}")
+            results["failed_files"].append({"file_name": path.name, "error": sent["error"]})
+
+    if survivors:
+        logging.info(f"已将 {results['chunks_reuploaded']} 个共享知识块重新上传到仍引用它们的文件")
+    return results
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+知识库增量同步
+根据知识库同步清单比较本地Markdown文件与已上传文档：新文件新增、已变化的文件原地更新、
+本地已删除的文件从知识库删除，未变化的文件跳过，避免重复上传产生重复文档和重复向量化；
+被删除或整体更新的文档持有其他文件共享的知识块时，将这些知识块重新上传到仍引用它们的文件的文档中
+"""
+
+import logging
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from .api_clients.knowledge_base_api import UPLOAD_REJECTED
+from .jobs.chunk_index import get_chunk_index
+from .jobs.file_state import file_content_hash
+from .jobs.kb_manifest import KBManifest, get_kb_manifest
+from .kb_chunker import reupload_shared_chunks
+
+# 单次删除请求的最大文档数
+_DELETE_BATCH_SIZE = 100
+
+
+def plan_kb_sync(directory: str, knowledge_base_id: Optional[str], files: List[Path] = None,
+                 manifest: KBManifest = None) -> Dict:
+    """
+    计算同步计划
+
+    文件大小和修改时间与清单一致时直接视为未变化，不计算哈希；修改时间变化但内容未变的文件只更新清单。
+
+    Args:
+        directory: 本地Markdown目录
+        knowledge_base_id: 知识库ID
+        files: 只同步这些文件（不删除其他文件对应的文档），默认同步目录下全部Markdown文件
+        manifest: 知识库同步清单
+
+    Returns:
+        {"new": [文件], "changed": [文件], "unchanged": [文件], "removed": [清单记录],
+         "doc_ids": 文件名 -> 文档ID（已变化的文件）, "hashes": 文件路径键 -> 内容哈希}
+    """
+    manifest = manifest or get_kb_manifest()
+    directory = Path(directory).resolve()
+    local_files = sorted(directory.glob("*.md")) if files is None else [Path(path) for path in files]
+    entries = manifest.entries(knowledge_base_id)
+
+    plan = {"new": [], "changed": [], "unchanged": [], "removed": [], "doc_ids": {}, "hashes": {}}
+    touched = []
+    local_keys = set()
+    for path in local_files:
+        key = str(path.resolve())
+        local_keys.add(key)
+        stat = path.stat()
+        entry = entries.get(key)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            plan["unchanged"].append(path)
+            continue
+
+        content_hash = file_content_hash(path)
+        plan["hashes"][key] = content_hash
+        if entry is None:
+            plan["new"].append(path)
+        elif entry["content_hash"] == content_hash:
+            plan["unchanged"].append(path)
+            touched.append((key, stat.st_size, stat.st_mtime_ns))
+        else:
+            plan["changed"].append(path)
+            plan["doc_ids"][path.name] = entry["doc_id"]
+
+    if touched:
+        manifest.touch(knowledge_base_id, touched)
+    if files is None:
+        plan["removed"] = [
+            entry for key, entry in entries.items()
+            if key not in local_keys and Path(key).parent == directory
+        ]
+    return plan
+
+
+def apply_kb_sync(client, plan: Dict, knowledge_base_id: Optional[str], chunk_token: int = 600,
+                  splitter: str = None, manifest: KBManifest = None,
+                  progress_callback: Callable[[int, int], None] = None,
+                  file_callback: Callable[[str, str, str], None] = None,
+                  concurrent_batches: int = None) -> Dict:
+    """
+    执行同步计划：删除已移除文件的文档，新增新文件，更新已变化的文件
+
+    Args:
+        client: KnowledgeBaseAPI客户端
+        plan: plan_kb_sync 返回的同步计划
+        knowledge_base_id: 知识库ID
+        chunk_token: 分块Token数
+        splitter: 分隔符
+        manifest: 知识库同步清单
+        progress_callback: 进度回调，参数为 (已提交文件数, 待新增和更新的文件总数)
+        file_callback: 文件状态回调，参数为 (文件名, 状态: in_flight/done/failed, 文档ID或失败原因)
+        concurrent_batches: 同时在途的上传批次数
+
+    Returns:
+        与目录批量上传相同格式的结果，另含 added/updated/deleted/unchanged/chunks_reuploaded 计数和
+        delete_failed/reupload_failed 列表
+    """
+    manifest = manifest or get_kb_manifest()
+    results = {
+        "total_files": len(plan["new"]) + len(plan["changed"]),
+        "successful_uploads": 0,
+        "failed_uploads": 0,
+        "uploaded_files": [],
+        "failed_files": [],
+        "batches_processed": 0,
+        "added": 0,
+        "updated": 0,
+        "deleted": 0,
+        "unchanged": len(plan["unchanged"]),
+        "chunks_reuploaded": 0,
+        "delete_failed": [],
+        "reupload_failed": []
+    }
+    # 被删除/整体更新的文档中仍被其他文件引用的知识块：文件路径 -> {"doc_id", "hashes"}
+    survivors: Dict[str, Dict] = {}
+    survivors_lock = threading.Lock()
+
+    def release_chunks(doc_ids: List[str], paths: List):
+        released = get_chunk_index().remove_documents(knowledge_base_id, doc_ids, paths)
+        with survivors_lock:
+            for path, survivor in released.items():
+                survivors.setdefault(path, {"doc_id": survivor["doc_id"], "hashes": set()})["hashes"] |= \
+                    survivor["hashes"]
+
+    # 删除本地已移除文件对应的文档
+    removed = plan["removed"]
+    for i in range(0, len(removed), _DELETE_BATCH_SIZE):
+        batch = removed[i:i + _DELETE_BATCH_SIZE]
+        response = client.delete_documents([entry["doc_id"] for entry in batch])
+        if response and "error" not in response:
+            manifest.remove(knowledge_base_id, [entry["path"] for entry in batch])
+            release_chunks([entry["doc_id"] for entry in batch], [entry["path"] for entry in batch])
+            results["deleted"] += len(batch)
+        else:
+            error = response.get("message", "未知错误") if response else "API调用失败"
+            logging.error(f"删除知识库文档失败: {error}")
+            results["delete_failed"].extend({"file_name": entry["name"], "error": error} for entry in batch)
+
+    offset = 0
+
+    def run_phase(files: List[Path], counter: str, update_doc_ids: Dict[str, str] = None):
+        nonlocal offset
+        if not files:
+            return
+        files_by_name = {path.name: path for path in files}
+        phase_offset = offset
+
+        def on_progress(done, total):
+            if progress_callback:
+                progress_callback(phase_offset + done, results["total_files"])
+
+        def on_file(filename, status, detail):
+            path = files_by_name.get(filename)
+            if path is not None and status == "done":
+                manifest.record(knowledge_base_id, path, detail, plan["hashes"].get(str(path.resolve())))
+                if update_doc_ids:
+                    # 整体更新后文档由服务端重新分块，原先本地分块上传的知识块不再存在
+                    release_chunks([detail], [path])
+            if file_callback:
+                file_callback(filename, status, detail)
+
+        phase_result = client.upload_markdown_files_from_directory(
+            directory_path=str(files[0].parent),
+            knowledge_base_id=knowledge_base_id,
+            chunk_token=chunk_token,
+            splitter=splitter,
+            progress_callback=on_progress,
+            files=files,
+            file_callback=on_file,
+            concurrent_batches=concurrent_batches,
+            update_doc_ids=update_doc_ids
+        )
+        if "error" in phase_result:
+            raise RuntimeError(phase_result["error"])
+        if update_doc_ids:
+            # 接口拒绝更新的文档在知识库中已不存在：移出清单，下次同步按新文件上传
+            missing = [files_by_name[failed["file_name"]] for failed in phase_result["failed_files"]
+                       if failed.get("reason") == UPLOAD_REJECTED and failed["file_name"] in files_by_name]
+            if missing:
+                manifest.remove(knowledge_base_id, missing)
+        for key in ("successful_uploads", "failed_uploads", "batches_processed"):
+            results[key] += phase_result[key]
+        results["uploaded_files"].extend(phase_result["uploaded_files"])
+        results["failed_files"].extend(phase_result["failed_files"])
+        results[counter] += phase_result["successful_uploads"]
+        offset += len(files)
+
+    run_phase(plan["new"], "added")
+    run_phase(plan["changed"], "updated", plan["doc_ids"])
+
+    if survivors:
+        reuploaded = reupload_shared_chunks(client, knowledge_base_id, survivors, chunk_token)
+        results["chunks_reuploaded"] = reuploaded["chunks_reuploaded"]
+        results["reupload_failed"] = reuploaded["failed_files"]
+
+    logging.info(f"知识库同步完成: 新增 {results['added']} 个, 更新 {results['updated']} 个, "
+                 f"删除 {results['deleted']} 个, 未变化 {results['unchanged']} 个")
+    return results
+
+
+def record_uploaded(knowledge_base_id: Optional[str], path, doc_id: str, manifest: KBManifest = None):
+    """
+    将非同步方式上传成功的文件记入同步清单，之后同步时不再重复新增
+
+    Args:
+        knowledge_base_id: 知识库ID
+        path: 本地文件路径
+        doc_id: 知识库文档ID
+        manifest: 知识库同步清单
+    """
+    if not doc_id:
+        return
+    try:
+        (manifest or get_kb_manifest()).record(knowledge_base_id, path, doc_id)
+    except OSError as e:
+        logging.warning(f"记录同步清单失败 {path}: {e}")
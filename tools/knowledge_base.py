@@ -5,10 +5,12 @@
 
 import streamlit as st
 import pandas as pd
-import json
-from pathlib import Path
 from datetime import datetime
+from pathlib import Path
 from .utils import count_files, log_activity
+from .jobs import is_active, get_kb_mirror
+from .job_panel import (get_current_job, submit_job, show_job_panel, show_dead_letter_panel,
+                        show_embedding_status, refresh_while_active)
 
 
 def show_knowledge_base_page():
@@ -113,12 +115,13 @@ def show_knowledge_base_page():
         # 分块方式选择
         chunk_method = st.radio(
             "分块方式",
-            ["按Token数分块", "按分隔符分块"],
-            help="选择文档分块方式",
+            ["按Token数分块", "按分隔符分块", "本地分块"],
+            help="选择文档分块方式；本地分块按标题和Token数在本地切分，附带邮件信息作为上下文，并跳过已上传过的重复知识块（如反复引用的历史邮件）",
             key="chunk_method"
         )
+        client_chunking = chunk_method == "本地分块"
         
-        if chunk_method == "按Token数分块":
+        if chunk_method != "按分隔符分块":
             chunk_token = st.number_input(
                 "分块Token数",
                 min_value=1,
@@ -153,6 +156,14 @@ def show_knowledge_base_page():
             key="upload_all"
         )
         
+        sync_mode = st.checkbox(
+            "增量同步",
+            value=True,
+            help="按同步清单只新增新文件、更新内容已变化的文件，跳过未变化的文件；上传所有文件时同时删除本地已删除文件对应的知识库文档",
+            key="kb_sync_mode",
+            disabled=client_chunking
+        )
+        
         if not upload_all_files:
             # 文件选择器
             final_dir = Path(CONFIG["final_dir"])
@@ -200,6 +211,17 @@ def show_knowledge_base_page():
                 help="API调用失败时的重试次数",
                 key="max_retries"
             )
+            
+            # 并发上传选项
+            from config import KB_UPLOAD_CONFIG
+            concurrent_batches = st.slider(
+                "并发上传批次数",
+                min_value=1,
+                max_value=8,
+                value=KB_UPLOAD_CONFIG["concurrent_batches"],
+                help="上传整个目录时同时在途的批次数，上一批上传期间预先读取编码下一批；请求发起速率仍受限流配置约束",
+                key="kb_concurrent_batches"
+            )
     
     # 开始上传按钮
     st.markdown("---")
@@ -212,8 +234,9 @@ def show_knowledge_base_page():
         selected_count = len(selected_files) if 'selected_files' in locals() else 0
         st.info(f"📊 将上传 {selected_count} 个选中的文件到知识库")
     
-    # 上传按钮
-    if st.button("🚀 开始上传到知识库", type="primary", key="start_kb_upload"):
+    # 上传按钮（上传在后台任务中执行，页面只轮询任务状态）
+    current_job = get_current_job("kb_upload", "kb_upload")
+    if st.button("🚀 开始上传到知识库", type="primary", key="start_kb_upload", disabled=is_active(current_job)):
         # 准备上传参数
         upload_params = {
             "api_key": api_key,
@@ -224,12 +247,27 @@ def show_knowledge_base_page():
             "continue_on_error": continue_on_error,
             "max_retries": max_retries,
             "create_backup": create_backup,
+            "concurrent_batches": concurrent_batches,
+            "sync": sync_mode,
+            "client_chunking": client_chunking,
             "selected_files": selected_files if not upload_all_files and 'selected_files' in locals() else None
         }
         
         # 开始上传
         start_knowledge_base_upload(CONFIG, **upload_params)
     
+    job_active = show_job_panel("kb_upload", "kb_upload", render_result=show_upload_result)
+    show_dead_letter_panel("kb_upload", "kb_upload")
+    
+    # 知识库文档浏览
+    st.markdown("---")
+    mirror_active = show_document_browser(api_key, knowledge_base_id)
+    
+    # API调用指标
+    with st.expander("📊 API调用指标（延迟分位数/重试/流量）"):
+        from .api_metrics_panel import show_api_metrics_panel
+        show_api_metrics_panel(key_prefix="kb_api_metrics")
+    
     # 导航按钮
     st.markdown("---")
     col1, col2, col3 = st.columns([1, 2, 1])
@@ -241,6 +279,86 @@ def show_knowledge_base_page():
         if st.button("➡️ 下一步", help="前往问答系统", key="kb_next_btn"):
             st.session_state.current_step = "问答系统"
             st.rerun()
+    
+    refresh_while_active(job_active or mirror_active)
+
+
+def show_document_browser(api_key, knowledge_base_id):
+    """
+    显示知识库文档浏览区域：刷新本地镜像后可即时筛选和搜索全部文档
+    
+    Returns:
+        镜像刷新任务是否仍在进行中
+    """
+    st.subheader("📑 知识库文档")
+    
+    if not knowledge_base_id:
+        st.info("💡 请先在上方选择目标知识库，即可浏览和搜索该知识库中的全部文档")
+        return False
+    
+    mirror = get_kb_mirror()
+    mirror_state = mirror.state(knowledge_base_id)
+    current_job = get_current_job("kb_mirror", "kb_mirror")
+    
+    col1, col2 = st.columns([1, 2])
+    with col1:
+        if st.button("🔄 刷新文档列表", key="kb_mirror_refresh", disabled=is_active(current_job)):
+            submit_job("kb_mirror", {"api_key": api_key, "knowledge_base_id": knowledge_base_id},
+                       f"刷新知识库文档列表（{knowledge_base_id[:8]}...）", key_prefix="kb_mirror")
+            st.rerun()
+    with col2:
+        if mirror_state:
+            refreshed_at = datetime.fromtimestamp(mirror_state["refreshed_at"]).strftime("%m-%d %H:%M:%S")
+            st.caption(f"本地镜像: {mirror_state['total']} 个文档，上次刷新 {refreshed_at}；"
+                       f"刷新时只写入新增和变化的文档")
+        else:
+            st.caption("尚未获取该知识库的文档列表，点击刷新后可浏览和搜索全部文档")
+    
+    mirror_active = show_job_panel("kb_mirror", "kb_mirror", render_result=show_mirror_refresh_result)
+    if not mirror_state:
+        return mirror_active
+    
+    status_counts = mirror.status_counts(knowledge_base_id)
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        query = st.text_input("搜索文档", placeholder="输入文档名或文档ID", key="kb_mirror_query")
+    with col2:
+        status = st.selectbox(
+            "文档状态",
+            [""] + list(status_counts),
+            format_func=lambda value: f"{value}（{status_counts[value]}）" if value else "全部状态",
+            key="kb_mirror_status"
+        )
+    
+    documents, matched = mirror.search(knowledge_base_id, query=query.strip(), status=status or None)
+    if not documents:
+        st.info("没有符合条件的文档")
+        return mirror_active
+    
+    st.caption(f"共 {matched} 个文档符合条件" + (f"，显示最新的 {len(documents)} 个" if matched > len(documents) else ""))
+    st.dataframe(pd.DataFrame([
+        {
+            "文档名称": doc["name"],
+            "文档ID": doc["doc_id"],
+            "状态": doc["status"],
+            "知识块数": doc["chunk"],
+            "Token数": doc["token"],
+            "字符数": doc["char_count"],
+            "更新时间": datetime.fromtimestamp(doc["update_time"]).strftime("%Y-%m-%d %H:%M")
+                        if doc["update_time"] else ""
+        }
+        for doc in documents
+    ]), width='stretch', hide_index=True)
+    return mirror_active
+
+
+def show_mirror_refresh_result(job):
+    """显示文档列表刷新任务的结果"""
+    result = job["result"]
+    st.success(
+        f"✅ 文档列表已刷新: 共 {result['total']} 个文档，🆕 新增 {result['added']} 个 / "
+        f"✏️ 更新 {result['updated']} 个 / 🗑️ 移除 {result['removed']} 个"
+    )
 
 
 def get_knowledge_base_list(api_key):
@@ -248,9 +366,9 @@ def get_knowledge_base_list(api_key):
     st.info("🔄 正在获取知识库列表...")
     
     try:
-        from .api_clients import KnowledgeBaseAPI
+        from .client_cache import get_knowledge_base_client
         
-        client = KnowledgeBaseAPI(api_key)
+        client = get_knowledge_base_client(api_key)
         result = client.get_knowledge_bases()
         
         if result and "knowledge_base" in result:
@@ -290,253 +408,117 @@ def get_knowledge_base_list(api_key):
 
 
 def start_knowledge_base_upload(config, **params):
-    """开始知识库上传"""
-    st.info("🚀 开始上传文件到知识库...")
+    """提交知识库上传后台任务"""
+    params["final_dir"] = config["final_dir"]
+    if params["selected_files"]:
+        file_count = len(params["selected_files"])
+    else:
+        file_count = count_files(config["final_dir"], "*.md")
+    
+    submit_job("kb_upload", params, f"知识库上传（{file_count} 个文件）", key_prefix="kb_upload")
     log_activity("开始知识库上传")
+
+
+def show_upload_result(job):
+    """显示知识库上传任务的结果"""
+    upload_result = job["result"]
     
-    # 创建进度条和状态显示
-    progress_bar = st.progress(0)
-    status_text = st.empty()
-    result_container = st.empty()
+    st.success("🎉 知识库上传完成！")
     
-    try:
-        from .api_clients import KnowledgeBaseAPI
-        
-        # 初始化API客户端
-        status_text.text("🔍 初始化知识库API客户端...")
-        client = KnowledgeBaseAPI(params["api_key"])
-        
-        # 确定要上传的文件
-        final_dir = Path(config["final_dir"])
-        if params["selected_files"]:
-            # 上传选中的文件
-            files_to_upload = [final_dir / filename for filename in params["selected_files"]]
-            upload_mode = "selected"
-        else:
-            # 上传所有文件
-            files_to_upload = list(final_dir.glob("*.md"))
-            upload_mode = "all"
-        
-        if not files_to_upload:
-            st.error("❌ 没有找到要上传的文件")
-            return
-        
-        progress_bar.progress(10)
-        status_text.text(f"📧 准备上传 {len(files_to_upload)} 个文件...")
-        
-        # 根据上传模式选择不同的上传方法
-        if upload_mode == "all":
-            # 使用批量上传功能（上传整个目录）
-            upload_result = client.upload_markdown_files_from_directory(
-                directory_path=str(final_dir),
-                knowledge_base_id=params["knowledge_base_id"],
-                chunk_token=params["chunk_token"] or 600,
-                splitter=params["splitter"],
-                batch_size=10  # 使用固定的批次大小
-            )
-        else:
-            # 逐个上传选中的文件
-            upload_result = upload_selected_files(
-                client, files_to_upload, params, progress_bar, status_text
-            )
-        
-        progress_bar.progress(90)
-        status_text.text("📝 处理上传结果...")
-        
-        if "error" not in upload_result:
-            progress_bar.progress(100)
-            status_text.empty()
-            
-            # 显示上传结果
-            with result_container.container():
-                st.success("🎉 知识库上传完成！")
-                
-                # 统计信息 - 兼容两种上传方式的结果格式
-                col1, col2, col3, col4 = st.columns(4)
-                
-                # 统一处理不同上传方式的结果格式
-                total_files = upload_result.get("total_count", upload_result.get("total_files", 0))
-                successful_uploads = upload_result.get("success_count", upload_result.get("successful_uploads", 0))
-                failed_uploads = upload_result.get("failed_count", upload_result.get("failed_uploads", 0))
-                batches_processed = upload_result.get("batches_processed", 1)
-                
-                with col1:
-                    st.metric("总文件数", total_files)
-                
-                with col2:
-                    st.metric("上传成功", successful_uploads)
-                
-                with col3:
-                    st.metric("上传失败", failed_uploads)
-                
-                with col4:
-                    st.metric("处理批次", batches_processed)
-                
-                # 成功上传的文件 - 兼容两种格式
-                uploaded_files = upload_result.get("uploaded_files", [])
-                success_files = upload_result.get("success_files", [])
-                
-                if uploaded_files or success_files:
-                    st.subheader("✅ 成功上传的文件")
-                    
-                    # 处理批量上传的结果格式
-                    if uploaded_files:
-                        success_data = []
-                        for doc in uploaded_files:
-                            success_data.append({
-                                "文档ID": doc.get("doc_id", ""),
-                                "文档名称": doc.get("doc_name", "")
-                            })
-                        
-                        if success_data:
-                            st.dataframe(pd.DataFrame(success_data))
-                    
-                    # 处理选择文件上传的结果格式
-                    elif success_files:
-                        for file_info in success_files:
-                            if isinstance(file_info, dict):
-                                file_name = file_info.get('file', file_info.get('filename', '未知文件'))
-                                chunks = file_info.get('chunks', file_info.get('chunks_count', 0))
-                                size = file_info.get('size', 0)
-                                st.write(f"📄 {file_name} - {chunks} 个分片 ({size} 字符)")
-                            else:
-                                st.write(f"📄 {file_info}")
-                
-                # 失败的文件 - 兼容两种格式
-                failed_files = upload_result.get("failed_files", [])
-                if failed_files:
-                    st.subheader("❌ 上传失败的文件")
-                    for failed in failed_files:
-                        if isinstance(failed, dict):
-                            # 批量上传格式
-                            if 'file_name' in failed:
-                                st.error(f"{failed['file_name']}: {failed['error']}")
-                            # 选择文件上传格式
-                            elif 'file' in failed:
-                                st.error(f"{failed['file']}: {failed['error']}")
-                            else:
-                                st.error(f"未知文件: {failed.get('error', '未知错误')}")
-                        else:
-                            st.error(str(failed))
-                
-                # 保存上传记录
-                if params["create_backup"]:
-                    backup_filename = f"kb_upload_result_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-                    backup_path = Path(config["final_dir"]) / backup_filename
-                    
-                    with open(backup_path, 'w', encoding='utf-8') as f:
-                        json.dump(upload_result, f, indent=2, ensure_ascii=False)
-                    
-                    st.info(f"📄 上传记录已保存到: {backup_filename}")
-                
-                log_activity(f"知识库上传完成: {successful_uploads}/{total_files} 成功")
-        
-        else:
-            progress_bar.progress(0)
-            status_text.empty()
-            result_container.error(f"❌ 上传失败: {upload_result['error']}")
-            log_activity(f"知识库上传失败: {upload_result['error']}")
+    # 统计信息 - 兼容两种上传方式的结果格式
+    col1, col2, col3, col4 = st.columns(4)
     
-    except Exception as e:
-        progress_bar.progress(0)
-        status_text.empty()
-        result_container.error(f"❌ 上传过程中发生错误: {str(e)}")
-        log_activity(f"知识库上传错误: {str(e)}")
-        st.exception(e)
-
-
-def upload_selected_files(client, files_to_upload, params, progress_bar, status_text):
-    """
-    上传选中的文件到知识库
+    # 统一处理不同上传方式的结果格式
+    total_files = upload_result.get("total_count", upload_result.get("total_files", 0))
+    successful_uploads = upload_result.get("success_count", upload_result.get("successful_uploads", 0))
+    failed_uploads = upload_result.get("failed_count", upload_result.get("failed_uploads", 0))
+    batches_processed = upload_result.get("batches_processed", 1)
     
-    Args:
-        client: KnowledgeBaseAPI客户端
-        files_to_upload: 要上传的文件路径列表
-        params: 上传参数
-        progress_bar: 进度条
-        status_text: 状态文本
+    with col1:
+        st.metric("总文件数", total_files)
     
-    Returns:
-        dict: 上传结果
-    """
-    import time
-    from datetime import datetime
-    
-    upload_results = {
-        "success_count": 0,
-        "failed_count": 0,
-        "total_count": len(files_to_upload),
-        "failed_files": [],
-        "success_files": [],
-        "upload_time": datetime.now().strftime('%Y%m%d_%H%M%S')
-    }
+    with col2:
+        st.metric("上传成功", successful_uploads)
     
-    try:
-        # 逐个上传文件
-        for i, file_path in enumerate(files_to_upload):
-            try:
-                # 更新进度
-                progress = 20 + (i / len(files_to_upload)) * 60  # 20-80%的进度用于文件上传
-                progress_bar.progress(int(progress))
-                status_text.text(f"📤 正在上传文件 {i+1}/{len(files_to_upload)}: {file_path.name}")
-                
-                # 读取文件内容
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                if not content.strip():
-                    upload_results["failed_files"].append({
-                        "file": file_path.name,
-                        "error": "文件内容为空"
-                    })
-                    upload_results["failed_count"] += 1
-                    continue
-                
-                # 调用单文件上传API
-                result = client.upload_markdown_content(
-                    content=content,
-                    filename=file_path.name,
-                    knowledge_base_id=params["knowledge_base_id"],
-                    chunk_token=params["chunk_token"] or 600,
-                    splitter=params["splitter"]
-                )
-                
-                if result and "error" not in result:
-                    upload_results["success_files"].append({
-                        "file": file_path.name,
-                        "chunks": result.get("chunks_count", 0),
-                        "size": len(content)
-                    })
-                    upload_results["success_count"] += 1
-                else:
-                    error_msg = result.get("error", "未知错误") if result else "API调用失败"
-                    upload_results["failed_files"].append({
-                        "file": file_path.name,
-                        "error": error_msg
-                    })
-                    upload_results["failed_count"] += 1
-                
-                # 添加延迟避免API限流
-                if i < len(files_to_upload) - 1:
-                    time.sleep(1)
-                    
-            except Exception as e:
-                upload_results["failed_files"].append({
-                    "file": file_path.name,
-                    "error": f"处理错误: {str(e)}"
-                })
-                upload_results["failed_count"] += 1
-                
-                # 如果设置了遇到错误时继续，则继续处理下一个文件
-                if not params.get("continue_on_error", True):
-                    break
+    with col3:
+        st.metric("上传失败", failed_uploads)
+    
+    with col4:
+        st.metric("处理批次", batches_processed)
+    
+    if upload_result.get("skipped_files"):
+        st.info(f"⏭️ 续跑: 跳过 {upload_result['skipped_files']} 个上次已上传且内容未变化的文件")
+    
+    if "unchanged" in upload_result:
+        st.info(
+            f"🔄 增量同步: 🆕 新增 {upload_result['added']} 个 / ✏️ 更新 {upload_result['updated']} 个 / "
+            f"🗑️ 删除 {upload_result['deleted']} 个 / ✅ 未变化 {upload_result['unchanged']} 个"
+        )
+        if upload_result["delete_failed"]:
+            st.warning(f"⚠️ {len(upload_result['delete_failed'])} 个已删除文件对应的知识库文档删除失败，下次同步时重试")
+        if upload_result.get("chunks_reuploaded"):
+            st.caption(f"♻️ {upload_result['chunks_reuploaded']} 个仍被其他文件引用的共享知识块已重新上传")
+        if upload_result.get("reupload_failed"):
+            st.warning(f"⚠️ {len(upload_result['reupload_failed'])} 个文件的共享知识块重新上传失败，"
+                       f"下次本地分块上传这些文件时补传")
+    
+    if "chunks_total" in upload_result:
+        st.info(
+            f"✂️ 本地分块: 共 {upload_result['chunks_total']} 个知识块，上传 {upload_result['chunks_uploaded']} 个，"
+            f"跳过重复 {upload_result['chunks_skipped']} 个（约 {upload_result['tokens_skipped']} Token）"
+        )
+        if upload_result["duplicate_files"]:
+            st.caption(f"{len(upload_result['duplicate_files'])} 个文件的知识块均已存在，未创建文档: "
+                       + "、".join(upload_result["duplicate_files"][:20]))
+    
+    show_embedding_status(job, "kb_upload")
+    
+    # 成功上传的文件 - 兼容两种格式
+    uploaded_files = upload_result.get("uploaded_files", [])
+    success_files = upload_result.get("success_files", [])
+    
+    if uploaded_files or success_files:
+        st.subheader("✅ 成功上传的文件")
         
-        return upload_results
+        # 处理批量上传的结果格式
+        if uploaded_files:
+            success_data = []
+            for doc in uploaded_files:
+                success_data.append({
+                    "文档ID": doc.get("doc_id", ""),
+                    "文档名称": doc.get("doc_name", "")
+                })
+            
+            if success_data:
+                st.dataframe(pd.DataFrame(success_data))
         
-    except Exception as e:
-        return {
-            "error": f"批量上传过程中发生错误: {str(e)}",
-            "success_count": upload_results["success_count"],
-            "failed_count": upload_results["failed_count"],
-            "total_count": upload_results["total_count"]
-        }
+        # 处理选择文件上传的结果格式
+        elif success_files:
+            for file_info in success_files:
+                if isinstance(file_info, dict):
+                    file_name = file_info.get('file', file_info.get('filename', '未知文件'))
+                    chunks = file_info.get('chunks', file_info.get('chunks_count', 0))
+                    size = file_info.get('size', 0)
+                    st.write(f"📄 {file_name} - {chunks} 个分片 ({size} 字符)")
+                else:
+                    st.write(f"📄 {file_info}")
+    
+    # 失败的文件 - 兼容两种格式
+    failed_files = upload_result.get("failed_files", [])
+    if failed_files:
+        st.subheader("❌ 上传失败的文件")
+        for failed in failed_files:
+            if isinstance(failed, dict):
+                # 批量上传格式
+                if 'file_name' in failed:
+                    st.error(f"{failed['file_name']}: {failed['error']}")
+                # 选择文件上传格式
+                elif 'file' in failed:
+                    st.error(f"{failed['file']}: {failed['error']}")
+                else:
+                    st.error(f"未知文件: {failed.get('error', '未知错误')}")
+            else:
+                st.error(str(failed))
+    
+    if upload_result.get("backup_filename"):
+        st.info(f"📄 上传记录已保存到: {upload_result['backup_filename']}")
@@ -0,0 +1,35 @@
+"""
+LLM处理引擎模块
+包含提示词管理、响应缓存、邮件LLM处理流程、并发处理池和增量处理
+"""
+
+from .prompts import PROMPT_TEMPLATE_VERSION, PACKED_TEMPLATE_VERSION, build_prompt, extract_llm_content
+from .response_cache import LLMResponseCache
+from .processor import LLMEmailProcessor
+from .tokens import estimate_tokens
+from .prompt_packing import plan_packs, build_packed_prompt, split_packed_response
+from .map_reduce import MapReduceRunner, split_into_chunks
+from .worker_pool import LLMWorkerPool
+from .output import save_llm_result
+from .incremental import LLM_STAGE, llm_fingerprint, preview_llm_run, collect_orphan_outputs
+
+__all__ = [
+    'PROMPT_TEMPLATE_VERSION',
+    'PACKED_TEMPLATE_VERSION',
+    'build_prompt',
+    'extract_llm_content',
+    'LLMResponseCache',
+    'LLMEmailProcessor',
+    'estimate_tokens',
+    'plan_packs',
+    'build_packed_prompt',
+    'split_packed_response',
+    'MapReduceRunner',
+    'split_into_chunks',
+    'LLMWorkerPool',
+    'save_llm_result',
+    'LLM_STAGE',
+    'llm_fingerprint',
+    'preview_llm_run',
+    'collect_orphan_outputs'
+]
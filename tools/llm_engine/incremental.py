@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+LLM增量处理
+根据文件处理状态表判断哪些邮件需要重新调用LLM：内容哈希、提示词模板版本或Bot Key变化时才重新处理，
+并清理源文件已删除的结果文件
+"""
+
+import hashlib
+import logging
+from pathlib import Path
+from typing import Dict, List
+
+from .prompts import PROMPT_TEMPLATE_VERSION
+from ..jobs.file_state import FileStateStore, get_file_state_store
+
+# LLM阶段在文件处理状态表中的阶段名
+LLM_STAGE = "llm"
+
+
+def llm_fingerprint(bot_key: str, template_version: str = PROMPT_TEMPLATE_VERSION) -> str:
+    """
+    生成LLM处理参数指纹（不保存Bot Key原文）
+
+    Args:
+        bot_key: LLM Bot的API Key
+        template_version: 提示词模板版本
+
+    Returns:
+        指纹字符串
+    """
+    bot_hash = hashlib.sha256(bot_key.encode("utf-8")).hexdigest()[:16]
+    return f"{template_version}:{bot_hash}"
+
+
+def preview_llm_run(processed_dir: str, bot_key: str, file_states: FileStateStore = None) -> Dict:
+    """
+    预估一次增量LLM处理的工作量，供页面在开始处理前展示
+
+    Args:
+        processed_dir: 清洗后的Markdown目录
+        bot_key: LLM Bot的API Key
+        file_states: 文件处理状态表
+
+    Returns:
+        {"new": 新文件数, "changed": 已变化文件数, "up_to_date": 无需处理文件数, "orphans": 待清理结果数}
+    """
+    file_states = file_states or get_file_state_store()
+    md_files = sorted(Path(processed_dir).glob("*.md"))
+    groups, _ = file_states.classify(LLM_STAGE, md_files, llm_fingerprint(bot_key), check_output=True)
+    summary = {name: len(files) for name, files in groups.items()}
+    summary["orphans"] = len(file_states.find_orphans(LLM_STAGE))
+    return summary
+
+
+def collect_orphan_outputs(file_states: FileStateStore = None) -> List[str]:
+    """
+    删除源文件已不存在的LLM结果文件及其处理状态
+
+    Args:
+        file_states: 文件处理状态表
+
+    Returns:
+        已删除的结果文件名列表
+    """
+    file_states = file_states or get_file_state_store()
+    removed = []
+    cleared = []
+    for state in file_states.find_orphans(LLM_STAGE):
+        output = Path(state["output"]) if state["output"] else None
+        if output and output.exists():
+            try:
+                output.unlink()
+                removed.append(output.name)
+            except OSError as e:
+                # 删除失败时保留状态，下次运行再清理
+                logging.warning(f"删除结果文件 {output} 失败: {e}")
+                continue
+        cleared.append(state["path"])
+    file_states.remove(LLM_STAGE, cleared)
+    if removed:
+        logging.info(f"已清理 {len(removed)} 个源文件已删除的LLM结果文件")
+    return removed
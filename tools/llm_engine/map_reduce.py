@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+超长邮件分块处理（map-reduce）
+按段落边界切分超长邮件，并发处理各分块后再用一次调用汇总结果
+"""
+
+import re
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from .prompts import MAP_PROMPT_TEMPLATE, REDUCE_PROMPT_TEMPLATE, extract_llm_content
+from .tokens import estimate_tokens
+
+# 清洗后Markdown中正文部分的标题，之前的内容视为邮件元数据
+_BODY_HEADING = "## 📄 邮件内容"
+
+
+def split_email_markdown(content: str) -> Tuple[str, str]:
+    """
+    将清洗后的邮件Markdown拆分为元数据头部和正文
+
+    Args:
+        content: 邮件Markdown内容
+
+    Returns:
+        (元数据头部, 正文)；找不到正文标题时头部为空
+    """
+    index = content.find(_BODY_HEADING)
+    if index == -1:
+        return "", content
+    return content[:index].strip(), content[index + len(_BODY_HEADING):].strip()
+
+
+def split_into_chunks(text: str, max_tokens: int) -> List[str]:
+    """
+    按段落边界将文本切分为不超过 max_tokens 的分块
+
+    单个段落超过上限时按行切分，单行仍超过上限时按字符硬切分。
+
+    Args:
+        text: 待切分文本
+        max_tokens: 单个分块的Token上限
+
+    Returns:
+        分块列表
+    """
+    pieces = []
+    for paragraph in re.split(r'\n\s*\n', text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if estimate_tokens(paragraph) <= max_tokens:
+            pieces.append(paragraph)
+            continue
+        for line in paragraph.split('\n'):
+            if estimate_tokens(line) <= max_tokens:
+                pieces.append(line)
+                continue
+            # 按字符硬切分，步长以最坏情况（每字符1 Token）估算
+            for start in range(0, len(line), max_tokens):
+                pieces.append(line[start:start + max_tokens])
+
+    chunks = []
+    current = []
+    current_tokens = 0
+    for piece in pieces:
+        # 额外计入段落分隔符的开销
+        piece_tokens = estimate_tokens(piece) + 1
+        if current and current_tokens + piece_tokens > max_tokens:
+            chunks.append("\n\n".join(current))
+            current = []
+            current_tokens = 0
+        current.append(piece)
+        current_tokens += piece_tokens
+    if current:
+        chunks.append("\n\n".join(current))
+
+    return chunks
+
+
+class MapReduceRunner:
+    def __init__(self, client, chunk_tokens: int, max_workers: int = 4):
+        """
+        初始化分块处理器
+
+        Args:
+            client: GPTBotsAPI客户端
+            chunk_tokens: 单个分块的Token上限
+            max_workers: map阶段并发线程数
+        """
+        self.client = client
+        self.chunk_tokens = chunk_tokens
+        self.max_workers = max_workers
+        self.api_calls = 0
+        self._lock = threading.Lock()
+
+    def _call(self, prompt: str) -> Optional[str]:
+        with self._lock:
+            self.api_calls += 1
+        return extract_llm_content(self.client.call_agent(prompt))
+
+    def run(self, email_content: str) -> Dict:
+        """
+        对超长邮件执行分块处理与汇总
+
+        Args:
+            email_content: 邮件Markdown内容
+
+        Returns:
+            dict: {"content": 汇总结果或None, "error": 错误信息, "chunks": 分块数}
+        """
+        header, body = split_email_markdown(email_content)
+        body_budget = max(200, self.chunk_tokens - estimate_tokens(header))
+        chunks = split_into_chunks(body, body_budget)
+        logging.info(f"超长邮件切分为 {len(chunks)} 个分块并发处理")
+
+        prompts = [
+            MAP_PROMPT_TEMPLATE.format(
+                part_index=index + 1,
+                part_count=len(chunks),
+                email_header=header,
+                email_content=chunk
+            )
+            for index, chunk in enumerate(chunks)
+        ]
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            partials = list(executor.map(self._call, prompts))
+
+        failed = [index + 1 for index, partial in enumerate(partials) if not partial]
+        if failed:
+            return {"content": None, "error": f"分块 {failed} 处理失败", "chunks": len(chunks)}
+
+        if len(partials) == 1:
+            return {"content": partials[0], "error": None, "chunks": 1}
+
+        reduced = self._reduce(header, partials)
+        if not reduced:
+            return {"content": None, "error": "分块结果汇总失败", "chunks": len(chunks)}
+
+        return {"content": reduced, "error": None, "chunks": len(chunks)}
+
+    def _reduce(self, header: str, partials: List[str]) -> Optional[str]:
+        """汇总分块结果；结果总量超过上限时先分组汇总再逐级合并"""
+        total_tokens = sum(estimate_tokens(partial) for partial in partials)
+        if total_tokens > self.chunk_tokens and len(partials) > 2:
+            middle = len(partials) // 2
+            left = self._reduce(header, partials[:middle])
+            right = self._reduce(header, partials[middle:])
+            if not left or not right:
+                return None
+            partials = [left, right]
+
+        partial_results = "\n\n".join(
+            f"### 第 {index + 1} 部分结果\n\n{partial}"
+            for index, partial in enumerate(partials)
+        )
+        return self._call(REDUCE_PROMPT_TEMPLATE.format(
+            part_count=len(partials),
+            email_header=header,
+            partial_results=partial_results
+        ))
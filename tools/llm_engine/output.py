@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+LLM处理结果输出
+生成 llm_<原文件名>.md 格式的最终文件
+"""
+
+from datetime import datetime
+from pathlib import Path
+
+
+def save_llm_result(md_file: Path, email_content: str, llm_response: str,
+                    output_dir: str, endpoint: str, api_key: str) -> str:
+    """
+    保存单个文件的LLM处理结果
+
+    Args:
+        md_file: 清洗后的邮件Markdown文件
+        email_content: 邮件Markdown内容
+        llm_response: LLM提取的结构化信息
+        output_dir: 输出目录
+        endpoint: 使用的API节点
+        api_key: LLM Bot的API Key（输出中只保留首尾8位）
+
+    Returns:
+        输出文件名
+    """
+    output_filename = f"llm_{md_file.name}"
+    output_path = Path(output_dir) / output_filename
+
+    # 确保输出目录存在
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    # 生成最终的Markdown内容
+    final_content = f"""# LLM处理结果 - {md_file.name}
+
+## 🤖 AI提取的结构化信息
+
+{llm_response}
+
+---
+
+## 📄 原始邮件内容
+
+{email_content}
+
+---
+*LLM处理时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}*
+*使用节点: {endpoint}*
+*API Key: {api_key[:8]}...{api_key[-8:]}*
+"""
+
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(final_content)
+
+    return output_filename
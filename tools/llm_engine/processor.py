@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+邮件LLM处理器
+封装单封邮件的 缓存查询 -> 调用LLM -> 提取结果 -> 写入缓存 流程
+"""
+
+import logging
+import threading
+from typing import Callable, Dict, List, Tuple
+
+from config import LLM_CONFIG, get_llm_split_threshold
+from ..api_clients.circuit_breaker import CLOSED
+from .prompts import PACKED_TEMPLATE_VERSION, build_prompt, extract_llm_content
+from .response_cache import LLMResponseCache
+from .prompt_packing import plan_packs, build_packed_prompt, split_packed_response
+from .map_reduce import MapReduceRunner
+from .tokens import estimate_tokens
+
+
+class LLMEmailProcessor:
+    def __init__(self, client, api_key: str, cache: LLMResponseCache = None,
+                 split_threshold: int = None, map_workers: int = None):
+        """
+        初始化邮件LLM处理器
+
+        Args:
+            client: GPTBotsAPI客户端
+            api_key: LLM Bot的API Key（参与缓存键计算）
+            cache: LLM响应缓存，None表示不使用缓存
+            split_threshold: 超过该Token数的邮件走分块+汇总处理，默认按Bot配置
+            map_workers: 分块并发处理的线程数
+        """
+        self.client = client
+        self.api_key = api_key
+        self.cache = cache
+        self.split_threshold = split_threshold or get_llm_split_threshold(api_key)
+        self.map_workers = map_workers or LLM_CONFIG["map_workers"]
+
+        self.api_calls = 0
+        self.cache_hits = 0
+        self.packed_calls = 0
+        self.packed_emails = 0
+        self.map_reduce_emails = 0
+
+        # 合并调用得到的结果，键为单独处理的缓存键
+        self._packed_results: Dict[str, str] = {}
+
+        # process() 可能在多个工作线程中并发调用
+        self._lock = threading.Lock()
+
+    def _count(self, name: str, value: int = 1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def _packed_key(self, email_content: str) -> str:
+        """合并处理结果的缓存键（与单独处理的结果分开缓存）"""
+        return LLMResponseCache.make_key(email_content, self.api_key, PACKED_TEMPLATE_VERSION)
+
+    def prefetch_packed(self, items: List[Tuple[str, str]], token_budget: int = None,
+                        max_emails: int = None, small_email_tokens: int = None,
+                        progress_callback: Callable[[int, int], None] = None) -> int:
+        """
+        将未缓存的短邮件合并为少量LLM调用，结果供后续 process() 直接使用
+
+        合并响应无法按ID完整拆分时丢弃该组结果，组内邮件在 process() 中回退为单独调用。
+
+        Args:
+            items: (来源文件名, 邮件内容) 列表
+            token_budget: 单次调用的Token预算
+            max_emails: 单次调用的最大邮件数
+            small_email_tokens: 低于该Token数的邮件才参与合并
+            progress_callback: 进度回调，参数为 (已完成组数, 总组数)
+
+        Returns:
+            通过合并调用成功处理的邮件数
+        """
+        pending = []
+        for source_name, content in items:
+            key = LLMResponseCache.make_key(content, self.api_key)
+            if key in self._packed_results:
+                continue
+            if self.cache is not None and (self.cache.contains(key) or
+                                           self.cache.contains(self._packed_key(content))):
+                continue
+            pending.append((key, content))
+
+        packs = plan_packs(
+            pending,
+            token_budget or LLM_CONFIG["pack_token_budget"],
+            max_emails or LLM_CONFIG["pack_max_emails"],
+            small_email_tokens or LLM_CONFIG["pack_small_email_tokens"]
+        )
+
+        packed_count = 0
+        for index, pack in enumerate(packs):
+            prompt, email_ids = build_packed_prompt(pack)
+            self._count("api_calls")
+            self._count("packed_calls")
+            result = self.client.call_agent(prompt)
+            split_results = split_packed_response(extract_llm_content(result), email_ids)
+
+            if split_results is None:
+                logging.warning(f"合并调用结果无法拆分，{len(pack)} 封邮件将回退为单独调用")
+            else:
+                for email_id, (key, content) in zip(email_ids, pack):
+                    self._packed_results[key] = split_results[email_id]
+                    if self.cache is not None:
+                        self.cache.put(self._packed_key(content), split_results[email_id],
+                                       template_version=PACKED_TEMPLATE_VERSION)
+                packed_count += len(pack)
+
+            if progress_callback:
+                progress_callback(index + 1, len(packs))
+
+        self._count("packed_emails", packed_count)
+        logging.info(f"合并处理完成: {len(packs)} 次调用处理 {packed_count} 封短邮件")
+        return packed_count
+
+    def process(self, email_content: str, source_name: str = None) -> Dict:
+        """
+        处理单封邮件
+
+        Args:
+            email_content: 清洗后的邮件Markdown内容
+            source_name: 来源文件名
+
+        Returns:
+            dict: {"content": 提取的结果或None, "cached": 是否命中缓存, "error": 错误信息,
+                   "circuit_open": 失败是否由服务熔断导致（可在恢复后重试）}
+        """
+        cache_key = LLMResponseCache.make_key(email_content, self.api_key)
+
+        packed = self._packed_results.pop(cache_key, None)
+        if packed:
+            return {"content": packed, "cached": True, "error": None, "circuit_open": False}
+
+        if self.cache is not None:
+            # 优先使用单独处理的结果，没有时使用之前合并处理的结果
+            lookup_key = cache_key
+            if not self.cache.contains(cache_key) and self.cache.contains(self._packed_key(email_content)):
+                lookup_key = self._packed_key(email_content)
+            cached = self.cache.get(lookup_key)
+            if cached:
+                self._count("cache_hits")
+                logging.info(f"LLM缓存命中: {source_name}")
+                return {"content": cached, "cached": True, "error": None, "circuit_open": False}
+
+        if estimate_tokens(email_content) > self.split_threshold:
+            # 超长邮件：按段落分块并发处理后汇总
+            runner = MapReduceRunner(self.client, self.split_threshold, self.map_workers)
+            outcome = runner.run(email_content)
+            self._count("api_calls", runner.api_calls)
+            self._count("map_reduce_emails")
+            if not outcome["content"]:
+                return self._failure(outcome["error"])
+            content = outcome["content"]
+        else:
+            self._count("api_calls")
+            result = self.client.call_agent(build_prompt(email_content))
+            if not result:
+                return self._failure("API调用失败")
+
+            content = extract_llm_content(result)
+            if not content:
+                return self._failure("无法提取LLM响应内容")
+
+        if self.cache is not None:
+            self.cache.put(cache_key, content, source_name)
+
+        return {"content": content, "cached": False, "error": None, "circuit_open": False}
+
+    def _failure(self, error: str) -> Dict:
+        """构造失败结果，熔断器未处于正常状态时标记为可重试"""
+        if self.client.circuit.state != CLOSED:
+            return {"content": None, "cached": False, "error": f"服务熔断中: {error}", "circuit_open": True}
+        return {"content": None, "cached": False, "error": error, "circuit_open": False}
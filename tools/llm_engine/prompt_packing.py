@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+提示词合并（Prompt Packing）
+将多封短邮件合并为一次LLM调用，并把结构化响应拆分回每封邮件
+"""
+
+import re
+from typing import Dict, List, Optional, Tuple
+
+from .prompts import PACKED_PROMPT_TEMPLATE
+from .tokens import estimate_tokens
+
+# 合并提示词自身的固定开销（说明文字与分隔符）
+PACK_OVERHEAD_TOKENS = 150
+PER_EMAIL_OVERHEAD_TOKENS = 20
+
+_RESULT_PATTERN = re.compile(
+    r'<<<RESULT id=([A-Za-z0-9_-]+)>>>\s*(.*?)\s*<<<END RESULT>>>',
+    re.DOTALL
+)
+
+
+def plan_packs(items: List[Tuple[str, str]], token_budget: int, max_emails: int,
+               small_email_tokens: int) -> List[List[Tuple[str, str]]]:
+    """
+    将短邮件按Token预算分组
+
+    Args:
+        items: (邮件标识, 邮件内容) 列表
+        token_budget: 单次调用的Token预算
+        max_emails: 单组最大邮件数
+        small_email_tokens: 低于该Token数的邮件才参与合并
+
+    Returns:
+        分组列表，每组至少包含2封邮件；未分组的邮件走单独调用
+    """
+    candidates = []
+    for item_id, content in items:
+        tokens = estimate_tokens(content)
+        if tokens < small_email_tokens:
+            candidates.append((tokens, item_id, content))
+
+    # 按长度从大到小放置，减少每组剩余的空间
+    candidates.sort(key=lambda x: x[0], reverse=True)
+
+    packs = []
+    pack_tokens = []
+    for tokens, item_id, content in candidates:
+        cost = tokens + PER_EMAIL_OVERHEAD_TOKENS
+        for index, pack in enumerate(packs):
+            if len(pack) < max_emails and pack_tokens[index] + cost <= token_budget:
+                pack.append((item_id, content))
+                pack_tokens[index] += cost
+                break
+        else:
+            packs.append([(item_id, content)])
+            pack_tokens.append(PACK_OVERHEAD_TOKENS + cost)
+
+    return [pack for pack in packs if len(pack) > 1]
+
+
+def build_packed_prompt(pack: List[Tuple[str, str]]) -> Tuple[str, List[str]]:
+    """
+    构建合并后的提示词
+
+    Args:
+        pack: (邮件标识, 邮件内容) 列表
+
+    Returns:
+        (提示词, 与pack顺序一致的邮件ID列表)
+    """
+    email_ids = [f"E{index + 1}" for index in range(len(pack))]
+    blocks = []
+    for email_id, (_, content) in zip(email_ids, pack):
+        blocks.append(f"<<<EMAIL id={email_id}>>>\n{content}\n<<<END EMAIL>>>")
+
+    prompt = PACKED_PROMPT_TEMPLATE.format(
+        email_count=len(pack),
+        packed_emails="\n\n".join(blocks)
+    )
+    return prompt, email_ids
+
+
+def split_packed_response(response_text: str, email_ids: List[str]) -> Optional[Dict[str, str]]:
+    """
+    将合并调用的响应拆分为每封邮件的结果
+
+    Args:
+        response_text: LLM响应文本
+        email_ids: 期望的邮件ID列表
+
+    Returns:
+        {邮件ID: 结果文本}；任意邮件缺失或为空时返回None，由调用方回退到单独调用
+    """
+    if not response_text:
+        return None
+
+    expected_ids = set(email_ids)
+    results = {}
+    for email_id, content in _RESULT_PATTERN.findall(response_text):
+        # 忽略模型复述说明文字时产生的未知ID
+        if email_id not in expected_ids:
+            continue
+        # 同一ID出现多次说明响应格式混乱，整体视为解析失败
+        if email_id in results:
+            return None
+        results[email_id] = content.strip()
+
+    if set(results) != expected_ids or not all(results.values()):
+        return None
+
+    return results
@@ -0,0 +1,86 @@
+"""
+LLM提示词模板
+统一管理邮件处理使用的提示词及其版本
+"""
+
+from typing import Dict, Optional
+
+# 修改本文件中任一提示词模板时必须同步更新版本号，旧版本的缓存结果将自动失效
+PROMPT_TEMPLATE_VERSION = "v1"
+# 合并处理的结果来自不同的提示词，以独立的版本号缓存，不与单独处理的结果共用缓存键
+PACKED_TEMPLATE_VERSION = f"{PROMPT_TEMPLATE_VERSION}-packed"
+
+LLM_PROMPT_TEMPLATE = """
+            以下是需要处理的邮件内容：
+
+            {email_content}"""
+
+# 多封邮件合并为一次调用时使用的模板，邮件与结果均以固定分隔符和ID标记
+PACKED_PROMPT_TEMPLATE = """
+            以下共有 {email_count} 封需要分别处理的邮件，每封邮件位于 <<<EMAIL id=ID>>> 与 <<<END EMAIL>>> 之间。
+            请对每封邮件独立处理，不要混合不同邮件的信息，并严格按照以下格式依次输出每封邮件的结果：
+
+            <<<RESULT id=ID>>>
+            该邮件的处理结果
+            <<<END RESULT>>>
+
+            {packed_emails}"""
+
+
+# 超长邮件分块处理（map阶段）使用的模板
+MAP_PROMPT_TEMPLATE = """
+            以下是一封超长邮件的第 {part_index}/{part_count} 部分，请仅根据这一部分提取信息，后续会与其他部分的结果合并。
+
+            {email_header}
+
+            {email_content}"""
+
+# 超长邮件分块结果汇总（reduce阶段）使用的模板
+REDUCE_PROMPT_TEMPLATE = """
+            以下是同一封邮件被分为 {part_count} 部分分别处理后得到的结果。
+            请将它们合并为一份完整的处理结果，去除重复信息，保留所有关键细节，输出格式与单封邮件的处理结果保持一致。
+
+            {email_header}
+
+            {partial_results}"""
+
+
+def build_prompt(email_content: str) -> str:
+    """
+    根据邮件内容构建完整的提示词
+
+    Args:
+        email_content: 清洗后的邮件Markdown内容
+
+    Returns:
+        完整的提示词
+    """
+    return LLM_PROMPT_TEMPLATE.format(email_content=email_content)
+
+
+def extract_llm_content(result: Dict) -> Optional[str]:
+    """
+    从LLM API响应中提取文本内容
+
+    Args:
+        result: GPTBots API响应
+
+    Returns:
+        提取的文本内容，无法提取时返回None
+    """
+    if not result:
+        return None
+
+    if "output" in result:
+        content = ""
+        for output_item in result.get("output", []):
+            content_obj = output_item.get("content", {})
+            if "text" in content_obj:
+                content += content_obj["text"] + "\n"
+        return content.strip() or None
+
+    # 备用提取方法
+    return (result.get("answer") or
+            result.get("content") or
+            result.get("message") or
+            None)
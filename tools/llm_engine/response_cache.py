@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+LLM响应缓存
+以 (提示词版本, 邮件内容, Bot Key) 的哈希为键，将LLM处理结果持久化到磁盘
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Optional
+
+from config import DIRECTORIES, LLM_CONFIG
+from .prompts import PROMPT_TEMPLATE_VERSION
+
+
+class LLMResponseCache:
+    def __init__(self, cache_dir: str = None, max_size_mb: float = None,
+                 max_age_days: float = None, bypass: bool = False):
+        """
+        初始化LLM响应缓存
+
+        Args:
+            cache_dir: 缓存目录，默认为 DIRECTORIES["cache_dir"]/llm
+            max_size_mb: 缓存总大小上限（MB）
+            max_age_days: 缓存条目最长保留天数
+            bypass: 为True时跳过缓存读取（仍会写入新结果）
+        """
+        self.cache_dir = Path(cache_dir or Path(DIRECTORIES["cache_dir"]) / "llm")
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        self.max_size_bytes = (max_size_mb or LLM_CONFIG["cache_max_size_mb"]) * 1024 * 1024
+        self.max_age_seconds = (max_age_days or LLM_CONFIG["cache_max_age_days"]) * 24 * 3600
+        self.evict_interval = LLM_CONFIG["cache_evict_interval"]
+        self.bypass = bypass
+
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(email_content: str, bot_key: str,
+                 template_version: str = PROMPT_TEMPLATE_VERSION) -> str:
+        """
+        生成缓存键
+
+        Args:
+            email_content: 邮件内容
+            bot_key: LLM Bot的API Key
+            template_version: 提示词模板版本
+
+        Returns:
+            SHA-256十六进制字符串
+        """
+        bot_hash = hashlib.sha256(bot_key.encode("utf-8")).hexdigest()
+        content_hash = hashlib.sha256(email_content.encode("utf-8")).hexdigest()
+        raw = f"{template_version}\n{bot_hash}\n{content_hash}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path_for(self, key: str) -> Path:
+        """按键的前两位分目录存放，避免单目录文件过多"""
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def contains(self, key: str) -> bool:
+        """
+        检查缓存中是否有未过期的条目（不计入命中统计，也不刷新访问时间）
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            是否存在可用的缓存条目
+        """
+        if self.bypass:
+            return False
+        try:
+            return time.time() - self._path_for(key).stat().st_mtime <= self.max_age_seconds
+        except FileNotFoundError:
+            return False
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        读取缓存的LLM响应
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            缓存的响应文本，未命中时返回None
+        """
+        if self.bypass:
+            return None
+
+        path = self._path_for(key)
+        try:
+            if time.time() - path.stat().st_mtime > self.max_age_seconds:
+                path.unlink(missing_ok=True)
+                self._count(hit=False)
+                return None
+
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+
+            # 刷新访问时间，淘汰时按最近使用排序
+            os.utime(path, None)
+            self._count(hit=True)
+            return entry.get("response")
+
+        except FileNotFoundError:
+            self._count(hit=False)
+            return None
+        except Exception as e:
+            logging.warning(f"读取LLM缓存失败 {key[:12]}: {str(e)}")
+            self._count(hit=False)
+            return None
+
+    def put(self, key: str, response: str, source_name: str = None,
+            template_version: str = PROMPT_TEMPLATE_VERSION):
+        """
+        写入LLM响应
+
+        Args:
+            key: 缓存键
+            response: LLM响应文本
+            source_name: 来源文件名（仅用于排查）
+            template_version: 生成该响应的提示词模板版本（仅用于排查）
+        """
+        path = self._path_for(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        entry = {
+            "key": key,
+            "template_version": template_version,
+            "source_name": source_name,
+            "created_at": datetime.now().isoformat(),
+            "response": response
+        }
+
+        try:
+            tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logging.warning(f"写入LLM缓存失败 {key[:12]}: {str(e)}")
+            return
+
+        with self._lock:
+            self._writes += 1
+            should_evict = self._writes % self.evict_interval == 0
+        if should_evict:
+            self.evict()
+
+    def evict(self) -> int:
+        """
+        淘汰过期条目，并在超出大小上限时按最近访问时间删除最旧的条目
+
+        Returns:
+            删除的条目数
+        """
+        now = time.time()
+        removed = 0
+        entries = []
+
+        for path in self.cache_dir.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime > self.max_age_seconds:
+                path.unlink(missing_ok=True)
+                removed += 1
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_size = sum(size for _, size, _ in entries)
+        if total_size > self.max_size_bytes:
+            entries.sort()
+            for _, size, path in entries:
+                if total_size <= self.max_size_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total_size -= size
+                removed += 1
+
+        if removed:
+            logging.info(f"LLM缓存淘汰 {removed} 个条目")
+        return removed
+
+    def clear(self) -> int:
+        """清空全部缓存，返回删除的条目数"""
+        removed = 0
+        for path in self.cache_dir.glob("*/*.json"):
+            path.unlink(missing_ok=True)
+            removed += 1
+        return removed
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get_stats(self) -> Dict:
+        """获取缓存统计信息"""
+        entries = 0
+        total_size = 0
+        for path in self.cache_dir.glob("*/*.json"):
+            try:
+                total_size += path.stat().st_size
+                entries += 1
+            except FileNotFoundError:
+                continue
+
+        return {
+            "entries": entries,
+            "size_mb": round(total_size / (1024 * 1024), 2),
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypass": self.bypass
+        }
@@ -0,0 +1,27 @@
+"""
+本地Token估算
+无需调用分词器，按字符类别粗略估算文本的Token数
+"""
+
+import re
+
+# 中日韩字符通常约1个Token/字，其余文本约4个字符/Token
+_CJK_PATTERN = re.compile(r'[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]')
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本的Token数
+
+    Args:
+        text: 待估算的文本
+
+    Returns:
+        估算的Token数
+    """
+    if not text:
+        return 0
+
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    other_count = len(text) - cjk_count
+    return cjk_count + (other_count + 3) // 4
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+LLM并发处理池
+多个工作线程并发处理邮件文件，结果按输入顺序回调到调用线程，
+便于在Streamlit主线程中更新进度条和写入结果
+"""
+
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple
+
+from config import LLM_CONFIG
+
+
+class LLMWorkerPool:
+    def __init__(self, processor, workers: int = None, max_retries: int = None,
+                 retry_backoff: float = None, delay: float = 0.0, retry_wait: Callable[[float], None] = None):
+        """
+        初始化LLM并发处理池
+
+        实际同时进行的LLM调用数仍受自适应并发控制器限制，工作线程数只决定最多有多少个文件在处理中。
+
+        Args:
+            processor: LLMEmailProcessor实例
+            workers: 工作线程数
+            max_retries: 单个文件失败后的最大重试次数（服务熔断导致的失败不重试，由调用方暂存）
+            retry_backoff: 重试退避基数（秒），第n次重试前等待 retry_backoff * 2^(n-1)
+            delay: 每个工作线程在两次实际API调用之间的等待时间（秒），缓存命中时不等待
+            retry_wait: 重试退避和调用间隔的等待函数，默认 time.sleep（后台任务中传入可响应暂停/取消的等待）
+        """
+        self.processor = processor
+        self.workers = max(1, int(workers or LLM_CONFIG["workers"]))
+        self.max_retries = LLM_CONFIG["file_max_retries"] if max_retries is None else max_retries
+        self.retry_backoff = LLM_CONFIG["file_retry_backoff"] if retry_backoff is None else retry_backoff
+        self.delay = delay or 0.0
+        self.retry_wait = retry_wait or time.sleep
+
+        self.retried_files = 0
+        self._lock = threading.Lock()
+
+    def process_one(self, source_name: str, content: str, before_item: Callable[[str], None] = None) -> Dict:
+        """
+        处理单个文件，失败时按退避策略重试（可在调用方自己的工作线程中直接使用）
+
+        Returns:
+            处理结果，同 LLMEmailProcessor.process() 并附加 attempts
+        """
+        if before_item:
+            before_item(source_name)
+
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                outcome = self.processor.process(content, source_name)
+            except Exception as e:
+                logging.error(f"处理文件 {source_name} 时出错: {e}")
+                outcome = {"content": None, "cached": False, "error": str(e), "circuit_open": False}
+
+            if outcome["content"] or outcome["circuit_open"] or attempts > self.max_retries:
+                break
+
+            if attempts == 1:
+                with self._lock:
+                    self.retried_files += 1
+            wait = self.retry_backoff * (2 ** (attempts - 1))
+            logging.warning(f"{source_name} 处理失败（{outcome['error']}），{wait:.1f} 秒后第 {attempts} 次重试")
+            self.retry_wait(wait)
+
+        if self.delay and not outcome["cached"]:
+            self.retry_wait(self.delay)
+
+        outcome["attempts"] = attempts
+        return outcome
+
+    def run(self, items: List[Tuple[Any, str, str]],
+            on_result: Callable[[int, Any, Dict], None],
+            should_stop: Callable[[], bool] = None,
+            before_item: Callable[[str], None] = None) -> int:
+        """
+        并发处理文件，并按输入顺序回调结果
+
+        回调在调用线程中执行。同时提交的文件数不超过工作线程数的2倍，
+        避免停止时有大量已提交但尚未开始的任务。
+
+        Args:
+            items: (调用方标识, 来源文件名, 邮件内容) 列表
+            on_result: 结果回调，参数为 (序号, 调用方标识, 处理结果)，处理结果同 LLMEmailProcessor.process() 并附加 attempts
+            should_stop: 每次回调前检查，返回True时停止提交新任务并丢弃尚未回调的结果
+            before_item: 工作线程开始处理每个文件前调用，参数为来源文件名，可阻塞（暂停）或抛出异常（取消）
+
+        Returns:
+            已回调的结果数（即从头开始连续完成的文件数）
+        """
+        if not items:
+            return 0
+
+        window = self.workers * 2
+        futures = {}
+        next_submit = 0
+        next_emit = 0
+
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="llm-worker")
+        try:
+            while next_emit < len(items):
+                while next_submit < len(items) and next_submit - next_emit < window:
+                    _, source_name, content = items[next_submit]
+                    futures[next_submit] = executor.submit(self.process_one, source_name, content, before_item)
+                    next_submit += 1
+
+                if should_stop and should_stop():
+                    break
+
+                outcome = futures.pop(next_emit).result()
+                on_result(next_emit, items[next_emit][0], outcome)
+                next_emit += 1
+        finally:
+            # 停止或回调异常时取消尚未开始的任务，已开始的任务运行结束后结果写入缓存
+            for future in futures.values():
+                future.cancel()
+            executor.shutdown(wait=True)
+
+        return next_emit
@@ -5,10 +5,9 @@ LLM处理模块
 
 import streamlit as st
 import os
-import time
-from pathlib import Path
-from datetime import datetime
 from .utils import count_files, log_activity
+from .jobs import is_active
+from .job_panel import get_current_job, submit_job, show_job_panel, show_dead_letter_panel, refresh_while_active
 
 
 def show_llm_processing_page():
@@ -17,14 +16,6 @@ def show_llm_processing_page():
     
     st.header("LLM数据处理")
     
-    # 初始化LLM处理状态
-    if "llm_processing_state" not in st.session_state:
-        st.session_state.llm_processing_state = "idle"  # idle, processing, paused
-    if "llm_processed_count" not in st.session_state:
-        st.session_state.llm_processed_count = 0
-    if "llm_total_files" not in st.session_state:
-        st.session_state.llm_total_files = 0
-    
     # 检查清洗后的文件
     md_files = count_files(CONFIG["processed_dir"], "*.md")
     
@@ -76,55 +67,111 @@ def show_llm_processing_page():
         # LLM处理参数
         st.subheader("⚙️ 处理参数")
 
+        from config import LLM_CONFIG
+        workers = st.number_input(
+            "并发工作线程数",
+            min_value=1,
+            max_value=32,
+            value=LLM_CONFIG["workers"],
+            help="同时处理的文件数；实际并发调用数仍受自适应并发控制限制",
+            key="llm_workers"
+        )
+        
         delay_seconds = st.number_input(
             "请求间隔(秒)",
             min_value=0,
             max_value=10,
             value=1,
-            help="API请求之间的延迟时间"
+            help="每个工作线程在两次API调用之间的等待时间（缓存命中时不等待）"
+        )
+        
+        bypass_cache = st.checkbox(
+            "跳过LLM缓存",
+            value=False,
+            help="勾选后忽略已缓存的LLM结果，强制重新调用API（新结果仍会写入缓存）",
+            key="llm_bypass_cache"
         )
+        
+        from config import HEDGING_CONFIG
+        enable_hedging = st.checkbox(
+            "启用对冲请求",
+            value=HEDGING_CONFIG["enabled"],
+            help="请求超过历史P95延迟仍未返回时，在新对话上发起一次重复请求并取先返回的结果（额外负载受预算限制）",
+            key="llm_enable_hedging"
+        )
+        
+        from config import get_llm_split_threshold
+        split_threshold = st.number_input(
+            "超长邮件分块阈值(Token)",
+            min_value=1000,
+            max_value=100000,
+            value=get_llm_split_threshold(api_key),
+            step=1000,
+            help="超过该Token数的邮件将按段落分块并发处理后汇总，默认值可通过GPTBOTS_LLM_SPLIT_TOKENS_<编号>按Bot配置",
+            key="llm_split_threshold"
+        )
+        
+        from config import CIRCUIT_RETRY_CONFIG
+        park_on_open = st.checkbox(
+            "服务熔断时暂存并自动重试",
+            value=CIRCUIT_RETRY_CONFIG["park_on_open"],
+            help="后端连续失败触发熔断后，后续文件不再逐个等待超时：勾选时暂存到重试队列，探测恢复后自动继续处理；不勾选时立即记为失败",
+            key="llm_park_on_open"
+        )
+        
+        pack_small_emails = st.checkbox(
+            "合并短邮件批量处理",
+            value=False,
+            help="将多封短邮件合并为一次LLM调用，显著减少调用次数；结果无法拆分时自动回退为单封调用",
+            key="llm_pack_small_emails"
+        )
+        pack_token_budget = None
+        if pack_small_emails:
+            pack_token_budget = st.number_input(
+                "单次调用Token预算",
+                min_value=500,
+                max_value=16000,
+                value=3000,
+                step=500,
+                help="合并后单次调用的估算Token上限",
+                key="llm_pack_token_budget"
+            )
     
-        # 动态按钮逻辑
-        processing_state = st.session_state.llm_processing_state
+        incremental = st.checkbox(
+            "增量处理",
+            value=True,
+            help="只处理新增或内容变化的文件；提示词模板版本或API Key变化时全部重新处理，源文件已删除的结果文件会被清理",
+            key="llm_incremental"
+        )
         
-        if processing_state == "idle":
-            # 未开始处理
-            if st.button("🚀 开始LLM处理", type="primary", key="start_llm_btn"):
-                st.session_state.llm_processing_state = "processing"
-                st.session_state.llm_processed_count = 0
-                st.rerun()
-        elif processing_state == "processing":
-            # 正在处理中
-            col_btn1, col_btn2 = st.columns(2)
-            with col_btn1:
-                if st.button("⏸️ 暂停处理", type="secondary", key="pause_llm_btn"):
-                    st.session_state.llm_processing_state = "paused"
-                    st.rerun()
-            with col_btn2:
-                st.info("🔄 正在处理中...")
-        elif processing_state == "paused":
-            # 已暂停
-            col_btn1, col_btn2 = st.columns(2)
-            with col_btn1:
-                if st.button("▶️ 继续处理", type="primary", key="resume_llm_btn"):
-                    st.session_state.llm_processing_state = "processing"
-                    st.rerun()
-            with col_btn2:
-                if st.button("🛑 停止处理", type="secondary", key="stop_llm_btn"):
-                    st.session_state.llm_processing_state = "idle"
-                    st.session_state.llm_processed_count = 0
-                    st.rerun()
+        # 处理在后台任务中执行，页面只轮询任务状态；暂停/取消立即生效（进行中的请求完成后停止）
+        current_job = get_current_job("llm", "llm")
+        if incremental and not is_active(current_job):
+            show_incremental_preview(CONFIG["processed_dir"], api_key)
         
-        # 显示处理进度
-        if processing_state in ["processing", "paused"]:
-            if st.session_state.llm_total_files > 0:
-                progress_pct = st.session_state.llm_processed_count / st.session_state.llm_total_files
-                st.progress(progress_pct)
-                st.text(f"进度: {st.session_state.llm_processed_count}/{st.session_state.llm_total_files} 文件")
+        if st.button("🚀 开始LLM处理", type="primary", key="start_llm_btn", disabled=is_active(current_job)):
+            start_llm_processing(
+                api_key, delay_seconds, CONFIG, endpoint, bypass_cache,
+                pack_small_emails=pack_small_emails,
+                pack_token_budget=pack_token_budget,
+                split_threshold=split_threshold,
+                park_on_open=park_on_open,
+                workers=workers,
+                incremental=incremental,
+                enable_hedging=enable_hedging
+            )
         
-        # 执行处理逻辑
-        if processing_state == "processing":
-            start_llm_processing(api_key, delay_seconds, CONFIG)
+        job_active = show_job_panel("llm", "llm", render_result=show_llm_result)
+        show_dead_letter_panel("llm", "llm")
+    
+    # 自适应并发状态
+    with st.expander("📈 自适应并发与吞吐", expanded=job_active):
+        show_concurrency_panel()
+    
+    # API调用指标
+    with st.expander("📊 API调用指标（延迟分位数/重试/流量）"):
+        from .api_metrics_panel import show_api_metrics_panel
+        show_api_metrics_panel(key_prefix="llm_api_metrics")
         
     # 导航按钮
     st.markdown("---")
@@ -137,6 +184,8 @@ def show_llm_processing_page():
         if st.button("➡️ 下一步", help="前往结果查看页面", key="llm_next_btn"):
             st.session_state.current_step = "结果查看"
             st.rerun()
+    
+    refresh_while_active(job_active)
 
 
 def test_api_connection(api_key):
@@ -144,10 +193,10 @@ def test_api_connection(api_key):
     st.info("🔄 正在测试API连接...")
     
     try:
-        from .api_clients import GPTBotsAPI
+        from .client_cache import get_gptbots_client
         
         # 创建API客户端
-        client = GPTBotsAPI(api_key)
+        client = get_gptbots_client(api_key)
         
         # 发送测试消息
         test_query = "你好，这是一个连接测试。"
@@ -170,212 +219,158 @@ def test_api_connection(api_key):
         st.warning("请确认API配置正确")
 
 
-def start_llm_processing(api_key, delay, config):
-    """开始LLM处理"""
-    # 检查处理状态
-    if st.session_state.llm_processing_state != "processing":
-        return
-    
-    st.info("🚀 开始LLM处理...")
-    log_activity("开始LLM处理")
+def show_concurrency_panel(container=None):
+    """显示自适应并发控制器的实时状态"""
+    from .api_clients import get_concurrency_controller, get_hedging_policy, get_circuit_breaker
     
-    # 创建进度条
-    progress_bar = st.progress(0)
-    status_text = st.empty()
-    result_container = st.empty()
+    target = container.container() if container is not None else st.container()
+    stats = get_concurrency_controller("llm").get_stats()
+    hedge_stats = get_hedging_policy().get_stats()
+    circuit_stats = get_circuit_breaker("gptbots").get_stats()
     
-    try:
-        from .api_clients import GPTBotsAPI
-        
-        # 初始化API客户端
-        status_text.text("🔍 初始化GPTBots API客户端...")
-        client = GPTBotsAPI(api_key)
-        
-        # 获取待处理的Markdown文件
-        processed_dir = Path(config["processed_dir"])
-        md_files = list(processed_dir.glob("*.md"))
-        
-        # 过滤掉处理报告文件
-        md_files = [f for f in md_files if f.name != "processing_report.json"]
+    with target:
+        if circuit_stats["state"] == "open":
+            st.error(
+                f"⛔ 服务熔断中（连续失败 {circuit_stats['consecutive_failures']} 次），"
+                f"{circuit_stats['retry_after']:.0f} 秒后发起探测请求"
+            )
+        elif circuit_stats["state"] == "half_open":
+            st.warning("🔎 熔断器半开：正在发送探测请求，成功后自动恢复处理")
         
-        if not md_files:
-            st.error("❌ 未找到待处理的Markdown文件")
-            return
-        
-        progress_bar.progress(10)
-        status_text.text(f"📧 发现 {len(md_files)} 个Markdown文件待处理...")
-        
-        # 更新session state中的总文件数
-        st.session_state.llm_total_files = len(md_files)
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("并发上限", stats["limit"])
+        with col2:
+            st.metric("在途请求", stats["in_flight"])
+        with col3:
+            st.metric("吞吐量(次/分钟)", stats["throughput_per_min"])
+        with col4:
+            st.metric("平均延迟(秒)", f"{stats['avg_latency']:.1f}")
         
-        # LLM提示词模板
-        llm_prompt_template = """
-            以下是需要处理的邮件内容：
-
-            {email_content}"""
-            
-        # 开始处理文件
-        processed_files = []
-        failed_files = []
+        st.caption(
+            f"累计请求 {stats['total_requests']} 次，"
+            f"限流/超时 {stats['total_throttled']} 次，错误 {stats['total_errors']} 次；"
+            f"熔断器 {circuit_stats['state_label']}，累计熔断 {circuit_stats['total_opened']} 次，"
+            f"快速失败 {circuit_stats['total_rejected']} 次"
+        )
         
-        # 从上次暂停的位置继续处理
-        start_index = st.session_state.llm_processed_count
+        if st.session_state.get("llm_enable_hedging") or hedge_stats["hedges_sent"] or hedge_stats["hedges_skipped"]:
+            p50 = f"{hedge_stats['p50']:.1f}s" if hedge_stats["p50"] is not None else "-"
+            p99 = f"{hedge_stats['p99']:.1f}s" if hedge_stats["p99"] is not None else "-"
+            delay = f"{hedge_stats['hedge_delay']:.1f}s" if hedge_stats["hedge_delay"] is not None else "样本不足"
+            st.caption(
+                f"对冲请求: 等待阈值 {delay}，延迟 P50 {p50} / P99 {p99}，"
+                f"已发起 {hedge_stats['hedges_sent']} 次，对冲胜出 {hedge_stats['hedge_wins']} 次 "
+                f"(胜率 {hedge_stats['win_rate']:.0%})，因预算跳过 {hedge_stats['hedges_skipped']} 次"
+            )
         
-        for i, md_file in enumerate(md_files):
-            # 检查是否需要暂停
-            if st.session_state.llm_processing_state != "processing":
-                status_text.text("⏸️ 处理已暂停")
-                return
-            
-            # 跳过已经处理过的文件（从暂停位置继续）
-            if i < start_index:
-                continue
-                
-            try:
-                # 更新进度
-                progress = 10 + (i / len(md_files)) * 80
-                progress_bar.progress(int(progress))
-                status_text.text(f"🤖 处理中: {md_file.name} ({i+1}/{len(md_files)})")
-                
-                # 更新session state中的当前进度
-                st.session_state.llm_processed_count = i
-                
-                # 读取文件内容
-                with open(md_file, 'r', encoding='utf-8') as f:
-                    email_content = f.read()
-                
-                # 构建完整的提示词
-                full_prompt = llm_prompt_template.format(email_content=email_content)
-                
-                # 调用LLM API
-                result = client.call_agent(full_prompt)
-                
-                if result and "output" in result:
-                    # 提取LLM响应内容
-                    llm_response = extract_llm_content(result)
-                    
-                    if llm_response:
-                        # 保存LLM处理结果
-                        output_filename = f"llm_{md_file.name}"
-                        output_path = Path(config["final_dir"]) / output_filename
-                        
-                        # 确保输出目录存在
-                        output_path.parent.mkdir(parents=True, exist_ok=True)
-                        
-                        # 生成最终的Markdown内容
-                        final_content = f"""# LLM处理结果 - {md_file.name}
+        if stats["events"]:
+            st.markdown("**并发上限调整记录**")
+            event_rows = [
+                {
+                    "时间": event["time"],
+                    "调整": f"{event['old_limit']} → {event['new_limit']}",
+                    "原因": event["reason"]
+                }
+                for event in reversed(stats["events"])
+            ]
+            st.table(event_rows[:10])
 
-## 🤖 AI提取的结构化信息
 
-{llm_response}
+def show_incremental_preview(processed_dir, api_key):
+    """显示增量处理将要处理的文件数"""
+    from .llm_engine import preview_llm_run
+    
+    preview = preview_llm_run(processed_dir, api_key)
+    st.info(
+        f"📋 增量处理: 🆕 新文件 {preview['new']} 个 / ✏️ 已变化 {preview['changed']} 个 / "
+        f"✅ 无需处理 {preview['up_to_date']} 个"
+    )
+    if preview["orphans"]:
+        st.caption(f"🗑️ {preview['orphans']} 个结果文件的源文件已删除，开始处理时将被清理")
 
----
 
-## 📄 原始邮件内容
+def start_llm_processing(api_key, delay, config, endpoint="sg", bypass_cache=False,
+                         pack_small_emails=False, pack_token_budget=None, split_threshold=None,
+                         park_on_open=True, workers=None, incremental=False, enable_hedging=False):
+    """提交LLM处理后台任务"""
+    params = {
+        "api_key": api_key,
+        "endpoint": endpoint,
+        "delay": delay,
+        "workers": workers,
+        "bypass_cache": bypass_cache,
+        "enable_hedging": enable_hedging,
+        "pack_small_emails": pack_small_emails,
+        "pack_token_budget": pack_token_budget,
+        "split_threshold": split_threshold,
+        "park_on_open": park_on_open,
+        "incremental": incremental,
+        "processed_dir": config["processed_dir"],
+        "final_dir": config["final_dir"]
+    }
+    md_count = count_files(config["processed_dir"], "*.md")
+    submit_job("llm", params, f"LLM处理（{md_count} 个文件）", key_prefix="llm")
+    log_activity("开始LLM处理")
 
-{email_content}
 
----
-*LLM处理时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}*
-*使用节点: {endpoint}*
-*API Key: {api_key[:8]}...{api_key[-8:]}*
-"""
-                        
-                        with open(output_path, 'w', encoding='utf-8') as f:
-                            f.write(final_content)
-                        
-                        processed_files.append(output_filename)
-                        
-                        # 添加延迟避免API限流
-                        if i < len(md_files) - 1:  # 不是最后一个文件
-                            time.sleep(delay)
-                    else:
-                        failed_files.append(md_file.name)
-                        st.warning(f"⚠️ {md_file.name} - 无法提取LLM响应内容")
-                        
-                else:
-                    failed_files.append(md_file.name)
-                    st.warning(f"⚠️ {md_file.name} - LLM处理失败")
-                    
-            except Exception as e:
-                failed_files.append(md_file.name)
-                st.error(f"❌ {md_file.name} - 处理出错: {str(e)}")
-        
-        # 显示处理结果
-        progress_bar.progress(100)
-        status_text.empty()
-        
-        # 处理完成，重置状态
-        st.session_state.llm_processing_state = "idle"
-        st.session_state.llm_processed_count = 0
-        
-        with result_container.container():
-            st.success("🎉 LLM处理完成！")
-            
-            # 统计信息
-            col1, col2, col3 = st.columns(3)
-            
-            with col1:
-                st.metric("输入文件", len(md_files))
-            
-            with col2:
-                st.metric("处理成功", len(processed_files))
-            
-            with col3:
-                st.metric("处理失败", len(failed_files))
-            
-            # 显示处理结果
-            if processed_files:
-                st.subheader("✅ 处理成功的文件")
-                for filename in processed_files[:5]:  # 显示前5个
+def show_llm_result(job):
+    """显示LLM处理任务的结果"""
+    result = job["result"]
+    processed_files = result["processed_files"]
+    failed_files = result["failed_files"]
+    
+    st.success("🎉 LLM处理完成！")
+    
+    # 统计信息
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        st.metric("输入文件", result["input_files"])
+    
+    with col2:
+        st.metric("处理成功", len(processed_files))
+    
+    with col3:
+        st.metric("处理失败", len(failed_files))
+    
+    with col4:
+        st.metric("缓存命中", result["cache_hits"], help=f"实际调用LLM {result['api_calls']} 次")
+    
+    if result.get("skipped_files"):
+        st.info(
+            f"⏭️ 增量处理: 新文件 {result.get('new_files', 0)} 个 / 已变化 {result.get('changed_files', 0)} 个 / "
+            f"跳过未变化的 {result['skipped_files']} 个"
+        )
+    
+    if result.get("removed_outputs"):
+        st.info(f"🗑️ 已清理 {len(result['removed_outputs'])} 个源文件已删除的结果文件")
+    
+    if result["packed_calls"]:
+        st.info(f"📦 合并处理: {result['packed_calls']} 次调用处理了 {result['packed_emails']} 封短邮件")
+    
+    if result["map_reduce_emails"]:
+        st.info(f"✂️ 分块处理: {result['map_reduce_emails']} 封超长邮件按段落分块后汇总")
+    
+    if result["retried_files"]:
+        st.info(f"🔁 自动重试: {result['retried_files']} 个文件首次处理失败后进行了重试")
+    
+    # 显示处理结果
+    if processed_files:
+        st.subheader("✅ 处理成功的文件")
+        for filename in processed_files[:5]:  # 显示前5个
+            st.code(filename)
+        if len(processed_files) > 5:
+            with st.expander(f"查看剩余 {len(processed_files) - 5} 个文件"):
+                for filename in processed_files[5:]:
                     st.code(filename)
-                if len(processed_files) > 5:
-                    with st.expander(f"查看剩余 {len(processed_files) - 5} 个文件"):
-                        for filename in processed_files[5:]:
-                            st.code(filename)
-            
-            if failed_files:
-                st.subheader("❌ 处理失败的文件")
-                for filename in failed_files:
-                    st.error(filename)
-            
-            # 输出位置
-            st.subheader("📁 输出位置")
-            st.success("📁 LLM处理结果保存至:")
-            st.code(config["final_dir"])
-            
-            log_activity(f"LLM处理完成: {len(processed_files)}/{len(md_files)} 成功")
     
-    except Exception as e:
-        progress_bar.progress(0)
-        status_text.empty()
-        result_container.error(f"❌ LLM处理过程中发生错误: {str(e)}")
-        # 出错时重置状态
-        st.session_state.llm_processing_state = "idle"
-        st.session_state.llm_processed_count = 0
-        log_activity(f"LLM处理失败: {str(e)}")
-        st.exception(e)
-
-
-def extract_llm_content(result):
-    """从LLM API响应中提取内容"""
-    try:
-        if "output" in result:
-            output_list = result.get("output", [])
-            content = ""
-            for output_item in output_list:
-                if "content" in output_item:
-                    content_obj = output_item["content"]
-                    if "text" in content_obj:
-                        content += content_obj["text"] + "\n"
-            return content.strip()
-        
-        # 备用提取方法
-        return (result.get("answer") or 
-                result.get("content") or 
-                result.get("message") or
-                None)
-                
-    except Exception as e:
-        st.error(f"内容提取失败: {e}")
-        return None
+    if failed_files:
+        st.subheader("❌ 处理失败的文件")
+        for failed in failed_files:
+            st.error(f"{failed['file']} - {failed['error']}")
+    
+    # 输出位置
+    st.subheader("📁 输出位置")
+    st.success("📁 LLM处理结果保存至:")
+    st.code(result["final_dir"])
@@ -0,0 +1,222 @@
+"""
+流式流水线模块
+各处理阶段通过有界队列连接、并行运行：上游产出一项即交给下游处理，
+下游处理不过来时队列写满、上游阻塞（背压），总耗时接近最慢阶段而不是各阶段之和
+"""
+
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+# 队列结束标记
+_END = object()
+
+
+class StreamStage:
+    def __init__(self, name: str, handler: Callable[[Any, Callable[[Any], None]], None],
+                 workers: int = 1, queue_size: int = 20, batch_size: int = 1, linger: float = 0.0):
+        """
+        初始化流水线阶段
+
+        Args:
+            name: 阶段名称
+            handler: 处理函数，参数为 (输入项或输入批次, emit)，调用 emit(结果) 把结果交给下一阶段；
+                     抛出的异常会终止整条流水线
+            workers: 工作线程数
+            queue_size: 输入队列容量
+            batch_size: 大于1时按批处理，handler 收到输入项列表
+            linger: 凑批等待时间（秒），批次第一项到达后最多等待多久
+        """
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, int(workers))
+        self.batch_size = max(1, int(batch_size))
+        self.linger = linger
+        self.input: queue.Queue = queue.Queue(maxsize=max(1, int(queue_size)))
+
+        self.processed = 0
+        self.emitted = 0
+        self.busy_seconds = 0.0
+        self.max_queue_depth = 0
+        self.first_emit_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._running_workers = self.workers
+
+    def get_stats(self, started_at: float) -> Dict:
+        """获取阶段统计信息"""
+        with self._lock:
+            return {
+                "stage": self.name,
+                "workers": self.workers,
+                "processed": self.processed,
+                "emitted": self.emitted,
+                "busy_seconds": round(self.busy_seconds, 3),
+                "queue_depth": self.input.qsize(),
+                "max_queue_depth": self.max_queue_depth,
+                "first_output_seconds": (
+                    round(self.first_emit_at - started_at, 3) if self.first_emit_at is not None else None
+                )
+            }
+
+
+class StreamPipeline:
+    def __init__(self, stages: List[StreamStage], checkpoint: Callable[[], None] = None):
+        """
+        初始化流式流水线
+
+        Args:
+            stages: 按顺序连接的阶段，最后一个阶段的输出被丢弃
+            checkpoint: 写入队列前和每个输入项处理前调用，用于响应暂停和取消
+        """
+        if not stages:
+            raise ValueError("流水线至少需要一个阶段")
+        self.stages = stages
+        self.checkpoint = checkpoint or (lambda: None)
+        self.started_at = 0.0
+
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+        self._failure: Optional[BaseException] = None
+        self._failure_lock = threading.Lock()
+
+    def start(self):
+        """启动各阶段的工作线程"""
+        self.started_at = time.time()
+        for index, stage in enumerate(self.stages):
+            for worker in range(stage.workers):
+                thread = threading.Thread(
+                    target=self._worker, args=(index,), name=f"stream-{stage.name}-{worker}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def feed(self, item: Any):
+        """
+        向第一个阶段输入一项，队列已满时阻塞
+
+        Raises:
+            流水线中任一阶段抛出的异常
+        """
+        self._put(0, item)
+        self._raise_failure()
+
+    def finish(self) -> List[Dict]:
+        """
+        结束输入，等待所有阶段处理完成
+
+        Returns:
+            各阶段统计信息
+
+        Raises:
+            流水线中任一阶段抛出的异常
+        """
+        first = self.stages[0]
+        for _ in range(first.workers):
+            self._put(0, _END, force=True)
+        for thread in self._threads:
+            thread.join()
+        self._raise_failure()
+        return self.get_stats()
+
+    def abort(self, error: BaseException = None):
+        """终止流水线：工作线程处理完当前项后退出"""
+        self._fail(error)
+        for thread in self._threads:
+            thread.join()
+
+    def get_stats(self) -> List[Dict]:
+        """获取各阶段统计信息"""
+        return [stage.get_stats(self.started_at) for stage in self.stages]
+
+    def _fail(self, error: Optional[BaseException]):
+        with self._failure_lock:
+            if self._failure is None and error is not None:
+                self._failure = error
+        self._stop.set()
+
+    def _raise_failure(self):
+        if self._failure is not None:
+            raise self._failure
+
+    def _put(self, index: int, item: Any, force: bool = False):
+        # 结束标记在流水线终止后仍需写入，以便工作线程退出
+        stage = self.stages[index]
+        while True:
+            if not force:
+                if self._stop.is_set():
+                    return
+                self.checkpoint()
+            try:
+                stage.input.put(item, timeout=0.5)
+            except queue.Full:
+                if force and self._stop.is_set():
+                    # 终止后工作线程通过停止信号退出，无需等待队列空出
+                    return
+                continue
+            with stage._lock:
+                stage.max_queue_depth = max(stage.max_queue_depth, stage.input.qsize())
+            return
+
+    def _take(self, stage: StreamStage) -> Any:
+        """取出一项，按批处理时在等待时间内凑批；返回 _END 表示输入结束"""
+        while True:
+            if self._stop.is_set():
+                return _END
+            try:
+                first = stage.input.get(timeout=0.5)
+                break
+            except queue.Empty:
+                continue
+        if first is _END or stage.batch_size == 1:
+            return first
+
+        batch = [first]
+        deadline = time.time() + stage.linger
+        while len(batch) < stage.batch_size:
+            remaining = deadline - time.time()
+            try:
+                item = stage.input.get(timeout=max(remaining, 0)) if remaining > 0 else stage.input.get_nowait()
+            except queue.Empty:
+                break
+            if item is _END:
+                # 结束标记放回队列，由本线程下一次取出后退出
+                stage.input.put(item)
+                break
+            batch.append(item)
+        return batch
+
+    def _worker(self, index: int):
+        stage = self.stages[index]
+        next_index = index + 1 if index + 1 < len(self.stages) else None
+
+        def emit(result):
+            with stage._lock:
+                stage.emitted += 1
+                if stage.first_emit_at is None:
+                    stage.first_emit_at = time.time()
+            if next_index is not None:
+                self._put(next_index, result)
+
+        try:
+            while True:
+                item = self._take(stage)
+                if item is _END:
+                    break
+                self.checkpoint()
+                start = time.time()
+                stage.handler(item, emit)
+                with stage._lock:
+                    stage.busy_seconds += time.time() - start
+                    stage.processed += len(item) if stage.batch_size > 1 else 1
+        except BaseException as e:
+            # 包括取消任务的 JobCancelled，交由调用线程重新抛出
+            self._fail(e)
+        finally:
+            with stage._lock:
+                stage._running_workers -= 1
+                last = stage._running_workers == 0
+            # 本阶段最后一个工作线程退出时通知下一阶段输入结束
+            if last and next_index is not None:
+                for _ in range(self.stages[next_index].workers):
+                    self._put(next_index, _END, force=True)
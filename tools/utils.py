@@ -25,13 +25,15 @@ def count_files(directory, pattern):
 def log_activity(message):
     """记录活动日志"""
     import os
+    from config import LOGGING_CONFIG
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     log_entry = f"[{timestamp}] {message}\n"
     
-    # 确保logs目录存在
-    os.makedirs("logs", exist_ok=True)
+    # 确保日志目录存在
+    activity_log = LOGGING_CONFIG["activity_log"]
+    os.makedirs(os.path.dirname(activity_log) or ".", exist_ok=True)
     
-    with open("logs/activity.log", "a", encoding="utf-8") as f:
+    with open(activity_log, "a", encoding="utf-8") as f:
         f.write(log_entry)
 
 